@@ -11,7 +11,6 @@
 # have received a copy of GPLv2 along with this software; if not, see
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
-import time
 from gettext import gettext as _
 
 from pulp.client import arg_utils, validators
@@ -19,6 +18,7 @@ from pulp.client.extensions.extensions import (PulpCliSection, PulpCliCommand,
     PulpCliOption, PulpCliFlag)
 from pulp.bindings.exceptions import NotFoundException
 from pulp.client.commands.criteria import CriteriaCommand
+from pulp.client.commands.polling import poll_task
 
 # -- framework hook -----------------------------------------------------------
 
@@ -315,18 +315,13 @@ class PollingCommand(PulpCliCommand):
             pass
 
     def poll(self, task):
-        server = self.context.server
-        cfg = self.context.config
         spinner = self.context.prompt.create_spinner()
-        interval = float(cfg['output']['poll_frequency_in_seconds'])
         while not task.is_completed():
             if task.is_waiting():
                 spinner.next(_('Waiting to begin'))
             else:
                 spinner.next()
-            time.sleep(interval)
-            response = server.tasks.get_task(task.task_id)
-            task = response.response_body
+            task = poll_task(self.context, task)
         return task
 
     def rejected(self, task):
@@ -12,8 +12,12 @@
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
 import base64
+import httplib
 import locale
 import logging
+import socket
+import threading
+import time
 import urllib
 from types import NoneType
 
@@ -28,6 +32,17 @@ import pulp.bindings.exceptions as exceptions
 from pulp.bindings.responses import Response, Task
 from pulp.common.util import ensure_utf_8
 
+# Maximum number of idle connections kept open to the server
+DEFAULT_MAX_CONNECTIONS = 4
+
+# Idle connections are not reused after this many seconds, shortly before the
+# server (Apache's default KeepAliveTimeout is 5 seconds) closes them
+DEFAULT_MAX_IDLE_SECONDS = 4.0
+
+# Methods that may be sent again after the server received them; see
+# HTTPSServerWrapper.request
+RESEND_SAFE_METHODS = ('GET', 'HEAD')
+
 # -- server connection --------------------------------------------------------
 
 class PulpConnection(object):
@@ -38,11 +53,15 @@ class PulpConnection(object):
     parameter can be used to pass in another mechanism to make the actual
     call to the server. The likely use of this is a duck-typed mock object
     for unit testing purposes.
+
+    Connections to the server are kept open and reused by subsequent calls,
+    up to max_connections of them; see ConnectionPool.
     """
 
     def __init__(self, host, port=443, path_prefix='/pulp/api', timeout=120,
                  logger=None, api_responses_logger=None,
-                 username=None, password=None, cert_filename=None, server_wrapper=None):
+                 username=None, password=None, cert_filename=None, server_wrapper=None,
+                 max_connections=DEFAULT_MAX_CONNECTIONS):
 
         self.host = host
         self.port = port
@@ -69,6 +88,9 @@ class PulpConnection(object):
                         'Accept-Language': default_locale,
                         'Content-Type': 'application/json'}
 
+        # Connections
+        self.connection_pool = ConnectionPool(self, max_connections)
+
         # Server Wrapper
         if server_wrapper:
             self.server_wrapper = server_wrapper
@@ -92,6 +114,21 @@ class PulpConnection(object):
     def PUT(self, path, body, ensure_encoding=True):
         return self._request('PUT', path, body=body, ensure_encoding=ensure_encoding)
 
+    def connection_stats(self):
+        """
+        :return: statistics on the reuse of connections to the server; see
+                 ConnectionPool.stats
+        :rtype:  dict
+        """
+        return self.connection_pool.stats()
+
+    def close(self):
+        """
+        Close the idle connections to the server. Subsequent calls open new
+        ones as needed.
+        """
+        self.connection_pool.close()
+
     # protected request utilities ---------------------------------------------
 
     def _request(self, method, path, queries=(), body=None, ensure_encoding=True):
@@ -220,6 +257,208 @@ class PulpConnection(object):
             path = '?'.join((path, queries))
         return path
 
+# -- connection pool ----------------------------------------------------------
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of keep-alive HTTPS connections to the Pulp server.
+
+    A connection is checked out for the duration of a single call and
+    returned to the pool afterwards, so a thread never shares a connection
+    with another. Up to max_connections idle connections are kept open; any
+    more are closed when they are returned. All connections share one SSL
+    context and new connections resume the TLS session of an earlier one,
+    so that only the first connection performs a full handshake.
+
+    Connections that have been idle for max_idle_seconds are closed instead
+    of reused, so that requests are rarely written to a connection the server
+    has already closed. The SSL context is rebuilt, and the idle connections
+    closed, when the connection's certificate file changes.
+    """
+
+    def __init__(self, pulp_connection, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_idle_seconds=DEFAULT_MAX_IDLE_SECONDS):
+        self.pulp_connection = pulp_connection
+        self.max_connections = max_connections
+        self.max_idle_seconds = max_idle_seconds
+
+        self._idle = []
+        self._ssl_context = None
+        self._cert_filename = None
+        self._session = None
+
+        self._created = 0
+        self._reused = 0
+        self._reconnected = 0
+
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Check out an idle connection, or open a new one if there are none.
+
+        :return: tuple of the connection and whether it was used before
+        :rtype:  tuple
+        """
+        expired = []
+        self._lock.acquire()
+        try:
+            self._check_context()
+            # the least recently used connections are at the front
+            oldest = time.time() - self.max_idle_seconds
+            while self._idle and self._idle[0].pool_idle_since < oldest:
+                expired.append(self._idle.pop(0))
+            if self._idle:
+                self._reused += 1
+                return self._idle.pop(), True
+        finally:
+            self._lock.release()
+            for connection in expired:
+                connection.close()
+        return self.connect(), False
+
+    def connect(self):
+        """
+        Open a new connection, to be returned with release() when done.
+
+        :return: new connection
+        :rtype:  M2Crypto.httpslib.HTTPSConnection
+        """
+        self._lock.acquire()
+        try:
+            self._check_context()
+            ssl_context = self._ssl_context
+            session = self._session
+            self._created += 1
+        finally:
+            self._lock.release()
+        connection = httpslib.HTTPSConnection(self.pulp_connection.host,
+                                              self.pulp_connection.port,
+                                              ssl_context=ssl_context)
+        connection.pool_ssl_context = ssl_context
+        if session is not None:
+            connection.set_session(session)
+        return connection
+
+    def reconnect(self, connection):
+        """
+        Replace a connection the server has closed with a new one.
+
+        :param connection: stale connection; it is closed
+        :type  connection: M2Crypto.httpslib.HTTPSConnection
+
+        :return: new connection
+        :rtype:  M2Crypto.httpslib.HTTPSConnection
+        """
+        connection.close()
+        self._lock.acquire()
+        try:
+            self._reconnected += 1
+        finally:
+            self._lock.release()
+        return self.connect()
+
+    def release(self, connection):
+        """
+        Return a connection after a successful call so that it can be reused.
+
+        :param connection: connection checked out from the pool
+        :type  connection: M2Crypto.httpslib.HTTPSConnection
+        """
+        self._lock.acquire()
+        try:
+            if connection.pool_ssl_context is self._ssl_context and \
+                    len(self._idle) < self.max_connections:
+                connection.pool_idle_since = time.time()
+                self._idle.append(connection)
+                return
+        finally:
+            self._lock.release()
+        connection.close()
+
+    def save_session(self, connection):
+        """
+        Remember the TLS session of a connection that has completed its
+        handshake so that new connections can resume it.
+
+        :param connection: connected connection
+        :type  connection: M2Crypto.httpslib.HTTPSConnection
+        """
+        try:
+            session = connection.get_session()
+        except AttributeError:
+            # the connection has already been closed
+            return
+        self._lock.acquire()
+        try:
+            if connection.pool_ssl_context is self._ssl_context:
+                self._session = session
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """
+        Close the idle connections.
+        """
+        self._lock.acquire()
+        try:
+            idle = self._idle
+            self._idle = []
+        finally:
+            self._lock.release()
+        for connection in idle:
+            connection.close()
+
+    def stats(self):
+        """
+        Report on the reuse of connections.
+        Keys:
+         * created: connections opened
+         * reused: calls made on a connection opened by an earlier call
+         * reconnected: reused connections found closed by the server and
+           replaced with a new one
+         * idle: connections currently open and waiting to be reused
+         * max_connections: maximum number of idle connections kept
+
+        :return: connection statistics
+        :rtype:  dict
+        """
+        self._lock.acquire()
+        try:
+            return {'created': self._created,
+                    'reused': self._reused,
+                    'reconnected': self._reconnected,
+                    'idle': len(self._idle),
+                    'max_connections': self.max_connections}
+        finally:
+            self._lock.release()
+
+    def _check_context(self):
+        """
+        Build the SSL context if it has not been built yet or the certificate
+        file has changed since. The certificate is only presented when no
+        username and password are given, so that a user whose certificate
+        has expired can still log in. NOTE: must be called with the lock held
+        """
+        cert_filename = self.pulp_connection.cert_filename
+        if self.pulp_connection.username and self.pulp_connection.password:
+            cert_filename = None
+        if self._ssl_context is not None and cert_filename == self._cert_filename:
+            return
+        if cert_filename:
+            ssl_context = SSL.Context('sslv3')
+            ssl_context.set_session_timeout(self.pulp_connection.timeout)
+            ssl_context.load_cert(cert_filename)
+        else:
+            ssl_context = SSL.Context()
+        idle = self._idle
+        self._idle = []
+        for connection in idle:
+            connection.close()
+        self._ssl_context = ssl_context
+        self._cert_filename = cert_filename
+        self._session = None
+
 # -- wrapper classes ----------------------------------------------------------
 
 class HTTPSServerWrapper(object):
@@ -237,41 +476,71 @@ class HTTPSServerWrapper(object):
 
         headers = dict(self.pulp_connection.headers) # copy so we don't affect the calling method
 
-        # Create a new connection each time since HTTPSConnection has problems
-        # reusing a connection for multiple calls (lame).
-        ssl_context = None
         if self.pulp_connection.username and self.pulp_connection.password:
             raw = ':'.join((self.pulp_connection.username, self.pulp_connection.password))
             encoded = base64.encodestring(raw)[:-1]
             headers['Authorization'] = 'Basic ' + encoded
-        elif self.pulp_connection.cert_filename:
-            ssl_context = SSL.Context('sslv3')
-            ssl_context.set_session_timeout(self.pulp_connection.timeout)
-            ssl_context.load_cert(self.pulp_connection.cert_filename)
-
-        # Can't pass in None, so need to decide between two signatures (also lame)
-        if ssl_context is not None:
-            connection = httpslib.HTTPSConnection(self.pulp_connection.host, self.pulp_connection.port, ssl_context=ssl_context)
-        else:
-            connection = httpslib.HTTPSConnection(self.pulp_connection.host, self.pulp_connection.port)
-
-        # Request against the server
-        connection.request(method, url, body=body, headers=headers)
 
+        pool = self.pulp_connection.connection_pool
+        connection, reused = pool.acquire()
         try:
-            response = connection.getresponse()
+            try:
+                self._send(connection, method, url, body, headers)
+            except (httplib.HTTPException, socket.error, SSL.SSLError):
+                if not reused:
+                    raise
+                # The server closed the connection while it was idle and the
+                # request could not be written, so send it on a new connection.
+                connection, reused = pool.reconnect(connection), False
+                self._send(connection, method, url, body, headers)
+            try:
+                response = self._receive(connection)
+            except httplib.BadStatusLine, e:
+                # Once written, the request may have been processed; it is only
+                # sent again if the server closed the idle connection without
+                # responding and sending it twice is harmless.
+                if not reused or e.line not in ('', repr('')) or method not in RESEND_SAFE_METHODS:
+                    raise
+                connection = pool.reconnect(connection)
+                self._send(connection, method, url, body, headers)
+                response = self._receive(connection)
         except SSL.SSLError, err:
+            connection.close()
             # Translate stale login certificate to an auth exception
             if 'sslv3 alert certificate expired' == str(err):
                 raise exceptions.PermissionsException()
             else:
                 raise exceptions.ConnectionException(None, str(err), None)
+        except:
+            connection.close()
+            raise
+        pool.release(connection)
 
+        response_status, response_body = response
         # Attempt to deserialize the body (should pass unless the server is busted)
-        response_body = response.read()
-
         try:
             response_body = json.loads(response_body)
         except:
             pass
-        return response.status, response_body
+        return response_status, response_body
+
+    def _send(self, connection, method, url, body, headers):
+        """
+        Write a request on a connection, connecting first if needed.
+        """
+        connected = connection.sock is not None
+        connection.request(method, url, body=body, headers=headers)
+        if not connected:
+            # resume this handshake's session on subsequent new connections
+            self.pulp_connection.connection_pool.save_session(connection)
+
+    def _receive(self, connection):
+        """
+        Read the entire response to a request, leaving the connection ready
+        for the next request.
+
+        :return: tuple of the response status and (raw) body
+        :rtype:  tuple
+        """
+        response = connection.getresponse()
+        return response.status, response.read()
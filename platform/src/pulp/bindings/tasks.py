@@ -34,17 +34,27 @@ class TasksAPI(PulpAPI):
         response = self.server.DELETE(path)
         return response
 
-    def get_task(self, task_id):
+    def get_task(self, task_id, wait=None, state=None):
         """
         Retrieves the status of the given task if it exists.
 
+        If wait is specified, the server waits up to that many seconds for
+        the task to change (state or progress) before responding, instead of
+        responding immediately. It does not wait for a completed task or, if
+        state is specified, for a task that is no longer in that state.
+
+        @param wait: maximum number of seconds for the server to wait
+        @type  wait: float or None
+        @param state: state the task was last seen in
+        @type  state: str or None
+
         @return: response with a Task object in the response_body
         @rtype:  Response
 
         @raise NotFoundException: if there is no task with the given ID
         """
         path = '/v2/tasks/%s/' % task_id
-        response = self.server.GET(path)
+        response = self.server.GET(path, _wait_queries(wait, state))
 
         # Since it was a 200, the connection parsed the response body into a
         # Document. We know this will be task data, so convert the object here.
@@ -138,17 +148,36 @@ class TaskGroupsAPI(PulpAPI):
         response = self.server.DELETE(path)
         return response
 
-    def get_task_group(self, task_group_id):
+    def get_task_group(self, task_group_id, wait=None, state=None):
         """
         Retrieves the status of all tasks in the task group.
 
+        If wait is specified, the server waits up to that many seconds for
+        any of the tasks to change (state or progress) before responding; see
+        TasksAPI.get_task.
+
         @param task_group_id: ID of the task group to retrieve
         @type task_group_id: str
+        @param wait: maximum number of seconds for the server to wait
+        @type  wait: float or None
+        @param state: state all of the tasks were last seen in
+        @type  state: str or None
         @return: response with the status of all tasks in the task group in its body
         @rtype: Response
         """
         path = 'v2/task_groups/%s/' % task_group_id
-        response = self.server.GET(path)
+        response = self.server.GET(path, _wait_queries(wait, state))
         response.response_body = [Task(t) for t in response.response_body]
         return response
 
+
+def _wait_queries(wait, state):
+    """
+    Build the query parameters asking the server to wait for tasks to change.
+    """
+    queries = []
+    if wait is not None:
+        queries.append(('wait', wait))
+        if state is not None:
+            queries.append(('state', state))
+    return queries
@@ -21,9 +21,12 @@ class UploadAPI(PulpAPI):
     def __init__(self, pulp_connection):
         super(UploadAPI, self).__init__(pulp_connection)
 
-    def initialize_upload(self):
+    def initialize_upload(self, size=None):
         url = '/v2/content/uploads/'
-        return self.server.POST(url)
+        body = None
+        if size is not None:
+            body = {'size' : size}
+        return self.server.POST(url, body)
 
     def upload_segment(self, upload_id, offset, data):
         url = '/v2/content/uploads/%s/%s/' % (upload_id, offset)
@@ -46,3 +49,23 @@ class UploadAPI(PulpAPI):
             'unit_metadata' : unit_metadata,
         }
         return self.server.POST(url, body)
+
+    def find_existing_unit(self, unit_type_id, unit_key, checksum_type, checksum):
+        url = '/v2/content/actions/find_existing_unit/'
+        body = {
+            'unit_type_id' : unit_type_id,
+            'unit_key' : unit_key,
+            'checksum_type' : checksum_type,
+            'checksum' : checksum,
+        }
+        return self.server.POST(url, body)
+
+    def import_existing_unit(self, repo_id, unit_type_id, unit_key, checksum_type, checksum):
+        url = '/v2/repositories/%s/actions/import_existing_unit/' % repo_id
+        body = {
+            'unit_type_id' : unit_type_id,
+            'unit_key' : unit_key,
+            'checksum_type' : checksum_type,
+            'checksum' : checksum,
+        }
+        return self.server.POST(url, body)
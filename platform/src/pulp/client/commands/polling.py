@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Contains functions for following the status of a task on the server.
+"""
+
+import time
+
+# Used when the client configuration does not specify poll_wait_in_seconds
+DEFAULT_POLL_WAIT_IN_SECONDS = 10
+
+# -- public -------------------------------------------------------------------
+
+def poll_task(context, task):
+    """
+    Retrieves the next status of a task that has not completed. The server is
+    asked to respond as soon as the task changes state or reports progress,
+    waiting up to the configured poll_wait_in_seconds, so that changes are
+    seen immediately without repeatedly requesting an unchanged status.
+
+    Servers that do not support waiting respond immediately; in that case an
+    unchanged status is not requested again until poll_frequency_in_seconds
+    has passed.
+
+    :param context: CLI context
+    :type  context: pulp.client.extensions.core.ClientContext
+    :param task: last retrieved status of the task
+    :type  task: pulp.bindings.responses.Task
+
+    :return: the task's next status
+    :rtype:  pulp.bindings.responses.Task
+    """
+    output_config = context.config['output']
+    wait = float(output_config.get('poll_wait_in_seconds', DEFAULT_POLL_WAIT_IN_SECONDS))
+    poll_frequency_in_seconds = float(output_config['poll_frequency_in_seconds'])
+
+    start = time.time()
+    response = context.server.tasks.get_task(task.task_id, wait=wait, state=task.state)
+    next_task = response.response_body
+
+    if next_task.state == task.state and next_task.progress == task.progress:
+        remaining = poll_frequency_in_seconds - (time.time() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    return next_task
@@ -16,7 +16,8 @@ Contains functions for rendering the sync/publish progress reports.
 """
 
 from gettext import gettext as _
-import time
+
+from pulp.client.commands.polling import poll_task
 
 # -- public -------------------------------------------------------------------
 
@@ -110,27 +111,25 @@ def _display_task_status(context, renderer, task_id, quiet_waiting=False):
     """
 
     begin_spinner = context.prompt.create_spinner()
-    poll_frequency_in_seconds = float(context.config['output']['poll_frequency_in_seconds'])
 
     response = context.server.tasks.get_task(task_id)
+    task = response.response_body
 
-    while not response.response_body.is_completed():
+    while not task.is_completed():
 
-        if response.response_body.is_waiting() and not quiet_waiting:
+        if task.is_waiting() and not quiet_waiting:
             begin_spinner.next(_('Waiting to begin next step'))
         else:
-            renderer.display_report(response.response_body.progress)
-
-        time.sleep(poll_frequency_in_seconds)
+            renderer.display_report(task.progress)
 
-        response = context.server.tasks.get_task(response.response_body.task_id)
+        task = poll_task(context, task)
 
     # Even after completion, we still want to display the report one last
     # time in case there was no poll between, say, the middle of the
     # package download and when the task itself reports as finished. We
     # don't want to leave the UI in that half-finished state so this final
     # call is to clean up and render the completed report.
-    renderer.display_report(response.response_body.progress)
+    renderer.display_report(task.progress)
 
-    return response.response_body
+    return task
 
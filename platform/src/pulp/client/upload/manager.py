@@ -22,12 +22,18 @@ import copy
 import os
 import pickle
 import sys
+import threading
+import time
+from Queue import Queue, Empty
 
 from pulp.client.lock import LockFile
+from pulp.common.util import calculate_checksum, DEFAULT_CHECKSUM_TYPE
 
 # -- constants ----------------------------------------------------------------
 
 DEFAULT_CHUNKSIZE = 1048576 # 1 MB per upload call
+DEFAULT_CONCURRENCY = 4 # upload calls in flight at once
+TRACKER_SAVE_INTERVAL = 1.0 # seconds between tracker saves during an upload
 
 # -- exceptions ---------------------------------------------------------------
 
@@ -84,7 +90,8 @@ class UploadManager(object):
     on disk state files.
     """
 
-    def __init__(self, upload_working_dir, bindings, chunk_size=DEFAULT_CHUNKSIZE):
+    def __init__(self, upload_working_dir, bindings, chunk_size=DEFAULT_CHUNKSIZE,
+                 concurrency=DEFAULT_CONCURRENCY, deduplicate=True):
         """
         @param upload_working_dir: directory in which to store client-side files
                to track upload requests; if it doesn't exist it will be created
@@ -97,10 +104,20 @@ class UploadManager(object):
         @param chunk_size: size in bytes of data to upload on each call to the
                server
         @type  chunk_size: int
+
+        @param concurrency: maximum number of upload calls to the server in
+               flight at once for a single upload
+        @type  concurrency: int
+
+        @param deduplicate: if true, the server is asked whether it already has
+               each file to upload before its bits are sent
+        @type  deduplicate: bool
         """
         self.upload_working_dir = upload_working_dir
         self.bindings = bindings
         self.chunk_size = chunk_size
+        self.concurrency = max(1, concurrency)
+        self.deduplicate = deduplicate
 
         # Internal state
         self.tracker_files = {}
@@ -134,6 +151,12 @@ class UploadManager(object):
         be sent to the server once the upload itself has completed as part of
         the import_upload call.
 
+        If deduplication is enabled, the file's checksum is calculated first
+        and the server is asked whether it has a unit with the same unit key
+        and checksum. If it does, the upload is tracked as already finished:
+        the upload call sends no bits and the import_upload call asks the
+        server to import its existing unit instead of the upload.
+
         @param filename: full path to the file on disk to upload; None if the
                manager is being used to track a purely metadata unit
         @type  filename: str, None
@@ -156,7 +179,21 @@ class UploadManager(object):
         """
         self._verify_initialized()
 
-        response = self.bindings.uploads.initialize_upload().response_body
+        # Letting the server know the size allows it to verify the upload is
+        # complete before importing it
+        size = None
+        if filename and os.path.isfile(filename):
+            size = os.path.getsize(filename)
+
+        existing_checksum = None
+        if self.deduplicate and size is not None:
+            existing_checksum = self._find_existing_unit(filename, unit_type_id, unit_key)
+
+        if existing_checksum is not None:
+            # Nothing will be written to the upload on the server
+            response = self.bindings.uploads.initialize_upload().response_body
+        else:
+            response = self.bindings.uploads.initialize_upload(size).response_body
 
         upload_id = response['upload_id']
         location = response['_href']
@@ -173,6 +210,12 @@ class UploadManager(object):
         tracker_file.unit_metadata = unit_metadata
         tracker_file.source_filename = filename
 
+        if existing_checksum is not None:
+            tracker_file.add_completed_range(0, size)
+            tracker_file.is_finished_uploading = True
+            tracker_file.is_duplicate = True
+            tracker_file.checksum_type, tracker_file.checksum = existing_checksum
+
         # Save the tracker file to disk
         tracker_file.save()
 
@@ -186,15 +229,20 @@ class UploadManager(object):
         Begins or resumes the upload process for the given upload request.
         This call will not return until the upload is complete. The other
         expected exit point is a KeyboardError to kill the process. The
-        client-side on disk tracker files will store the current offset and
-        resume the upload from where it left off on the next call to this method.
+        client-side on disk tracker files will store the ranges of the file
+        that have been uploaded and resume the upload with the remaining
+        ranges on the next call to this method.
+
+        The file is uploaded in chunk_size segments, up to concurrency of
+        which are sent to the server at once by a pool of worker threads.
+        Segments may therefore complete out of order.
 
         The callback_func is used to get feedback on the upload process. After
         each successful upload segment call to the server, this function
-        will be invoked with the new offset in the file and the file size
-        (intended to be fed into a progress indicator). As this is called
-        after each upload segment call, the granularity at which it is called
-        depends on the chunk_size value for this instance.
+        will be invoked with the number of bytes of the file uploaded so far
+        and the file size (intended to be fed into a progress indicator). As
+        this is called after each upload segment call, the granularity at
+        which it is called depends on the chunk_size value for this instance.
 
         The callback_func should have a signature of (int, int).
 
@@ -203,6 +251,14 @@ class UploadManager(object):
         running flag is stale, the force parameter will bypass this check and
         start the upload anyway.
 
+        If the pre-flight in initialize_upload found the unit on the server, no
+        bits are sent and the callback is notified once that the whole file is
+        uploaded.
+
+        If a segment fails to upload, no further segments are started and the
+        error is raised once the segments in flight have finished; the ranges
+        that were uploaded are kept in the tracker.
+
         @param upload_id: identifies the upload request
         @type  upload_id: str
 
@@ -231,6 +287,13 @@ class UploadManager(object):
         if not force and tracker_file.is_running:
             raise ConcurrentUploadException()
 
+        # Nothing to send if the pre-flight found the unit on the server
+        if tracker_file.is_duplicate:
+            if callback_func is not None:
+                source_file_size = os.path.getsize(tracker_file.source_filename)
+                callback_func(source_file_size, source_file_size)
+            return
+
         try:
             # Flag the upload request as running so other processes don't
             # attempt to run it as well
@@ -239,22 +302,30 @@ class UploadManager(object):
 
             source_file_size = os.path.getsize(tracker_file.source_filename)
 
-            f = open(tracker_file.source_filename, 'r')
-            while True:
-                # Load the chunk to upload
-                f.seek(tracker_file.offset)
-                data = f.read(self.chunk_size)
-                if not data:
-                    break
+            segments = Queue()
+            for segment in tracker_file.missing_segments(source_file_size, self.chunk_size):
+                segments.put(segment)
 
-                # Server request
-                self.bindings.uploads.upload_segment(upload_id, tracker_file.offset, data)
+            upload = _SegmentUpload(self.bindings, tracker_file, source_file_size, callback_func)
 
-                # Status update and callback notification
-                tracker_file.offset = min(tracker_file.offset + self.chunk_size, source_file_size)
-                tracker_file.save()
+            workers = []
+            for i in range(min(self.concurrency, segments.qsize())):
+                worker = threading.Thread(target=upload.run, args=(segments,))
+                worker.setDaemon(True)
+                workers.append(worker)
+                worker.start()
 
-                callback_func(tracker_file.offset, source_file_size)
+            try:
+                # Join with a timeout so a KeyboardInterrupt is delivered
+                for worker in workers:
+                    while worker.isAlive():
+                        worker.join(0.5)
+            finally:
+                # Don't start any more segments if interrupted
+                upload.cancelled = True
+
+            if upload.exc_info is not None:
+                raise upload.exc_info[0], upload.exc_info[1], upload.exc_info[2]
 
             tracker_file.is_finished_uploading = True
         finally:
@@ -287,6 +358,11 @@ class UploadManager(object):
         if tracker.source_filename and not tracker.is_finished_uploading:
             raise IncompleteUploadException()
 
+        # The pre-flight found the unit on the server; no bits were uploaded
+        if tracker.is_duplicate:
+            return self.bindings.uploads.import_existing_unit(tracker.repo_id, tracker.unit_type_id,
+                       tracker.unit_key, tracker.checksum_type, tracker.checksum)
+
         response = self.bindings.uploads.import_upload(upload_id, tracker.repo_id,
                    tracker.unit_type_id, tracker.unit_key, tracker.unit_metadata)
 
@@ -358,6 +434,29 @@ class UploadManager(object):
         self._uncache_tracker_file(tracker)
         tracker.delete()
 
+    def _find_existing_unit(self, filename, unit_type_id, unit_key):
+        """
+        Upload pre-flight; asks the server whether it has a unit with the
+        given key whose file matches the checksum of the file to upload. The
+        pre-flight is only an optimization, so if it fails for any reason,
+        including servers that don't support it, the file is uploaded.
+
+        @return: tuple of checksum type and checksum if the server has the
+                 unit; None if the file needs to be uploaded
+        @rtype:  tuple or None
+        """
+        checksum = calculate_checksum(filename, DEFAULT_CHECKSUM_TYPE)
+
+        try:
+            response = self.bindings.uploads.find_existing_unit(unit_type_id, unit_key,
+                                                                 DEFAULT_CHECKSUM_TYPE, checksum)
+        except Exception:
+            return None
+
+        if response.response_body is not True:
+            return None
+        return DEFAULT_CHECKSUM_TYPE, checksum
+
     # -- tracker utilities ----------------------------------------------------
 
     def _tracker_filename(self, upload_id):
@@ -393,7 +492,8 @@ class UploadTracker(object):
         # Upload call information
         self.upload_id = None
         self.location = None # URL to the upload request on the server
-        self.offset = None # start of next chunk to upload
+        self.offset = None # end of the contiguous uploaded data from the start of the file
+        self.completed_ranges = [] # [start, end) byte ranges uploaded so far
         self.source_filename = None # path on disk to the file to upload
 
         # Import call information
@@ -405,6 +505,59 @@ class UploadTracker(object):
         # State information
         self.is_running = False
         self.is_finished_uploading = False
+        self.is_duplicate = False # server already had the unit; no bits are sent
+        self.checksum_type = None # checksum the server found the unit by, for duplicates
+        self.checksum = None
+
+    def add_completed_range(self, start, end):
+        """
+        Records that the [start, end) byte range of the source file has been
+        uploaded, merging it with the adjacent completed ranges, and advances
+        the offset over any contiguous data from the start of the file.
+        """
+        merged = []
+        for range_start, range_end in self.completed_ranges:
+            if range_end < start or range_start > end:
+                merged.append([range_start, range_end])
+                continue
+            start = min(start, range_start)
+            end = max(end, range_end)
+        merged.append([start, end])
+        merged.sort()
+        self.completed_ranges = merged
+
+        if merged[0][0] == 0:
+            self.offset = merged[0][1]
+
+    def completed_bytes(self):
+        """
+        @return: number of bytes of the source file uploaded so far
+        @rtype:  int
+        """
+        return sum(end - start for start, end in self.completed_ranges)
+
+    def missing_segments(self, file_size, chunk_size):
+        """
+        Lists the segments of the source file that still need to be uploaded.
+
+        @param file_size: size of the source file
+        @type  file_size: int
+
+        @param chunk_size: maximum size of a segment
+        @type  chunk_size: int
+
+        @return: list of (offset, length) tuples in file order
+        @rtype:  list
+        """
+        segments = []
+        position = 0
+        for start, end in self.completed_ranges + [[file_size, file_size]]:
+            while position < min(start, file_size):
+                length = min(chunk_size, start - position)
+                segments.append((position, length))
+                position += length
+            position = max(position, end)
+        return segments
 
     def save(self):
         """
@@ -445,4 +598,88 @@ class UploadTracker(object):
         status_file = pickle.load(f)
         f.close()
 
+        # Trackers saved before ranges were tracked only carry an offset
+        if not hasattr(status_file, 'completed_ranges'):
+            status_file.completed_ranges = []
+            if status_file.offset:
+                status_file.completed_ranges = [[0, status_file.offset]]
+
+        if not hasattr(status_file, 'is_duplicate'):
+            status_file.is_duplicate = False
+            status_file.checksum_type = None
+            status_file.checksum = None
+
         return status_file
+
+
+class _SegmentUpload(object):
+    """
+    Shared state of the worker threads uploading the segments of a single
+    file. Each worker reads its segments through its own file handle; the
+    tracker is updated under a lock and saved at most once per
+    TRACKER_SAVE_INTERVAL, as well as at the end of the upload.
+    """
+
+    def __init__(self, bindings, tracker_file, source_file_size, callback_func):
+        self.bindings = bindings
+        self.tracker_file = tracker_file
+        self.source_file_size = source_file_size
+        self.callback_func = callback_func
+
+        self.cancelled = False
+        self.exc_info = None
+        self.last_save = time.time()
+        self.lock = threading.Lock()
+
+    def run(self, segments):
+        """
+        Worker thread loop; uploads segments from the queue until it is empty,
+        an upload call fails, or the upload is cancelled.
+
+        @param segments: queue of (offset, length) tuples to upload
+        @type  segments: Queue
+        """
+        f = open(self.tracker_file.source_filename, 'r')
+        try:
+            while not self.cancelled:
+                try:
+                    offset, length = segments.get_nowait()
+                except Empty:
+                    break
+
+                f.seek(offset)
+                data = f.read(length)
+
+                try:
+                    self.bindings.uploads.upload_segment(self.tracker_file.upload_id, offset, data)
+                except Exception:
+                    self.lock.acquire()
+                    try:
+                        if self.exc_info is None:
+                            self.exc_info = sys.exc_info()
+                        self.cancelled = True
+                    finally:
+                        self.lock.release()
+                    break
+
+                self._segment_uploaded(offset, len(data))
+        finally:
+            f.close()
+
+    def _segment_uploaded(self, offset, length):
+        """
+        Records the uploaded segment and notifies the callback.
+        """
+        self.lock.acquire()
+        try:
+            self.tracker_file.add_completed_range(offset, offset + length)
+
+            now = time.time()
+            if now - self.last_save >= TRACKER_SAVE_INTERVAL:
+                self.tracker_file.save()
+                self.last_save = now
+
+            if self.callback_func is not None:
+                self.callback_func(self.tracker_file.completed_bytes(), self.source_file_size)
+        finally:
+            self.lock.release()
@@ -12,12 +12,21 @@
 # see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
 
 import logging
+import os
+import shutil
+import threading
+import time
+import weakref
 
 from pulp.common.download.listener import DownloadEventListener
+from pulp.common.download.report import DownloadBatchReport
 
 
 _LOG = logging.getLogger(__name__)
 
+# minimum seconds between progress events for a download, or for a batch
+DEFAULT_PROGRESS_INTERVAL = 1.0
+
 
 class DownloadBackend(object):
     """
@@ -43,6 +52,18 @@ class DownloadBackend(object):
         self.event_listener = event_listener or DownloadEventListener()
         self.is_cancelled = False
 
+        # report -> (time, bytes downloaded) of its last progress event
+        self._progress_events = weakref.WeakKeyDictionary()
+        self._progress_lock = threading.Lock()
+        self._batch_report = None
+        self._last_batch_progress = 0
+
+    @property
+    def progress_interval(self):
+        if self.config.progress_interval is None:
+            return DEFAULT_PROGRESS_INTERVAL
+        return self.config.progress_interval
+
     # download api -------------------------------------------------------------
 
     def download(self, request_list):
@@ -73,6 +94,11 @@ class DownloadBackend(object):
         :param report_list: list of download reports
         :type report_list: list of pulp.common.download.report.DownloadReport
         """
+        self._batch_report = report_list
+        # the first batch progress event is fired a progress interval in
+        self._last_batch_progress = time.time()
+        if isinstance(report_list, DownloadBatchReport) and report_list.start_time is None:
+            report_list.start_time = time.time()
         self._fire_event_to_listener(self.event_listener.batch_started, report_list)
 
     def fire_batch_finished(self, report_list):
@@ -84,6 +110,21 @@ class DownloadBackend(object):
         :type report_list: list of pulp.common.download.report.DownloadReport
         """
         self._fire_event_to_listener(self.event_listener.batch_finished, report_list)
+        self._batch_report = None
+
+    def fire_batch_progress(self, batch_report):
+        """
+        Fire the ``batch_progress`` event using the batch report provided.
+        Listeners written before the event was introduced may not implement
+        it; the event is skipped for them.
+
+        :param batch_report: batch download report
+        :type batch_report: pulp.common.download.report.DownloadBatchReport
+        """
+        callback = getattr(self.event_listener, 'batch_progress', None)
+        if callback is None:
+            return
+        self._fire_event_to_listener(callback, batch_report)
 
     def fire_download_started(self, report):
         """
@@ -98,10 +139,44 @@ class DownloadBackend(object):
         """
         Fire the ``download_progress`` event using the download report provided.
 
+        Progress events are coalesced: they are fired for a download at most
+        once every progress interval, along with its first and final progress,
+        and the ``batch_progress`` event is fired, with the aggregate progress
+        of the batch, once every progress interval after the batch started.
+
         :param report: download reports
         :type report: pulp.common.download.report.DownloadReport
         """
-        self._fire_event_to_listener(self.event_listener.download_progress, report)
+        now = time.time()
+        interval = self.progress_interval
+        fire_download_progress = True
+        fire_batch_progress = False
+
+        self._progress_lock.acquire()
+        try:
+            last_event = self._progress_events.get(report)
+            if last_event is not None:
+                last_time, last_bytes = last_event
+                if report.bytes_downloaded == last_bytes:
+                    return
+                complete = report.total_bytes and report.bytes_downloaded >= report.total_bytes
+                if now - last_time < interval and not complete:
+                    fire_download_progress = False
+            if fire_download_progress:
+                self._progress_events[report] = (now, report.bytes_downloaded)
+
+            # the batch's progress is throttled independently of the download's
+            if self._batch_report is not None and now - self._last_batch_progress >= interval:
+                self._last_batch_progress = now
+                fire_batch_progress = True
+        finally:
+            self._progress_lock.release()
+
+        if fire_download_progress:
+            self._fire_event_to_listener(self.event_listener.download_progress, report)
+
+        if fire_batch_progress:
+            self.fire_batch_progress(self._batch_report)
 
     def fire_download_succeeded(self, report):
         """
@@ -129,3 +204,28 @@ class DownloadBackend(object):
         except Exception, e:
             _LOG.exception(e)
 
+
+
+# download file utilities ------------------------------------------------------
+
+def open_download_file(file_path, append=False):
+    """
+    Open a file for a download to be written to. Existing files may be
+    hardlinks to cached or mirrored files, so they are never written through:
+    they are replaced, or broken off into a copy of their own when appending.
+
+    :param file_path: path to the downloaded file
+    :type file_path: str
+    :param append: True to append to an existing (partial) file
+    :type append: bool
+    :return: open file object
+    :rtype: file
+    """
+    if os.path.exists(file_path):
+        if not append:
+            os.remove(file_path)
+        elif os.stat(file_path).st_nlink > 1:
+            tmp_path = file_path + '.tmp'
+            shutil.copyfile(file_path, tmp_path)
+            os.rename(tmp_path, file_path)
+    return open(file_path, append and 'ab' or 'wb')
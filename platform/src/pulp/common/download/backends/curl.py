@@ -12,15 +12,21 @@
 # see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
 
 import datetime
+import heapq
+import itertools
 import logging
+import os
 import shutil
 import signal
 import tempfile
+import time
 
 import pycurl
 
 from pulp.common.download import report as download_report
-from pulp.common.download.backends.base import DownloadBackend
+from pulp.common.download import verification
+from pulp.common.download.backends import hosts
+from pulp.common.download.backends.base import DownloadBackend, open_download_file
 
 # default constants ------------------------------------------------------------
 
@@ -28,6 +34,9 @@ _LOG = logging.getLogger(__name__)
 
 # backend constants
 DEFAULT_MAX_CONCURRENT = 5
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_RETRY_BACKOFF = 1.0 # seconds
+DEFAULT_MAX_RETRY_BACKOFF = 60.0 # seconds
 
 # multi handle constants
 DEFAULT_SELECT_TIMEOUT = 1.0
@@ -44,6 +53,11 @@ DEFAULT_NO_PROGRESS = 0
 DEFAULT_SSL_VERIFY_PEER = 1
 DEFAULT_SSL_VERIFY_HOST = 2
 
+HTTP_NOT_MODIFIED = 304
+
+# curl error returned when a server does not honor a resume request
+E_RANGE_ERROR = getattr(pycurl, 'E_RANGE_ERROR', getattr(pycurl, 'E_HTTP_RANGE_ERROR', 33))
+
 # curl-based http download backend ---------------------------------------------
 
 class HTTPCurlDownloadBackend(DownloadBackend):
@@ -52,12 +66,43 @@ class HTTPCurlDownloadBackend(DownloadBackend):
     def max_concurrent(self):
         return self.config.max_concurrent or DEFAULT_MAX_CONCURRENT
 
+    @property
+    def max_retries(self):
+        if self.config.max_retries is None:
+            return DEFAULT_MAX_RETRIES
+        return self.config.max_retries
+
+    @property
+    def retry_backoff(self):
+        if self.config.retry_backoff is None:
+            return DEFAULT_RETRY_BACKOFF
+        return self.config.retry_backoff
+
+    @property
+    def max_retry_backoff(self):
+        if self.config.max_retry_backoff is None:
+            return DEFAULT_MAX_RETRY_BACKOFF
+        return self.config.max_retry_backoff
+
+    @property
+    def speed_limited(self):
+        return self.config.max_speed is not None or self.config.max_speed_per_host is not None
+
     def download(self, request_list):
 
-        # this list is backwards so we can pop() efficiently and maintain the original order
-        request_queue = [(r, download_report.DownloadReport.from_download_request(r))
-                         for r in request_list[::-1]]
-        request_cache = []
+        batch_report = download_report.DownloadBatchReport()
+        request_queue = hosts.HostScheduler(self.config.max_concurrent_per_host)
+        host_statistics = hosts.HostStatistics()
+
+        for request in request_list:
+            report = download_report.DownloadReport.from_download_request(request)
+            batch_report.append(report)
+            request_queue.put(request, report)
+
+        # heap of (retry time, sequence, request, report) for failed downloads
+        # waiting out their backoff before being put back in the request queue
+        retry_queue = []
+        retry_sequence = itertools.count()
 
         total_requests = len(request_queue)
         processed_requests = 0
@@ -65,7 +110,7 @@ class HTTPCurlDownloadBackend(DownloadBackend):
         multi_handle = self._build_multi_handle()
         free_handles = multi_handle.handles[:]
 
-        self.fire_batch_started([i[1] for i in request_queue[::-1]])
+        self.fire_batch_started(batch_report)
         self._set_signals()
 
         # main request processing loop
@@ -74,18 +119,57 @@ class HTTPCurlDownloadBackend(DownloadBackend):
 
             try:
 
-                # populate max_concurrent downloads into the pycurl multi handle
-                while request_queue and free_handles:
-                    request, report = request_queue.pop()
-                    request_cache.append((request, report))
+                # retries whose backoff has expired go to the front of their host's queue
+                now = time.time()
+                while retry_queue and retry_queue[0][0] <= now:
+                    retry_time, sequence, request, report = heapq.heappop(retry_queue)
+                    request_queue.put(request, report, front=True)
 
-                    report.state = download_report.DOWNLOAD_DOWNLOADING
-                    report.start_time = datetime.datetime.now()
-                    self.fire_download_started(report)
+                # populate max_concurrent downloads into the pycurl multi handle,
+                # round-robin across the hosts that are under their connection cap
+                handles_added = False
+
+                while free_handles:
+                    next_request = request_queue.get()
+                    if next_request is None:
+                        break
+                    request, report = next_request
+
+                    if report.attempts == 0:
+                        report.state = download_report.DOWNLOAD_DOWNLOADING
+                        report.start_time = datetime.datetime.now()
+                        self.fire_download_started(report)
+
+                    report.attempts += 1
+
+                    try:
+                        verifier = verification.StreamingVerifier(request)
+
+                    except verification.UnsupportedChecksumType, e:
+                        report.finish_time = datetime.datetime.now()
+                        report.state = download_report.DOWNLOAD_FAILED
+                        report.error_report['error_message'] = str(e)
+                        self.fire_download_failed(report)
+                        request_queue.release(request)
+                        processed_requests += 1
+                        continue
 
                     easy_handle = free_handles.pop()
-                    self._set_easy_handle_download(easy_handle, request, report)
+                    self._set_easy_handle_download(easy_handle, request, report, verifier)
                     multi_handle.add_handle(easy_handle)
+                    host_statistics.started(hosts.host_for_url(request.url))
+                    handles_added = True
+
+                if processed_requests == total_requests:
+                    break
+
+                if handles_added and self.speed_limited:
+                    self._set_speed_limits(multi_handle)
+
+                # nothing in flight: wait for the next retry's backoff to expire
+                if len(free_handles) == len(multi_handle.handles):
+                    time.sleep(max(0, min(retry_queue[0][0] - time.time(), DEFAULT_SELECT_TIMEOUT)))
+                    continue
 
                 # i/o loop for current set of downloads
                 multi_handle.select(DEFAULT_SELECT_TIMEOUT)
@@ -99,34 +183,62 @@ class HTTPCurlDownloadBackend(DownloadBackend):
                 while True:
                     num_q, ok_list, err_list = multi_handle.info_read()
 
-                    # XXX these loops contain duplicate code; which just pisses me off
+                    completed_list = [(h, None, None) for h in ok_list] + err_list
 
-                    for easy_handle in ok_list:
-                        easy_handle.report.finish_time = datetime.datetime.now()
-                        easy_handle.report.state = download_report.DOWNLOAD_SUCCEEDED
+                    for easy_handle, err_code, err_msg in completed_list:
+                        request = easy_handle.request
+                        report = easy_handle.report
+                        report.error_report = {}
 
-                        self.fire_download_succeeded(easy_handle.report)
+                        report.response_code = easy_handle.getinfo(pycurl.HTTP_CODE)
 
-                        multi_handle.remove_handle(easy_handle)
-                        self._clear_easy_handle_download(easy_handle)
-                        free_handles.append(easy_handle)
+                        if err_code is None and report.response_code == HTTP_NOT_MODIFIED:
+                            # conditional request for a file the caller already has
+                            pass
 
-                    for easy_handle, err_code, err_msg in err_list:
-                        easy_handle.report.finish_time = datetime.datetime.now()
-                        easy_handle.report.state = download_report.DOWNLOAD_FAILED
+                        elif err_code is None:
+                            # the checksum and size have been computed as the file
+                            # was written, so there's no need to re-read the file
+                            report.error_report.update(easy_handle.verifier.verify(report))
 
-                        response_code = easy_handle.getinfo(pycurl.HTTP_CODE)
-                        easy_handle.report.error_report['response_code'] = response_code
-                        easy_handle.report.error_report['error_code'] = err_code
-                        easy_handle.report.error_report['error_message'] = err_msg
+                        else:
+                            report.error_report['response_code'] = report.response_code
+                            report.error_report['error_code'] = err_code
+                            report.error_report['error_message'] = err_msg
 
-                        self.fire_download_failed(easy_handle.report)
+                        host_statistics.finished(hosts.host_for_url(request.url),
+                                                 easy_handle.write_functor.bytes_written,
+                                                 not report.error_report)
+                        request_queue.release(request)
 
                         multi_handle.remove_handle(easy_handle)
                         self._clear_easy_handle_download(easy_handle)
                         free_handles.append(easy_handle)
 
-                    processed_requests += (len(ok_list) + len(err_list))
+                        if not report.error_report:
+                            report.finish_time = datetime.datetime.now()
+                            report.state = download_report.DOWNLOAD_SUCCEEDED
+                            self.fire_download_succeeded(report)
+                            processed_requests += 1
+                            continue
+
+                        # a bad file or a server that cannot resume means that
+                        # the next attempt has to start over from the beginning
+                        if err_code in (None, E_RANGE_ERROR):
+                            verification.remove_partial_file(report.file_path)
+
+                        if report.attempts <= self.max_retries:
+                            retry_time = time.time() + self._retry_delay(report.attempts)
+                            heapq.heappush(retry_queue, (retry_time, retry_sequence.next(), request, report))
+                            continue
+
+                        report.finish_time = datetime.datetime.now()
+                        report.state = download_report.DOWNLOAD_FAILED
+                        self.fire_download_failed(report)
+                        processed_requests += 1
+
+                    if completed_list and self.speed_limited:
+                        self._set_speed_limits(multi_handle)
 
                     if num_q == 0:
                         break
@@ -136,7 +248,31 @@ class HTTPCurlDownloadBackend(DownloadBackend):
                 break
 
         self._clear_signals()
-        self.fire_batch_finished([i[1] for i in request_cache])
+        batch_report.host_stats = host_statistics.report()
+        self.fire_batch_finished(batch_report)
+
+    def _set_speed_limits(self, multi_handle):
+        # share the global and per-host bandwidth limits evenly between the
+        # active downloads; curl enforces the resulting per-handle limit
+        active_handles = [h for h in multi_handle.handles if h.request is not None]
+        host_counts = {}
+        for easy_handle in active_handles:
+            host = hosts.host_for_url(easy_handle.request.url)
+            host_counts[host] = host_counts.get(host, 0) + 1
+
+        for easy_handle in active_handles:
+            limits = []
+            if self.config.max_speed is not None:
+                limits.append(self.config.max_speed / len(active_handles))
+            if self.config.max_speed_per_host is not None:
+                host = hosts.host_for_url(easy_handle.request.url)
+                limits.append(self.config.max_speed_per_host / host_counts[host])
+            # a limit of 0 would mean unlimited to curl
+            easy_handle.setopt(pycurl.MAX_RECV_SPEED_LARGE, max(1, int(min(limits))))
+
+    def _retry_delay(self, attempts):
+        # exponential backoff: retry_backoff, 2 * retry_backoff, 4 * retry_backoff, ...
+        return min(self.retry_backoff * (2 ** (attempts - 1)), self.max_retry_backoff)
 
     # signal utility methods ---------------------------------------------------
 
@@ -165,6 +301,8 @@ class HTTPCurlDownloadBackend(DownloadBackend):
         easy_handle = pycurl.Curl()
         easy_handle.request = None
         easy_handle.report = None
+        easy_handle.verifier = None
+        easy_handle.write_functor = None
         easy_handle.fp = None
 
         self._add_connection_configuration(easy_handle)
@@ -190,16 +328,39 @@ class HTTPCurlDownloadBackend(DownloadBackend):
 
     # pycurl easy handle download management -----------------------------------
 
-    def _set_easy_handle_download(self, easy_handle, request, report):
+    def _set_easy_handle_download(self, easy_handle, request, report, verifier):
         # store this on the handle so that it's easier to track
         easy_handle.request = request
         easy_handle.report = report
-        easy_handle.fp = open(request.file_path, 'wb')
+        easy_handle.verifier = verifier
+
+        # retries pick up where the last attempt left off; so can the first
+        # attempt, if the configuration says partial files can be trusted
+        resume_from = 0
+        if report.attempts > 1 or self.config.resume_partial:
+            resume_from = self._partial_file_size(request.file_path)
+
+        if resume_from > 0:
+            # the verifier has to account for the bytes that are already there
+            verifier.update_from_file(request.file_path)
+            easy_handle.fp = open_download_file(request.file_path, append=True)
+        else:
+            easy_handle.fp = open_download_file(request.file_path)
 
         easy_handle.setopt(pycurl.URL, request.url)
-        easy_handle.setopt(pycurl.WRITEDATA, easy_handle.fp)
+        easy_handle.setopt(pycurl.RESUME_FROM_LARGE, resume_from)
+
+        headers = ['%s: %s' % (k, v) for k, v in request.headers.items()]
+        easy_handle.setopt(pycurl.HTTPHEADER, headers)
+
+        report.headers = {}
+        header_functor = CurlDownloadHeaderFunctor(report)
+        easy_handle.setopt(pycurl.HEADERFUNCTION, header_functor)
 
-        progress_functor = CurlDownloadProgressFunctor(report, self.fire_download_progress)
+        easy_handle.write_functor = CurlDownloadWriteFunctor(easy_handle.fp, verifier)
+        easy_handle.setopt(pycurl.WRITEFUNCTION, easy_handle.write_functor)
+
+        progress_functor = CurlDownloadProgressFunctor(report, self.fire_download_progress, resume_from)
         easy_handle.setopt(pycurl.PROGRESSFUNCTION, progress_functor)
 
         return easy_handle
@@ -207,12 +368,20 @@ class HTTPCurlDownloadBackend(DownloadBackend):
     def _clear_easy_handle_download(self, easy_handle):
         easy_handle.request = None
         easy_handle.report = None
+        easy_handle.verifier = None
+        easy_handle.write_functor = None
 
         easy_handle.fp.close()
         easy_handle.fp = None
 
         return easy_handle
 
+    def _partial_file_size(self, file_path):
+        try:
+            return os.stat(file_path).st_size
+        except OSError:
+            return 0
+
 # curl-based https download backend --------------------------------------------
 
 class HTTPSCurlDownloadBackend(HTTPCurlDownloadBackend):
@@ -254,7 +423,10 @@ class HTTPSCurlDownloadBackend(HTTPCurlDownloadBackend):
         return easy_handle
 
     def _add_ssl_configuration(self, easy_handle):
-        # TODO (jconnor 2013-01-22) make this configurable
+        if self.config.ssl_validation is False:
+            easy_handle.setopt(pycurl.SSL_VERIFYPEER, 0)
+            easy_handle.setopt(pycurl.SSL_VERIFYHOST, 0)
+            return
         easy_handle.setopt(pycurl.SSL_VERIFYPEER, DEFAULT_SSL_VERIFY_PEER)
         easy_handle.setopt(pycurl.SSL_VERIFYHOST, DEFAULT_SSL_VERIFY_HOST)
 
@@ -277,12 +449,47 @@ class HTTPSCurlDownloadBackend(HTTPCurlDownloadBackend):
 
 class CurlDownloadProgressFunctor(object):
 
-    def __init__(self, report, progress_callback):
+    def __init__(self, report, progress_callback, offset=0):
         self.report = report
         self.progress_callback = progress_callback
+        # bytes already on disk from a previous attempt; curl only reports the current transfer
+        self.offset = offset
 
     def __call__(self, download_t, download_d, upload_t, upload_d):
-        self.report.total_bytes = download_t
-        self.report.bytes_downloaded = download_d
+        # the total is 0 until curl knows it; keep any expected size until then
+        if download_t:
+            self.report.total_bytes = download_t + self.offset
+        self.report.bytes_downloaded = download_d + self.offset
         self.progress_callback(self.report)
 
+
+# download write callback functor ----------------------------------------------
+
+class CurlDownloadWriteFunctor(object):
+
+    def __init__(self, fp, verifier):
+        self.fp = fp
+        self.verifier = verifier
+        self.bytes_written = 0
+
+    def __call__(self, data):
+        self.fp.write(data)
+        self.verifier.update(data)
+        self.bytes_written += len(data)
+
+# download header callback functor ---------------------------------------------
+
+class CurlDownloadHeaderFunctor(object):
+
+    def __init__(self, report):
+        self.report = report
+
+    def __call__(self, header_line):
+        # a new status line means a redirect was followed, start over
+        if header_line.startswith('HTTP/'):
+            self.report.headers = {}
+            return
+        if ':' not in header_line:
+            return
+        name, value = header_line.split(':', 1)
+        self.report.headers[name.strip().lower()] = value.strip()
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the License
+# (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied, including the
+# implied warranties of MERCHANTABILITY, NON-INFRINGEMENT, or FITNESS FOR A
+# PARTICULAR PURPOSE.
+# You should have received a copy of GPLv2 along with this software; if not,
+# see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
+
+import threading
+import time
+import urlparse
+from collections import deque
+
+# host utilities ---------------------------------------------------------------
+
+def host_for_url(url):
+    """
+    :param url: url of a download
+    :type url: str
+    :return: host (and port, if any) the url is served from, in lower case
+    :rtype: str
+    """
+    return urlparse.urlsplit(url)[1].lower()
+
+# host-aware request scheduler -------------------------------------------------
+
+class HostScheduler(object):
+    """
+    Queues download requests per host and hands them out round-robin across
+    the hosts, never exceeding the per-host connection cap. This keeps a
+    single slow host from occupying every connection of a backend.
+
+    :ivar max_per_host: maximum number of concurrent downloads from any one host (None for no cap)
+    """
+
+    def __init__(self, max_per_host=None):
+        """
+        :param max_per_host: maximum number of concurrent downloads from any one host
+        :type max_per_host: int or None
+        """
+        self.max_per_host = max_per_host
+
+        # host -> deque of (request, report)
+        self._queues = {}
+        # round-robin order of the hosts with queued requests
+        self._hosts = deque()
+        # host -> number of downloads handed out and not yet released
+        self._active = {}
+        self._queued = 0
+
+    def __len__(self):
+        return self._queued
+
+    def put(self, request, report, front=False):
+        """
+        Queue a request.
+
+        :param request: download request
+        :type request: pulp.common.download.request.DownloadRequest
+        :param report: report for the download request
+        :type report: pulp.common.download.report.DownloadReport
+        :param front: queue the request ahead of the host's other requests, as for retries
+        :type front: bool
+        """
+        host = host_for_url(request.url)
+        queue = self._queues.get(host)
+        if queue is None:
+            queue = self._queues[host] = deque()
+            self._hosts.append(host)
+        if front:
+            queue.appendleft((request, report))
+        else:
+            queue.append((request, report))
+        self._queued += 1
+
+    def get(self):
+        """
+        Get the next request from the next host, in round-robin order, that
+        is under its connection cap. The request must be released once its
+        download is finished.
+
+        :return: tuple of (request, report), None if no host can take another download
+        :rtype: tuple or None
+        """
+        for i in range(len(self._hosts)):
+            host = self._hosts[0]
+            self._hosts.rotate(-1)
+            if self.max_per_host is not None and self._active.get(host, 0) >= self.max_per_host:
+                continue
+            queue = self._queues[host]
+            request, report = queue.popleft()
+            if not queue:
+                self._queues.pop(host)
+                self._hosts.remove(host)
+            self._active[host] = self._active.get(host, 0) + 1
+            self._queued -= 1
+            return request, report
+        return None
+
+    def release(self, request):
+        """
+        Free the connection used by a request handed out by get.
+
+        :param request: download request
+        :type request: pulp.common.download.request.DownloadRequest
+        """
+        host = host_for_url(request.url)
+        self._active[host] -= 1
+        if not self._active[host]:
+            self._active.pop(host)
+
+    def active(self, host):
+        """
+        :param host: host as returned by host_for_url
+        :type host: str
+        :return: number of downloads from the host currently handed out
+        :rtype: int
+        """
+        return self._active.get(host, 0)
+
+# per-host throughput statistics -----------------------------------------------
+
+class HostStatistics(object):
+    """
+    Collects the per-host throughput of a batch of downloads. A host's
+    throughput is measured over the time it had at least one download in
+    progress.
+    """
+
+    def __init__(self):
+        # host -> stats dictionary
+        self._stats = {}
+        # host -> (number of downloads in progress, time the host became busy)
+        self._busy = {}
+
+    def _host_stats(self, host):
+        stats = self._stats.get(host)
+        if stats is None:
+            stats = self._stats[host] = {'attempts': 0,
+                                         'succeeded': 0,
+                                         'failed': 0,
+                                         'bytes': 0,
+                                         'busy_seconds': 0.0,
+                                         'bytes_per_second': 0.0}
+        return stats
+
+    def started(self, host):
+        """
+        Record the start of a download attempt from a host.
+        """
+        self._host_stats(host)['attempts'] += 1
+        count, busy_since = self._busy.get(host, (0, None))
+        if count == 0:
+            busy_since = time.time()
+        self._busy[host] = (count + 1, busy_since)
+
+    def finished(self, host, bytes, succeeded):
+        """
+        Record the end of a download attempt from a host.
+
+        :param bytes: number of bytes transferred by the attempt
+        :type bytes: int
+        :param succeeded: True if the attempt succeeded
+        :type succeeded: bool
+        """
+        stats = self._host_stats(host)
+        stats['bytes'] += bytes
+        if succeeded:
+            stats['succeeded'] += 1
+        else:
+            stats['failed'] += 1
+
+        count, busy_since = self._busy[host]
+        if count == 1:
+            stats['busy_seconds'] += time.time() - busy_since
+            self._busy.pop(host)
+        else:
+            self._busy[host] = (count - 1, busy_since)
+
+        if stats['busy_seconds'] > 0:
+            stats['bytes_per_second'] = stats['bytes'] / stats['busy_seconds']
+
+    def report(self):
+        """
+        :return: dictionary of host -> statistics (attempts, succeeded, failed, bytes, busy_seconds, bytes_per_second)
+        :rtype: dict
+        """
+        return dict((host, stats.copy()) for host, stats in self._stats.items())
+
+# bandwidth limiting -----------------------------------------------------------
+
+class RateLimiter(object):
+    """
+    Token bucket limiting the rate at which bytes are transferred. It may be
+    shared by any number of threads, which share the rate between them.
+
+    :ivar rate: maximum rate, in bytes per second
+    """
+
+    def __init__(self, rate):
+        """
+        :param rate: maximum rate, in bytes per second
+        :type rate: int
+        """
+        self.rate = float(rate)
+        # allow up to one second's worth of bytes in a burst
+        self._tokens = self.rate
+        self._last_fill = time.time()
+        self._lock = threading.Lock()
+
+    def consume(self, bytes):
+        """
+        Account for transferred bytes, sleeping as long as necessary to keep
+        the transfer rate at or under the limit.
+
+        :param bytes: number of bytes transferred
+        :type bytes: int
+        """
+        self._lock.acquire()
+        try:
+            now = time.time()
+            self._tokens = min(self.rate, self._tokens + (now - self._last_fill) * self.rate)
+            self._last_fill = now
+            self._tokens -= bytes
+            delay = 0.0
+            if self._tokens < 0:
+                delay = -self._tokens / self.rate
+        finally:
+            self._lock.release()
+
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the License
+# (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied, including the
+# implied warranties of MERCHANTABILITY, NON-INFRINGEMENT, or FITNESS FOR A
+# PARTICULAR PURPOSE.
+# You should have received a copy of GPLv2 along with this software; if not,
+# see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
+
+import errno
+import os
+import shutil
+import urllib
+import urlparse
+
+from pulp.common.download.backends.base import open_download_file
+from pulp.common.download.backends.threaded import ThreadedDownloadBackend, TransferError
+
+# local file download backend --------------------------------------------------
+
+class FileDownloadBackend(ThreadedDownloadBackend):
+    """
+    Download backend for file:// urls, such as mirrors mounted over NFS. Files
+    are hardlinked into place when possible and copied otherwise, without any
+    network protocol overhead.
+
+    Hardlinking can be disabled with the ``link_files`` configuration value.
+    """
+
+    @property
+    def link_files(self):
+        return self.config.link_files is None or self.config.link_files
+
+    def _transfer(self, request, report, verifier, rate_limiters):
+        source_path = file_path_from_url(request.url)
+
+        try:
+            report.total_bytes = os.stat(source_path).st_size
+            report.bytes_downloaded = 0
+
+            # a bandwidth limit only makes sense if the bytes are copied
+            if self.link_files and not rate_limiters and _link(source_path, request.file_path):
+                if verifier.digest() is None:
+                    verifier.bytes_written = report.total_bytes
+                else:
+                    verifier.update_from_file(request.file_path)
+                report.bytes_downloaded = report.total_bytes
+                self.fire_download_progress(report)
+                return
+
+            input_fp = open(source_path, 'rb')
+            try:
+                output_fp = open_download_file(request.file_path)
+                try:
+                    self._copy(input_fp, output_fp, report, verifier, rate_limiters)
+                finally:
+                    output_fp.close()
+            finally:
+                input_fp.close()
+
+        except (IOError, OSError), e:
+            raise TransferError({'error_code': e.errno, 'error_message': str(e)})
+
+# utility functions ------------------------------------------------------------
+
+def file_path_from_url(url):
+    """
+    :param url: file:// url
+    :type url: str
+    :return: local path the url refers to
+    :rtype: str
+    """
+    return urllib.url2pathname(urlparse.urlsplit(url)[2])
+
+
+def link_or_copy(source_path, destination_path):
+    """
+    Hardlink the source file to the destination path, copying it if a link
+    cannot be made. Any existing destination file is replaced and any missing
+    destination directories are created.
+
+    :param source_path: path to the existing file
+    :type source_path: str
+    :param destination_path: path to link or copy the file to
+    :type destination_path: str
+    """
+    if not _link(source_path, destination_path):
+        shutil.copyfile(source_path, destination_path)
+
+
+def _link(source_path, destination_path):
+    # returns False if a link cannot be made; cross device, unsupported, etc.
+    destination_dir = os.path.dirname(destination_path)
+    if destination_dir and not os.path.exists(destination_dir):
+        os.makedirs(destination_dir)
+    if os.path.exists(destination_path):
+        os.remove(destination_path)
+    try:
+        os.link(source_path, destination_path)
+    except OSError, e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+        return False
+    return True
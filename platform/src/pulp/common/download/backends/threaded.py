@@ -0,0 +1,554 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the License
+# (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied, including the
+# implied warranties of MERCHANTABILITY, NON-INFRINGEMENT, or FITNESS FOR A
+# PARTICULAR PURPOSE.
+# You should have received a copy of GPLv2 along with this software; if not,
+# see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
+
+import datetime
+import heapq
+import httplib
+import itertools
+import logging
+import os
+import shutil
+import socket
+import ssl
+import tempfile
+import threading
+import time
+import urllib2
+
+from pulp.common.download import report as download_report
+from pulp.common.download import verification
+from pulp.common.download.backends import hosts
+from pulp.common.download.backends.base import DownloadBackend, open_download_file
+
+# default constants ------------------------------------------------------------
+
+_LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT = 5
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_RETRY_BACKOFF = 1.0 # seconds
+DEFAULT_MAX_RETRY_BACKOFF = 60.0 # seconds
+
+DEFAULT_REQUEST_TIMEOUT = 300 # seconds
+DEFAULT_BUFFER_SIZE = 65536 # bytes
+
+# certificate authority bundles used to verify servers when no ssl_ca_cert is configured
+SYSTEM_CA_BUNDLES = ('/etc/pki/tls/certs/ca-bundle.crt',
+                     '/etc/ssl/certs/ca-certificates.crt',
+                     '/etc/ssl/ca-bundle.pem')
+
+HTTP_PARTIAL_CONTENT = 206
+HTTP_NOT_MODIFIED = 304
+
+# transfer errors --------------------------------------------------------------
+
+class TransferError(Exception):
+    """
+    Raised by a backend's transfer method when a download attempt fails.
+
+    :ivar error_report: debugging info for the download report's error_report
+    """
+
+    def __init__(self, error_report):
+        Exception.__init__(self, error_report)
+        self.error_report = error_report
+
+# thread pool download backend -------------------------------------------------
+
+class ThreadedDownloadBackend(DownloadBackend):
+    """
+    Abstract download backend that runs downloads on a pool of worker threads.
+    Concrete backends implement the ``_transfer`` method, which is run once per
+    download attempt.
+
+    Downloads are scheduled per host and retried with exponential backoff in
+    the same way as the curl backends. Events are fired from the worker
+    threads, but never concurrently, so listeners need not be thread safe.
+    """
+
+    def __init__(self, config, event_listener=None):
+        super(ThreadedDownloadBackend, self).__init__(config, event_listener)
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._event_lock = threading.RLock()
+
+    @property
+    def max_concurrent(self):
+        return self.config.max_concurrent or DEFAULT_MAX_CONCURRENT
+
+    @property
+    def max_retries(self):
+        if self.config.max_retries is None:
+            return DEFAULT_MAX_RETRIES
+        return self.config.max_retries
+
+    @property
+    def retry_backoff(self):
+        if self.config.retry_backoff is None:
+            return DEFAULT_RETRY_BACKOFF
+        return self.config.retry_backoff
+
+    @property
+    def max_retry_backoff(self):
+        if self.config.max_retry_backoff is None:
+            return DEFAULT_MAX_RETRY_BACKOFF
+        return self.config.max_retry_backoff
+
+    def download(self, request_list):
+
+        batch = _Batch(self.config)
+
+        for request in request_list:
+            report = download_report.DownloadReport.from_download_request(request)
+            batch.report.append(report)
+            batch.request_queue.put(request, report)
+
+        batch.total_requests = len(request_list)
+
+        self.fire_batch_started(batch.report)
+
+        workers = []
+        for i in range(min(self.max_concurrent, batch.total_requests)):
+            worker = threading.Thread(target=self._worker, args=(batch,))
+            worker.setDaemon(True)
+            workers.append(worker)
+            worker.start()
+
+        for worker in workers:
+            worker.join()
+
+        batch.report.host_stats = batch.host_statistics.report()
+        self.fire_batch_finished(batch.report)
+
+    def _retry_delay(self, attempts):
+        # exponential backoff: retry_backoff, 2 * retry_backoff, 4 * retry_backoff, ...
+        return min(self.retry_backoff * (2 ** (attempts - 1)), self.max_retry_backoff)
+
+    # worker threads -----------------------------------------------------------
+
+    def _worker(self, batch):
+        while True:
+            next_request = self._next_request(batch)
+            if next_request is None:
+                return
+
+            request, report = next_request
+            host = hosts.host_for_url(request.url)
+
+            if report.attempts == 1:
+                report.state = download_report.DOWNLOAD_DOWNLOADING
+                report.start_time = datetime.datetime.now()
+                self.fire_download_started(report)
+
+            try:
+                error_report, retryable, bytes_transferred = self._attempt(request, report, batch)
+            except Exception, e:
+                _LOG.exception(e)
+                error_report, retryable, bytes_transferred = {'error_message': str(e)}, True, 0
+
+            self._finish_attempt(batch, host, request, report, error_report, retryable, bytes_transferred)
+
+    def _next_request(self, batch):
+        # get the next request this worker should download, waiting for retry
+        # backoffs and host connection caps as necessary; None when finished
+        self._lock.acquire()
+        try:
+            while batch.processed_requests < batch.total_requests:
+
+                if self.is_cancelled:
+                    self._cancel_remaining(batch)
+                    continue
+
+                now = time.time()
+                while batch.retry_queue and batch.retry_queue[0][0] <= now:
+                    retry_time, sequence, request, report = heapq.heappop(batch.retry_queue)
+                    batch.request_queue.put(request, report, front=True)
+
+                next_request = batch.request_queue.get()
+                if next_request is not None:
+                    request, report = next_request
+                    report.attempts += 1
+                    batch.host_statistics.started(hosts.host_for_url(request.url))
+                    return next_request
+
+                timeout = None
+                if batch.retry_queue:
+                    timeout = max(0, batch.retry_queue[0][0] - now)
+                self._condition.wait(timeout)
+
+            return None
+        finally:
+            self._lock.release()
+
+    def _cancel_remaining(self, batch):
+        # called with the lock held: cancel everything that has not started
+        remaining = []
+        while True:
+            next_request = batch.request_queue.get()
+            if next_request is None:
+                break
+            batch.request_queue.release(next_request[0])
+            remaining.append(next_request[1])
+        remaining.extend(r[3] for r in batch.retry_queue)
+        batch.retry_queue = []
+
+        for report in remaining:
+            report.state = download_report.DOWNLOAD_CANCELED
+            report.finish_time = datetime.datetime.now()
+
+        batch.processed_requests += len(remaining)
+        self._condition.notifyAll()
+
+        # everything left is in progress; wait for it to finish
+        if batch.processed_requests < batch.total_requests:
+            self._condition.wait()
+
+    def _attempt(self, request, report, batch):
+        # returns a tuple of (error report, retryable, bytes transferred)
+        try:
+            verifier = verification.StreamingVerifier(request)
+        except verification.UnsupportedChecksumType, e:
+            return {'error_message': str(e)}, False, 0
+
+        report.response_code = None
+
+        try:
+            self._transfer(request, report, verifier, batch.rate_limiters(request.url))
+        except TransferError, e:
+            return e.error_report, True, verifier.bytes_written - verifier.bytes_resumed
+
+        bytes_transferred = verifier.bytes_written - verifier.bytes_resumed
+
+        if report.response_code == HTTP_NOT_MODIFIED:
+            # conditional request for a file the caller already has
+            return {}, False, bytes_transferred
+
+        # the checksum and size have been computed as the file was written,
+        # so there's no need to re-read the file
+        error_report = verifier.verify(report)
+        if error_report:
+            verification.remove_partial_file(request.file_path)
+        return error_report, True, bytes_transferred
+
+    def _finish_attempt(self, batch, host, request, report, error_report, retryable, bytes_transferred):
+        self._lock.acquire()
+        try:
+            batch.host_statistics.finished(host, bytes_transferred, not error_report)
+            batch.request_queue.release(request)
+
+            if error_report and retryable and report.attempts <= self.max_retries and not self.is_cancelled:
+                retry_time = time.time() + self._retry_delay(report.attempts)
+                heapq.heappush(batch.retry_queue, (retry_time, batch.retry_sequence.next(), request, report))
+                self._condition.notifyAll()
+                return
+
+            batch.processed_requests += 1
+            self._condition.notifyAll()
+        finally:
+            self._lock.release()
+
+        report.finish_time = datetime.datetime.now()
+        report.error_report = error_report
+
+        if error_report:
+            report.state = download_report.DOWNLOAD_FAILED
+            self.fire_download_failed(report)
+        else:
+            report.state = download_report.DOWNLOAD_SUCCEEDED
+            self.fire_download_succeeded(report)
+
+    # download attempts --------------------------------------------------------
+
+    def _transfer(self, request, report, verifier, rate_limiters):
+        """
+        Make a single attempt at downloading the request's file, passing the
+        data written to the verifier and updating the report's progress.
+
+        :param request: download request
+        :type request: pulp.common.download.request.DownloadRequest
+        :param report: report for the download request
+        :type report: pulp.common.download.report.DownloadReport
+        :param verifier: streaming verifier for the download
+        :type verifier: pulp.common.download.verification.StreamingVerifier
+        :param rate_limiters: rate limiters the transfer is subject to
+        :type rate_limiters: list of pulp.common.download.backends.hosts.RateLimiter
+        :raise TransferError: if the attempt fails
+        """
+        raise NotImplementedError()
+
+    def _copy(self, input_fp, output_fp, report, verifier, rate_limiters):
+        # copy the input to the output, feeding the verifier and progress events
+        while True:
+            data = input_fp.read(DEFAULT_BUFFER_SIZE)
+            if not data:
+                break
+            for limiter in rate_limiters:
+                limiter.consume(len(data))
+            output_fp.write(data)
+            verifier.update(data)
+            report.bytes_downloaded += len(data)
+            self.fire_download_progress(report)
+
+    # events utility methods ---------------------------------------------------
+
+    def _fire_event_to_listener(self, event_listener_callback, *args, **kwargs):
+        # serialize the events fired from the worker threads
+        self._event_lock.acquire()
+        try:
+            super(ThreadedDownloadBackend, self)._fire_event_to_listener(event_listener_callback, *args, **kwargs)
+        finally:
+            self._event_lock.release()
+
+
+class _Batch(object):
+    # state of a batch of downloads shared by the worker threads
+
+    def __init__(self, config):
+        self.report = download_report.DownloadBatchReport()
+        self.request_queue = hosts.HostScheduler(config.max_concurrent_per_host)
+        self.host_statistics = hosts.HostStatistics()
+
+        # heap of (retry time, sequence, request, report)
+        self.retry_queue = []
+        self.retry_sequence = itertools.count()
+
+        self.total_requests = 0
+        self.processed_requests = 0
+
+        self.max_speed_per_host = config.max_speed_per_host
+        self.global_rate_limiter = None
+        if config.max_speed is not None:
+            self.global_rate_limiter = hosts.RateLimiter(config.max_speed)
+        self.host_rate_limiters = {}
+        self.rate_limiters_lock = threading.Lock()
+
+    def rate_limiters(self, url):
+        limiters = []
+        if self.global_rate_limiter is not None:
+            limiters.append(self.global_rate_limiter)
+        if self.max_speed_per_host is not None:
+            host = hosts.host_for_url(url)
+            self.rate_limiters_lock.acquire()
+            try:
+                limiter = self.host_rate_limiters.get(host)
+                if limiter is None:
+                    limiter = self.host_rate_limiters[host] = hosts.RateLimiter(self.max_speed_per_host)
+            finally:
+                self.rate_limiters_lock.release()
+            limiters.append(limiter)
+        return limiters
+
+# urllib2-based http download backend ------------------------------------------
+
+class HTTPThreadedDownloadBackend(ThreadedDownloadBackend):
+    """
+    Pure-python http download backend for environments without pycurl.
+    """
+
+    def _build_opener(self):
+        return urllib2.build_opener(*self._opener_handlers())
+
+    def _opener_handlers(self):
+        # handlers passed to build_opener replace urllib2's default ones
+        handlers = []
+        if None not in (self.config.basic_auth_username, self.config.basic_auth_password):
+            password_manager = urllib2.HTTPPasswordMgrWithDefaultRealm()
+            password_manager.add_password(None, '/', self.config.basic_auth_username,
+                                          self.config.basic_auth_password)
+            handlers.append(_PreemptiveBasicAuthHandler(password_manager))
+        return handlers
+
+    def _transfer(self, request, report, verifier, rate_limiters):
+        # retries pick up where the last attempt left off; so can the first
+        # attempt, if the configuration says partial files can be trusted
+        resume_from = 0
+        if report.attempts > 1 or self.config.resume_partial:
+            resume_from = _partial_file_size(request.file_path)
+
+        headers = dict(request.headers)
+        if resume_from > 0:
+            headers['Range'] = 'bytes=%d-' % resume_from
+
+        http_request = urllib2.Request(request.url, headers=headers)
+
+        try:
+            response = self._build_opener().open(http_request, timeout=DEFAULT_REQUEST_TIMEOUT)
+
+        except urllib2.HTTPError, e:
+            report.response_code = e.code
+            report.headers = _lower_case_headers(e.info())
+            if e.code == HTTP_NOT_MODIFIED:
+                return
+            raise TransferError({'response_code': e.code, 'error_message': str(e)})
+
+        except (urllib2.URLError, httplib.HTTPException, socket.error, ssl.SSLError), e:
+            raise TransferError({'error_message': str(e)})
+
+        try:
+            report.response_code = response.getcode()
+            report.headers = _lower_case_headers(response.info())
+
+            if resume_from > 0 and report.response_code == HTTP_PARTIAL_CONTENT:
+                # the verifier has to account for the bytes that are already there
+                verifier.update_from_file(request.file_path)
+                output_fp = open_download_file(request.file_path, append=True)
+            else:
+                resume_from = 0
+                output_fp = open_download_file(request.file_path)
+
+            report.bytes_downloaded = resume_from
+            content_length = report.headers.get('content-length')
+            if content_length is not None and content_length.isdigit():
+                report.total_bytes = resume_from + int(content_length)
+
+            try:
+                self._copy(response, output_fp, report, verifier, rate_limiters)
+            finally:
+                output_fp.close()
+
+        except (IOError, httplib.HTTPException, socket.error, ssl.SSLError), e:
+            raise TransferError({'response_code': report.response_code, 'error_message': str(e)})
+
+        finally:
+            response.close()
+
+
+class HTTPSThreadedDownloadBackend(HTTPThreadedDownloadBackend):
+    """
+    Pure-python https download backend for environments without pycurl.
+
+    The server certificate is verified against ssl_ca_cert, or the system's
+    certificate authority bundle when none is configured, and must match the
+    server's host name. Connections are refused when there is nothing to
+    verify the certificate against. Verification is only skipped when
+    ssl_validation is explicitly set to False.
+    """
+
+    def __init__(self, config, event_listener=None):
+        super(HTTPSThreadedDownloadBackend, self).__init__(config, event_listener)
+        self.ssl_working_dir = tempfile.mkdtemp(prefix=self.__class__.__name__ + '-ssl_working_dir-')
+        self.ssl_ca_cert = self._write_tmp_ssl_data(self.config.ssl_ca_cert, '-ssl_ca_cert.pem')
+        self.ssl_client_cert = self._write_tmp_ssl_data(self.config.ssl_client_cert, '-ssl_client_cert.pem')
+        self.ssl_client_key = self._write_tmp_ssl_data(self.config.ssl_client_key, '-ssl_client_key.pem')
+
+    def __del__(self):
+        shutil.rmtree(self.ssl_working_dir, ignore_errors=True)
+
+    def _write_tmp_ssl_data(self, data, file_suffix=None):
+        if data is None:
+            return None
+        file_handle, file_path = tempfile.mkstemp(suffix=file_suffix, dir=self.ssl_working_dir)
+        os.write(file_handle, data)
+        os.close(file_handle)
+        return file_path
+
+    def _opener_handlers(self):
+        handlers = super(HTTPSThreadedDownloadBackend, self)._opener_handlers()
+        validate = self.config.ssl_validation is not False
+        handlers.append(_HTTPSHandler(self.ssl_ca_cert, self.ssl_client_cert, self.ssl_client_key,
+                                      validate))
+        return handlers
+
+# urllib2 extensions -----------------------------------------------------------
+
+class _PreemptiveBasicAuthHandler(urllib2.HTTPBasicAuthHandler):
+    # send the credentials up front instead of waiting for a 401 from the server
+
+    def http_request(self, request):
+        user, password = self.passwd.find_user_password(None, request.get_full_url())
+        if user is not None:
+            credentials = ('%s:%s' % (user, password)).encode('base64').strip()
+            request.add_unredirected_header('Authorization', 'Basic %s' % credentials)
+        return request
+
+    https_request = http_request
+
+
+class _HTTPSConnection(httplib.HTTPSConnection):
+    # verifies the server's certificate and host name unless validate is False
+
+    def __init__(self, host, ca_cert=None, validate=True, **kwargs):
+        httplib.HTTPSConnection.__init__(self, host, **kwargs)
+        self.ca_cert = ca_cert
+        self.validate = validate
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        if not self.validate:
+            self.sock = ssl.wrap_socket(sock, self.key_file, self.cert_file, cert_reqs=ssl.CERT_NONE)
+            return
+        ca_certs = self.ca_cert or _system_ca_bundle()
+        if ca_certs is None:
+            sock.close()
+            raise ssl.SSLError('no certificate authority certificates to verify %s with' % self.host)
+        self.sock = ssl.wrap_socket(sock, self.key_file, self.cert_file,
+                                    cert_reqs=ssl.CERT_REQUIRED, ca_certs=ca_certs)
+        if not _match_hostname(self.sock.getpeercert(), self.host):
+            self.sock.close()
+            raise ssl.SSLError('server certificate does not match host name %s' % self.host)
+
+
+class _HTTPSHandler(urllib2.HTTPSHandler):
+
+    def __init__(self, ca_cert=None, client_cert=None, client_key=None, validate=True):
+        urllib2.HTTPSHandler.__init__(self)
+        self.ca_cert = ca_cert
+        self.client_cert = client_cert
+        self.client_key = client_key
+        self.validate = validate
+
+    def https_open(self, request):
+        return self.do_open(self._get_connection, request)
+
+    def _get_connection(self, host, timeout=DEFAULT_REQUEST_TIMEOUT):
+        return _HTTPSConnection(host, ca_cert=self.ca_cert, validate=self.validate,
+                                key_file=self.client_key, cert_file=self.client_cert,
+                                timeout=timeout)
+
+# utility functions ------------------------------------------------------------
+
+def _partial_file_size(file_path):
+    try:
+        return os.stat(file_path).st_size
+    except OSError:
+        return 0
+
+
+def _system_ca_bundle():
+    for path in SYSTEM_CA_BUNDLES:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _match_hostname(cert, host):
+    # the subject alternative DNS names take precedence over the common name
+    names = [value for key, value in cert.get('subjectAltName', ()) if key == 'DNS']
+    if not names:
+        for rdn in cert.get('subject', ()):
+            names.extend([value for key, value in rdn if key == 'commonName'])
+    host = host.lower()
+    for name in names:
+        name = name.lower()
+        if name == host:
+            return True
+        # a wildcard only matches a single, left-most label
+        if name.startswith('*.') and '.' in host:
+            label, domain = host.split('.', 1)
+            if label and domain == name[2:]:
+                return True
+    return False
+
+
+def _lower_case_headers(message):
+    return dict((k.lower(), v) for k, v in message.items())
@@ -0,0 +1,535 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the License
+# (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied, including the
+# implied warranties of MERCHANTABILITY, NON-INFRINGEMENT, or FITNESS FOR A
+# PARTICULAR PURPOSE.
+# You should have received a copy of GPLv2 along with this software; if not,
+# see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
+
+import datetime
+import logging
+import os
+import threading
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from pulp.common.download import report as download_report
+from pulp.common.download.backends.base import DownloadBackend
+from pulp.common.download.backends.local import link_or_copy
+from pulp.common.download.listener import DownloadEventListener
+from pulp.common.download.request import DownloadRequest
+
+
+_LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024 * 1024 # bytes
+DEFAULT_CHECKSUM_TYPE = 'sha256'
+
+HTTP_NOT_MODIFIED = 304
+
+INDEX_FILE_NAME = 'index.json'
+CONTENT_DIR_NAME = 'content'
+
+# download cache ---------------------------------------------------------------
+
+class DownloadCache(object):
+    """
+    Content-addressed store of downloaded files, shared by every downloader
+    configured with the same cache directory.
+
+    Files are stored by checksum, so that a request carrying an expected
+    checksum can be satisfied without touching the network. Files are also
+    indexed by url, along with the ETag and Last-Modified response headers, so
+    that requests without a checksum can be revalidated with a conditional
+    request instead of downloaded again.
+
+    The total size of the stored files is kept under a disk budget by evicting
+    the least recently used files.
+
+    :ivar cache_dir: directory the cache is stored in
+    :ivar max_size: disk budget, in bytes
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        """
+        :param cache_dir: directory the cache is stored in
+        :type cache_dir: str
+        :param max_size: disk budget, in bytes
+        :type max_size: int
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+        # content key -> {'path', 'size', 'last_used'}
+        self._content = {}
+        # url -> {'content_key', 'etag', 'last_modified'}
+        self._urls = {}
+        self._size = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._revalidated = 0
+        self._evictions = 0
+
+        self._lock = threading.RLock()
+
+        self._load_index()
+
+    # index persistence --------------------------------------------------------
+
+    @property
+    def index_path(self):
+        return os.path.join(self.cache_dir, INDEX_FILE_NAME)
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            fp = open(self.index_path, 'r')
+            try:
+                index = json.load(fp)
+            finally:
+                fp.close()
+        except (IOError, ValueError), e:
+            _LOG.error('Ignoring unreadable download cache index %s: %s' % (self.index_path, e))
+            return
+
+        for key, entry in index.get('content', {}).items():
+            # files may have been removed from underneath us
+            if not os.path.exists(entry['path']):
+                continue
+            self._content[key] = entry
+            self._size += entry['size']
+
+        for url, entry in index.get('urls', {}).items():
+            if entry['content_key'] in self._content:
+                self._urls[url] = entry
+
+    def save(self):
+        """
+        Write the cache index to disk.
+        """
+        self._lock.acquire()
+        try:
+            index = {'content': self._content, 'urls': self._urls}
+            tmp_path = self.index_path + '.tmp'
+            fp = open(tmp_path, 'w')
+            try:
+                json.dump(index, fp)
+            finally:
+                fp.close()
+            os.rename(tmp_path, self.index_path)
+        finally:
+            self._lock.release()
+
+    # lookups ------------------------------------------------------------------
+
+    @staticmethod
+    def content_key(checksum_type, checksum):
+        return '%s:%s' % (checksum_type.lower(), checksum.lower())
+
+    def lookup_checksum(self, checksum_type, checksum):
+        """
+        Look up a stored file by its checksum.
+
+        :param checksum_type: hashlib algorithm name
+        :type checksum_type: str
+        :param checksum: hex digest
+        :type checksum: str
+        :return: content key of the stored file, None if it is not cached
+        :rtype: str or None
+        """
+        key = self.content_key(checksum_type, checksum)
+        self._lock.acquire()
+        try:
+            if key not in self._content:
+                return None
+            return key
+        finally:
+            self._lock.release()
+
+    def lookup_url(self, url):
+        """
+        Look up the file last stored for a url.
+
+        :param url: url the file was downloaded from
+        :type url: str
+        :return: copy of the url's entry (content_key, etag, last_modified), None if it is not cached
+        :rtype: dict or None
+        """
+        self._lock.acquire()
+        try:
+            entry = self._urls.get(url)
+            if entry is None:
+                return None
+            return entry.copy()
+        finally:
+            self._lock.release()
+
+    def conditional_headers(self, url_entry):
+        """
+        Build the request headers used to revalidate a cached url.
+
+        :param url_entry: entry returned by lookup_url
+        :type url_entry: dict
+        :return: request headers; empty if the url cannot be revalidated
+        :rtype: dict
+        """
+        headers = {}
+        if url_entry.get('etag'):
+            headers['If-None-Match'] = url_entry['etag']
+        if url_entry.get('last_modified'):
+            headers['If-Modified-Since'] = url_entry['last_modified']
+        return headers
+
+    # cache hits and misses ----------------------------------------------------
+
+    def fetch(self, content_key, file_path, revalidated=False):
+        """
+        Hardlink, or copy if a link cannot be made, a stored file to the given path.
+
+        :param content_key: content key of the stored file
+        :type content_key: str
+        :param file_path: destination path
+        :type file_path: str
+        :param revalidated: True if the hit required a conditional request
+        :type revalidated: bool
+        :return: True if the file was fetched, False if it is no longer cached
+        :rtype: bool
+        """
+        self._lock.acquire()
+        try:
+            entry = self._content.get(content_key)
+            if entry is None:
+                return False
+            entry['last_used'] = time.time()
+            link_or_copy(entry['path'], file_path)
+            self._hits += 1
+            if revalidated:
+                self._revalidated += 1
+            return True
+        finally:
+            self._lock.release()
+
+    def store(self, url, file_path, checksum_type, checksum, headers=None):
+        """
+        Store a downloaded file in the cache.
+
+        :param url: url the file was downloaded from
+        :type url: str
+        :param file_path: path to the downloaded file
+        :type file_path: str
+        :param checksum_type: hashlib algorithm name of the file's checksum
+        :type checksum_type: str
+        :param checksum: hex digest of the file
+        :type checksum: str
+        :param headers: response headers, used to revalidate the url later
+        :type headers: dict or None
+        """
+        headers = headers or {}
+        key = self.content_key(checksum_type, checksum)
+        size = os.stat(file_path).st_size
+
+        if size > self.max_size:
+            return
+
+        self._lock.acquire()
+        try:
+            self._misses += 1
+
+            if key not in self._content:
+                content_path = os.path.join(self.cache_dir, CONTENT_DIR_NAME, checksum_type.lower(),
+                                            checksum[:2], checksum)
+                link_or_copy(file_path, content_path)
+                self._content[key] = {'path': content_path, 'size': size, 'last_used': time.time()}
+                self._size += size
+
+            else:
+                self._content[key]['last_used'] = time.time()
+
+            self._urls[url] = {'content_key': key,
+                               'etag': headers.get('etag'),
+                               'last_modified': headers.get('last-modified')}
+
+            self._evict(keep=key)
+        finally:
+            self._lock.release()
+
+    def _evict(self, keep=None):
+        # evict the least recently used files until the cache is within budget
+        if self._size <= self.max_size:
+            return
+
+        evicted_keys = set()
+        lru_keys = sorted(self._content, key=lambda k: self._content[k]['last_used'])
+
+        for key in lru_keys:
+            if self._size <= self.max_size:
+                break
+            if key == keep:
+                continue
+            entry = self._content.pop(key)
+            self._size -= entry['size']
+            self._evictions += 1
+            evicted_keys.add(key)
+            try:
+                os.remove(entry['path'])
+            except OSError, e:
+                _LOG.exception(e)
+
+        for url in [u for u, e in self._urls.items() if e['content_key'] in evicted_keys]:
+            self._urls.pop(url)
+
+    # statistics ---------------------------------------------------------------
+
+    def stats(self):
+        """
+        Report the cache's usage.
+        Keys:
+         * hits: number of requests served from the cache
+         * misses: number of requests downloaded and added to the cache
+         * revalidated: number of hits that required a conditional request
+         * evictions: number of files evicted to stay within the disk budget
+         * files: number of files stored
+         * size: total size, in bytes, of the files stored
+         * max_size: disk budget, in bytes
+
+        :return: cache statistics
+        :rtype: dict
+        """
+        self._lock.acquire()
+        try:
+            return {'hits': self._hits,
+                    'misses': self._misses,
+                    'revalidated': self._revalidated,
+                    'evictions': self._evictions,
+                    'files': len(self._content),
+                    'size': self._size,
+                    'max_size': self.max_size}
+        finally:
+            self._lock.release()
+
+
+# shared cache instances -------------------------------------------------------
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_cache(cache_dir, max_size=None):
+    """
+    Get the download cache for the given directory, creating it if necessary.
+    There is a single cache instance per directory so that concurrent
+    downloaders share the same index and disk budget.
+
+    :param cache_dir: directory the cache is stored in
+    :type cache_dir: str
+    :param max_size: disk budget, in bytes; None for the default or, if the cache exists, its current budget
+    :type max_size: int or None
+    :return: download cache
+    :rtype: DownloadCache
+    """
+    cache_dir = os.path.abspath(cache_dir)
+    _CACHES_LOCK.acquire()
+    try:
+        cache = _CACHES.get(cache_dir)
+        if cache is None:
+            cache = DownloadCache(cache_dir, max_size or DEFAULT_MAX_SIZE)
+            _CACHES[cache_dir] = cache
+        elif max_size is not None:
+            cache.max_size = max_size
+        return cache
+    finally:
+        _CACHES_LOCK.release()
+
+# caching download backend -----------------------------------------------------
+
+class CachingDownloadBackend(DownloadBackend):
+    """
+    Download backend that serves requests from a download cache where it can
+    and uses another backend for the rest, adding the files it downloads to
+    the cache.
+
+    :ivar backend: backend used to download the files that are not cached
+    :ivar cache: download cache
+    """
+
+    def __init__(self, backend, cache, event_listener=None):
+        """
+        :param backend: backend used to download the files that are not cached
+        :type backend: pulp.common.download.backends.base.DownloadBackend
+        :param cache: download cache
+        :type cache: DownloadCache
+        :param event_listener: event listener coupled to this backend
+        :type event_listener: pulp.common.download.listener.DownloadEventListener
+        """
+        super(CachingDownloadBackend, self).__init__(backend.config, event_listener)
+        self.backend = backend
+        self.cache = cache
+        self.backend.event_listener = _CacheEventListener(self)
+
+        # url -> content key of the cached file being revalidated, per batch
+        self._revalidating = {}
+        # (report, content key) of the requests served from the cache, per batch
+        self._hits = []
+        self._batch_report = None
+
+    def download(self, request_list):
+        self._revalidating = {}
+        self._batch_report = download_report.DownloadBatchReport()
+        self._hits = []
+
+        backend_requests = []
+
+        for request in request_list:
+            content_key = None
+            if request.checksum_type is not None and request.checksum_value is not None:
+                content_key = self.cache.lookup_checksum(request.checksum_type, request.checksum_value)
+
+            if content_key is None:
+                backend_requests.append(self._backend_request(request))
+                continue
+
+            report = download_report.DownloadReport.from_download_request(request)
+            self._batch_report.append(report)
+            self._hits.append((report, content_key))
+
+        # the batch events are fired when the backend fires its own, if it's used
+        if not backend_requests:
+            self._batch_started([])
+            self._batch_finished()
+            return
+
+        self.backend.download(backend_requests)
+
+    def cancel(self):
+        super(CachingDownloadBackend, self).cancel()
+        self.backend.cancel()
+
+    # request and report management --------------------------------------------
+
+    def _backend_request(self, request):
+        # always have the backend compute a checksum, it's how the file is stored
+        backend_request = DownloadRequest(request.url, request.file_path,
+                                          request.checksum_type or DEFAULT_CHECKSUM_TYPE,
+                                          request.checksum_value, request.size, dict(request.headers))
+
+        url_entry = self.cache.lookup_url(request.url)
+        if url_entry is None:
+            return backend_request
+
+        # a request expecting a checksum can only be satisfied by the same content
+        if request.checksum_value is not None and \
+                url_entry['content_key'] != self.cache.content_key(request.checksum_type,
+                                                                    request.checksum_value):
+            return backend_request
+
+        conditional_headers = self.cache.conditional_headers(url_entry)
+        if conditional_headers:
+            backend_request.headers.update(conditional_headers)
+            self._revalidating[request.url] = url_entry['content_key']
+
+        return backend_request
+
+    def _cache_hit(self, report, content_key, revalidated=False):
+        report.cache_hit = True
+        report.finish_time = datetime.datetime.now()
+
+        try:
+            fetched = self.cache.fetch(content_key, report.file_path, revalidated)
+        except (IOError, OSError), e:
+            _LOG.exception(e)
+            fetched = False
+
+        if not fetched:
+            report.state = download_report.DOWNLOAD_FAILED
+            report.error_report['error_message'] = 'Cached file is no longer available'
+            self.fire_download_failed(report)
+            return
+
+        checksum_type, checksum = content_key.split(':', 1)
+        report.checksum_type = checksum_type
+        report.checksum = checksum
+        report.bytes_downloaded = report.total_bytes = os.stat(report.file_path).st_size
+        report.state = download_report.DOWNLOAD_SUCCEEDED
+        self.fire_download_succeeded(report)
+
+    def _cache_miss(self, report):
+        report.cache_hit = False
+        # files are stored by checksum, so one the backend did not compute cannot be cached
+        if report.checksum_type is None or report.checksum is None:
+            return
+        try:
+            self.cache.store(report.url, report.file_path, report.checksum_type,
+                             report.checksum, report.headers)
+        except Exception, e:
+            # not being able to cache a file does not fail its download
+            _LOG.exception(e)
+
+    # backend event handling ---------------------------------------------------
+
+    def _batch_started(self, report_list):
+        self._batch_report.extend(report_list)
+        self.fire_batch_started(self._batch_report)
+
+        # files already in the cache are served without touching the network
+        for report, content_key in self._hits:
+            report.state = download_report.DOWNLOAD_DOWNLOADING
+            report.start_time = datetime.datetime.now()
+            self.fire_download_started(report)
+            self._cache_hit(report, content_key)
+        self._hits = []
+
+    def _batch_finished(self, report_list=None):
+        if report_list is not None:
+            self._batch_report.host_stats = getattr(report_list, 'host_stats', {})
+        try:
+            self.cache.save()
+        except (IOError, OSError), e:
+            _LOG.exception(e)
+        self._batch_report.cache_stats = self.cache.stats()
+        self.fire_batch_finished(self._batch_report)
+
+    def _download_succeeded(self, report):
+        content_key = self._revalidating.get(report.url)
+        if content_key is not None and report.response_code == HTTP_NOT_MODIFIED:
+            self._cache_hit(report, content_key, revalidated=True)
+            return
+        self._cache_miss(report)
+        self.fire_download_succeeded(report)
+
+
+class _CacheEventListener(DownloadEventListener):
+    """
+    Relays the wrapped backend's events to the caching backend.
+    """
+
+    def __init__(self, caching_backend):
+        self.caching_backend = caching_backend
+
+    def batch_started(self, report_list):
+        self.caching_backend._batch_started(report_list)
+
+    def batch_finished(self, report_list):
+        self.caching_backend._batch_finished(report_list)
+
+    def download_started(self, report):
+        self.caching_backend.fire_download_started(report)
+
+    def download_progress(self, report):
+        self.caching_backend.fire_download_progress(report)
+
+    def download_succeeded(self, report):
+        self.caching_backend._download_succeeded(report)
+
+    def download_failed(self, report):
+        self.caching_backend.fire_download_failed(report)
@@ -20,13 +20,28 @@ class DownloaderConfig(object):
 
     Currently supported configuration values are:
 
-     * protocol: network protocol to use (http, https)
+     * protocol: network protocol to use (http, https, file)
+     * backend: name of the backend to use for the protocol (curl or threaded for http and https);
+       defaults to curl if pycurl is installed
      * max_concurrent: maximum number of downloads to run concurrently
+     * max_concurrent_per_host: maximum number of downloads to run concurrently from any one host
+     * max_speed: maximum total download speed, in bytes per second
+     * max_speed_per_host: maximum download speed from any one host, in bytes per second
+     * max_retries: number of times a failed download is retried
+     * retry_backoff: seconds to wait before the first retry; doubled for each subsequent retry
+     * max_retry_backoff: maximum seconds to wait before any retry
+     * link_files: hardlink, instead of copy, files when possible (file protocol only, defaults to True)
+     * progress_interval: minimum seconds between progress events for a download, or for a batch
+     * resume_partial: resume the first attempt from an existing (partial) file at the destination path
+     * cache_dir: directory of the download cache shared by downloaders configured with it (no caching if not set)
+     * cache_max_size: disk budget, in bytes, of the download cache
      * basic_auth_username: http basic auth username (basic_auth_password must also be provided)
      * basic_auth_password: http basic auth password (basic_auth_username must also be provided)
      * ssl_ca_cert: certificate authority cert for secure connections (https protocol only)
      * ssl_client_cert: client certificate for secure connections (https protocol only)
      * ssl_client_key: client private key for secure connections (https protocol only)
+     * ssl_validation: verify the server's certificate and host name (https protocol only, defaults
+       to True); set to False only for servers that are known not to present a valid certificate
     """
 
     def __init__(self, protocol, **kwargs):
@@ -44,6 +59,24 @@ class DownloaderConfig(object):
 
         self.max_concurrent = max_concurrent
 
+        for limit in ('max_concurrent_per_host', 'max_speed', 'max_speed_per_host'):
+            value = kwargs.pop(limit, None)
+            if not (value > 0 or value is None):
+                raise AttributeError('%s must be greater than 0' % limit)
+            setattr(self, limit, value)
+
+        max_retries = kwargs.pop('max_retries', None)
+        if not (max_retries >= 0 or max_retries is None):
+            raise AttributeError('max_retries must be greater than or equal to 0')
+
+        self.max_retries = max_retries
+
+        for interval in ('retry_backoff', 'max_retry_backoff', 'progress_interval'):
+            value = kwargs.pop(interval, None)
+            if not (value >= 0 or value is None):
+                raise AttributeError('%s must be greater than or equal to 0' % interval)
+            setattr(self, interval, value)
+
         # the open-ended nature of this will be solved with documentation
         self.__dict__.update(kwargs)
 
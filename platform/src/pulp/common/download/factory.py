@@ -13,8 +13,17 @@
 
 from gettext import gettext as _
 
-from pulp.common.download.backends.curl import (
-    HTTPCurlDownloadBackend, HTTPSCurlDownloadBackend)
+from pulp.common.download import cache as download_cache
+from pulp.common.download.backends.local import FileDownloadBackend
+from pulp.common.download.backends.threaded import (
+    HTTPThreadedDownloadBackend, HTTPSThreadedDownloadBackend)
+
+# pycurl is preferred, but not required
+try:
+    from pulp.common.download.backends.curl import (
+        HTTPCurlDownloadBackend, HTTPSCurlDownloadBackend)
+except ImportError:
+    HTTPCurlDownloadBackend = HTTPSCurlDownloadBackend = None
 
 # download backends and management ---------------------------------------------
 
@@ -28,18 +37,24 @@ class NoBackendForProtocol(Exception):
         return _('No downloader backend found for: %(p)s') % {'p': self.protocol}
 
 
+# protocol -> list of (backend name, backend class) in order of preference
 _BACKENDS = {
-    'http': HTTPCurlDownloadBackend,
-    'https': HTTPSCurlDownloadBackend,
+    'http': [('curl', HTTPCurlDownloadBackend), ('threaded', HTTPThreadedDownloadBackend)],
+    'https': [('curl', HTTPSCurlDownloadBackend), ('threaded', HTTPSThreadedDownloadBackend)],
+    'file': [('file', FileDownloadBackend)],
 }
 
 # downloader factory methods ---------------------------------------------------
 
-def _get_downloader_class_for_protocol(protocol):
-    downloader_class = _BACKENDS.get(protocol, None)
-    if downloader_class is None:
-        raise NoBackendForProtocol(protocol)
-    return downloader_class
+def _get_downloader_class_for_protocol(protocol, backend_name=None):
+    for name, downloader_class in _BACKENDS.get(protocol, []):
+        # backends with missing dependencies are None
+        if downloader_class is None:
+            continue
+        if backend_name is not None and backend_name != name:
+            continue
+        return downloader_class
+    raise NoBackendForProtocol(protocol)
 
 
 def get_downloader(downloader_config, event_listener=None):
@@ -55,11 +70,16 @@ def get_downloader(downloader_config, event_listener=None):
     :rtype: pulp.common.download.backends.base.DownloadBackend
     """
 
-    # XXX keeping this protocol based for the time being; in the future we may
-    # want to support multiple backends for any particular protocol and use the
-    # downloader_config as a "hint" as to which one the caller wants
+    # the preferred backend for the protocol is used unless the configuration
+    # asks for a particular one by name
 
-    downloader_class = _get_downloader_class_for_protocol(downloader_config.protocol)
+    downloader_class = _get_downloader_class_for_protocol(downloader_config.protocol,
+                                                          downloader_config.backend)
     downloader_instance = downloader_class(downloader_config, event_listener)
-    return downloader_instance
+
+    if downloader_config.cache_dir is None:
+        return downloader_instance
+
+    cache = download_cache.get_cache(downloader_config.cache_dir, downloader_config.cache_max_size)
+    return download_cache.CachingDownloadBackend(downloader_instance, cache, event_listener)
 
@@ -36,6 +36,9 @@ class DownloadEventListener(object):
     def batch_finished(self, report_list):
         pass
 
+    def batch_progress(self, batch_report):
+        pass
+
     # individual download events
 
     def download_started(self, report):
@@ -11,6 +11,8 @@
 # You should have received a copy of GPLv2 along with this software; if not,
 # see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
 
+import time
+
 # download states --------------------------------------------------------------
 
 DOWNLOAD_WAITING = 'waiting'
@@ -32,6 +34,12 @@ class DownloadReport(object):
     :ivar bytes_downloaded: bytes of the file downloaded so far
     :ivar start_time: start time of the file download
     :ivar finish_time: finish time of the file download
+    :ivar attempts: number of times the download has been attempted, including retries
+    :ivar checksum_type: hashlib algorithm name of the computed checksum
+    :ivar checksum: hex digest computed while the file was downloaded
+    :ivar response_code: response code of the last attempt, if the protocol has one
+    :ivar headers: response headers of the last attempt, keys are lower case
+    :ivar cache_hit: True if the file came from the download cache, False if it was added to it, None if no cache is used
     :ivar error_report: arbitrary dictionary containing debugging info in the event of a failure
     """
 
@@ -44,7 +52,11 @@ class DownloadReport(object):
         :return: report for request
         :rtype: pulp.common.download.report.DownloadReport
         """
-        return cls(request.url, request.file_path)
+        report = cls(request.url, request.file_path)
+        report.checksum_type = request.checksum_type
+        # the expected size, if any, stands in until the backend knows better
+        report.total_bytes = request.size or 0
+        return report
 
     def __init__(self, url, file_path):
         """
@@ -62,4 +74,85 @@ class DownloadReport(object):
         self.bytes_downloaded = 0
         self.start_time = None
         self.finish_time = None
+        self.attempts = 0
+        self.checksum_type = None
+        self.checksum = None
+        self.response_code = None
+        self.headers = {}
+        self.cache_hit = None
         self.error_report = {}
+
+# batch download report --------------------------------------------------------
+
+class DownloadBatchReport(list):
+    """
+    List of the individual download reports for a batch of downloads, passed
+    to the ``batch_started`` and ``batch_finished`` events, that carries
+    batch-wide statistics along with it.
+
+    :ivar cache_stats: download cache statistics (None if no cache is used)
+    :ivar host_stats: dictionary of host -> throughput statistics for the hosts downloaded from
+    :ivar start_time: time, in seconds since the epoch, the batch was started
+    """
+
+    def __init__(self, report_list=None):
+        """
+        :param report_list: individual download reports
+        :type report_list: list of pulp.common.download.report.DownloadReport
+        """
+        super(DownloadBatchReport, self).__init__(report_list or [])
+        self.cache_stats = None
+        self.host_stats = {}
+        self.start_time = None
+
+    # aggregate progress -------------------------------------------------------
+
+    @property
+    def total_bytes(self):
+        """
+        Total bytes of all the files in the batch, None if any are not yet known.
+        """
+        total_bytes = 0
+        for report in self:
+            if not report.total_bytes and report.state != DOWNLOAD_FAILED:
+                return None
+            total_bytes += report.total_bytes
+        return total_bytes
+
+    @property
+    def bytes_downloaded(self):
+        """
+        Bytes of all the files in the batch downloaded so far.
+        """
+        return sum(r.bytes_downloaded for r in self)
+
+    @property
+    def bytes_per_second(self):
+        """
+        Average download rate since the batch was started.
+        """
+        if self.start_time is None:
+            return 0.0
+        elapsed = time.time() - self.start_time
+        if elapsed <= 0:
+            return 0.0
+        return self.bytes_downloaded / elapsed
+
+    @property
+    def eta(self):
+        """
+        Estimated seconds until the batch is finished, None if it cannot be estimated.
+        """
+        total_bytes = self.total_bytes
+        bytes_per_second = self.bytes_per_second
+        if total_bytes is None or bytes_per_second <= 0:
+            return None
+        return max(0, total_bytes - self.bytes_downloaded) / bytes_per_second
+
+    @property
+    def cache_hits(self):
+        return len([r for r in self if r.cache_hit is True])
+
+    @property
+    def cache_misses(self):
+        return len([r for r in self if r.cache_hit is False])
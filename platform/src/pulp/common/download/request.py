@@ -15,15 +15,33 @@
 class DownloadRequest(object):
     """
     Representation of a request for a file download.
+
+    If an expected checksum and/or size are provided, the download backend
+    verifies them as the file is written and fails the download on a mismatch.
     """
 
-    def __init__(self, url, file_path):
+    def __init__(self, url, file_path, checksum_type=None, checksum_value=None, size=None,
+                 headers=None):
         """
         :param url: url of the file to be downloaded
         :type url: str
         :param file_path: local path to the downloaded file
         :type file_path: str
+        :param checksum_type: hashlib algorithm name of the expected checksum (md5, sha1, sha256, ...)
+        :type checksum_type: str or None
+        :param checksum_value: expected hex digest of the downloaded file
+        :type checksum_value: str or None
+        :param size: expected size, in bytes, of the downloaded file
+        :type size: int or None
+        :param headers: additional request headers
+        :type headers: dict or None
         """
 
         self.url = url
         self.file_path = file_path
+
+        self.checksum_type = checksum_type
+        self.checksum_value = checksum_value
+        self.size = size
+
+        self.headers = headers or {}
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the License
+# (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied, including the
+# implied warranties of MERCHANTABILITY, NON-INFRINGEMENT, or FITNESS FOR A
+# PARTICULAR PURPOSE.
+# You should have received a copy of GPLv2 along with this software; if not,
+# see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
+
+import hashlib
+import logging
+import os
+
+from gettext import gettext as _
+
+
+_LOG = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1048576 # bytes
+
+# download verification --------------------------------------------------------
+
+class UnsupportedChecksumType(Exception):
+
+    def __init__(self, checksum_type):
+        Exception.__init__(self, checksum_type)
+        self.checksum_type = checksum_type
+
+    def __str__(self):
+        return _('Unsupported checksum type: %(t)s') % {'t': self.checksum_type}
+
+
+class StreamingVerifier(object):
+    """
+    Incrementally computes the checksum and size of a download as the bytes are
+    written, so that the file does not need to be read a second time in order
+    to be verified.
+
+    :ivar request: download request being verified
+    :ivar bytes_written: number of bytes seen so far
+    :ivar bytes_resumed: number of those bytes that were already on disk when the download was resumed
+    """
+
+    def __init__(self, request):
+        """
+        :param request: download request providing the expected checksum and size
+        :type request: pulp.common.download.request.DownloadRequest
+        :raise UnsupportedChecksumType: if the request's checksum type is not supported by hashlib
+        """
+        self.request = request
+        self.bytes_written = 0
+        self.bytes_resumed = 0
+        self._hasher = None
+
+        if request.checksum_type is not None:
+            try:
+                self._hasher = hashlib.new(request.checksum_type.lower())
+            except ValueError:
+                raise UnsupportedChecksumType(request.checksum_type)
+
+    def update(self, data):
+        """
+        Account for a chunk of data written to the downloaded file.
+
+        :param data: chunk of the file
+        :type data: str
+        """
+        self.bytes_written += len(data)
+        if self._hasher is not None:
+            self._hasher.update(data)
+
+    def update_from_file(self, file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Account for data already written to the downloaded file, as when a
+        download is resumed from a partial file.
+
+        :param file_path: path to the partially downloaded file
+        :type file_path: str
+        :param chunk_size: number of bytes to read at a time
+        :type chunk_size: int
+        """
+        fp = open(file_path, 'rb')
+        try:
+            while True:
+                data = fp.read(chunk_size)
+                if not data:
+                    break
+                self.update(data)
+        finally:
+            fp.close()
+        self.bytes_resumed = self.bytes_written
+
+    def digest(self):
+        """
+        :return: hex digest of the data seen so far, None if no checksum type was requested
+        :rtype: str or None
+        """
+        if self._hasher is None:
+            return None
+        return self._hasher.hexdigest()
+
+    def verify(self, report):
+        """
+        Record the computed checksum on the report and compare the computed
+        checksum and size against the expected values from the request.
+
+        :param report: report for the download
+        :type report: pulp.common.download.report.DownloadReport
+        :return: dictionary of the mismatches, suitable for the report's error_report; empty if the download verified
+        :rtype: dict
+        """
+        report.checksum = self.digest()
+        errors = {}
+
+        if self.request.size is not None and self.request.size != self.bytes_written:
+            errors['expected_size'] = self.request.size
+            errors['actual_size'] = self.bytes_written
+
+        if self.request.checksum_value is not None and \
+                self.request.checksum_value.lower() != report.checksum:
+            errors['expected_checksum'] = self.request.checksum_value
+            errors['actual_checksum'] = report.checksum
+
+        if errors:
+            errors['error_message'] = _('Downloaded file failed verification')
+
+        return errors
+
+
+def remove_partial_file(file_path):
+    """
+    Remove a downloaded file that failed, logging instead of raising on errors.
+
+    :param file_path: path to the downloaded file
+    :type file_path: str
+    """
+    try:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    except OSError, e:
+        _LOG.exception(e)
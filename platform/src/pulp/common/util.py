@@ -11,6 +11,40 @@
 # You should have received a copy of GPLv2 along with this software; if not,
 # see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
 
+import hashlib
+
+
+DEFAULT_CHECKSUM_TYPE = 'sha256'
+CHECKSUM_CHUNK_SIZE = 1048576 # bytes read per update of the checksum
+
+
+def calculate_checksum(file_path, checksum_type=DEFAULT_CHECKSUM_TYPE, chunk_size=CHECKSUM_CHUNK_SIZE):
+    """
+    Calculate the checksum of a file, reading it in chunks so that large files
+    are not loaded into memory.
+
+    @param file_path: full path to the file
+    @type  file_path: str
+    @param checksum_type: any hash algorithm name supported by hashlib
+    @type  checksum_type: str
+    @param chunk_size: number of bytes to read at a time
+    @type  chunk_size: int
+    @return: hex digest of the file's contents
+    @rtype:  str
+    @raise ValueError: if the checksum type is not supported
+    """
+    hasher = hashlib.new(checksum_type.lower())
+    f = open(file_path, 'rb')
+    try:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            hasher.update(data)
+    finally:
+        f.close()
+    return hasher.hexdigest()
+
 
 def encode_unicode(path):
     """
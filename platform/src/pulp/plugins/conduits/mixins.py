@@ -14,6 +14,7 @@
 from gettext import gettext as _
 import logging
 import sys
+import threading
 
 import pulp.plugins.conduits._common as common_utils
 from   pulp.plugins.model import Unit, PublishReport
@@ -30,6 +31,10 @@ from   pulp.server.db.model.criteria import UnitAssociationCriteria, Criteria
 
 _LOG = logging.getLogger(__name__)
 
+# Number of units resolved against the database, inserted and associated in a
+# single round of queries by AddUnitMixin.save_units
+DEFAULT_SAVE_BATCH_SIZE = 500
+
 # -- exceptions ---------------------------------------------------------------
 
 class ImporterConduitException(Exception):
@@ -146,6 +151,30 @@ class SingleRepoUnitsMixin(object):
         """
         return do_get_repo_units(self.repo_id, criteria, self.exception_class)
 
+    def get_units_iter(self, criteria=None, batch_size=None):
+        """
+        Generator variation of get_units. Units are loaded from the server in
+        batches as the generator is consumed, so memory usage is bounded by
+        the batch size rather than the size of the repository. This should be
+        preferred over get_units when walking all of the units in a large
+        repository, for instance during a publish.
+
+        Units are returned in association order; sorting on unit metadata is
+        not supported by this call.
+
+        @param criteria: used to scope the returned results or the data within;
+               the Criteria class can be imported from this module
+        @type  criteria: L{UnitAssociationCriteria}
+
+        @param batch_size: number of units to load from the server at a time;
+               defaults to the server's configured value
+        @type  batch_size: int
+
+        @return: generator of unit instances
+        @rtype:  generator of L{AssociatedUnit}
+        """
+        return do_get_repo_units_iter(self.repo_id, criteria, self.exception_class, batch_size)
+
 
 class MultipleRepoUnitsMixin(object):
 
@@ -169,6 +198,28 @@ class MultipleRepoUnitsMixin(object):
         """
         return do_get_repo_units(repo_id, criteria, self.exception_class)
 
+    def get_units_iter(self, repo_id, criteria=None, batch_size=None):
+        """
+        Generator variation of get_units. Units are loaded from the server in
+        batches as the generator is consumed, so memory usage is bounded by
+        the batch size rather than the size of the repository.
+
+        Units are returned in association order; sorting on unit metadata is
+        not supported by this call.
+
+        @param criteria: used to scope the returned results or the data within;
+               the Criteria class can be imported from this module
+        @type  criteria: L{UnitAssociationCriteria}
+
+        @param batch_size: number of units to load from the server at a time;
+               defaults to the server's configured value
+        @type  batch_size: int
+
+        @return: generator of unit instances
+        @rtype:  generator of L{AssociatedUnit}
+        """
+        return do_get_repo_units_iter(repo_id, criteria, self.exception_class, batch_size)
+
 
 class SearchUnitsMixin(object):
 
@@ -386,6 +437,11 @@ class AddUnitMixin(object):
 
         self._association_owner_id = association_owner_id
 
+        # Units queued through queue_unit that have yet to be flushed
+        self.save_batch_size = DEFAULT_SAVE_BATCH_SIZE
+        self._unit_buffer = []
+        self._unit_lock = threading.RLock()
+
     def init_unit(self, type_id, unit_key, metadata, relative_path):
         """
         Initializes the Pulp representation of a content unit. The conduit will
@@ -480,6 +536,192 @@ class AddUnitMixin(object):
             _LOG.exception(_('Content unit association failed [%s]' % str(unit)))
             raise ImporterConduitException(e), None, sys.exc_info()[2]
 
+    def save_units(self, units):
+        """
+        Bulk variation of save_unit. The units are processed in batches of
+        save_batch_size; for each batch, existing units are resolved with a
+        single query per unit type, existing units whose metadata changed are
+        updated with one bulk call per unit type, new units are inserted with a
+        single multi-document insert and the associations (and the repository's
+        unit count) are created with one bulk call per unit type.
+
+        This call is idempotent in the same way save_unit is. If the same unit
+        key appears more than once in the list, the first occurrence creates
+        the unit and the subsequent ones are treated as updates.
+
+        The id field of each provided unit will be populated with the UUID for
+        the unit.
+
+        @param units: unit objects returned from the init_unit call
+        @type  units: list of L{Unit}
+
+        @return: object references to the provided units, their state updated
+                 from the call
+        @rtype:  list of L{Unit}
+        """
+        units = list(units)
+        batch_size = max(1, self.save_batch_size)
+        for i in range(0, len(units), batch_size):
+            self._save_unit_batch(units[i:i + batch_size])
+        return units
+
+    def queue_unit(self, unit):
+        """
+        Buffered variation of save_unit. The unit is held by the conduit and
+        saved, along with any other queued units, when the number of queued
+        units reaches save_batch_size or flush_units is called. Importers using
+        this call must call flush_units (or discard_units) before the
+        operation completes; building the sync report does so implicitly.
+
+        The unit's id field is not populated until the unit is flushed.
+
+        @param unit: unit object returned from the init_unit call
+        @type  unit: L{Unit}
+        """
+        self._unit_lock.acquire()
+        try:
+            self._unit_buffer.append(unit)
+            if len(self._unit_buffer) >= self.save_batch_size:
+                self.flush_units()
+        finally:
+            self._unit_lock.release()
+
+    def flush_units(self):
+        """
+        Saves and associates all units queued through queue_unit. This call
+        has no effect if there are no queued units.
+
+        The units remain queued if saving them fails, so a subsequent flush
+        will attempt to save them again.
+
+        @return: the units that were flushed, their id fields populated
+        @rtype:  list of L{Unit}
+        """
+        self._unit_lock.acquire()
+        try:
+            units = self.save_units(self._unit_buffer)
+            self._unit_buffer = []
+            return units
+        finally:
+            self._unit_lock.release()
+
+    def discard_units(self):
+        """
+        Discards all units queued through queue_unit without saving them.
+
+        @return: the units that were discarded
+        @rtype:  list of L{Unit}
+        """
+        self._unit_lock.acquire()
+        try:
+            units = self._unit_buffer
+            self._unit_buffer = []
+            return units
+        finally:
+            self._unit_lock.release()
+
+    def _save_unit_batch(self, units):
+        """
+        Saves and associates a single batch of units. See save_units for the
+        semantics.
+
+        @type units: list of L{Unit}
+        """
+        try:
+            content_query_manager = manager_factory.content_query_manager()
+            content_manager = manager_factory.content_manager()
+            association_manager = manager_factory.repo_unit_association_manager()
+
+            # Preserve the order in which the types are first encountered
+            units_by_type = {}
+            type_ids = []
+            for unit in units:
+                if unit.type_id not in units_by_type:
+                    type_ids.append(unit.type_id)
+                units_by_type.setdefault(unit.type_id, []).append(unit)
+
+            added_count = 0
+            updated_count = 0
+
+            for type_id in type_ids:
+                type_units = units_by_type[type_id]
+                key_fields = sorted(type_units[0].unit_key)
+                pulp_units = [common_utils.to_pulp_unit(u) for u in type_units]
+
+                # The existing units are fetched with the fields being saved so
+                # that units whose stored metadata is unchanged are not written.
+                # The multi keys query may return a superset of the requested
+                # units, so the results are matched back by unit key here
+                fields = set(['_id'])
+                for pulp_unit in pulp_units:
+                    fields.update(pulp_unit.keys())
+                existing_units = content_query_manager.get_multiple_units_by_keys_dicts(
+                    type_id, [u.unit_key for u in type_units], list(fields))
+                existing_docs = {}
+                for existing_unit in existing_units:
+                    signature = tuple((k, existing_unit.get(k)) for k in key_fields)
+                    existing_docs[signature] = existing_unit
+
+                new_units = {} # maps unit key signature to the units to insert
+                new_signatures = []
+                updated_units = {} # maps unit id to its merged metadata
+                unit_docs = {} # maps unit id to its stored document
+                for unit, pulp_unit in zip(type_units, pulp_units):
+                    signature = tuple((k, unit.unit_key.get(k)) for k in key_fields)
+                    if signature in existing_docs:
+                        unit.id = existing_docs[signature]['_id']
+                        unit_docs[unit.id] = existing_docs[signature]
+                        updated_units.setdefault(unit.id, {}).update(pulp_unit)
+                        updated_count += 1
+                    else:
+                        if signature not in new_units:
+                            new_signatures.append(signature)
+                        new_units.setdefault(signature, []).append(unit)
+
+                # Duplicates within the batch are merged in order so the stored
+                # unit matches what sequential save_unit calls would produce
+                new_docs = []
+                for signature in new_signatures:
+                    doc = {}
+                    for unit in new_units[signature]:
+                        doc.update(common_utils.to_pulp_unit(unit))
+                    new_docs.append(doc)
+
+                changed_units = {}
+                for unit_id, pulp_unit in updated_units.items():
+                    unit_doc = unit_docs[unit_id]
+                    if [f for f in pulp_unit if unit_doc.get(f) != pulp_unit[f]]:
+                        changed_units[unit_id] = pulp_unit
+                content_manager.update_content_units(type_id, changed_units)
+                new_ids = content_manager.add_content_units(type_id, new_docs)
+                for signature, unit_id in zip(new_signatures, new_ids):
+                    for unit in new_units[signature]:
+                        unit.id = unit_id
+                    added_count += 1
+                    updated_count += len(new_units[signature]) - 1
+
+                unit_ids = []
+                seen_ids = set()
+                for unit in type_units:
+                    if unit.id not in seen_ids:
+                        seen_ids.add(unit.id)
+                        unit_ids.append(unit.id)
+
+                association_manager.associate_all_by_ids(self.repo_id, type_id, unit_ids,
+                                                         self.association_owner_type,
+                                                         self.association_owner_id)
+
+            self._unit_lock.acquire()
+            try:
+                self._added_count += added_count
+                self._updated_count += updated_count
+            finally:
+                self._unit_lock.release()
+
+        except Exception, e:
+            _LOG.exception(_('Bulk content unit association failed for [%(n)s] units') % {'n' : len(units)})
+            raise ImporterConduitException(e), None, sys.exc_info()[2]
+
     def link_unit(self, from_unit, to_unit, bidirectional=False):
         """
         Creates a reference between two content units. The semantics of what
@@ -607,3 +849,24 @@ def do_get_repo_units(repo_id, criteria, exception_class):
         _LOG.exception('Exception from server requesting all content units for repository [%s]' % repo_id)
         raise exception_class(e), None, sys.exc_info()[2]
 
+
+
+def do_get_repo_units_iter(repo_id, criteria, exception_class, batch_size=None):
+    """
+    Generator variation of do_get_repo_units. Type definitions are loaded as
+    each new type is encountered.
+    """
+    try:
+        association_query_manager = manager_factory.repo_unit_association_query_manager()
+        units = association_query_manager.get_units_iter(repo_id, criteria=criteria, batch_size=batch_size)
+
+        type_defs = {}
+        for unit in units:
+            type_id = unit['unit_type_id']
+            if type_id not in type_defs:
+                type_defs[type_id] = types_db.type_definition(type_id)
+            yield common_utils.to_plugin_associated_unit(unit, type_defs[type_id])
+
+    except Exception, e:
+        _LOG.exception('Exception from server requesting content units for repository [%s]' % repo_id)
+        raise exception_class(e), None, sys.exc_info()[2]
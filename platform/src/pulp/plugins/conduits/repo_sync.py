@@ -29,7 +29,9 @@ its calls into this conduit:
    b. Uses the storage_path field in the returned unit to save the bits for the
       unit to disk.
    c. Calls save_unit which creates/updates Pulp's knowledge of the content unit
-      and creates an association between the unit and the repository
+      and creates an association between the unit and the repository. For
+      large repositories, save_units or queue_unit/flush_units can be used
+      instead to save the units in batches.
    d. If necessary, calls link_unit to establish any relationships between units.
 3. For units previously associated with the repository (known from get_units)
    that should no longer be, calls remove_unit to remove that association.
@@ -126,12 +128,16 @@ class RepoSyncConduit(RepoScratchPadMixin, ImporterScratchPadMixin, AddUnitMixin
         If these are inaccurate for a given plugin's implementation, the counts
         can be changed in the returned report before returning it to Pulp.
 
+        Any units queued through queue_unit are flushed before the report is
+        built.
+
         @param summary: short log of the sync; may be None but probably shouldn't be
         @type  summary: any serializable
 
         @param details: potentially longer log of the sync; may be None
         @type  details: any serializable
         """
+        self.flush_units()
         r = SyncReport(True, self._added_count, self._updated_count,
                        self._removed_count, summary, details)
         return r
@@ -151,12 +157,22 @@ class RepoSyncConduit(RepoScratchPadMixin, ImporterScratchPadMixin, AddUnitMixin
         be overridden if the plugin attempts to do some form of rollback due to
         the encountered error.
 
+        Any units queued through queue_unit are flushed before the report is
+        built. If they cannot be saved, they are discarded and the report is
+        built regardless.
+
         @param summary: short log of the sync; may be None but probably shouldn't be
         @type  summary: any serializable
 
         @param details: potentially longer log of the sync; may be None
         @type  details: any serializable
         """
+        try:
+            self.flush_units()
+        except ImporterConduitException:
+            # Already logged; the sync is reported as failed either way
+            discarded = self.discard_units()
+            _LOG.warn(_('Discarded [%(n)s] queued units') % {'n' : len(discarded)})
         r = SyncReport(False, self._added_count, self._updated_count,
                        self._removed_count, summary, details)
         return r
@@ -120,6 +120,35 @@ class ImportUnitConduit(ImporterScratchPadMixin, RepoScratchPadMixin,
             _LOG.exception(_('Content unit association failed [%s]' % str(unit)))
             raise UnitImportConduitException(e), None, sys.exc_info()[2]
 
+    def associate_units(self, units):
+        """
+        Bulk variation of associate_unit. The associations are created with a
+        single query and multi-document insert per unit type (per batch)
+        rather than a series of calls for each unit.
+
+        This call is idempotent. Units whose associations already exist are
+        ignored.
+
+        @param units: unit objects with their id fields populated
+        @type  units: list of L{Unit}
+
+        @return: object references to the provided units
+        @rtype:  list of L{Unit}
+        """
+
+        try:
+            unit_ids_by_type = {}
+            for unit in units:
+                unit_ids_by_type.setdefault(unit.type_id, []).append(unit.id)
+
+            for type_id, unit_ids in unit_ids_by_type.items():
+                self.__association_manager.associate_all_by_ids(self.dest_repo_id, type_id, unit_ids, self.association_owner_type, self.association_owner_id)
+
+            return units
+        except Exception, e:
+            _LOG.exception(_('Content unit association failed for [%(n)s] units') % {'n' : len(units)})
+            raise UnitImportConduitException(e), None, sys.exc_info()[2]
+
     def get_source_units(self, criteria=None):
         """
         Returns the collection of content units associated with the source
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+In-memory index of the permissions and super users in the database, so that
+authorization checks do not query the database.
+
+The index is loaded from the database on first use and is kept current by the
+user, role and permission managers, which report each change they save. As
+a safety net against changes made outside of this process, it is reloaded
+once it is older than the [security] authorization_index_refresh option.
+"""
+
+import logging
+import threading
+import time
+
+from pulp.server import config as pulp_config
+from pulp.server.db.model.auth import Permission, User
+
+
+_LOG = logging.getLogger(__name__)
+
+SUPER_USER_ROLE = 'super-users'
+
+# resource trie ----------------------------------------------------------------
+
+class _Node(object):
+    """
+    Node of the resource trie; one per resource path component.
+    @ivar children: path component -> child node
+    @ivar users: login -> set of operations permitted on the node's resource
+    """
+
+    __slots__ = ('children', 'users')
+
+    def __init__(self):
+        self.children = {}
+        self.users = {}
+
+
+def _resource_parts(resource):
+    """
+    Split a resource path into its components.
+    @return: list of path components; None if the resource is not in the
+             normalized /a/b/ form that authorization checks look up
+    @rtype:  list or None
+    """
+    parts = [p for p in resource.split('/') if p]
+    if parts and resource != '/%s/' % '/'.join(parts):
+        return None
+    if not parts and resource != '/':
+        return None
+    return parts
+
+# authorization index class ----------------------------------------------------
+
+class AuthorizationIndex(object):
+    """
+    AuthorizationIndex class
+    Trie of resource paths whose nodes hold the operations each user is
+    permitted on the resource, along with the known users and which of them
+    are super users. Role permissions are already granted to each member of
+    the role by the role manager, so the per-user permissions include them.
+    """
+
+    def __init__(self):
+        self.__root = _Node()
+        self.__users = {} # login -> is super user
+        self.__lock = threading.RLock()
+
+    # loading methods ----------------------------------------------------------
+
+    def load(self, permissions, users):
+        """
+        Replace the contents of the index.
+        @param permissions: all of the permissions
+        @type  permissions: iterable of L{Permission}
+        @param users: all of the users
+        @type  users: iterable of L{User}
+        """
+        self.__lock.acquire()
+        try:
+            self.__root = _Node()
+            self.__users = {}
+            for permission in permissions:
+                self.set_permission(permission['resource'], permission['users'])
+            for user in users:
+                self.set_user(user['login'], user['roles'])
+        finally:
+            self.__lock.release()
+
+    # update methods -----------------------------------------------------------
+
+    def set_permission(self, resource, users):
+        """
+        Set the operations each user is permitted on a resource.
+        @param resource: resource path
+        @type  resource: str
+        @param users: login -> list of operations
+        @type  users: dict
+        """
+        parts = _resource_parts(resource)
+        if parts is None:
+            return
+        self.__lock.acquire()
+        try:
+            node = self.__root
+            for part in parts:
+                node = node.children.setdefault(part, _Node())
+            node.users = dict((login, frozenset(operations))
+                              for login, operations in users.items() if operations)
+        finally:
+            self.__lock.release()
+
+    def remove_permission(self, resource):
+        """
+        Remove all of the operations permitted on a resource.
+        @param resource: resource path
+        @type  resource: str
+        """
+        parts = _resource_parts(resource)
+        if parts is None:
+            return
+        self.__lock.acquire()
+        try:
+            path = [self.__root]
+            for part in parts:
+                node = path[-1].children.get(part)
+                if node is None:
+                    return
+                path.append(node)
+            path[-1].users = {}
+            # prune the nodes left without permissions or children
+            for depth in range(len(parts), 0, -1):
+                node = path[depth]
+                if node.users or node.children:
+                    break
+                del path[depth - 1].children[parts[depth - 1]]
+        finally:
+            self.__lock.release()
+
+    def set_user(self, login, roles):
+        """
+        Record a user and whether they are a super user.
+        @param login: user's login
+        @type  login: str
+        @param roles: ids of the roles the user belongs to
+        @type  roles: list
+        """
+        self.__lock.acquire()
+        try:
+            self.__users[login] = SUPER_USER_ROLE in (roles or ())
+        finally:
+            self.__lock.release()
+
+    def remove_user(self, login):
+        """
+        Forget a deleted user.
+        @param login: user's login
+        @type  login: str
+        """
+        self.__lock.acquire()
+        try:
+            self.__users.pop(login, None)
+        finally:
+            self.__lock.release()
+
+    # query methods ------------------------------------------------------------
+
+    def is_superuser(self, login):
+        """
+        @param login: user's login
+        @type  login: str
+        @return: True if the user is a super user, False if not, None if the
+                 user does not exist
+        @rtype:  bool or None
+        """
+        self.__lock.acquire()
+        try:
+            return self.__users.get(login)
+        finally:
+            self.__lock.release()
+
+    def is_authorized(self, resource, login, operation):
+        """
+        Check whether a user is permitted an operation on a resource, or on
+        any of the resource's ancestors up to and including the root.
+        NOTE: super users are not considered; see is_superuser
+        @param resource: resource path
+        @type  resource: str
+        @param login: user's login
+        @type  login: str
+        @param operation: operation to be performed on the resource
+        @type  operation: int
+        @rtype: bool
+        """
+        parts = [p for p in resource.split('/') if p]
+        self.__lock.acquire()
+        try:
+            node = self.__root
+            if operation in node.users.get(login, ()):
+                return True
+            for part in parts:
+                node = node.children.get(part)
+                if node is None:
+                    return False
+                if operation in node.users.get(login, ()):
+                    return True
+            return False
+        finally:
+            self.__lock.release()
+
+# authorization index api ------------------------------------------------------
+
+_INDEX = None
+_LOADED = 0.0
+_LOCK = threading.RLock()
+
+
+def _refresh_interval():
+    return pulp_config.config.getfloat('security', 'authorization_index_refresh')
+
+
+def enabled():
+    """
+    @return: True if authorization checks should use the index
+    @rtype:  bool
+    """
+    return _refresh_interval() > 0
+
+
+def authorization_index():
+    """
+    Get the authorization index, loading it from the database if it has not
+    been loaded yet or was loaded longer ago than the refresh interval.
+    @rtype: L{AuthorizationIndex}
+    """
+    global _INDEX, _LOADED
+    _LOCK.acquire()
+    try:
+        if _INDEX is None or time.time() - _LOADED > _refresh_interval():
+            # NOTE the lock is held while reading the database so that changes
+            # reported during the load are applied after it, not lost
+            index = AuthorizationIndex()
+            index.load(Permission.get_collection().find(), User.get_collection().find())
+            _INDEX = index
+            _LOADED = time.time()
+        return _INDEX
+    finally:
+        _LOCK.release()
+
+
+def _loaded_index():
+    """
+    @return: the index if it is loaded, otherwise None as there is nothing
+             to update; the changes will be read when it is loaded
+    """
+    return _INDEX
+
+
+def permission_saved(permission):
+    """
+    Report that a permission was created or updated.
+    @type permission: L{Permission}
+    """
+    _LOCK.acquire()
+    try:
+        index = _loaded_index()
+        if index is not None:
+            index.set_permission(permission['resource'], permission['users'])
+    finally:
+        _LOCK.release()
+
+
+def permission_deleted(resource):
+    """
+    Report that the permission for a resource was deleted.
+    @type resource: str
+    """
+    _LOCK.acquire()
+    try:
+        index = _loaded_index()
+        if index is not None:
+            index.remove_permission(resource)
+    finally:
+        _LOCK.release()
+
+
+def user_saved(user):
+    """
+    Report that a user was created or updated.
+    @type user: L{User}
+    """
+    _LOCK.acquire()
+    try:
+        index = _loaded_index()
+        if index is not None:
+            index.set_user(user['login'], user['roles'])
+    finally:
+        _LOCK.release()
+
+
+def user_deleted(login):
+    """
+    Report that a user was deleted.
+    @type login: str
+    """
+    _LOCK.acquire()
+    try:
+        index = _loaded_index()
+        if index is not None:
+            index.remove_user(login)
+    finally:
+        _LOCK.release()
+
+
+def reset():
+    """
+    Discard the index; it is loaded from the database on next use.
+    """
+    global _INDEX, _LOADED
+    _LOCK.acquire()
+    try:
+        _INDEX = None
+        _LOADED = 0.0
+    finally:
+        _LOCK.release()
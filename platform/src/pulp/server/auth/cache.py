@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Cache of successfully verified credentials, so that a client making many
+calls only pays for password hashing or certificate verification once per
+time to live instead of on every request.
+
+Credentials are never stored; entries are keyed by an HMAC of the
+credentials under a secret generated when the cache is created, and map to
+the login or consumer ID the credentials authenticated as.
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from pulp.server import config as pulp_config
+
+
+_LOG = logging.getLogger(__name__)
+
+# kinds of principal an entry can authenticate as
+USER = 'user'
+CONSUMER = 'consumer'
+
+DEFAULT_TTL = 300 # seconds
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_STATS_INTERVAL = 3600 # seconds
+
+# authentication cache class ---------------------------------------------------
+
+class AuthenticationCache(object):
+    """
+    AuthenticationCache class
+    Bounded cache of verified credential fingerprints mapped to the principal
+    they authenticate as. Entries expire after the time to live and, when the
+    cache is full, the oldest entries are evicted first. All of the entries
+    for a principal can be invalidated at once, e.g. when a user's password is
+    changed. The cache's statistics are logged periodically as lookups are
+    made.
+
+    @ivar ttl: seconds an entry is valid for; 0 disables the cache
+    @type ttl: float
+    @ivar max_entries: maximum number of entries
+    @type max_entries: int
+    @ivar stats_interval: seconds between logging the statistics; 0 disables
+                          the logging
+    @type stats_interval: float
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+                 stats_interval=DEFAULT_STATS_INTERVAL):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats_interval = stats_interval
+
+        self.__secret = os.urandom(32)
+        self.__entries = {} # fingerprint -> (kind, principal id, expiration)
+        self.__principals = {} # (kind, principal id) -> set of fingerprints
+        self.__order = deque() # (fingerprint, expiration) in insertion order
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__invalidations = 0
+        self.__next_report = time.time() + stats_interval
+
+        self.__lock = threading.RLock()
+
+    # cache methods ------------------------------------------------------------
+
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def fingerprint(self, *credentials):
+        """
+        Compute the key for a set of credentials.
+        @param credentials: strings that together identify the credentials,
+                            e.g. the kind of check, login and password
+        @return: hex digest of the credentials
+        @rtype:  str
+        """
+        mac = hmac.new(self.__secret, digestmod=hashlib.sha256)
+        for c in credentials:
+            if isinstance(c, unicode):
+                c = c.encode('utf-8')
+            mac.update(str(c))
+            mac.update('\0')
+        return mac.hexdigest()
+
+    def get(self, fingerprint, kind):
+        """
+        Look up the principal verified credentials authenticate as.
+        @param fingerprint: key for the credentials
+        @type  fingerprint: str
+        @param kind: kind of principal expected, USER or CONSUMER
+        @type  kind: str
+        @return: login or consumer id; None if the credentials are not cached
+        @rtype:  str or None
+        """
+        if not self.enabled():
+            return None
+        now = time.time()
+        principal_id = None
+        self.__lock.acquire()
+        try:
+            entry = self.__entries.get(fingerprint)
+            if entry is not None and entry[0] == kind:
+                if entry[2] > now:
+                    principal_id = entry[1]
+                else:
+                    self.__remove(fingerprint)
+            if principal_id is None:
+                self.__misses += 1
+            else:
+                self.__hits += 1
+            report = self.__report_due(now)
+        finally:
+            self.__lock.release()
+        if report:
+            self.log_stats()
+        return principal_id
+
+    def put(self, fingerprint, kind, principal_id):
+        """
+        Record the principal verified credentials authenticate as.
+        @param fingerprint: key for the credentials
+        @type  fingerprint: str
+        @param kind: kind of principal, USER or CONSUMER
+        @type  kind: str
+        @param principal_id: login or consumer id
+        @type  principal_id: str
+        """
+        if not self.enabled():
+            return
+        self.__lock.acquire()
+        try:
+            self.__remove(fingerprint)
+            expiration = time.time() + self.ttl
+            self.__entries[fingerprint] = (kind, principal_id, expiration)
+            self.__principals.setdefault((kind, principal_id), set()).add(fingerprint)
+            self.__order.append((fingerprint, expiration))
+            while len(self.__entries) > self.max_entries:
+                self.__evict_oldest()
+        finally:
+            self.__lock.release()
+
+    def invalidate(self, kind, principal_id):
+        """
+        Remove all of the entries that authenticate as the given principal.
+        @param kind: kind of principal, USER or CONSUMER
+        @type  kind: str
+        @param principal_id: login or consumer id
+        @type  principal_id: str
+        """
+        self.__lock.acquire()
+        try:
+            fingerprints = self.__principals.get((kind, principal_id), ())
+            for fingerprint in list(fingerprints):
+                self.__remove(fingerprint)
+                self.__invalidations += 1
+        finally:
+            self.__lock.release()
+
+    def clear(self):
+        """
+        Remove all of the entries.
+        """
+        self.__lock.acquire()
+        try:
+            self.__entries.clear()
+            self.__principals.clear()
+            self.__order.clear()
+        finally:
+            self.__lock.release()
+
+    # internal methods ---------------------------------------------------------
+
+    def __remove(self, fingerprint):
+        """
+        Remove an entry; its position in the eviction order is dropped lazily.
+        NOTE: must be called with the lock held
+        """
+        entry = self.__entries.pop(fingerprint, None)
+        if entry is None:
+            return
+        key = (entry[0], entry[1])
+        fingerprints = self.__principals.get(key)
+        fingerprints.discard(fingerprint)
+        if not fingerprints:
+            del self.__principals[key]
+
+    def __evict_oldest(self):
+        """
+        Remove the oldest live entry.
+        NOTE: must be called with the lock held
+        """
+        while self.__order:
+            fingerprint, expiration = self.__order.popleft()
+            entry = self.__entries.get(fingerprint)
+            # skip positions of entries since removed or re-added
+            if entry is None or entry[2] != expiration:
+                continue
+            self.__remove(fingerprint)
+            self.__evictions += 1
+            return
+
+    def __report_due(self, now):
+        """
+        Determine whether the statistics are due to be logged and, if so,
+        schedule the next time they are.
+        NOTE: must be called with the lock held
+        """
+        if self.stats_interval <= 0 or now < self.__next_report:
+            return False
+        self.__next_report = now + self.stats_interval
+        return True
+
+    # statistics methods -------------------------------------------------------
+
+    def stats(self):
+        """
+        Report the cache's effectiveness.
+        Keys:
+         * entries: number of cached credentials
+         * max_entries: maximum number of cached credentials
+         * ttl: seconds an entry is valid for
+         * hits: lookups answered from the cache
+         * misses: lookups that required the credentials to be verified
+         * hit_rate: fraction of lookups answered from the cache
+         * evictions: entries removed to make room for new ones
+         * invalidations: entries removed because their principal changed
+        @return: cache statistics
+        @rtype:  dict
+        """
+        self.__lock.acquire()
+        try:
+            lookups = self.__hits + self.__misses
+            hit_rate = 0.0
+            if lookups:
+                hit_rate = float(self.__hits) / lookups
+            return {'entries': len(self.__entries),
+                    'max_entries': self.max_entries,
+                    'ttl': self.ttl,
+                    'hits': self.__hits,
+                    'misses': self.__misses,
+                    'hit_rate': hit_rate,
+                    'evictions': self.__evictions,
+                    'invalidations': self.__invalidations}
+        finally:
+            self.__lock.release()
+
+    def log_stats(self):
+        """
+        Log the cache's statistics.
+        """
+        stats = self.stats()
+        stats['hit_rate'] *= 100
+        _LOG.info('Authentication cache: %(entries)d of %(max_entries)d entries, '
+                  '%(hits)d hits, %(misses)d misses (%(hit_rate).1f%% hit rate), '
+                  '%(evictions)d evictions, %(invalidations)d invalidations' % stats)
+
+# authentication cache api -----------------------------------------------------
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def authentication_cache():
+    """
+    Get the server's authentication cache, creating it from the [security]
+    auth_cache_ttl, auth_cache_max_entries and auth_cache_stats_interval
+    options on first use.
+    @rtype: L{AuthenticationCache}
+    """
+    global _CACHE
+    if _CACHE is not None:
+        return _CACHE
+    _CACHE_LOCK.acquire()
+    try:
+        if _CACHE is None:
+            ttl = pulp_config.config.getfloat('security', 'auth_cache_ttl')
+            max_entries = pulp_config.config.getint('security', 'auth_cache_max_entries')
+            stats_interval = pulp_config.config.getfloat('security', 'auth_cache_stats_interval')
+            _CACHE = AuthenticationCache(ttl, max_entries, stats_interval)
+        return _CACHE
+    finally:
+        _CACHE_LOCK.release()
+
+
+def invalidate_user(login):
+    """
+    Drop the cached credentials of a user whose password, roles or existence
+    has changed.
+    @param login: user's login
+    @type  login: str
+    """
+    authentication_cache().invalidate(USER, login)
+
+
+def invalidate_consumer(consumer_id):
+    """
+    Drop the cached credentials of a consumer that has been unregistered.
+    @param consumer_id: consumer's id
+    @type  consumer_id: str
+    """
+    authentication_cache().invalidate(CONSUMER, consumer_id)
+
+
+def reset():
+    """
+    Discard the server's authentication cache; it is recreated from the
+    configuration on next use.
+    """
+    global _CACHE
+    _CACHE_LOCK.acquire()
+    try:
+        _CACHE = None
+    finally:
+        _CACHE_LOCK.release()
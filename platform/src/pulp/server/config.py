@@ -21,6 +21,10 @@ config = None # ConfigParser.SafeConfigParser instance
 
 # to guarantee that a section and/or setting exists, add a default value here
 _default_values = {
+    'applicability': {
+        'refresh_interval': '60',
+        'refresh_batch_size': '1000',
+    },
     'consumer_history': {
         'lifetime': '180', # in days
     },
@@ -39,6 +43,7 @@ _default_values = {
         'name': 'pulp_database',
         'seeds': 'localhost:27017',
         'operation_retries': '2',
+        'query_batch_size': '1000',
     },
     'email': {
         'host': 'localhost',
@@ -79,6 +84,10 @@ _default_values = {
         'user_cert_expiration': '7',
         'consumer_cert_expiration': '3650',
         'serial_number_path': '/var/lib/pulp/sn.dat',
+        'auth_cache_ttl': '300',
+        'auth_cache_max_entries': '10000',
+        'auth_cache_stats_interval': '3600',
+        'authorization_index_refresh': '300',
     },
     'server': {
         'server_name': socket.gethostname(),
@@ -90,8 +99,12 @@ _default_values = {
     'tasks': {
         'concurrency_threshold': '9',
         'dispatch_interval': '0.5',
+        'worker_threads': '20',
         'archived_call_lifetime': '48',
         'consumer_content_weight': '0',
+        'consumer_group_concurrency': '10',
+        'long_poll_timeout': '30',
+        'long_poll_max_waiters': '4',
         'create_weight': '0',
         'publish_weight': '1',
         'sync_weight': '2',
@@ -12,9 +12,11 @@
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
 import datetime
+import hashlib
 
 from pulp.server.db.model.base import Model
 from pulp.common import dateutils
+from pulp.server.compat import json
 
 # -- classes -----------------------------------------------------------------
 
@@ -118,6 +120,8 @@ class UnitProfile(Model):
     @type content_type: str
     @ivar profile: The stored profile.
     @type profile: dict
+    @ivar profile_hash: A hash of the stored profile.
+    @type profile_hash: str
     """
 
     collection_name = 'consumer_unit_profiles'
@@ -138,6 +142,79 @@ class UnitProfile(Model):
         self.consumer_id = consumer_id
         self.content_type = content_type
         self.profile = profile
+        self.profile_hash = self.calculate_hash(profile)
+
+    @staticmethod
+    def calculate_hash(profile):
+        """
+        Calculate the hash of a profile.
+        Equal profiles have equal hashes, so profiles can be compared
+        by hash without being read.
+        @param profile: A profile.
+        @type profile: object
+        @return: The hex digest of the profile.
+        @rtype: str
+        """
+        digest = hashlib.sha256(json.dumps(profile, sort_keys=True))
+        return digest.hexdigest()
+
+
+class ConsumerApplicability(Model):
+    """
+    Represents the stored applicability of a content unit to a consumer.
+    The entry is current only while the consumer's profile for the unit
+    type and the content of the consumer's bound repositories are as they
+    were when the applicability was evaluated.
+    @ivar consumer_id: A consumer ID.
+    @type consumer_id: str
+    @ivar type_id: The unit type ID.
+    @type type_id: str
+    @ivar unit_key: The unit key.
+    @type unit_key: dict
+    @ivar unit_hash: A hash of the type ID and unit key.
+    @type unit_hash: str
+    @ivar profile_hash: The hash of the consumer's profile for the unit
+        type when evaluated; None when the consumer had no such profile.
+    @type profile_hash: str
+    @ivar repo_ids: The IDs of the repositories bound when evaluated.
+    @type repo_ids: list
+    @ivar repo_hash: A hash of the bound repositories and their content
+        versions when evaluated.
+    @type repo_hash: str
+    @ivar applicable: Indicates whether the unit is applicable.
+    @type applicable: bool
+    @ivar summary: The applicability report summary.
+    @type summary: object
+    @ivar details: The applicability report details.
+    @type details: object
+    @ivar stale: Indicates the profile or the bound repository content has
+        changed since evaluated and the entry needs to be refreshed.
+    @type stale: bool
+    """
+
+    collection_name = 'consumer_applicability'
+    unique_indices = (
+        ('consumer_id', 'unit_hash'),
+    )
+    search_indices = (
+        ('repo_ids', 'stale'),
+        'stale',
+    )
+
+    def __init__(self, consumer_id, type_id, unit_key, unit_hash,
+                 profile_hash, repo_ids, repo_hash, applicable, summary, details):
+        super(ConsumerApplicability, self).__init__()
+        self.consumer_id = consumer_id
+        self.type_id = type_id
+        self.unit_key = unit_key
+        self.unit_hash = unit_hash
+        self.profile_hash = profile_hash
+        self.repo_ids = repo_ids
+        self.repo_hash = repo_hash
+        self.applicable = applicable
+        self.summary = summary
+        self.details = details
+        self.stale = False
 
 
 class ConsumerHistoryEvent(Model):
@@ -45,6 +45,11 @@ class Repo(Model):
                               unit may be associated multiple times.
     @type content_unit_count: int
 
+    @ivar content_version: incremented each time units are associated with or
+                           unassociated from this repo, or the metadata of
+                           its units is updated
+    @type content_version: int
+
     @ivar metadata: arbitrary data that describes the contents of the repo;
                     the values may change as the contents of the repo change,
                     either set by the user or by an importer or distributor
@@ -63,6 +68,7 @@ class Repo(Model):
         self.notes = notes or {}
         self.scratchpad = {} # default to dict in hopes the plugins will just add/remove from it
         self.content_unit_count = content_unit_count
+        self.content_version = 0
 
         # Timeline
         # TODO: figure out how to track repo modified states
@@ -217,7 +223,8 @@ class RepoContentUnit(Model):
     # modifying the following index
     unique_indices = ( ('repo_id', 'unit_type_id', 'unit_id', 'owner_type', 'owner_id'), )
     search_indices = ( ('repo_id', 'unit_type_id', 'owner_type'),
-                       ('unit_type_id', 'created') # default sort order on get_units query, do not remove
+                       ('unit_type_id', 'created'), # default sort order on get_units query, do not remove
+                       ('unit_type_id', 'unit_id') # orphan lookups across all repositories
                      )
 
     OWNER_TYPE_IMPORTER = 'importer'
@@ -14,6 +14,7 @@
 import copy
 import datetime
 import logging
+import threading
 import time
 import types
 import uuid
@@ -25,6 +26,7 @@ from pulp.server.db.model.dispatch import QueuedCall, CallResource
 from pulp.server.dispatch import constants as dispatch_constants
 from pulp.server.dispatch import exceptions as dispatch_exceptions
 from pulp.server.dispatch import factory as dispatch_factory
+from pulp.server.dispatch import task as dispatch_task
 from pulp.server.dispatch.call import CallRequest
 from pulp.server.dispatch.task import AsyncTask, Task
 from pulp.server.exceptions import OperationTimedOut
@@ -44,7 +46,14 @@ class Coordinator(object):
     """
     Coordinator class that runs call requests in the task queue and detects and
     resolves conflicting operations on resources.
-    @ivar task_state_poll_interval: sleep interval to use while polling a "synchronous" task
+
+    The resources used by queued call requests are tracked in an in-memory
+    index, which is authoritative for conflict detection. It is not
+    persisted: on start, the interrupted calls are queued again, which
+    rebuilds it.
+
+    @ivar task_state_poll_interval: maximum interval between checks of a "synchronous"
+                                    task's state; state changes end the wait immediately
     @type task_state_poll_interval: float
     """
 
@@ -53,6 +62,13 @@ class Coordinator(object):
         self.task_state_poll_interval = task_state_poll_interval
         self.call_resource_collection = CallResource.get_collection()
 
+        # (resource type, resource id) -> {call request id: operation}
+        self.__resource_operations = {}
+        # call request id -> list of (resource type, resource id)
+        self.__call_request_resources = {}
+
+        self.__lock = threading.RLock()
+
     # explicit initialization --------------------------------------------------
 
     def start(self):
@@ -60,10 +76,11 @@ class Coordinator(object):
         Start the coordinator by clearing conflicting metadata and restarting any
         interrupted tasks.
         """
-        # drop all previous knowledge of previous calls
+        # drop all previous knowledge of previous calls, including the call
+        # resources stored by earlier versions, which are no longer used
         self.call_resource_collection.remove(safe=True)
 
-        # re-start interrupted tasks
+        # re-start interrupted tasks; queuing them again locks their resources
         queued_call_collection = QueuedCall.get_collection()
         queued_call_list = list(queued_call_collection.find().sort('timestamp'))
         queued_call_collection.remove(safe=True)
@@ -244,7 +261,7 @@ class Coordinator(object):
                 return
 
             if call_resource_list:
-                self.call_resource_collection.insert(call_resource_list, safe=True)
+                self._lock_resources(call_resource_list)
 
             for task in task_list:
                 task_queue.enqueue(task)
@@ -336,34 +353,37 @@ class Coordinator(object):
         rejecting_call_requests = set()
         rejecting_reasons = []
 
-        call_resource_collection = CallResource.get_collection()
         call_resources = resource_dict_to_call_resources(resources)
-        or_query = filter_dicts(call_resources, ('resource_type', 'resource_id'))
-        cursor = call_resource_collection.find({'$or': or_query})
 
-        for call_resource in cursor:
-            proposed_operation = resources[call_resource['resource_type']][call_resource['resource_id']]
-            queued_operation = call_resource['operation']
+        self.__lock.acquire()
+        try:
+            for call_resource in call_resources:
+                key = (call_resource['resource_type'], call_resource['resource_id'])
+                queued_operations = self.__resource_operations.get(key)
 
-            postponing_operations = get_postponing_operations(proposed_operation)
+                if not queued_operations:
+                    continue
 
-            if queued_operation in postponing_operations:
-                postponing_call_requests.add(call_resource['call_request_id'])
-                reason = filter_dicts([call_resource], ('resource_type', 'resource_id'))[0]
-                reason['operation'] = queued_operation
+                proposed_operation = call_resource['operation']
+                postponing_operations = get_postponing_operations(proposed_operation)
+                rejecting_operations = get_rejecting_operations(proposed_operation)
 
-                if reason not in postponing_reasons:
-                    postponing_reasons.append(reason)
+                for call_request_id, queued_operation in queued_operations.items():
+                    reason = {'resource_type': key[0], 'resource_id': key[1], 'operation': queued_operation}
 
-            rejecting_operations = get_rejecting_operations(proposed_operation)
+                    if queued_operation in postponing_operations:
+                        postponing_call_requests.add(call_request_id)
 
-            if queued_operation in rejecting_operations:
-                rejecting_call_requests.add(call_resource['call_request_id'])
-                reason = filter_dicts([call_resource], ('resource_type', 'resource_id'))[0]
-                reason['operation'] = queued_operation
+                        if reason not in postponing_reasons:
+                            postponing_reasons.append(reason)
 
-                if reason not in rejecting_reasons:
-                    rejecting_reasons.append(reason)
+                    if queued_operation in rejecting_operations:
+                        rejecting_call_requests.add(call_request_id)
+
+                        if reason not in rejecting_reasons:
+                            rejecting_reasons.append(reason)
+        finally:
+            self.__lock.release()
 
         if rejecting_call_requests:
             return dispatch_constants.CALL_REJECTED_RESPONSE, rejecting_call_requests, rejecting_reasons, call_resources
@@ -373,6 +393,44 @@ class Coordinator(object):
 
         return dispatch_constants.CALL_ACCEPTED_RESPONSE, set(), [], call_resources
 
+    # resource index methods ---------------------------------------------------
+
+    def _lock_resources(self, call_resources):
+        """
+        Add call resources to the resource index, so that they are taken into
+        account by subsequent conflict detection.
+        @param call_resources: call resources with their call request ids set
+        @type  call_resources: list of L{CallResource} instances
+        """
+        self.__lock.acquire()
+        try:
+            for call_resource in call_resources:
+                key = (call_resource['resource_type'], call_resource['resource_id'])
+                call_request_id = call_resource['call_request_id']
+                self.__resource_operations.setdefault(key, {})[call_request_id] = call_resource['operation']
+                self.__call_request_resources.setdefault(call_request_id, []).append(key)
+        finally:
+            self.__lock.release()
+
+    def _unlock_resources(self, call_request_id):
+        """
+        Remove all of a call request's call resources from the resource index.
+        @param call_request_id: call request id
+        @type  call_request_id: str
+        """
+        self.__lock.acquire()
+        try:
+            keys = self.__call_request_resources.pop(call_request_id, None)
+            if keys is None:
+                return
+            for key in keys:
+                queued_operations = self.__resource_operations.get(key, {})
+                queued_operations.pop(call_request_id, None)
+                if not queued_operations:
+                    self.__resource_operations.pop(key, None)
+        finally:
+            self.__lock.release()
+
     # query methods ------------------------------------------------------------
 
     def get_call_reports_by_call_request_ids(self, call_request_id_list, include_completed=False):
@@ -450,6 +508,43 @@ class Coordinator(object):
         tasks = self._find_tasks(**criteria)
         return [t.call_report for t in tasks]
 
+    def wait_for_call_reports(self, timeout, known_state=None, **criteria):
+        """
+        Wait for the tasks that match the criteria to change, then find their
+        call reports. The wait ends as soon as any of the tasks changes state
+        or reports progress, or when the timeout expires. It does not start if
+        there are no such tasks, they are all complete or, when known_state is
+        given, any of them is no longer in that state.
+
+        Supports the same criteria as find_call_reports.
+
+        @param timeout: maximum number of seconds to wait
+        @type  timeout: float
+        @param known_state: state the caller last saw the tasks in
+        @type  known_state: None or str
+        @return: call reports of the tasks that match the criteria
+        @rtype:  list
+        """
+        deadline = time.time() + timeout
+        initial_changes = None
+        while True:
+            count = dispatch_task.change_count()
+            tasks = self._find_tasks(**criteria)
+            changes = dict((t.call_request.id, t.change_count) for t in tasks)
+            if initial_changes is None:
+                initial_changes = changes
+            if changes != initial_changes:
+                break
+            states = set(t.call_report.state for t in tasks)
+            if not states.difference(dispatch_constants.CALL_COMPLETE_STATES):
+                break
+            if known_state is not None and states != set([known_state]):
+                break
+            remaining = deadline - time.time()
+            if remaining <= 0 or not dispatch_task.wait_for_change(count, remaining):
+                break
+        return [t.call_report for t in tasks]
+
     # control methods ----------------------------------------------------------
 
     def complete_call_success(self, call_request_id, result=None):
@@ -609,13 +704,15 @@ def set_call_request_id_on_call_resources(call_request_id, call_resources):
 def wait_for_task(task, states, poll_interval=0.5, timeout=None):
     """
     Wait for a task to be in a certain set of states
+    The wait is woken as soon as the task changes state; the state is also
+    re-checked every poll interval in case it is changed without notification.
     @param task: task to wait for
     @type  task: L{Task}
     @param states: set of valid states
     @type  states: list or tuple
-    @param poll_interval: time, in seconds, to wait in between polling the task
+    @param poll_interval: maximum time, in seconds, to wait in between checks of the task
     @type  poll_interval: float or int
-    @param timeout: maximum amount of time to poll task, None means indefinitely
+    @param timeout: maximum amount of time to wait for the task, None means indefinitely
     @type  timeout: None or datetime.timedelta
     """
     assert isinstance(task, Task)
@@ -624,14 +721,21 @@ def wait_for_task(task, states, poll_interval=0.5, timeout=None):
     assert isinstance(timeout, (datetime.timedelta, types.NoneType))
 
     start = datetime.datetime.now()
-    while task.call_report.state not in states:
-        time.sleep(poll_interval)
-        if timeout is None:
-            continue
-        now = datetime.datetime.now()
-        if now - start < timeout:
-            continue
-        raise OperationTimedOut(timeout)
+    while True:
+        count = dispatch_task.change_count()
+        if task.call_report.state in states:
+            return
+        wait = poll_interval
+        if timeout is not None:
+            remaining = timeout - (datetime.datetime.now() - start)
+            if remaining <= datetime.timedelta(0):
+                raise OperationTimedOut(timeout)
+            wait = min(wait, _total_seconds(remaining))
+        dispatch_task.wait_for_change(count, wait)
+
+
+def _total_seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1000000.0
 
 # query utility functions ------------------------------------------------------
 
@@ -677,6 +781,9 @@ def coordinator_dequeue_callback(call_request, call_report):
     @param call_report: call report for the call
     @type  call_report: L{call.CallReport} instance
     """
-    collection = CallResource.get_collection()
-    collection.remove({'call_request_id': call_request.id}, safe=True)
+    # the coordinator is finalized before the task queue, see dispatch.factory
+    coordinator = dispatch_factory._COORDINATOR
+    if coordinator is None:
+        return
+    coordinator._unlock_resources(call_request.id)
 
@@ -19,6 +19,7 @@ from pulp.server.dispatch import context as dispatch_context
 _COORDINATOR = None
 _SCHEDULER = None
 _TASK_QUEUE = None
+_WORKER_POOL = None
 
 # initialization ---------------------------------------------------------------
 
@@ -46,14 +47,26 @@ def _initialize_task_queue():
     from pulp.server.dispatch.taskqueue import TaskQueue
     concurrency_threshold = pulp_config.config.getint('tasks', 'concurrency_threshold')
     dispatch_interval = pulp_config.config.getfloat('tasks', 'dispatch_interval')
-    _TASK_QUEUE = TaskQueue(concurrency_threshold, dispatch_interval)
+    _TASK_QUEUE = TaskQueue(concurrency_threshold, dispatch_interval, worker_pool=_WORKER_POOL)
     _TASK_QUEUE.start()
 
 
+def _initialize_worker_pool():
+    global _WORKER_POOL
+    assert _WORKER_POOL is None
+    from pulp.server.dispatch.pool import WorkerPool
+    # there must be a worker thread for every unit of weight the task queue can
+    # run concurrently, the remainder is shared by tasks of weight 0
+    concurrency_threshold = pulp_config.config.getint('tasks', 'concurrency_threshold')
+    worker_threads = pulp_config.config.getint('tasks', 'worker_threads')
+    _WORKER_POOL = WorkerPool(max(worker_threads, concurrency_threshold, 1))
+
+
 def initialize():
     # order sensitive
     from pulp.server.dispatch import pickling
     pickling.initialize()
+    _initialize_worker_pool()
     _initialize_task_queue()
     _initialize_coordinator()
     _initialize_scheduler()
@@ -80,6 +93,13 @@ def _finalize_task_queue(clear_queued_calls):
     _TASK_QUEUE = None
 
 
+def _finalize_worker_pool():
+    global _WORKER_POOL
+    assert _WORKER_POOL is not None
+    _WORKER_POOL.stop()
+    _WORKER_POOL = None
+
+
 def finalize(clear_queued_calls=False):
     # NOTE this is not required for the pulp server, but is for unit testing
     # order sensitive
@@ -87,6 +107,7 @@ def finalize(clear_queued_calls=False):
     _finalize_scheduler()
     _finalize_coordinator()
     _finalize_task_queue(clear_queued_calls)
+    _finalize_worker_pool()
 
 # factory functions ------------------------------------------------------------
 
@@ -129,3 +150,13 @@ def _task_queue():
     """
     assert _TASK_QUEUE is not None
     return _TASK_QUEUE
+
+
+def worker_pool():
+    """
+    Dispatch worker pool factory. Returns the current worker pool instance.
+    @return: pool of reusable threads for running tasks
+    @rtype:  L{pulp.server.dispatch.pool.WorkerPool}
+    """
+    assert _WORKER_POOL is not None
+    return _WORKER_POOL
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import logging
+import sys
+import threading
+import time
+from collections import deque
+
+
+_LOG = logging.getLogger(__name__)
+
+# worker pool class ------------------------------------------------------------
+
+class WorkerPool(object):
+    """
+    WorkerPool class
+    Bounded pool of reusable worker threads. Worker threads are started on
+    demand, up to max_workers, and are reused for subsequent work items instead
+    of exiting. Work submitted while all of the workers are busy is queued.
+
+    @ivar max_workers: maximum number of worker threads
+    @type max_workers: int
+    @ivar idle_callback: callable called, without arguments, each time a worker
+                         finishes a work item
+    @type idle_callback: callable or None
+    """
+
+    def __init__(self, max_workers, idle_callback=None):
+        assert max_workers > 0
+
+        self.max_workers = max_workers
+        self.idle_callback = idle_callback
+
+        self.__work = deque()
+        self.__workers = []
+
+        self.__idle_workers = 0
+        self.__busy_workers = 0
+        self.__peak_busy_workers = 0
+        self.__submitted = 0
+        self.__completed = 0
+        self.__busy_time = 0.0
+        self.__start_time = time.time()
+        self.__exit = False
+
+        self.__lock = threading.RLock()
+        self.__condition = threading.Condition(self.__lock)
+
+    # worker methods -----------------------------------------------------------
+
+    def __worker(self):
+        """
+        Worker thread loop
+        """
+        while True:
+            self.__lock.acquire()
+            try:
+                while not self.__work and not self.__exit:
+                    self.__idle_workers += 1
+                    self.__condition.wait()
+                    self.__idle_workers -= 1
+                if not self.__work:
+                    self.__workers.remove(threading.currentThread())
+                    return
+                target, args, kwargs = self.__work.popleft()
+                self.__busy_workers += 1
+                self.__peak_busy_workers = max(self.__peak_busy_workers, self.__busy_workers)
+            finally:
+                self.__lock.release()
+
+            start = time.time()
+            try:
+                target(*args, **kwargs)
+            except Exception, e:
+                _LOG.exception(e)
+
+            self.__lock.acquire()
+            try:
+                self.__busy_workers -= 1
+                self.__completed += 1
+                self.__busy_time += time.time() - start
+            finally:
+                self.__lock.release()
+
+            # NOTE the callback is made without holding the pool lock as it is
+            # expected to acquire other locks, e.g. the task queue's
+            self._call_idle_callback()
+
+    def _call_idle_callback(self):
+        """
+        Safely call the idle_callback, if there is one.
+        """
+        if self.idle_callback is None:
+            return
+        try:
+            self.idle_callback()
+        except Exception, e:
+            _LOG.exception(e)
+
+    def _start_worker(self):
+        """
+        Start a new worker thread
+        """
+        worker = threading.Thread(target=self.__worker)
+        worker.setDaemon(True)
+        self.__workers.append(worker)
+        worker.start()
+
+    # pool control methods -----------------------------------------------------
+
+    def submit(self, target, *args, **kwargs):
+        """
+        Submit a callable to be run by a worker thread. The callable is run
+        immediately if a worker is available, otherwise it is queued.
+        @param target: callable to run
+        @type  target: callable
+        @param args: positional arguments for the callable
+        @param kwargs: key word arguments for the callable
+        """
+        self.__lock.acquire()
+        try:
+            assert not self.__exit
+            self.__work.append((target, args, kwargs))
+            self.__submitted += 1
+            if len(self.__work) > self.__idle_workers and len(self.__workers) < self.max_workers:
+                self._start_worker()
+            self.__condition.notify()
+        finally:
+            self.__lock.release()
+
+    def available(self):
+        """
+        Number of work items that can be submitted without being queued
+        @return: number of free worker threads, existing or not yet started
+        @rtype:  int
+        """
+        self.__lock.acquire()
+        try:
+            return max(0, self.max_workers - self.__busy_workers - len(self.__work))
+        finally:
+            self.__lock.release()
+
+    def stop(self):
+        """
+        Stop the pool once the queued work has been run.
+        NOTE: this does not wait for the worker threads to exit
+        """
+        self.__lock.acquire()
+        try:
+            self.__exit = True
+            self.__condition.notifyAll()
+        finally:
+            self.__lock.release()
+
+    @classmethod
+    def run_all(cls, max_workers, target, items):
+        """
+        Call target once with each item, using a temporary pool of at most
+        max_workers worker threads, and wait for all of the calls to finish.
+        The calls are made in the calling thread when there is only one item
+        or one worker. The first exception raised by target is re-raised once
+        all of the calls have finished; items not yet started when it is raised
+        are skipped.
+        @param max_workers: maximum number of worker threads
+        @type  max_workers: int
+        @param target: callable that accepts an item
+        @type  target: callable
+        @param items: items to call target with
+        @type  items: list
+        """
+        if len(items) < 2 or max_workers < 2:
+            for item in items:
+                target(item)
+            return
+        pool = cls(min(max_workers, len(items)))
+        condition = threading.Condition()
+        state = {'pending': len(items), 'exc_info': None}
+
+        def call(item):
+            try:
+                if state['exc_info'] is None:
+                    target(item)
+            except Exception:
+                condition.acquire()
+                try:
+                    if state['exc_info'] is None:
+                        state['exc_info'] = sys.exc_info()
+                finally:
+                    condition.release()
+            condition.acquire()
+            try:
+                state['pending'] -= 1
+                condition.notify()
+            finally:
+                condition.release()
+
+        try:
+            for item in items:
+                pool.submit(call, item)
+            condition.acquire()
+            try:
+                while state['pending']:
+                    condition.wait()
+            finally:
+                condition.release()
+        finally:
+            pool.stop()
+        exc_info = state['exc_info']
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    # statistics methods -------------------------------------------------------
+
+    def stats(self):
+        """
+        Report the pool's utilization.
+        Keys:
+         * max_workers: maximum number of worker threads
+         * workers: number of worker threads started
+         * busy_workers: number of worker threads currently running work
+         * idle_workers: number of worker threads waiting for work
+         * peak_busy_workers: maximum number of concurrently busy worker threads
+         * queued: number of work items waiting for a worker thread
+         * submitted: total number of work items submitted
+         * completed: total number of work items run
+         * utilization: fraction of the pool's total thread time, since it was
+           created, spent running work
+        @return: pool statistics
+        @rtype:  dict
+        """
+        self.__lock.acquire()
+        try:
+            elapsed = time.time() - self.__start_time
+            utilization = 0.0
+            if elapsed > 0:
+                utilization = min(1.0, self.__busy_time / (elapsed * self.max_workers))
+            return {'max_workers': self.max_workers,
+                    'workers': len(self.__workers),
+                    'busy_workers': self.__busy_workers,
+                    'idle_workers': self.__idle_workers,
+                    'peak_busy_workers': self.__peak_busy_workers,
+                    'queued': len(self.__work),
+                    'submitted': self.__submitted,
+                    'completed': self.__completed,
+                    'utilization': utilization}
+        finally:
+            self.__lock.release()
@@ -12,6 +12,7 @@
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
 import datetime
+import heapq
 import logging
 import threading
 from gettext import gettext as _
@@ -43,7 +44,14 @@ class Scheduler(object):
     """
     Scheduler class
     Manager and dispatcher of scheduled call requests
-    @ivar dispatch_interval: time, in seconds, between schedule checks
+
+    The next run times of the scheduled calls are kept in an in-process heap so
+    that the dispatcher can sleep until the next call is due instead of
+    periodically querying the database.
+
+    @ivar dispatch_interval: time, in seconds, to back off after a failed dispatch
+                             and to defer scheduled calls that are past due but
+                             cannot run yet
     @type dispatch_interval: int
     """
 
@@ -51,6 +59,15 @@ class Scheduler(object):
         self.dispatch_interval = dispatch_interval
         self.scheduled_call_collection = ScheduledCall.get_collection()
 
+        # heap of (next_run, schedule_id), entries that do not match the
+        # schedule's current next run time are stale and discarded when popped
+        # or when they outnumber the current entries
+        self.__next_run_heap = []
+        # schedule_id -> next_run
+        self.__next_runs = {}
+        # schedule id -> lateness statistics, see lateness_stats
+        self.__lateness = {}
+
         self.__exit = False
         self.__lock = threading.RLock()
         self.__condition = threading.Condition(self.__lock)
@@ -62,22 +79,50 @@ class Scheduler(object):
         """
         Dispatcher thread loop
         """
-        self.__lock.acquire()
+        failed = False
 
         while True:
-            self.__condition.wait(timeout=self.dispatch_interval)
-
-            if self.__exit:
-                if self.__lock is not None:
-                    self.__lock.release()
-                return
+            # NOTE the lock is not held while running the scheduled calls so
+            # that schedules can be added and removed in the meantime
+            self.__lock.acquire()
+            try:
+                if failed:
+                    timeout = self.dispatch_interval
+                else:
+                    timeout = self._dispatch_timeout()
+                if not self.__exit and (timeout is None or timeout > 0):
+                    self.__condition.wait(timeout=timeout)
+                if self.__exit:
+                    return
+            finally:
+                self.__lock.release()
 
             try:
                 self._run_scheduled_calls()
+                failed = False
 
             except Exception, e:
                 _LOG.critical('Unhandled exception in scheduler dispatch: %s' % repr(e))
                 _LOG.exception(e)
+                failed = True
+
+    def _dispatch_timeout(self):
+        """
+        Determine how long the dispatcher should sleep: until the next scheduled
+        call is due.
+        @return: timeout in seconds or None to sleep until notified
+        @rtype:  float or None
+        """
+        self.__lock.acquire()
+        try:
+            next_run = self._peek_next_run()
+            if next_run is None:
+                return None
+            delta = next_run - datetime.datetime.utcnow()
+            seconds = delta.days * 86400 + delta.seconds + delta.microseconds / 1000000.0
+            return max(seconds, 0.0)
+        finally:
+            self.__lock.release()
 
     def _run_scheduled_calls(self):
         """
@@ -121,25 +166,43 @@ class Scheduler(object):
         coordinator = dispatch_factory.coordinator()
 
         now = datetime.datetime.utcnow()
-        query = {'next_run': {'$lte': now}}
+        schedule_ids = self._get_due_schedule_ids(now)
+
+        if not schedule_ids:
+            return
+
+        query = {'_id': {'$in': schedule_ids}, 'next_run': {'$lte': now}}
+        scheduled_calls = list(self.scheduled_call_collection.find(query))
+
+        # re-synchronize the heap with any scheduled calls that turned out not
+        # to be due, otherwise the dispatcher would keep waking up for them
+        due_schedule_ids = set(c['_id'] for c in scheduled_calls)
+        for schedule_id in schedule_ids:
+            if schedule_id in due_schedule_ids:
+                continue
+            scheduled_call = self.scheduled_call_collection.find_one({'_id': schedule_id}, fields=['next_run'])
+            self._set_next_run(schedule_id, scheduled_call and scheduled_call['next_run'])
 
-        for scheduled_call in self.scheduled_call_collection.find(query):
+        # updating the next run times will keep the scheduler from finding
+        # these calls again before they complete
+        # it's also important to update the next run time for disabled calls
+        self.update_next_runs(scheduled_calls, now)
 
-            # updating the next run time will keep the scheduler from finding
-            # this call again before it completes
-            # it's also important to update the next run time for disabled calls
-            self.update_next_run(scheduled_call)
+        # test to see if any tasks from these schedules are already in the queue
+        queued_schedule_ids = set(r.schedule_id for r in coordinator.find_call_reports())
+
+        for scheduled_call in scheduled_calls:
 
             if not scheduled_call['enabled']:
                 continue
 
-            # test to see if any tasks from this schedule are already in the queue
-            already_queued = coordinator.find_call_reports(schedule_id=scheduled_call['id'])
-            if already_queued:
+            if scheduled_call['id'] in queued_schedule_ids:
                 log_msg = _('Schedule %(s)s skipped: last scheduled call still running') % {'s': scheduled_call['id']}
                 _LOG.info(log_msg)
                 continue
 
+            self._record_lateness(scheduled_call, now)
+
             # scheduled calls are always itinerary calls: calls that generate
             # call requests
             # get the itinerary call request and execute
@@ -155,6 +218,156 @@ class Scheduler(object):
             map(lambda r: setattr(r, 'schedule_id', str(scheduled_call['_id'])), call_request_group)
             yield  call_request_group
 
+    # next run heap methods ----------------------------------------------------
+
+    def _load_next_runs(self):
+        """
+        (Re)build the next run heap from the scheduled calls collection
+        """
+        self.__lock.acquire()
+        try:
+            self.__next_run_heap = []
+            self.__next_runs = {}
+            for scheduled_call in self.scheduled_call_collection.find(fields=['next_run']):
+                self._set_next_run(scheduled_call['_id'], scheduled_call['next_run'])
+        finally:
+            self.__lock.release()
+
+    def _set_next_run(self, schedule_id, next_run):
+        """
+        Set, or clear, the next run time of a scheduled call in the heap and
+        wake the dispatcher so that it can re-calculate how long to sleep.
+        @param schedule_id: id of the scheduled call
+        @type  schedule_id: ObjectId
+        @param next_run: next run time of the scheduled call, None to remove it
+        @type  next_run: datetime.datetime or None
+        """
+        self.__lock.acquire()
+        try:
+            if next_run is None:
+                self.__next_runs.pop(schedule_id, None)
+                self.__lateness.pop(str(schedule_id), None)
+            elif self.__next_runs.get(schedule_id) != next_run:
+                self.__next_runs[schedule_id] = next_run
+                heapq.heappush(self.__next_run_heap, (next_run, schedule_id))
+            if len(self.__next_run_heap) > 2 * len(self.__next_runs):
+                self.__next_run_heap = [(r, i) for i, r in self.__next_runs.items()]
+                heapq.heapify(self.__next_run_heap)
+            self.__condition.notify()
+        finally:
+            self.__lock.release()
+
+    def _defer_past_due(self, next_run, now):
+        """
+        Get the time the dispatcher should next consider a scheduled call that
+        has just been dispatched, or skipped.
+        A next run time that is not in the future belongs to a scheduled call
+        that has never run and is either disabled or still running its first
+        call; it stays due, but is not considered again for dispatch_interval
+        seconds so that the dispatcher does not keep waking up for it.
+        @param next_run: next run time of the scheduled call
+        @type  next_run: datetime.datetime
+        @param now: time of dispatch
+        @type  now: datetime.datetime
+        @return: time the scheduled call is next due in the heap
+        @rtype:  datetime.datetime
+        """
+        if next_run > now:
+            return next_run
+        return now + datetime.timedelta(seconds=self.dispatch_interval)
+
+    def _peek_next_run(self):
+        """
+        Get the earliest next run time, discarding stale heap entries
+        @return: earliest next run time or None if there are no scheduled calls
+        @rtype:  datetime.datetime or None
+        """
+        heap = self.__next_run_heap
+        while heap:
+            next_run, schedule_id = heap[0]
+            if self.__next_runs.get(schedule_id) == next_run:
+                return next_run
+            heapq.heappop(heap)
+        return None
+
+    def _get_due_schedule_ids(self, now):
+        """
+        Get the ids of the scheduled calls whose next run time has passed.
+        NOTE: the heap entries are left in place, they become stale once the
+        scheduled calls' next run times are updated
+        @param now: current time
+        @type  now: datetime.datetime
+        @return: (possibly empty) list of schedule ids
+        @rtype:  list
+        """
+        self.__lock.acquire()
+        try:
+            heap = self.__next_run_heap
+            schedule_ids = set()
+            # walk the heap from the root, pruning sub-trees that are not yet
+            # due as every entry in them is later than their root entry
+            indices = [0]
+            while indices:
+                index = indices.pop()
+                if index >= len(heap):
+                    continue
+                next_run, schedule_id = heap[index]
+                if next_run > now:
+                    continue
+                if self.__next_runs.get(schedule_id) == next_run:
+                    schedule_ids.add(schedule_id)
+                indices.extend((2 * index + 1, 2 * index + 2))
+            return list(schedule_ids)
+        finally:
+            self.__lock.release()
+
+    # lateness metrics methods -------------------------------------------------
+
+    def _record_lateness(self, scheduled_call, now):
+        """
+        Record how late a scheduled call is being dispatched.
+        @param scheduled_call: scheduled call being dispatched
+        @type  scheduled_call: dict
+        @param now: time of dispatch
+        @type  now: datetime.datetime
+        """
+        delta = now - scheduled_call['next_run']
+        lateness = delta.days * 86400 + delta.seconds + delta.microseconds / 1000000.0
+        self.__lock.acquire()
+        try:
+            stats = self.__lateness.setdefault(str(scheduled_call['_id']),
+                                               {'runs': 0, 'last': 0.0, 'max': 0.0, 'total': 0.0})
+            stats['runs'] += 1
+            stats['last'] = lateness
+            stats['max'] = max(stats['max'], lateness)
+            stats['total'] += lateness
+        finally:
+            self.__lock.release()
+
+    def lateness_stats(self):
+        """
+        Report how late, in seconds, each schedule's calls have been dispatched
+        relative to their scheduled run times, since the scheduler started.
+        Keys of each schedule's statistics:
+         * runs: number of times the schedule was dispatched
+         * last: lateness of the most recent dispatch
+         * max: maximum lateness
+         * average: average lateness
+        @return: dictionary of schedule id -> lateness statistics
+        @rtype:  dict
+        """
+        self.__lock.acquire()
+        try:
+            report = {}
+            for schedule_id, stats in self.__lateness.items():
+                report[schedule_id] = {'runs': stats['runs'],
+                                       'last': stats['last'],
+                                       'max': stats['max'],
+                                       'average': stats['total'] / stats['runs']}
+            return report
+        finally:
+            self.__lock.release()
+
     def start(self):
         """
         Start the scheduler
@@ -163,6 +376,7 @@ class Scheduler(object):
         self.__lock.acquire()
         self.__exit = False # needed for re-start
         try:
+            self._load_next_runs()
             self.__dispatcher = threading.Thread(target=self.__dispatch)
             self.__dispatcher.setDaemon(True)
             self.__dispatcher.start()
@@ -237,10 +451,45 @@ class Scheduler(object):
         if next_run is None:
             # remove the scheduled call if there are no more
             self.scheduled_call_collection.remove({'_id': schedule_id}, safe=True)
+            self._set_next_run(schedule_id, None)
             return
 
         update = {'$set': {'next_run': next_run}}
         self.scheduled_call_collection.update({'_id': schedule_id}, update, safe=True)
+        self._set_next_run(schedule_id, next_run)
+
+    def update_next_runs(self, scheduled_calls, now=None):
+        """
+        Update the metadata for multiple scheduled calls that will be run again.
+        Scheduled calls that share a next run time are updated together and
+        scheduled calls without a next run are removed together.
+        @param scheduled_calls: scheduled calls to be updated
+        @type  scheduled_calls: list of dicts
+        @param now: time of dispatch, defaults to the current time
+        @type  now: datetime.datetime or None
+        """
+        now = now or datetime.datetime.utcnow()
+        finished_schedule_ids = []
+        schedule_ids_by_next_run = {}
+
+        for scheduled_call in scheduled_calls:
+            next_run = self.calculate_next_run(scheduled_call)
+            if next_run is None:
+                finished_schedule_ids.append(scheduled_call['_id'])
+            else:
+                schedule_ids_by_next_run.setdefault(next_run, []).append(scheduled_call['_id'])
+
+        if finished_schedule_ids:
+            # remove the scheduled calls if there are no more
+            self.scheduled_call_collection.remove({'_id': {'$in': finished_schedule_ids}}, safe=True)
+            for schedule_id in finished_schedule_ids:
+                self._set_next_run(schedule_id, None)
+
+        for next_run, schedule_ids in schedule_ids_by_next_run.items():
+            update = {'$set': {'next_run': next_run}}
+            self.scheduled_call_collection.update({'_id': {'$in': schedule_ids}}, update, multi=True, safe=True)
+            for schedule_id in schedule_ids:
+                self._set_next_run(schedule_id, self._defer_past_due(next_run, now))
 
     def calculate_next_run(self, scheduled_call):
         """
@@ -298,6 +547,7 @@ class Scheduler(object):
         scheduled_call['next_run'] = next_run
 
         self.scheduled_call_collection.insert(scheduled_call, safe=True)
+        self._set_next_run(scheduled_call['_id'], next_run)
 
         return str(scheduled_call['_id'])
 
@@ -356,6 +606,7 @@ class Scheduler(object):
             raise pulp_exceptions.MissingResource(schedule=str(schedule_id))
 
         self.scheduled_call_collection.remove({'_id': schedule_id}, safe=True)
+        self._set_next_run(schedule_id, None)
 
     def enable(self, schedule_id):
         """
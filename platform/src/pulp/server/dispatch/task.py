@@ -16,6 +16,7 @@ import datetime
 import logging
 import sys
 import threading
+import time
 import types
 from gettext import gettext as _
 
@@ -47,8 +48,12 @@ class Task(object):
     @type queued_call_id: str
     @ivar complete_callback: task queue callback called on completion
     @type complete_callback: callable or None
+    @ivar worker_pool: task queue worker pool used to run the call, if any
+    @type worker_pool: L{pulp.server.dispatch.pool.WorkerPool} or None
     @ivar progress_callback: call request progress callback called to report execution progress
     @type progress_callback: callable or None
+    @ivar change_count: number of state changes and progress reports; see wait_for_change
+    @type change_count: int
     """
 
     def __init__(self, call_request, call_report=None):
@@ -63,6 +68,8 @@ class Task(object):
         self.call_request_exit_state = None
         self.queued_call_id = None
         self.complete_callback = None
+        self.worker_pool = None
+        self.change_count = 0
 
     def __str__(self):
         return 'Task %s: %s' % (self.call_request.id, str(self.call_request))
@@ -79,6 +86,21 @@ class Task(object):
         Progress report callback
         """
         self.call_report.progress = progress
+        self._changed()
+
+    def _set_state(self, state):
+        """
+        Transition the call report to a new state.
+        """
+        self.call_report.state = state
+        self._changed()
+
+    def _changed(self):
+        """
+        Wake up anything waiting for the task to change.
+        """
+        self.change_count += 1
+        _task_changed()
 
     def _set_cancel_control_hook(self, hook):
         self.call_request.add_control_hook(dispatch_constants.CALL_CANCEL_CONTROL_HOOK, hook)
@@ -98,16 +120,20 @@ class Task(object):
 
     def run(self):
         """
-        Public wrapper to kick off the call in the call_request in a new thread.
+        Public wrapper to kick off the call in the call_request in a worker
+        thread from the worker pool or, if there isn't one, in a new thread.
         """
         assert self.call_report.state in dispatch_constants.CALL_READY_STATES
 
         # NOTE using run wrapper so that state transition is protected by the
         # task queue lock and doesn't occur in another thread
-        self.call_report.state = dispatch_constants.CALL_RUNNING_STATE
+        self._set_state(dispatch_constants.CALL_RUNNING_STATE)
 
-        task_thread = threading.Thread(target=self._run)
-        task_thread.start()
+        if self.worker_pool is None:
+            task_thread = threading.Thread(target=self._run)
+            task_thread.start()
+        else:
+            self.worker_pool.submit(self._run)
 
         # I'm fairly certain these will always be called *before* the context
         # switch to the task_thread
@@ -124,7 +150,7 @@ class Task(object):
 
         # generally set in the wrapper, but not when called directly
         if self.call_report.state in dispatch_constants.CALL_READY_STATES:
-            self.call_report.state = dispatch_constants.CALL_RUNNING_STATE
+            self._set_state(dispatch_constants.CALL_RUNNING_STATE)
 
         self.call_report.start_time = datetime.datetime.now(dateutils.utc_tz())
 
@@ -194,7 +220,7 @@ class Task(object):
         self._call_complete_callback()
 
         # don't set the state to complete in the report until the task is actually complete
-        self.call_report.state = state
+        self._set_state(state)
 
         self.call_life_cycle_callbacks(dispatch_constants.CALL_COMPLETE_LIFE_CYCLE_CALLBACK)
         if not self.call_request.archive:
@@ -304,7 +330,7 @@ class AsyncTask(Task):
 
         # usually set in the wrapper, unless called directly
         if self.call_report.state in dispatch_constants.CALL_READY_STATES:
-            self.call_report.state = dispatch_constants.CALL_RUNNING_STATE
+            self._set_state(dispatch_constants.CALL_RUNNING_STATE)
 
         self.call_report.start_time = datetime.datetime.now(dateutils.utc_tz())
 
@@ -332,3 +358,59 @@ class AsyncTask(Task):
             principal_manager.clear_principal()
             dispatch_context.CONTEXT.clear_task_attributes()
 
+# task change notification -----------------------------------------------------
+
+# NOTE the condition is never held while calling out of this module so that
+# it can be signaled while holding other locks, e.g. the task queue's
+
+_CHANGE_CONDITION = threading.Condition()
+_CHANGE_COUNT = 0
+
+
+def _task_changed():
+    global _CHANGE_COUNT
+    _CHANGE_CONDITION.acquire()
+    try:
+        _CHANGE_COUNT += 1
+        _CHANGE_CONDITION.notifyAll()
+    finally:
+        _CHANGE_CONDITION.release()
+
+
+def change_count():
+    """
+    Get the number of task changes (state transitions and progress reports)
+    so far, across all of the tasks. Read it *before* inspecting the tasks and
+    pass it to wait_for_change to wait for a change made after inspecting them.
+    @return: number of task changes
+    @rtype:  int
+    """
+    return _CHANGE_COUNT
+
+
+def wait_for_change(count, timeout=None):
+    """
+    Wait until any task changes after the given number of task changes.
+    @param count: number of task changes returned by change_count
+    @type  count: int
+    @param timeout: maximum number of seconds to wait, None means indefinitely
+    @type  timeout: None or float
+    @return: True if a task changed, False if the timeout expired first
+    @rtype:  bool
+    """
+    deadline = None
+    if timeout is not None:
+        deadline = time.time() + timeout
+    _CHANGE_CONDITION.acquire()
+    try:
+        while _CHANGE_COUNT == count:
+            if deadline is None:
+                _CHANGE_CONDITION.wait()
+                continue
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            _CHANGE_CONDITION.wait(remaining)
+        return True
+    finally:
+        _CHANGE_CONDITION.release()
@@ -11,6 +11,7 @@
 # have received a copy of GPLv2 along with this software; if not, see
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
+import bisect
 import itertools
 import logging
 import sys
@@ -36,34 +37,55 @@ class TaskQueue(object):
 
     @ivar concurrency_threshold: measurement of total allowed concurrency
     @type concurrency_threshold: int
-    @ivar dispatch_interval: time, in seconds, between checks for ready tasks
+    @ivar dispatch_interval: minimum time, in seconds, between sweeps of the
+                             completed task cache; the dispatcher is otherwise
+                             woken only when tasks are enqueued or completed
     @type dispatch_interval: float
     @ivar completed_task_cache_life: time, in seconds, to cache completed tasks
     @type completed_task_cache_life: float
+    @ivar worker_pool: pool of threads used to run tasks, if None each task
+                       runs in a new thread
+    @type worker_pool: L{pulp.server.dispatch.pool.WorkerPool} or None
     """
 
     def __init__(self,
                  concurrency_threshold,
                  dispatch_interval=0.5,
-                 completed_task_cache_life=20.0):
+                 completed_task_cache_life=20.0,
+                 worker_pool=None):
 
         self.concurrency_threshold = concurrency_threshold
         self.dispatch_interval = dispatch_interval
         self.completed_task_cache_life = timedelta(seconds=completed_task_cache_life)
+        self.worker_pool = worker_pool
 
         self.queued_call_collection = QueuedCall.get_collection()
 
-        self.__waiting_tasks = []
-        self.__running_tasks = []
+        # waiting and running tasks are keyed by call request id and store the
+        # task's enqueue sequence number so that listings retain queue order
+        self.__waiting_tasks = {}
+        self.__running_tasks = {}
         self.__completed_tasks = []
 
+        # unblocked waiting tasks: weight -> list of (sequence, task) sorted by
+        # sequence; blocked waiting tasks indexed by their blocking task's id
+        self.__ready_tasks = {}
+        self.__blocked_tasks = {}
+
+        self.__task_sequence = itertools.count()
         self.__running_weight = 0
         self.__exit = False
+        # set, with the lock held, whenever there may be tasks to dispatch so
+        # that wake-ups are not lost while the dispatcher is not waiting
+        self.__dispatch_pending = True
 
         self.__lock = threading.RLock()
         self.__condition = threading.Condition(self.__lock)
         self.__dispatcher = None
 
+        if self.worker_pool is not None:
+            self.worker_pool.idle_callback = self._worker_available
+
     # task dispatch methods ----------------------------------------------------
 
     def __dispatch(self):
@@ -73,11 +95,13 @@ class TaskQueue(object):
         self.__lock.acquire()
         while True:
             try:
-                self.__condition.wait(timeout=self.dispatch_interval)
+                if not self.__dispatch_pending and not self.__exit:
+                    self.__condition.wait(timeout=self._dispatch_timeout())
                 if self.__exit:
                     if self.__lock is not None:
                         self.__lock.release()
                     return
+                self.__dispatch_pending = False
                 ready_tasks = self._get_ready_tasks()
                 for task in ready_tasks:
                     self._run_ready_task(task)
@@ -86,24 +110,56 @@ class TaskQueue(object):
                 msg = _('Exception in task queue dispatcher thread:\n%(e)s')
                 _LOG.critical(msg % {'e': traceback.format_exception(*sys.exc_info())})
 
+    def _dispatch_timeout(self):
+        """
+        Determine how long the dispatcher may sleep before it needs to purge the
+        completed task cache. Enqueued and completed tasks wake the dispatcher
+        directly, so there is no need to poll for ready tasks.
+        @return: timeout in seconds or None to sleep until notified
+        @rtype:  float or None
+        """
+        if not self.__completed_tasks:
+            return None
+        expiration = self.__completed_tasks[0].call_report.finish_time + self.completed_task_cache_life
+        delta = expiration - datetime.now(dateutils.utc_tz())
+        seconds = delta.days * 86400 + delta.seconds + delta.microseconds / 1000000.0
+        return max(seconds, self.dispatch_interval)
+
     def _get_ready_tasks(self):
         """
         Algorithm at the heart of the task dispatcher. Gets the tasks that are
         ready to run (i.e. not blocked) within the limits of the available
-        concurrency threshold and returns them. Note that this algorithm checks
-        all the tasks as some may have a weight of 0.
+        concurrency threshold and returns them in queue order. Only unblocked
+        tasks are considered and they are bucketed by weight, so the cost is
+        proportional to the number of tasks returned, not the size of the queue.
+        Note that tasks with a weight of 0 are always returned, unless there is
+        a worker pool, in which case no more tasks are returned than there are
+        available worker threads.
         """
         self.__lock.acquire()
         try:
             tasks = []
             available_weight = self.concurrency_threshold - self.__running_weight
-            for task in self.__waiting_tasks:
-                if task.call_request.dependencies:
-                    continue
-                if task.call_request.weight > available_weight:
-                    continue
-                available_weight -= task.call_request.weight
-                tasks.append(task)
+            available_workers = None
+            if self.worker_pool is not None:
+                available_workers = self.worker_pool.available()
+            # position of the next candidate task in each weight bucket
+            positions = dict.fromkeys(self.__ready_tasks, 0)
+            while available_workers is None or len(tasks) < available_workers:
+                next_weight = None
+                next_sequence = None
+                for weight, bucket in self.__ready_tasks.items():
+                    if weight > available_weight or positions[weight] >= len(bucket):
+                        continue
+                    sequence = bucket[positions[weight]][0]
+                    if next_sequence is None or sequence < next_sequence:
+                        next_weight = weight
+                        next_sequence = sequence
+                if next_weight is None:
+                    break
+                tasks.append(self.__ready_tasks[next_weight][positions[next_weight]][1])
+                positions[next_weight] += 1
+                available_weight -= next_weight
             return tasks
         finally:
             self.__lock.release()
@@ -114,19 +170,69 @@ class TaskQueue(object):
         """
         self.__lock.acquire()
         try:
-            self.__waiting_tasks.remove(task)
-            self.__running_tasks.append(task)
+            sequence = self.__waiting_tasks.pop(task.call_request.id)[0]
+            self._remove_ready_task(task, sequence)
+            self.__running_tasks[task.call_request.id] = (sequence, task)
             self.__running_weight += task.call_request.weight
             task.run()
         finally:
             self.__lock.release()
 
+    def _worker_available(self):
+        """
+        Wake the dispatcher when a worker thread becomes available
+        NOTE: This method is used as a callback for the worker pool
+        """
+        self._wake_dispatcher()
+
+    def _wake_dispatcher(self):
+        """
+        Have the dispatcher look for ready tasks, now if it is waiting or as
+        soon as it finishes its current pass otherwise.
+        """
+        self.__lock.acquire()
+        try:
+            self.__dispatch_pending = True
+            self.__condition.notify()
+        finally:
+            self.__lock.release()
+
+    def _add_ready_task(self, task, sequence):
+        """
+        Add an unblocked waiting task to the ready tasks, in queue order.
+        @param task: task that is no longer blocked
+        @type  task: pulp.server.dispatch.task.Task
+        @param sequence: enqueue sequence number of the task
+        @type  sequence: int
+        """
+        bucket = self.__ready_tasks.setdefault(task.call_request.weight, [])
+        # keys differ in sequence, so the task itself is never compared
+        bisect.insort(bucket, (sequence, task))
+
+    def _remove_ready_task(self, task, sequence):
+        """
+        Remove a task from the ready tasks, if it is there.
+        @param task: task to remove
+        @type  task: pulp.server.dispatch.task.Task
+        @param sequence: enqueue sequence number of the task
+        @type  sequence: int
+        """
+        bucket = self.__ready_tasks.get(task.call_request.weight)
+        if not bucket:
+            return
+        index = bisect.bisect_left(bucket, (sequence,))
+        if index == len(bucket) or bucket[index][0] != sequence:
+            return
+        del bucket[index]
+        if not bucket:
+            self.__ready_tasks.pop(task.call_request.weight)
+
     def _purge_completed_task_cache(self):
         """
         Purge expired tasks from the completed tasks cache.
         """
         expired_cutoff = datetime.now(dateutils.utc_tz()) - self.completed_task_cache_life
-        index = 0 # index of the first non-expired cached task
+        index = len(self.__completed_tasks) # index of the first non-expired cached task
         # the tasks stored in the cache are in ascending order of finish time
         for i, task in enumerate(self.__completed_tasks):
             if task.call_report.finish_time > expired_cutoff:
@@ -143,6 +249,7 @@ class TaskQueue(object):
         assert self.__dispatcher is None
         self.__lock.acquire()
         self.__exit = False # needed for re-start
+        self.__dispatch_pending = True
         try:
             self.__dispatcher = threading.Thread(target=self.__dispatch)
             self.__dispatcher.setDaemon(True)
@@ -204,10 +311,17 @@ class TaskQueue(object):
             task.queued_call_id = queued_call['_id']
             self.queued_call_collection.save(queued_call, safe=True)
             task.complete_callback = self._complete
+            task.worker_pool = self.worker_pool
             self._validate_call_request_dependencies(task)
-            self.__waiting_tasks.append(task)
+            sequence = self.__task_sequence.next()
+            self.__waiting_tasks[task.call_request.id] = (sequence, task)
+            if task.call_request.dependencies:
+                for blocking_task_id in task.call_request.dependencies:
+                    self.__blocked_tasks.setdefault(blocking_task_id, []).append(task)
+            else:
+                self._add_ready_task(task, sequence)
             task.call_life_cycle_callbacks(dispatch_constants.CALL_ENQUEUE_LIFE_CYCLE_CALLBACK)
-            self.__condition.notify()
+            self._wake_dispatcher()
         finally:
             self.__lock.release()
 
@@ -222,10 +336,10 @@ class TaskQueue(object):
         self.__lock.acquire()
         try:
             valid_call_request_dependency_ids = []
-            for potential_blocking_task in itertools.chain(self.__running_tasks, self.__waiting_tasks):
-                if potential_blocking_task.call_request.id not in task.call_request.dependencies:
+            for call_request_id in task.call_request.dependencies:
+                if call_request_id not in self.__running_tasks and call_request_id not in self.__waiting_tasks:
                     continue
-                valid_call_request_dependency_ids.append(potential_blocking_task.call_request.id)
+                valid_call_request_dependency_ids.append(call_request_id)
             # DANGER this ignores valid call complete states of dependencies!!
             task.call_request.dependencies = subdict(task.call_request.dependencies, valid_call_request_dependency_ids)
         finally:
@@ -243,10 +357,10 @@ class TaskQueue(object):
             task.complete_callback = None
             self.queued_call_collection.remove({'_id': task.queued_call_id}, safe=True)
             task.queued_call_id = None
-            if task in self.__waiting_tasks:
-                self.__waiting_tasks.remove(task)
-            if task in self.__running_tasks:
-                self.__running_tasks.remove(task)
+            if task.call_request.id in self.__waiting_tasks:
+                sequence = self.__waiting_tasks.pop(task.call_request.id)[0]
+                self._remove_ready_task(task, sequence)
+            self.__running_tasks.pop(task.call_request.id, None)
             self._unblock_tasks(task)
             task.call_life_cycle_callbacks(dispatch_constants.CALL_DEQUEUE_LIFE_CYCLE_CALLBACK)
         finally:
@@ -260,7 +374,11 @@ class TaskQueue(object):
         """
         self.__lock.acquire()
         try:
-            for potentially_blocked_task in self.__waiting_tasks[:]:
+            for potentially_blocked_task in self.__blocked_tasks.pop(task.call_request.id, []):
+
+                # the blocked task may have been dequeued or skipped already
+                if potentially_blocked_task.call_request.id not in self.__waiting_tasks:
+                    continue
 
                 if task.call_request.id not in potentially_blocked_task.call_request.dependencies:
                     continue
@@ -274,6 +392,9 @@ class TaskQueue(object):
                 else:
                     # remove the task from the blocking_tasks dict
                     potentially_blocked_task.call_request.dependencies.pop(task.call_request.id)
+                    if not potentially_blocked_task.call_request.dependencies:
+                        sequence = self.__waiting_tasks[potentially_blocked_task.call_request.id][0]
+                        self._add_ready_task(potentially_blocked_task, sequence)
 
         finally:
             self.__lock.release()
@@ -288,16 +409,20 @@ class TaskQueue(object):
         """
         self.__lock.acquire()
         try:
-            self.__running_weight -= task.call_request.weight
+            # skipped tasks complete without ever having run
+            if task.call_request.id in self.__running_tasks:
+                self.__running_weight -= task.call_request.weight
             self.dequeue(task)
             self.__completed_tasks.append(task)
+            # freed weight and unblocked tasks may allow other tasks to run
+            self._wake_dispatcher()
         finally:
             self.__lock.release()
 
     def skip(self, task):
         self.__lock.acquire()
         try:
-            if task not in self.__waiting_tasks:
+            if task.call_request.id not in self.__waiting_tasks:
                 return
             return task.skip()
         finally:
@@ -317,6 +442,16 @@ class TaskQueue(object):
 
     # task query methods -------------------------------------------------------
 
+    def _ordered_tasks(self, tasks):
+        """
+        Get the tasks from a waiting or running tasks dict in queue order
+        @param tasks: dict of call request id -> (sequence, task)
+        @type  tasks: dict
+        @return: (potentially empty) list of tasks
+        @rtype:  list of pulp.server.dispatch.task.Task
+        """
+        return [task for sequence, task in sorted(tasks.values())]
+
     def get(self, call_request_id):
         """
         Get a single task by its id
@@ -327,9 +462,10 @@ class TaskQueue(object):
         """
         self.__lock.acquire()
         try:
-            for task in itertools.chain(self.__completed_tasks,
-                                        self.__running_tasks,
-                                        self.__waiting_tasks):
+            for tasks in (self.__waiting_tasks, self.__running_tasks):
+                if call_request_id in tasks:
+                    return tasks[call_request_id][1]
+            for task in self.__completed_tasks:
                 if task.call_request.id != call_request_id:
                     continue
                 return task
@@ -349,8 +485,8 @@ class TaskQueue(object):
         try:
             tasks = []
             for task in itertools.chain(self.__completed_tasks,
-                                        self.__running_tasks,
-                                        self.__waiting_tasks):
+                                        self._ordered_tasks(self.__running_tasks),
+                                        self._ordered_tasks(self.__waiting_tasks)):
                 for tag in tags:
                     if tag not in task.call_request.tags:
                         break
@@ -368,7 +504,7 @@ class TaskQueue(object):
         """
         self.__lock.acquire()
         try:
-            return self.__waiting_tasks[:]
+            return self._ordered_tasks(self.__waiting_tasks)
         finally:
             self.__lock.release()
 
@@ -380,7 +516,7 @@ class TaskQueue(object):
         """
         self.__lock.acquire()
         try:
-            return self.__running_tasks[:]
+            return self._ordered_tasks(self.__running_tasks)
         finally:
             self.__lock.release()
 
@@ -392,8 +528,8 @@ class TaskQueue(object):
         """
         self.__lock.acquire()
         try:
-            return itertools.chain(self.__running_tasks[:],
-                                   self.__waiting_tasks[:])
+            return itertools.chain(self._ordered_tasks(self.__running_tasks),
+                                   self._ordered_tasks(self.__waiting_tasks))
         finally:
             self.__lock.release()
 
@@ -418,7 +554,7 @@ class TaskQueue(object):
         self.__lock.acquire()
         try:
             return itertools.chain(self.__completed_tasks[:],
-                                   self.__running_tasks[:],
-                                   self.__waiting_tasks[:])
+                                   self._ordered_tasks(self.__running_tasks),
+                                   self._ordered_tasks(self.__waiting_tasks))
         finally:
             self.__lock.release()
@@ -28,13 +28,25 @@ import logging
 import threading
 
 from pulp.server.compat import json
+from pulp.server.dispatch.pool import WorkerPool
 
 # -- constants ----------------------------------------------------------------
 
 TYPE_ID = 'http'
 
+# Maximum number of events posted at once; further events are queued
+MAX_CONCURRENT_POSTS = 4
+
+# Seconds to wait on a notifier URL before giving up on posting an event
+POST_TIMEOUT = 30
+
 LOG = logging.getLogger(__name__)
 
+# Pool of threads posting events; separate from the dispatch worker pool so
+# that slow or unresponsive notifier URLs cannot hold up tasks
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
 # -- framework hook -----------------------------------------------------------
 
 def handle_event(notifier_config, event):
@@ -47,12 +59,20 @@ def handle_event(notifier_config, event):
 
     body = json.dumps(data)
 
-    thread = threading.Thread(target=_send_post, args=[notifier_config, body])
-    thread.setDaemon(True)
-    thread.start()
+    _post_pool().submit(_send_post, notifier_config, body)
 
 # -- private ------------------------------------------------------------------
 
+def _post_pool():
+    global _POOL
+    _POOL_LOCK.acquire()
+    try:
+        if _POOL is None:
+            _POOL = WorkerPool(MAX_CONCURRENT_POSTS)
+        return _POOL
+    finally:
+        _POOL_LOCK.release()
+
 def _send_post(notifier_config, body):
 
     # Basic headers
@@ -89,7 +109,7 @@ def _send_post(notifier_config, body):
 
 def _create_connection(scheme, server):
     if scheme.startswith('https'):
-        connection = httplib.HTTPSConnection(server)
+        connection = httplib.HTTPSConnection(server, timeout=POST_TIMEOUT)
     else:
-        connection = httplib.HTTPConnection(server)
+        connection = httplib.HTTPConnection(server, timeout=POST_TIMEOUT)
     return connection
@@ -15,6 +15,7 @@ import oauth2
 
 from pulp.server.db.model.consumer import Consumer
 from pulp.server.managers import factory
+from pulp.server.auth import cache as auth_cache
 from pulp.server.auth import ldap_connection
 from pulp.server.config import config
 from pulp.server.exceptions import PulpException
@@ -99,6 +100,10 @@ class AuthenticationManager(object):
         """
         Check username and password.
         Return None if the username and password are not valid
+
+        Valid passwords are remembered in the authentication cache, so the
+        password is only hashed again once the cache entry expires or the
+        user is changed.
     
         :type username: str
         :param username: the login of the user
@@ -109,12 +114,23 @@ class AuthenticationManager(object):
         :rtype: str or None
         :return: user login corresponding to the credentials
         """
+        cache = fingerprint = None
+        if password is not None:
+            cache = auth_cache.authentication_cache()
+            fingerprint = cache.fingerprint('password', username, password)
+            login = cache.get(fingerprint, auth_cache.USER)
+            if login is not None:
+                return login
+
         user = self._check_username_password_local(username, password)
         if user is None and config.getboolean('ldap', 'enabled'):
             user = self._check_username_password_ldap(username, password)
-        if user is not None:
-            return user['login']
-        return None
+        if user is None:
+            return None
+
+        if cache is not None:
+            cache.put(fingerprint, auth_cache.USER, user['login'])
+        return user['login']
 
     # -- ssl cert authentication ---------------------------------------------------
     
@@ -129,6 +145,12 @@ class AuthenticationManager(object):
         :rtype: str or None
         :return: user login corresponding to the credentials
         """
+        cache = auth_cache.authentication_cache()
+        fingerprint = cache.fingerprint('user_cert', cert_pem)
+        login = cache.get(fingerprint, auth_cache.USER)
+        if login is not None:
+            return login
+
         cert = factory.certificate_manager(content=cert_pem)
         subject = cert.subject()
         encoded_user = subject.get('CN', None)
@@ -147,7 +169,10 @@ class AuthenticationManager(object):
         except PulpException:
             return None
     
-        return self.check_username_password(username)
+        login = self.check_username_password(username)
+        if login is not None:
+            cache.put(fingerprint, auth_cache.USER, login)
+        return login
     
     def check_consumer_cert(self, cert_pem):
         """
@@ -160,6 +185,12 @@ class AuthenticationManager(object):
         :rtype: str or None
         :return: id of a consumer corresponding to the credentials
         """
+        cache = auth_cache.authentication_cache()
+        fingerprint = cache.fingerprint('consumer_cert', cert_pem)
+        consumerid = cache.get(fingerprint, auth_cache.CONSUMER)
+        if consumerid is not None:
+            return consumerid
+
         cert = factory.certificate_manager(content=cert_pem)
         subject = cert.subject()
         consumerid = subject.get('CN', None)
@@ -173,6 +204,7 @@ class AuthenticationManager(object):
                        consumerid)
             return None
     
+        cache.put(fingerprint, auth_cache.CONSUMER, consumerid)
         return consumerid
     
     # oauth authentication --------------------------------------------------------
@@ -18,6 +18,7 @@ Contains users query classes
 from gettext import gettext as _
 from logging import getLogger
 
+from pulp.server.auth import authorization_index
 from pulp.server.db.model.auth import User, Permission, Role
 from pulp.server.exceptions import PulpDataException, MissingResource
 from pulp.server.managers import factory
@@ -111,6 +112,12 @@ class UserQueryManager(object):
         @rtype: bool
         @return: True if the user is a super user, False otherwise
         """
+        if authorization_index.enabled():
+            is_superuser = authorization_index.authorization_index().is_superuser(login)
+            if is_superuser is None:
+                raise MissingResource(login)
+            return is_superuser
+
         user = User.get_collection().find_one({'login' : login})
         if user is None:
             raise MissingResource(login)
@@ -139,6 +146,10 @@ class UserQueryManager(object):
         if self.is_superuser(login):
             return True
 
+        if authorization_index.enabled():
+            index = authorization_index.authorization_index()
+            return index.is_authorized(resource, login, operation)
+
         permission_query_manager = factory.permission_query_manager()
 
         parts = [p for p in resource.split('/') if p]
@@ -39,6 +39,11 @@ from pulp.server.agent import PulpAgent
 
 _LOG = getLogger(__name__)
 
+# content actions; the name of both the agent and profiler methods
+CONTENT_INSTALL = 'install'
+CONTENT_UPDATE = 'update'
+CONTENT_UNINSTALL = 'uninstall'
+
 
 class AgentManager(object):
     """
@@ -129,22 +134,8 @@ class AgentManager(object):
         """
         manager = managers.consumer_manager()
         consumer = manager.get_consumer(consumer_id)
-        conduit = ProfilerConduit()
-        collated = Units(units)
-        for typeid, units in collated.items():
-            pc = self.__profiled_consumer(consumer_id)
-            profiler, cfg = self.__profiler(typeid)
-            units = self.__invoke_plugin(
-                profiler.install_units,
-                pc,
-                units,
-                options,
-                cfg,
-                conduit)
-            collated[typeid] = units
-        units = collated.join()
-        agent = PulpAgent(consumer)
-        agent.content.install(units, options)
+        profiles = self.__profiles(consumer_id)
+        self.content_request(CONTENT_INSTALL, consumer, profiles, units, options)
 
     def update_content(self, consumer_id, units, options):
         """
@@ -159,22 +150,8 @@ class AgentManager(object):
         """
         manager = managers.consumer_manager()
         consumer = manager.get_consumer(consumer_id)
-        conduit = ProfilerConduit()
-        collated = Units(units)
-        for typeid, units in collated.items():
-            pc = self.__profiled_consumer(consumer_id)
-            profiler, cfg = self.__profiler(typeid)
-            units = self.__invoke_plugin(
-                profiler.update_units,
-                pc,
-                units,
-                options,
-                cfg,
-                conduit)
-            collated[typeid] = units
-        units = collated.join()
-        agent = PulpAgent(consumer)
-        agent.content.update(units, options)
+        profiles = self.__profiles(consumer_id)
+        self.content_request(CONTENT_UPDATE, consumer, profiles, units, options)
 
     def uninstall_content(self, consumer_id, units, options):
         """
@@ -189,13 +166,40 @@ class AgentManager(object):
         """
         manager = managers.consumer_manager()
         consumer = manager.get_consumer(consumer_id)
+        profiles = self.__profiles(consumer_id)
+        self.content_request(CONTENT_UNINSTALL, consumer, profiles, units, options)
+
+    def content_request(self, action, consumer, profiles, units, options, profilers=None):
+        """
+        Request the agent to perform a content action using consumer
+        data that has already been read, e.g. in bulk for a consumer group.
+        The units are first passed to the profiler for their type.
+        @param action: The content action.
+            One of: CONTENT_INSTALL, CONTENT_UPDATE, CONTENT_UNINSTALL
+        @type action: str
+        @param consumer: The consumer.
+        @type consumer: dict
+        @param profiles: The consumer's profiles:
+            {content_type:<profile>}
+        @type profiles: dict
+        @param units: A list of content units.
+        @type units: list of:
+            { type_id:<str>, unit_key:<dict> }
+        @param options: Action options; based on unit type.
+        @type options: dict
+        @param profilers: The profilers by content type as returned
+            by find_profilers(); found as needed when not specified.
+        @type profilers: dict
+        """
+        if profilers is None:
+            profilers = self.find_profilers(Units(units).keys())
+        pc = ProfiledConsumer(consumer['id'], profiles)
         conduit = ProfilerConduit()
         collated = Units(units)
         for typeid, units in collated.items():
-            pc = self.__profiled_consumer(consumer_id)
-            profiler, cfg = self.__profiler(typeid)
+            profiler, cfg = profilers[typeid]
             units = self.__invoke_plugin(
-                profiler.uninstall_units,
+                getattr(profiler, '%s_units' % action),
                 pc,
                 units,
                 options,
@@ -204,7 +208,18 @@ class AgentManager(object):
             collated[typeid] = units
         units = collated.join()
         agent = PulpAgent(consumer)
-        agent.content.uninstall(units, options)
+        getattr(agent.content, action)(units, options)
+
+    def find_profilers(self, typeids):
+        """
+        Find the profilers for a list of content types.
+        The Profiler base class is used for types not matched.
+        @param typeids: A list of content type IDs.
+        @type typeids: list
+        @return: {typeid:(profiler, cfg)}
+        @rtype: dict
+        """
+        return dict([(t, self.__profiler(t)) for t in typeids])
 
     def send_profile(self, consumer_id):
         """
@@ -238,13 +253,13 @@ class AgentManager(object):
             cfg = {}
         return plugin, cfg
 
-    def __profiled_consumer(self, consumer_id):
+    def __profiles(self, consumer_id):
         """
-        Get a profiler consumer model object.
-        @param id: A consumer ID.
-        @type id: str
-        @return: A populated profiler consumer model object.
-        @rtype: L{ProfiledConsumer}
+        Get the profiles of a consumer.
+        @param consumer_id: A consumer ID.
+        @type consumer_id: str
+        @return: {content_type:<profile>}
+        @rtype: dict
         """
         profiles = {}
         manager = managers.consumer_profile_manager()
@@ -252,7 +267,7 @@ class AgentManager(object):
             typeid = p['content_type']
             profile = p['profile']
             profiles[typeid] = profile
-        return ProfiledConsumer(consumer_id, profiles)
+        return profiles
 
     def __bindings(self, bindings):
         """
@@ -15,6 +15,19 @@
 Contains content applicability management classes
 """
 
+import hashlib
+import threading
+from gettext import gettext as _
+from logging import getLogger
+
+from pymongo.errors import DuplicateKeyError
+
+from pulp.server import config as pulp_config
+from pulp.server.compat import json
+from pulp.server.db.model.consumer import ConsumerApplicability
+from pulp.server.db.model.criteria import Criteria
+from pulp.server.dispatch.pool import WorkerPool
+from pulp.server.exceptions import PulpExecutionException
 from pulp.server.managers import factory as managers
 from pulp.server.managers.pluginwrapper import PluginWrapper
 from pulp.plugins.profiler import Profiler
@@ -23,17 +36,30 @@ from pulp.plugins.model import Consumer as ProfiledConsumer
 from pulp.plugins.conduits.profiler import ProfilerConduit
 from pulp.plugins.loader import api as plugin_api
 from pulp.plugins.loader import exceptions as plugin_exceptions
-from logging import getLogger
 
 _LOG = getLogger(__name__)
 
+# Consumers are evaluated in batches of this size; batches are evaluated
+# concurrently by up to MAX_CONCURRENCY threads.  A single batch is
+# evaluated in the calling thread.
+CONSUMER_BATCH_SIZE = 100
+MAX_CONCURRENCY = 4
+
 
 class ApplicabilityManager(object):
+    """
+    Determines content applicability.
+    Each evaluated applicability is stored, keyed by the consumer's profile
+    hash and the content versions of its bound repositories, and is read
+    back instead of being evaluated again until one of those changes.
+    """
 
     def units_applicable(self, criteria, units):
         """
         Detemine and report which of the specified content units
         is applicable to consumers specified by the I{criteria}.
+        Stored results are used when current; the others are evaluated
+        and stored.
         @param criteria: The consumer selection criteria.
         @type criteria: list
         @param units: A list of content units to be installed.
@@ -44,22 +70,296 @@ class ApplicabilityManager(object):
         @rtype: list
         """
         result = {}
-        conduit = ProfilerConduit()
+        if not units:
+            return result
         manager = managers.consumer_query_manager()
         ids = [c['id'] for c in manager.find_by_criteria(criteria)]
+        if not ids:
+            return result
+        hashes = [unit_hash(u) for u in units]
+        type_ids = set([u['type_id'] for u in units])
+        states = self.__consumer_states(ids, type_ids)
+        stored = {}
+        collection = ConsumerApplicability.get_collection()
+        query = {'consumer_id':{'$in':ids}, 'unit_hash':{'$in':list(set(hashes))}}
+        for entry in collection.find(query):
+            stored[(entry['consumer_id'], entry['unit_hash'])] = entry
+        requests = []
+        for id in ids:
+            reports = [None] * len(units)
+            missing = []
+            for index, unit in enumerate(units):
+                entry = stored.get((id, hashes[index]))
+                if entry is not None and _current(entry, states[id]):
+                    reports[index] = _report(entry, unit)
+                else:
+                    missing.append(unit)
+            if missing:
+                requests.append((id, missing))
+            result[id] = reports
+        for id, evaluated in self.__evaluate(requests, states).items():
+            reports = result[id]
+            missing = [i for i, r in enumerate(reports) if r is None]
+            for index, report in zip(missing, evaluated):
+                reports[index] = report
+        return result
+
+    def refresh_stale(self, limit):
+        """
+        Evaluate and store the applicability of stale entries.
+        Entries that cannot be evaluated are removed; they will be
+        evaluated when next requested.
+        @param limit: The maximum number of entries to refresh.
+        @type limit: int
+        @return: The number of entries refreshed.
+        @rtype: int
+        """
+        collection = ConsumerApplicability.get_collection()
+        query = {'stale':True}
+        fields = ['consumer_id', 'type_id', 'unit_key']
+        requests = {}
+        type_ids = set()
+        count = 0
+        for entry in collection.find(query, fields=fields).limit(limit):
+            unit = {'type_id':entry['type_id'], 'unit_key':entry['unit_key']}
+            requests.setdefault(entry['consumer_id'], []).append(unit)
+            type_ids.add(entry['type_id'])
+            count += 1
+        if not requests:
+            return 0
+        states = self.__consumer_states(requests.keys(), type_ids)
+        self.__evaluate(requests.items(), states, discard_failed=True)
+        return count
+
+    # -- invalidation ---------------------------------------------------------
+
+    def profile_changed(self, consumer_id, content_type):
+        """
+        Notification that a consumer's profile has changed.
+        The stored applicability of units of the type is marked stale.
+        @param consumer_id: A consumer ID.
+        @type consumer_id: str
+        @param content_type: The profile (content) type ID.
+        @type content_type: str
+        """
+        collection = ConsumerApplicability.get_collection()
+        query = {'consumer_id':consumer_id, 'type_id':content_type}
+        collection.update(query, {'$set':{'stale':True}}, multi=True, safe=True)
+
+    def bindings_changed(self, consumer_id):
+        """
+        Notification that a consumer has been bound or unbound.
+        The consumer's stored applicability is marked stale.
+        @param consumer_id: A consumer ID.
+        @type consumer_id: str
+        """
+        collection = ConsumerApplicability.get_collection()
+        query = {'consumer_id':consumer_id}
+        collection.update(query, {'$set':{'stale':True}}, multi=True, safe=True)
+
+    def repo_content_changed(self, repo_id):
+        """
+        Notification that units have been associated with or unassociated
+        from a repository.  The stored applicability of the consumers
+        bound to it is marked stale.
+        @param repo_id: A repository ID.
+        @type repo_id: str
+        """
+        collection = ConsumerApplicability.get_collection()
+        query = {'repo_ids':repo_id, 'stale':False}
+        collection.update(query, {'$set':{'stale':True}}, multi=True, safe=True)
+
+    def consumer_deleted(self, consumer_id):
+        """
+        Notification that a consumer has been deleted.
+        The consumer's stored applicability is removed.
+        @param consumer_id: A consumer ID.
+        @type consumer_id: str
+        """
+        collection = ConsumerApplicability.get_collection()
+        collection.remove({'consumer_id':consumer_id}, safe=True)
+
+    # -- evaluation -----------------------------------------------------------
+
+    def __consumer_states(self, ids, type_ids):
+        """
+        Get what the applicability of units to consumers depends on.
+        @param ids: A list of consumer IDs.
+        @type ids: list
+        @param type_ids: The unit type IDs of interest.
+        @type type_ids: set
+        @return: A dict keyed by consumer ID of:
+            {profiles:{content_type:<profile hash>},
+             repo_ids:<bound repo IDs>,
+             repo_hash:<hash of the bound repo IDs and content versions>}
+        @rtype: dict
+        """
         manager = managers.consumer_profile_manager()
-        profiles = manager.find_profiles(ids)
+        profiles = manager.find_profile_hashes(ids, type_ids)
+        bound = dict([(id, set()) for id in ids])
+        manager = managers.consumer_bind_manager()
+        filters = {'consumer_id':{'$in':list(ids)}, 'deleted':False}
+        criteria = Criteria(filters=filters, fields=['consumer_id', 'repo_id'])
+        for bind in manager.find_by_criteria(criteria):
+            bound[bind['consumer_id']].add(bind['repo_id'])
+        repo_ids = set()
+        for bound_ids in bound.values():
+            repo_ids.update(bound_ids)
+        versions = {}
+        if repo_ids:
+            manager = managers.repo_query_manager()
+            filters = {'id':{'$in':list(repo_ids)}}
+            criteria = Criteria(filters=filters, fields=['id', 'content_version'])
+            for repo in manager.find_by_criteria(criteria):
+                versions[repo['id']] = repo.get('content_version', 0)
+        states = {}
         for id in ids:
+            bound_ids = sorted(bound[id])
+            signature = [(r, versions.get(r, 0)) for r in bound_ids]
+            states[id] = dict(
+                profiles=profiles[id],
+                repo_ids=bound_ids,
+                repo_hash=_hash(signature))
+        return states
+
+    def __evaluate(self, requests, states, discard_failed=False):
+        """
+        Evaluate and store the applicability of units to consumers.
+        @param requests: A list of: (consumer_id, [unit])
+        @type requests: list
+        @param states: The consumer states keyed by consumer ID.
+        @type states: dict
+        @param discard_failed: When True, the stored applicability of
+            consumers that cannot be evaluated is removed instead of the
+            error being raised.
+        @type discard_failed: bool
+        @return: A dict of:
+            {consumer_id:[<ApplicabilityReport>]}
+            with the reports in the order of the requested units.
+        @rtype: dict
+        """
+        result = {}
+        if not requests:
+            return result
+        manager = managers.consumer_profile_manager()
+        profiles = manager.find_profiles([id for id, units in requests])
+        profilers = {}
+        for id, units in requests:
             for unit in units:
                 typeid = unit['type_id']
-                profiler, cfg = self.__profiler(typeid)
-                pc = self.__profiled_consumer(id)
-                report = profiler.unit_applicable(pc, unit, cfg, conduit)
-                report.unit = unit
-                ulist = result.setdefault(id, [])
-                ulist.append(report)
+                if typeid not in profilers:
+                    profilers[typeid] = self.__profiler(typeid)
+        collection = ConsumerApplicability.get_collection()
+
+        def evaluate(batch):
+            conduit = ProfilerConduit()
+            replaced = []
+            entries = []
+            for id, units in batch:
+                pc = ProfiledConsumer(id, profiles[id])
+                try:
+                    reports = self.__reports(pc, units, profilers, conduit)
+                except Exception:
+                    if not discard_failed:
+                        raise
+                    _LOG.exception('Applicability of consumer [%s] failed' % id)
+                    reports = None
+                hashes = [unit_hash(u) for u in units]
+                replaced.append({'consumer_id':id, 'unit_hash':{'$in':hashes}})
+                if reports is None:
+                    continue
+                for unit, report in zip(units, reports):
+                    entries.append(self.__entry(id, unit, report, states[id]))
+                result[id] = reports
+            self.__store(collection, replaced, entries)
+
+        batches = []
+        for i in range(0, len(requests), CONSUMER_BATCH_SIZE):
+            batches.append(requests[i:i + CONSUMER_BATCH_SIZE])
+        WorkerPool.run_all(MAX_CONCURRENCY, evaluate, batches)
         return result
 
+    def __store(self, collection, replaced, entries):
+        """
+        Store evaluated applicability, replacing any previously stored.
+        The previously stored entries are removed with a single query and
+        the evaluated entries are written with a single bulk insert.
+        When another evaluation has stored the same applicability in the
+        meantime, the insert stops at the duplicate; the entries not
+        stored are evaluated again when next requested.
+        @param collection: The applicability collection.
+        @param replaced: A list of queries matching the stored entries to
+            be replaced, one per consumer.
+        @type replaced: list
+        @param entries: The evaluated applicability.
+        @type entries: list of L{ConsumerApplicability}
+        """
+        if replaced:
+            collection.remove({'$or':replaced}, safe=True)
+        if not entries:
+            return
+        try:
+            collection.insert(entries, safe=True)
+        except DuplicateKeyError:
+            _LOG.debug('Applicability stored concurrently; not replaced')
+
+    def __entry(self, consumer_id, unit, report, state):
+        """
+        Build the stored applicability of a unit to a consumer.
+        @param consumer_id: A consumer ID.
+        @type consumer_id: str
+        @param unit: A content unit.
+        @type unit: dict
+        @param report: The unit's applicability report.
+        @type report: L{ApplicabilityReport}
+        @param state: The consumer state the unit was evaluated with.
+        @type state: dict
+        @rtype: L{ConsumerApplicability}
+        """
+        typeid = unit['type_id']
+        return ConsumerApplicability(
+            consumer_id,
+            typeid,
+            unit['unit_key'],
+            unit_hash(unit),
+            state['profiles'].get(typeid),
+            state['repo_ids'],
+            state['repo_hash'],
+            report.applicable,
+            report.summary,
+            report.details)
+
+    def __reports(self, consumer, units, profilers, conduit):
+        """
+        Evaluate the applicability of units to a consumer.
+        @param consumer: A profiled consumer.
+        @type consumer: L{ProfiledConsumer}
+        @param units: A list of content units.
+        @type units: list
+        @param profilers: The (profiler, cfg) keyed by content type ID.
+        @type profilers: dict
+        @param conduit: A profiler conduit.
+        @type conduit: L{ProfilerConduit}
+        @return: An applicability report for each unit, in the order of units.
+        @rtype: list
+        """
+        by_type = {}
+        for index, unit in enumerate(units):
+            by_type.setdefault(unit['type_id'], []).append((index, unit))
+        reports = [None] * len(units)
+        for typeid, indexed in by_type.items():
+            profiler, cfg = profilers[typeid]
+            type_units = [u for i, u in indexed]
+            type_reports = profiler.units_applicable(consumer, type_units, cfg, conduit)
+            if len(type_reports) != len(type_units):
+                msg = _('Profiler for type %(t)s returned %(r)d reports for %(u)d units')
+                msg = msg % {'t':typeid, 'r':len(type_reports), 'u':len(type_units)}
+                raise PulpExecutionException(msg)
+            for (index, unit), report in zip(indexed, type_reports):
+                report.unit = unit
+                reports[index] = report
+        return reports
+
     def __profiler(self, typeid):
         """
         Find the profiler.
@@ -76,18 +376,146 @@ class ApplicabilityManager(object):
             cfg = {}
         return PluginWrapper(plugin), cfg
 
-    def __profiled_consumer(self, id):
+
+def unit_hash(unit):
+    """
+    Calculate the hash that identifies a content unit.
+    @param unit: A content unit: { type_id:<str>, unit_key:<dict> }
+    @type unit: dict
+    @return: The hex digest of the unit's type ID and key.
+    @rtype: str
+    """
+    return _hash({'type_id':unit['type_id'], 'unit_key':unit['unit_key']})
+
+
+def _hash(value):
+    digest = hashlib.sha256(json.dumps(value, sort_keys=True))
+    return digest.hexdigest()
+
+
+def _current(entry, state):
+    """
+    Get whether stored applicability is current.
+    @param entry: Stored applicability.
+    @type entry: L{ConsumerApplicability}
+    @param state: The consumer's current state.
+    @type state: dict
+    @rtype: bool
+    """
+    return not entry.get('stale') and \
+        entry['profile_hash'] == state['profiles'].get(entry['type_id']) and \
+        entry['repo_hash'] == state['repo_hash']
+
+
+def _report(entry, unit):
+    """
+    Build an applicability report from stored applicability.
+    @param entry: Stored applicability.
+    @type entry: L{ConsumerApplicability}
+    @param unit: The requested content unit.
+    @type unit: dict
+    @rtype: L{ApplicabilityReport}
+    """
+    return ApplicabilityReport(unit, entry['applicable'], entry['summary'], entry['details'])
+
+# -- stale applicability refresher ---------------------------------------------
+
+class ApplicabilityRefresher(object):
+    """
+    Refreshes stale stored applicability in the background, a batch at a
+    time, so that it is current when next requested.
+    @ivar refresh_interval: The seconds between checks for stale entries.
+    @type refresh_interval: float
+    @ivar batch_size: The maximum number of entries refreshed at a time.
+    @type batch_size: int
+    """
+
+    def __init__(self, refresh_interval, batch_size):
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+
+        self.__exit = False
+        self.__lock = threading.RLock()
+        self.__condition = threading.Condition(self.__lock)
+        self.__refresher = None
+
+    def __refresh(self):
+        while True:
+            self.__lock.acquire()
+            try:
+                if not self.__exit:
+                    self.__condition.wait(timeout=self.refresh_interval)
+                if self.__exit:
+                    return
+            finally:
+                self.__lock.release()
+            self._refresh_stale()
+
+    def _refresh_stale(self):
         """
-        Get a profiler consumer model object.
-        @param id: A consumer ID.
-        @type id: str
-        @return: A populated profiler consumer model object.
-        @rtype: L{ProfiledConsumer}
+        Refresh batches of stale entries until there are none left.
         """
-        profiles = {}
-        manager = managers.consumer_profile_manager()
-        for p in manager.get_profiles(id):
-            typeid = p['content_type']
-            profile = p['profile']
-            profiles[typeid] = profile
-        return ProfiledConsumer(id, profiles)
+        manager = managers.consumer_applicability_manager()
+        try:
+            while not self.__exit:
+                if manager.refresh_stale(self.batch_size) < self.batch_size:
+                    break
+        except Exception, e:
+            _LOG.critical('Unhandled exception in applicability refresher: %s' % repr(e))
+            _LOG.exception(e)
+
+    def start(self):
+        """
+        Start the refresher thread.
+        """
+        assert self.__refresher is None
+        self.__lock.acquire()
+        self.__exit = False # needed for re-starts
+        try:
+            self.__refresher = threading.Thread(target=self.__refresh)
+            self.__refresher.setDaemon(True)
+            self.__refresher.start()
+        finally:
+            self.__lock.release()
+
+    def stop(self):
+        """
+        Stop the refresher thread and wait for it to exit.
+        """
+        assert self.__refresher is not None
+        self.__lock.acquire()
+        self.__exit = True
+        self.__condition.notify()
+        self.__lock.release()
+        self.__refresher.join()
+        self.__refresher = None
+
+
+_REFRESHER = None
+
+
+def initialize():
+    """
+    Start the global applicability refresher, unless disabled by a
+    refresh interval of 0 in the [applicability] configuration.
+    """
+    global _REFRESHER
+    assert _REFRESHER is None
+    refresh_interval = pulp_config.config.getfloat('applicability', 'refresh_interval')
+    if refresh_interval <= 0:
+        return
+    batch_size = pulp_config.config.getint('applicability', 'refresh_batch_size')
+    _REFRESHER = ApplicabilityRefresher(refresh_interval, batch_size)
+    _REFRESHER.start()
+
+
+def finalize():
+    """
+    Stop the global applicability refresher and wait for its thread to exit.
+    NOTE: not used by the server but useful for testing.
+    """
+    global _REFRESHER
+    if _REFRESHER is None:
+        return
+    _REFRESHER.stop()
+    _REFRESHER = None
@@ -73,6 +73,9 @@ class BindManager(object):
             self.__reset_bind(consumer_id, repo_id, distributor_id)
         # fetch the inserted/updated bind
         bind = self.get_bind(consumer_id, repo_id, distributor_id)
+        # the stored applicability depends on the bound repositories
+        manager = factory.consumer_applicability_manager()
+        manager.bindings_changed(consumer_id)
         # update history
         details = {'repo_id':repo_id, 'distributor_id':distributor_id}
         manager = factory.consumer_history_manager()
@@ -249,6 +252,9 @@ class BindManager(object):
         collection = Bind.get_collection()
         query = self.bind_id(consumer_id, repo_id, distributor_id)
         collection.update(query, {'$set':{'deleted':True}}, safe=True)
+        # the stored applicability depends on the bound repositories
+        manager = factory.consumer_applicability_manager()
+        manager.bindings_changed(consumer_id)
 
     def delete(self, consumer_id, repo_id, distributor_id, force=False):
         """
@@ -22,6 +22,7 @@ import re
 
 from pulp.server import config
 from pulp.common.bundle import Bundle
+from pulp.server.auth import cache as auth_cache
 
 from pulp.server.db.model.consumer import Consumer
 from pulp.server.managers import factory
@@ -116,6 +117,10 @@ class ConsumerManager(object):
         manager = factory.consumer_profile_manager()
         manager.consumer_deleted(consumer_id)
 
+        # Remove stored applicability
+        manager = factory.consumer_applicability_manager()
+        manager.consumer_deleted(consumer_id)
+
         # Notify agent
         agent_consumer = factory.consumer_agent_manager()
         agent_consumer.unregistered(consumer_id)
@@ -138,6 +143,8 @@ class ConsumerManager(object):
                 'consumer [%s]' % consumer_id)
             raise PulpExecutionException("database-error"), None, sys.exc_info()[2]
 
+        auth_cache.invalidate_consumer(consumer_id)
+
         # remove the consumer from any groups it was a member of
         group_manager = factory.consumer_group_manager()
         group_manager.remove_consumer_from_groups(consumer_id)
@@ -19,8 +19,12 @@ from pymongo.errors import DuplicateKeyError
 
 from pulp.server import exceptions as pulp_exceptions
 from pulp.server.db.model.consumer import Consumer, ConsumerGroup
+from pulp.server.db.model.criteria import Criteria
 from pulp.server.exceptions import InvalidValue
 from pulp.server.managers import factory as manager_factory
+from pulp.server.managers.consumer.agent import (
+    CONTENT_INSTALL, CONTENT_UPDATE, CONTENT_UNINSTALL, Units)
+from pulp.server.managers.consumer.group.fanout import FanOut, GroupReport
 
 # -- constants ----------------------------------------------------------------
 
@@ -226,55 +230,140 @@ class ConsumerGroupManager(object):
     # content ------------------------------------------------------------
 
     def install_content(self, consumer_group_id, units, options):
-        group_collection = validate_existing_consumer_group(consumer_group_id)
-        consumer_group = group_collection.find_one({'id': consumer_group_id})
-        agent_manager = manager_factory.consumer_agent_manager()
-
-        for consumer_id in consumer_group['consumer_ids']:
-            agent_manager.install_content(consumer_id, units, options)
-
+        """
+        Install content units on the consumers of a consumer group.
+        @param consumer_group_id: unique id of the consumer group
+        @type  consumer_group_id: str
+        @param units: list of content units to be installed
+        @type  units: list of {type_id:<str>, unit_key:<dict>}
+        @param options: install options; based on unit type
+        @type  options: dict
+        @return: report of the outcome on each consumer
+        @rtype:  L{GroupReport}
+        """
+        return self.__content_request(CONTENT_INSTALL, consumer_group_id, units, options)
 
     def update_content(self, consumer_group_id, units, options):
-        group_collection = validate_existing_consumer_group(consumer_group_id)
-        consumer_group = group_collection.find_one({'id': consumer_group_id})
-        agent_manager = manager_factory.consumer_agent_manager()
-
-        for consumer_id in consumer_group['consumer_ids']:
-            agent_manager.update_content(consumer_id, units, options)
+        """
+        Update content units on the consumers of a consumer group.
+        @param consumer_group_id: unique id of the consumer group
+        @type  consumer_group_id: str
+        @param units: list of content units to be updated
+        @type  units: list of {type_id:<str>, unit_key:<dict>}
+        @param options: update options; based on unit type
+        @type  options: dict
+        @return: report of the outcome on each consumer
+        @rtype:  L{GroupReport}
+        """
+        return self.__content_request(CONTENT_UPDATE, consumer_group_id, units, options)
 
     def uninstall_content(self, consumer_group_id, units, options):
-        group_collection = validate_existing_consumer_group(consumer_group_id)
-        consumer_group = group_collection.find_one({'id': consumer_group_id})
-        agent_manager = manager_factory.consumer_agent_manager()
+        """
+        Uninstall content units on the consumers of a consumer group.
+        @param consumer_group_id: unique id of the consumer group
+        @type  consumer_group_id: str
+        @param units: list of content units to be uninstalled
+        @type  units: list of {type_id:<str>, unit_key:<dict>}
+        @param options: uninstall options; based on unit type
+        @type  options: dict
+        @return: report of the outcome on each consumer
+        @rtype:  L{GroupReport}
+        """
+        return self.__content_request(CONTENT_UNINSTALL, consumer_group_id, units, options)
 
-        for consumer_id in consumer_group['consumer_ids']:
-            agent_manager.uninstall_content(consumer_id, units, options)
+    def __content_request(self, action, consumer_group_id, units, options):
+        """
+        Send a content request to the agents of the consumers of a consumer
+        group. The consumers and their profiles are read in bulk and the
+        profilers are found once for the whole group.
+        """
+        consumer_ids = _consumer_ids(consumer_group_id)
+        consumers = _consumers(consumer_ids)
+        manager = manager_factory.consumer_profile_manager()
+        profiles = manager.find_profiles(consumers.keys())
+        agent_manager = manager_factory.consumer_agent_manager()
+        profilers = agent_manager.find_profilers(Units(units).keys())
+
+        report = GroupReport()
+        calls = []
+        for consumer_id in consumer_ids:
+            consumer = consumers.get(consumer_id)
+            if consumer is None:
+                report.failed(consumer_id, pulp_exceptions.MissingResource(consumer=consumer_id))
+                continue
+            args = (action, consumer, profiles[consumer_id], units, options, profilers)
+            calls.append((consumer_id, agent_manager.content_request, args))
+        return FanOut().run(report, calls)
 
     # bind ------------------------------------------------------------
 
     def bind(self, consumer_group_id, repo_id, distributor_id):
-        group_collection = validate_existing_consumer_group(consumer_group_id)
-        consumer_group = group_collection.find_one({'id': consumer_group_id})
+        """
+        Bind the consumers of a consumer group to a specific distributor
+        associated with a repository. Consumers already bound are not
+        bound again. This call is idempotent.
+        @param consumer_group_id: unique id of the consumer group
+        @type  consumer_group_id: str
+        @param repo_id: uniquely identifies the repository
+        @type  repo_id: str
+        @param distributor_id: uniquely identifies a distributor
+        @type  distributor_id: str
+        @return: report of the outcome on each consumer; the details of
+                 each are the consumer's Bind object
+        @rtype:  L{GroupReport}
+        @raise MissingResource: when the distributor does not exist
+        """
+        consumer_ids = _consumer_ids(consumer_group_id)
+        # ensure the repository & distributor are valid
+        manager = manager_factory.repo_distributor_manager()
+        manager.get_distributor(repo_id, distributor_id)
+        consumers = _consumers(consumer_ids)
+        bindings = _bindings(consumer_ids, repo_id, distributor_id)
         bind_manager = manager_factory.consumer_bind_manager()
 
-        binds = []
-        for consumer_id in consumer_group['consumer_ids']:
-            bind = bind_manager.bind(consumer_id, repo_id, distributor_id)
-            binds.append(bind)
-
-        return binds
+        report = GroupReport()
+        calls = []
+        for consumer_id in consumer_ids:
+            if consumer_id not in consumers:
+                report.failed(consumer_id, pulp_exceptions.MissingResource(consumer=consumer_id))
+                continue
+            bind = bindings.get(consumer_id)
+            if bind is not None:
+                report.succeeded(consumer_id, bind)
+                continue
+            args = (consumer_id, repo_id, distributor_id)
+            calls.append((consumer_id, bind_manager.bind, args))
+        return FanOut().run(report, calls)
 
     def unbind(self, consumer_group_id, repo_id, distributor_id):
-        group_collection = validate_existing_consumer_group(consumer_group_id)
-        consumer_group = group_collection.find_one({'id': consumer_group_id})
+        """
+        Unbind the consumers of a consumer group from a specific distributor
+        associated with a repository. Consumers that are not bound are left
+        alone. This call is idempotent.
+        @param consumer_group_id: unique id of the consumer group
+        @type  consumer_group_id: str
+        @param repo_id: uniquely identifies the repository
+        @type  repo_id: str
+        @param distributor_id: uniquely identifies a distributor
+        @type  distributor_id: str
+        @return: report of the outcome on each consumer; the details of
+                 each are the consumer's deleted Bind object, or None if
+                 the consumer was not bound
+        @rtype:  L{GroupReport}
+        """
+        consumer_ids = _consumer_ids(consumer_group_id)
+        bindings = _bindings(consumer_ids, repo_id, distributor_id)
         bind_manager = manager_factory.consumer_bind_manager()
 
-        unbinds = []
-        for consumer_id in consumer_group['consumer_ids']:
-            unbind = bind_manager.unbind(consumer_id, repo_id, distributor_id)
-            unbinds.append(unbind)
-
-        return unbinds
+        report = GroupReport()
+        calls = []
+        for consumer_id in consumer_ids:
+            if consumer_id not in bindings:
+                report.succeeded(consumer_id)
+                continue
+            args = (consumer_id, repo_id, distributor_id)
+            calls.append((consumer_id, bind_manager.unbind, args))
+        return FanOut().run(report, calls)
 
 
 # utility functions ------------------------------------------------------------
@@ -296,3 +385,44 @@ def validate_existing_consumer_group(group_id):
         return collection
     raise pulp_exceptions.MissingResource(consumer_group=group_id)
 
+
+def _consumer_ids(group_id):
+    """
+    @return: ids of the consumers belonging to a consumer group
+    @rtype:  list
+    @raise:  L{pulp.server.exceptions.MissingResource}
+    """
+    collection = ConsumerGroup.get_collection()
+    consumer_group = collection.find_one({'id': group_id}, fields=['consumer_ids'])
+    if consumer_group is None:
+        raise pulp_exceptions.MissingResource(consumer_group=group_id)
+    return consumer_group['consumer_ids']
+
+
+def _consumers(consumer_ids):
+    """
+    Read the consumers with a single query; only the fields needed to
+    contact their agents are read.
+    @return: consumers keyed by id; missing consumers are omitted
+    @rtype:  dict
+    """
+    criteria = Criteria(filters={'id': {'$in': consumer_ids}}, fields=['id', 'certificate'])
+    manager = manager_factory.consumer_query_manager()
+    return dict((c['id'], c) for c in manager.find_by_criteria(criteria))
+
+
+def _bindings(consumer_ids, repo_id, distributor_id):
+    """
+    Read the (non-deleted) bindings of consumers to a distributor with a
+    single query.
+    @return: bindings keyed by consumer id; consumers not bound are omitted
+    @rtype:  dict
+    """
+    filters = {'consumer_id': {'$in': consumer_ids},
+               'repo_id': repo_id,
+               'distributor_id': distributor_id,
+               'deleted': False}
+    manager = manager_factory.consumer_bind_manager()
+    bindings = manager.find_by_criteria(Criteria(filters=filters))
+    return dict((b['consumer_id'], b) for b in bindings)
+
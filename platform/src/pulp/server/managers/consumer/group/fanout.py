@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the License
+# (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied, including the
+# implied warranties of MERCHANTABILITY, NON-INFRINGEMENT, or FITNESS FOR A
+# PARTICULAR PURPOSE.
+# You should have received a copy of GPLv2 along with this software; if not,
+# see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
+
+"""
+Fan-out of a consumer group operation to the group's consumers.
+
+The per-consumer calls are made by a bounded pool of worker threads, which
+also bounds the number of agent requests in flight to the message broker, and
+their outcomes are collected into a single group report.
+"""
+
+import logging
+import threading
+
+from pulp.server import config as pulp_config
+from pulp.server.dispatch import factory as dispatch_factory
+from pulp.server.dispatch.pool import WorkerPool
+
+
+_LOG = logging.getLogger(__name__)
+
+# group report class -----------------------------------------------------------
+
+class GroupReport(dict):
+    """
+    Aggregate report of a consumer group operation.
+    Keys:
+     * succeeded: True if the operation succeeded on all of the consumers
+     * summary: {total:<int>, succeeded:<int>, failed:<int>}
+     * consumers: {consumer_id:<outcome>} where outcome is:
+         {succeeded:<bool>, details:<object>, exception:<dict>}
+       details is the result of the per-consumer call and exception, set when
+       it failed, is: {type:<str>, message:<str>}
+    NOTE: updates are not synchronized; see L{FanOut}
+    """
+
+    def __init__(self):
+        self['succeeded'] = True
+        self['summary'] = dict(total=0, succeeded=0, failed=0)
+        self['consumers'] = {}
+
+    def succeeded(self, consumer_id, details=None):
+        """
+        Record that the operation succeeded on a consumer.
+        @param consumer_id: A consumer ID.
+        @type consumer_id: str
+        @param details: The result of the operation on the consumer.
+        """
+        outcome = dict(succeeded=True, details=details, exception=None)
+        self.__add(consumer_id, outcome)
+
+    def failed(self, consumer_id, exception):
+        """
+        Record that the operation failed on a consumer.
+        @param consumer_id: A consumer ID.
+        @type consumer_id: str
+        @param exception: The raised exception.
+        @type exception: Exception
+        """
+        details = dict(type=exception.__class__.__name__, message=str(exception))
+        outcome = dict(succeeded=False, details=None, exception=details)
+        self.__add(consumer_id, outcome)
+
+    def __add(self, consumer_id, outcome):
+        self['consumers'][consumer_id] = outcome
+        summary = self['summary']
+        summary['total'] += 1
+        if outcome['succeeded']:
+            summary['succeeded'] += 1
+        else:
+            summary['failed'] += 1
+            self['succeeded'] = False
+
+# fan-out class ----------------------------------------------------------------
+
+class FanOut(object):
+    """
+    FanOut class
+    Makes a call per consumer using at most max_concurrency worker threads
+    and records the outcome of each call in a L{GroupReport}. A failed call
+    does not prevent the remaining calls from being made.
+
+    The calls are made within the caller's dispatch context so that requests
+    sent to the agents are tracked against the caller's call request.
+
+    @ivar max_concurrency: maximum number of calls in progress at once
+    @type max_concurrency: int
+    """
+
+    def __init__(self, max_concurrency=None):
+        if max_concurrency is None:
+            max_concurrency = pulp_config.config.getint('tasks', 'consumer_group_concurrency')
+        self.max_concurrency = max(max_concurrency, 1)
+        self.__lock = threading.Lock()
+
+    def run(self, report, calls):
+        """
+        Make the calls and wait for all of them to finish.
+        @param report: The report the outcomes are recorded in.
+        @type report: L{GroupReport}
+        @param calls: A list of: (consumer_id, function, args)
+        @type calls: list
+        @return: The report.
+        @rtype: L{GroupReport}
+        """
+        context = dispatch_factory.context()
+        call_request_id = context.call_request_id
+        call_request_group_id = context.call_request_group_id
+        caller = threading.currentThread()
+
+        def call(item):
+            # calls made inline run within the caller's own context
+            if threading.currentThread() is caller:
+                self.__call(report, *item)
+                return
+            context = dispatch_factory.context()
+            context.call_request_id = call_request_id
+            context.call_request_group_id = call_request_group_id
+            try:
+                self.__call(report, *item)
+            finally:
+                context.clear_task_attributes()
+
+        WorkerPool.run_all(self.max_concurrency, call, calls)
+        return report
+
+    def __call(self, report, consumer_id, function, args):
+        try:
+            details = function(*args)
+        except Exception, e:
+            _LOG.exception('consumer group operation failed on consumer: %s' % consumer_id)
+            self.__record(report.failed, consumer_id, e)
+        else:
+            self.__record(report.succeeded, consumer_id, details)
+
+    def __record(self, method, *args):
+        self.__lock.acquire()
+        try:
+            method(*args)
+        finally:
+            self.__lock.release()
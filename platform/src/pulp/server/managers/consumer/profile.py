@@ -57,11 +57,17 @@ class ProfileManager(object):
         manager.get_consumer(consumer_id)
         try:
             p = self.get_profile(consumer_id, content_type)
+            previous_hash = p.get('profile_hash')
             p['profile'] = profile
+            p['profile_hash'] = UnitProfile.calculate_hash(profile)
         except MissingResource:
+            previous_hash = None
             p = UnitProfile(consumer_id, content_type, profile)
         collection = UnitProfile.get_collection()
         collection.save(p, safe=True)
+        if p['profile_hash'] != previous_hash:
+            manager = factory.consumer_applicability_manager()
+            manager.profile_changed(consumer_id, content_type)
         return p
 
     def delete(self, consumer_id, content_type):
@@ -75,6 +81,8 @@ class ProfileManager(object):
         profile = self.get_profile(consumer_id, content_type)
         collection = UnitProfile.get_collection()
         collection.remove(profile, safe=True)
+        manager = factory.consumer_applicability_manager()
+        manager.profile_changed(consumer_id, content_type)
 
     def consumer_deleted(self, id):
         """
@@ -122,19 +130,53 @@ class ProfileManager(object):
 
     def find_profiles(self, consumer_ids):
         """
-        Get all profiles associated with lost of consumers.
+        Get all profiles associated with a list of consumers.
+        The profiles are read with a single query.
         @param consumer_ids: A list of consumer IDs.
         @type consumer_ids: list
         @return: A dict of:
             {consumer_id:{content_type:<profile>}}
-        @rtype: list
+        @rtype: dict
         """
         profiles = dict([(c, {}) for c in consumer_ids])
         collection = UnitProfile.get_collection()
-        for p in collection.find({'id':{'$in':profiles.keys()}}):
+        query = {'consumer_id':{'$in':profiles.keys()}}
+        fields = ['consumer_id', 'content_type', 'profile']
+        for p in collection.find(query, fields=fields):
             key = p['consumer_id']
             typeid = p['content_type']
             profile = p['profile']
             entry = profiles[key]
             entry[typeid] = profile
-        return profiles
\ No newline at end of file
+        return profiles
+
+    def find_profile_hashes(self, consumer_ids, content_types):
+        """
+        Get the hashes of the profiles of a list of consumers
+        without reading the profiles.
+        @param consumer_ids: A list of consumer IDs.
+        @type consumer_ids: list
+        @param content_types: A list of profile (content) type IDs.
+        @type content_types: list
+        @return: A dict of:
+            {consumer_id:{content_type:<profile hash>}}
+        @rtype: dict
+        """
+        hashes = dict([(c, {}) for c in consumer_ids])
+        collection = UnitProfile.get_collection()
+        query = {
+            'consumer_id':{'$in':hashes.keys()},
+            'content_type':{'$in':list(content_types)},
+        }
+        fields = ['consumer_id', 'content_type', 'profile_hash']
+        for p in collection.find(query, fields=fields):
+            key = p['consumer_id']
+            typeid = p['content_type']
+            profile_hash = p.get('profile_hash')
+            if profile_hash is None:
+                # stored before profile hashes were recorded
+                p = collection.find_one({'_id':p['_id']})
+                profile_hash = UnitProfile.calculate_hash(p['profile'])
+            entry = hashes[key]
+            entry[typeid] = profile_hash
+        return hashes
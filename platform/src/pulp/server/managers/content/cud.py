@@ -14,7 +14,9 @@
 import uuid
 
 from pulp.plugins.types import database as content_types_db
+from pulp.server.db.model.repository import RepoContentUnit
 from pulp.server.exceptions import InvalidValue
+import pulp.server.managers.factory as manager_factory
 
 class ContentManager(object):
     """
@@ -42,9 +44,38 @@ class ContentManager(object):
         collection.insert(unit_doc, safe=True)
         return unit_id
 
+    def add_content_units(self, content_type, units_metadata):
+        """
+        Add multiple content units of the same type to the corresponding pulp
+        db collection using a single multi-document insert. An id is generated
+        for each unit.
+        @param content_type: unique id of content collection
+        @type content_type: str
+        @param units_metadata: list of content unit metadata
+        @type units_metadata: list of dict's
+        @return: list of generated unit ids, in the same order as the metadata
+        @rtype: list of str's
+        """
+        if not units_metadata:
+            return []
+        collection = content_types_db.type_units_collection(content_type)
+        unit_ids = []
+        unit_docs = []
+        for unit_metadata in units_metadata:
+            unit_id = str(uuid.uuid4())
+            unit_doc = {'_id': unit_id, '_content_type_id': content_type}
+            unit_doc.update(unit_metadata)
+            unit_ids.append(unit_id)
+            unit_docs.append(unit_doc)
+        collection.insert(unit_docs, safe=True)
+        return unit_ids
+
     def update_content_unit(self, content_type, unit_id, unit_metadata_delta):
         """
         Update a content unit's stored metadata.
+        When the stored metadata changes, the content version of each repo
+        the unit is associated with is incremented so that applicability
+        evaluated against the previous metadata is no longer used.
         @param content_type: unique id of content collection
         @type content_type: str
         @param unit_id: unique id of content unit
@@ -52,8 +83,42 @@ class ContentManager(object):
         @param unit_metadata_delta: metadata fields that have changed
         @type unit_metadata_delta: dict
         """
+        self.update_content_units(content_type, {unit_id: unit_metadata_delta})
+
+    def update_content_units(self, content_type, unit_metadata_deltas):
+        """
+        Bulk variation of update_content_unit. The stored metadata of all of
+        the units is read with a single query and only the units whose
+        metadata actually changes are written. The associations of the changed
+        units are then looked up with a single query and the content version
+        of each affected repo is incremented once.
+        @param content_type: unique id of content collection
+        @type content_type: str
+        @param unit_metadata_deltas: maps unit id to the metadata fields that
+                                     have changed for that unit
+        @type unit_metadata_deltas: dict
+        """
+        if not unit_metadata_deltas:
+            return
         collection = content_types_db.type_units_collection(content_type)
-        collection.update({'_id': unit_id}, {'$set': unit_metadata_delta}, safe=True)
+        fields = set()
+        for unit_metadata_delta in unit_metadata_deltas.values():
+            fields.update(unit_metadata_delta.keys())
+        spec = {'_id': {'$in': unit_metadata_deltas.keys()}}
+        changed_ids = []
+        for unit in collection.find(spec, fields=list(fields)):
+            unit_metadata_delta = unit_metadata_deltas[unit['_id']]
+            changed = [f for f in unit_metadata_delta if unit.get(f) != unit_metadata_delta[f]]
+            if not changed:
+                continue
+            collection.update({'_id': unit['_id']}, {'$set': unit_metadata_delta}, safe=True)
+            changed_ids.append(unit['_id'])
+        if not changed_ids:
+            return
+        query = {'unit_type_id': content_type, 'unit_id': {'$in': changed_ids}}
+        associations = RepoContentUnit.get_collection().find(query, fields=['repo_id'])
+        repo_ids = list(set([a['repo_id'] for a in associations]))
+        manager_factory.repo_manager().units_updated(repo_ids)
 
     def remove_content_unit(self, content_type, unit_id):
         """
@@ -11,12 +11,17 @@
 # have received a copy of GPLv2 along with this software; if not, see
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
+import heapq
 import logging
 import os
+import Queue
 import re
 import shutil
+import threading
 from gettext import gettext as _
 
+import pymongo
+
 from pulp.server import config as pulp_config
 from pulp.plugins.types import database as content_types_db
 from pulp.server import exceptions as pulp_exceptions
@@ -26,6 +31,11 @@ from pulp.server.managers import factory as manager_factory
 
 _LOG = logging.getLogger(__name__)
 
+# maximum number of orphaned files deleted concurrently
+DELETION_THREADS = 4
+
+_ROOT_CONTENT_REGEX_CACHE = {}
+
 
 class OrphanManager(object):
 
@@ -35,15 +45,24 @@ class OrphanManager(object):
         @return: list of content units
         @rtype:  list
         """
+        return list(self.generate_all_orphans())
+
+    def generate_all_orphans(self, fields=None):
+        """
+        Return a generator of all content units that are not associated with a
+        repository.
+        @param fields: list of fields to return for each unit, None means all
+        @type  fields: list or None
+        @return: generator of content units
+        @rtype:  generator
+        """
 
         # iterate through all types and get the orphaned units for each
-        orphaned_units = []
         content_query_manager = manager_factory.content_query_manager()
         content_types = content_query_manager.list_content_types()
         for content_type in content_types:
-            orphaned_units_of_type = self.list_orphans_by_type(content_type)
-            orphaned_units.extend(orphaned_units_of_type)
-        return orphaned_units
+            for orphan in self.generate_orphans_by_type(content_type, fields):
+                yield orphan
 
     def list_orphans_by_type(self, content_type):
         """
@@ -53,17 +72,91 @@ class OrphanManager(object):
         @return: list of content units of the given type
         @rtype:  list
         """
+        return list(self.generate_orphans_by_type(content_type))
+
+    def generate_orphans_by_type(self, content_type, fields=None, batch_size=None):
+        """
+        Return a generator of all content units of a given type that are not
+        associated with a repository. Units are examined in batches, so memory
+        usage is bounded by the batch size rather than the number of units.
+        @param content_type: content type of orphaned units
+        @type  content_type: str
+        @param fields: list of fields to return for each unit, None means all
+        @type  fields: list or None
+        @param batch_size: number of units checked per query, None means to
+                           use the database query_batch_size setting
+        @type  batch_size: int or None
+        @return: generator of content units of the given type
+        @rtype:  generator
+        """
+        for orphans in self._generate_orphan_batches(content_type, fields, batch_size):
+            for orphan in orphans:
+                yield orphan
+
+    def _generate_orphan_batches(self, content_type, fields=None, batch_size=None):
+        """
+        Return a generator of lists of orphaned content units of the given type.
+        Unit ids are streamed from the content type collection in _id order and
+        each batch is checked against the (indexed) association collection with
+        a single $in query.
+        @param content_type: content type of orphaned units
+        @type  content_type: str
+        @param fields: list of fields to return for each unit, None means all
+        @type  fields: list or None
+        @param batch_size: number of units checked per query, None means to
+                           use the database query_batch_size setting
+        @type  batch_size: int or None
+        @return: generator of lists of content units
+        @rtype:  generator
+        """
+        if batch_size is None:
+            batch_size = pulp_config.config.getint('database', 'query_batch_size')
+        batch_size = max(1, batch_size)
+
+        units_collection = content_types_db.type_units_collection(content_type)
+        cursor = units_collection.find({}, fields=['_id'])
+        cursor.sort('_id', pymongo.ASCENDING)
+        cursor.batch_size(batch_size)
 
-        # find units of this type that are associated with one or more repositories
+        unit_ids = []
+        for unit in cursor:
+            unit_ids.append(unit['_id'])
+            if len(unit_ids) < batch_size:
+                continue
+            orphans = self._find_orphans(content_type, unit_ids, fields)
+            if orphans:
+                yield orphans
+            unit_ids = []
+
+        if unit_ids:
+            orphans = self._find_orphans(content_type, unit_ids, fields)
+            if orphans:
+                yield orphans
+
+    def _find_orphans(self, content_type, unit_ids, fields=None):
+        """
+        Of the given units, load the ones that are not associated with any
+        repository.
+        @param content_type: content type of the units
+        @type  content_type: str
+        @param unit_ids: ids of the units to check
+        @type  unit_ids: list
+        @param fields: list of fields to return for each unit, None means all
+        @type  fields: list or None
+        @return: list of orphaned content units
+        @rtype:  list
+        """
         associated_collection = RepoContentUnit.get_collection()
-        associated_units = associated_collection.find({'unit_type_id': content_type}, fields=['unit_id'])
-        associated_unit_ids = set(d['unit_id'] for d in associated_units)
+        spec = {'unit_type_id': content_type, 'unit_id': {'$in': unit_ids}}
+        associated_ids = set(d['unit_id'] for d in associated_collection.find(spec, fields=['unit_id']))
+        orphaned_ids = [i for i in unit_ids if i not in associated_ids]
+        if not orphaned_ids:
+            return []
 
-        # find units that are not associated with any repositories
         units_collection = content_types_db.type_units_collection(content_type)
-        spec = {'_id': {'$nin': list(associated_unit_ids)}}
-        orphaned_units = units_collection.find(spec)
-        return list(orphaned_units)
+        cursor = units_collection.find({'_id': {'$in': orphaned_ids}}, fields=fields)
+        cursor.sort('_id', pymongo.ASCENDING)
+        return list(cursor)
 
     def get_orphan(self, content_type, content_id):
         """
@@ -72,47 +165,90 @@ class OrphanManager(object):
         @type  content_type: str
         @param content_id: content id of the orphan
         @type  content_id: str
+        @raise MissingResource: if the unit does not exist or is associated
+                                with a repository
         """
-        orphans = self.list_orphans_by_type(content_type)
-        for orphan in orphans:
-            if content_id != orphan['_id']:
-                continue
-            return orphan
-        raise pulp_exceptions.MissingResource(content_type=content_type, content_id=content_id)
+        units_collection = content_types_db.type_units_collection(content_type)
+        orphan = units_collection.find_one({'_id': content_id})
+        if orphan is None:
+            raise pulp_exceptions.MissingResource(content_type=content_type, content_id=content_id)
 
-    def delete_all_orphans(self):
+        associated_collection = RepoContentUnit.get_collection()
+        spec = {'unit_type_id': content_type, 'unit_id': content_id}
+        if associated_collection.find_one(spec, fields=['unit_id']) is not None:
+            raise pulp_exceptions.MissingResource(content_type=content_type, content_id=content_id)
+
+        return orphan
+
+    def delete_all_orphans(self, dry_run=False):
         """
         Delete all orphaned content units.
+        @param dry_run: if True, compute the deletion report without removing
+                        anything from the database or disk
+        @type  dry_run: bool
+        @return: deletion report; see new_deletion_report
+        @rtype:  dict
         """
+        report = new_deletion_report(dry_run)
+        pruned_dirs = set()
 
         # iterate through the types and delete all orphans of each type
         content_query_manager = manager_factory.content_query_manager()
         content_types = content_query_manager.list_content_types()
         for content_type in content_types:
-            self.delete_orphans_by_type(content_type)
+            self.delete_orphans_by_type(content_type, dry_run=dry_run, report=report,
+                                        _pruned_dirs=pruned_dirs)
+
+        self.prune_empty_directories(pruned_dirs, dry_run)
+        return report
 
-    def delete_orphans_by_type(self, content_type):
+    def delete_orphans_by_type(self, content_type, dry_run=False, report=None, _pruned_dirs=None):
         """
-        Delete all orphaned content units of the given content type.
+        Delete all orphaned content units of the given content type. The
+        orphans are removed in bounded batches and their files are deleted in
+        parallel; parent directories that fall empty are pruned once at the end.
         @param content_type: content type of the orphans to delete
         @type  content_type: str
+        @param dry_run: if True, compute the deletion report without removing
+                        anything from the database or disk
+        @type  dry_run: bool
+        @param report: optional report to add to, see new_deletion_report
+        @type  report: dict or None
+        @return: deletion report
+        @rtype:  dict
         """
+        if report is None:
+            report = new_deletion_report(dry_run)
+
+        # when called by delete_all_orphans the parents are pruned by the caller
+        prune_here = _pruned_dirs is None
+        parent_dirs = set() if prune_here else _pruned_dirs
 
-        orphaned_units = self.list_orphans_by_type(content_type)
-        if not orphaned_units:
-            return
         collection = content_types_db.type_units_collection(content_type)
-        spec = {'_id': {'$in': [o['_id'] for o in orphaned_units]}}
-        collection.remove(spec, safe=True)
-        orphaned_paths = [o['_storage_path'] for o in orphaned_units if o['_storage_path'] is not None]
-        for path in orphaned_paths:
-            self.delete_orphaned_file(path)
+        fields = ['_id', '_storage_path']
+        for orphaned_units in self._generate_orphan_batches(content_type, fields):
+            if not dry_run:
+                spec = {'_id': {'$in': [o['_id'] for o in orphaned_units]}}
+                collection.remove(spec, safe=True)
+            report['units_removed'] += len(orphaned_units)
+            orphaned_paths = [o['_storage_path'] for o in orphaned_units if o.get('_storage_path') is not None]
+            self.delete_orphaned_files(orphaned_paths, dry_run=dry_run, report=report,
+                                       _parent_dirs=parent_dirs)
 
-    def delete_orphans_by_id(self, orphans):
+        if prune_here:
+            self.prune_empty_directories(parent_dirs, dry_run)
+        return report
+
+    def delete_orphans_by_id(self, orphans, dry_run=False):
         """
         Delete a list of orphaned content units by their content type and unit ids.
         @param orphans: list of documents with 'content_type' and 'content_id' keys
         @type  orphans: list
+        @param dry_run: if True, compute the deletion report without removing
+                        anything from the database or disk
+        @type  dry_run: bool
+        @return: deletion report; see new_deletion_report
+        @rtype:  dict
         """
         # XXX this does no validation of the orphans
 
@@ -124,25 +260,126 @@ class OrphanManager(object):
             id_list = orphans_by_id.setdefault(o['content_type_id'], [])
             id_list.append(o['unit_id'])
 
+        report = new_deletion_report(dry_run)
+        parent_dirs = set()
+
         # iterate through the types and ids
         content_query_manager = manager_factory.content_query_manager()
         for content_type, content_id_list in orphans_by_id.items():
 
             # build a list of the on-disk contents
-            orphaned_paths = []
-            for unit_id in content_id_list:
-                content_unit = content_query_manager.get_content_unit_by_id(content_type, unit_id, model_fields=['_storage_path'])
-                if content_unit['_storage_path'] is not None:
-                    orphaned_paths.append(content_unit['_storage_path'])
+            content_units = content_query_manager.get_multiple_units_by_ids(content_type, content_id_list,
+                                                                            model_fields=['_storage_path'])
+            orphaned_paths = [u['_storage_path'] for u in content_units if u.get('_storage_path') is not None]
 
             # remove the orphans from the db
-            collection = content_types_db.type_units_collection(content_type)
-            spec = {'_id': {'$in': content_id_list}}
-            collection.remove(spec, safe=True)
+            if not dry_run:
+                collection = content_types_db.type_units_collection(content_type)
+                spec = {'_id': {'$in': content_id_list}}
+                collection.remove(spec, safe=True)
+            report['units_removed'] += len(content_units)
 
             # delete the on-disk contents
-            for path in orphaned_paths:
-                self.delete_orphaned_file(path)
+            self.delete_orphaned_files(orphaned_paths, dry_run=dry_run, report=report,
+                                       _parent_dirs=parent_dirs)
+
+        self.prune_empty_directories(parent_dirs, dry_run)
+        return report
+
+    def delete_orphaned_files(self, paths, dry_run=False, report=None,
+                              threads=DELETION_THREADS, _parent_dirs=None):
+        """
+        Delete orphaned files (or directories) using a bounded pool of worker
+        threads. Unless a parent directory set is passed in by the caller, the
+        parent directories that fall empty are pruned once all of the files
+        have been deleted.
+        @param paths: absolute paths to the files to delete
+        @type  paths: list
+        @param dry_run: if True, compute the report without touching the disk
+        @type  dry_run: bool
+        @param report: optional report to add to, see new_deletion_report
+        @type  report: dict or None
+        @param threads: maximum number of concurrent deletions
+        @type  threads: int
+        @return: deletion report
+        @rtype:  dict
+        """
+        if report is None:
+            report = new_deletion_report(dry_run)
+
+        prune_here = _parent_dirs is None
+        parent_dirs = set() if prune_here else _parent_dirs
+
+        path_queue = Queue.Queue()
+        for path in paths:
+            path_queue.put(path)
+        report_lock = threading.Lock()
+
+        def _worker():
+            while True:
+                try:
+                    path = path_queue.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    result = _delete_path(path, dry_run)
+                except Exception, e:
+                    _LOG.exception(_('Error deleting orphaned file: %(p)s') % {'p': path})
+                    result = (0, 0, str(e))
+                file_count, byte_count, error = result
+                report_lock.acquire()
+                try:
+                    report['files_removed'] += file_count
+                    report['bytes_reclaimed'] += byte_count
+                    if error is not None:
+                        report['errors'].append({'path': path, 'error': error})
+                    parent_dirs.add(os.path.dirname(path))
+                finally:
+                    report_lock.release()
+
+        workers = [threading.Thread(target=_worker) for i in range(min(max(1, threads), len(paths)))]
+        for worker in workers:
+            worker.setDaemon(True)
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        if prune_here:
+            self.prune_empty_directories(parent_dirs, dry_run)
+        return report
+
+    def prune_empty_directories(self, directories, dry_run=False):
+        """
+        Delete the given directories, and their parents, as long as they are
+        empty. Each directory is only examined once, deepest first, and the
+        walk stops at the root content directory of each content type.
+        @param directories: absolute paths of the directories to prune
+        @type  directories: iterable
+        @param dry_run: if True, nothing is removed
+        @type  dry_run: bool
+        """
+        if dry_run:
+            return
+        root_content_regex = _root_content_regex()
+
+        # a heap ordered by depth guarantees every child is examined before its
+        # parent, so each directory only needs to be listed once
+        queued = set(directories)
+        heap = [(-d.count(os.sep), d) for d in queued]
+        heapq.heapify(heap)
+        while heap:
+            depth, path = heapq.heappop(heap)
+            if root_content_regex.match(path):
+                continue
+            if not os.path.isdir(path) or os.listdir(path):
+                continue
+            if not os.access(path, os.W_OK):
+                continue
+            os.rmdir(path)
+            parent = os.path.dirname(path)
+            if parent != path and parent not in queued:
+                queued.add(parent)
+                heapq.heappush(heap, (-parent.count(os.sep), parent))
 
     def delete_orphaned_file(self, path):
         """
@@ -150,34 +387,87 @@ class OrphanManager(object):
         @param path: absolute path to the file to delete
         @type  path: str
         """
-        assert os.path.isabs(path)
+        file_count, byte_count, error = _delete_path(path, False)
+        if file_count:
+            self.prune_empty_directories([os.path.dirname(path)])
 
-        _LOG.debug(_('Deleting orphaned file: %(p)s') % {'p': path})
+# utility functions ------------------------------------------------------------
 
-        if not os.path.exists(path):
-            _LOG.warn(_('Cannot delete orphaned file: %(p)s, No such file') % {'p': path})
-            return
+def new_deletion_report(dry_run=False):
+    """
+    Create an empty orphan deletion report. The report contains:
+     * dry_run: whether or not anything was actually removed
+     * units_removed: number of content units removed from the database
+     * files_removed: number of files removed from disk
+     * bytes_reclaimed: total size of the files removed from disk
+     * errors: list of dicts with the 'path' and 'error' of each failed removal
+    @param dry_run: whether the report is for a dry run
+    @type  dry_run: bool
+    @rtype: dict
+    """
+    return {'dry_run': dry_run,
+            'units_removed': 0,
+            'files_removed': 0,
+            'bytes_reclaimed': 0,
+            'errors': []}
 
-        if not os.access(path, os.W_OK):
-            _LOG.warn(_('Cannot delete orphaned file: %(p)s, Insufficient permissions') % {'p': path})
-            return
 
-        if os.path.isfile(path) or os.path.islink(path):
-            os.unlink(path)
-        elif os.path.isdir(path):
-            shutil.rmtree(path)
+def _root_content_regex():
+    """
+    Return the compiled regular expression matching the root content directory
+    of any content type, compiling it only once per storage directory.
+    """
+    storage_dir = pulp_config.config.get('server', 'storage_dir')
+    cached = _ROOT_CONTENT_REGEX_CACHE.get(storage_dir)
+    if cached is None:
+        content_dir = os.path.join(storage_dir, 'content')
+        cached = re.compile(re.escape(content_dir) + '/[^/]+/?$')
+        _ROOT_CONTENT_REGEX_CACHE[storage_dir] = cached
+    return cached
 
-        # delete parent directories on the path as long as they fall empty
-        storage_dir = pulp_config.config.get('server', 'storage_dir')
-        root_content_regex = re.compile(os.path.join(storage_dir, 'content', '[^/]+/?'))
-        while True:
-            path = os.path.dirname(path)
-            if root_content_regex.match(path):
-                break
-            contents = os.listdir(path)
-            if contents:
-                break
-            if not os.access(path, os.W_OK):
-                break
-            os.rmdir(path)
 
+def _path_size(path):
+    """
+    Return the number of files and total bytes at the given path.
+    """
+    if not os.path.isdir(path) or os.path.islink(path):
+        return 1, os.lstat(path).st_size
+    file_count = 0
+    byte_count = 0
+    for dir_path, dir_names, file_names in os.walk(path):
+        for file_name in file_names:
+            file_count += 1
+            byte_count += os.lstat(os.path.join(dir_path, file_name)).st_size
+    return file_count, byte_count
+
+
+def _delete_path(path, dry_run):
+    """
+    Delete a single orphaned file or directory tree.
+    @return: tuple of the number of files removed, the bytes reclaimed and an
+             error message (None on success)
+    @rtype:  tuple
+    """
+    assert os.path.isabs(path)
+
+    _LOG.debug(_('Deleting orphaned file: %(p)s') % {'p': path})
+
+    if not os.path.lexists(path):
+        _LOG.warn(_('Cannot delete orphaned file: %(p)s, No such file') % {'p': path})
+        return 0, 0, None
+
+    if not os.access(path, os.W_OK):
+        _LOG.warn(_('Cannot delete orphaned file: %(p)s, Insufficient permissions') % {'p': path})
+        return 0, 0, _('Insufficient permissions')
+
+    file_count, byte_count = _path_size(path)
+
+    if dry_run:
+        return file_count, byte_count, None
+
+    if os.path.isfile(path) or os.path.islink(path):
+        os.unlink(path)
+    elif os.path.isdir(path):
+        shutil.rmtree(path)
+
+    return file_count, byte_count, None
@@ -14,15 +14,18 @@
 import logging
 import os
 import sys
+import threading
 from uuid import uuid4
 
 from pulp.plugins.conduits.upload import UploadConduit
 from pulp.plugins.loader import api as plugin_api
 from pulp.plugins.loader import exceptions as plugin_exceptions
 from pulp.plugins.config import PluginCallConfiguration
+from pulp.common.util import calculate_checksum
 from pulp.server import config as pulp_config
+from pulp.server.compat import json
 from pulp.server.db.model.repository import RepoContentUnit
-from pulp.server.exceptions import PulpDataException, MissingResource, PulpExecutionException, PulpException
+from pulp.server.exceptions import InvalidValue, PulpDataException, MissingResource, PulpExecutionException, PulpException
 import pulp.server.managers.factory as manager_factory
 import pulp.server.managers.repo._common as repo_common_utils
 
@@ -30,13 +33,312 @@ import pulp.server.managers.repo._common as repo_common_utils
 
 _LOG = logging.getLogger(__name__)
 
+# Suffix of the file, stored next to each upload, recording the upload's
+# declared size and the byte ranges received so far
+RANGES_FILE_SUFFIX = '.ranges'
+
+# Maximum number of upload files held open between segment writes
+MAX_OPEN_UPLOAD_FILES = 32
+
+# Number of segment writes between saves of an upload's received ranges
+RANGES_SAVE_INTERVAL = 16
+
+# Fields of a content unit that, when present, hold the checksum of its file
+UNIT_CHECKSUM_FIELD = 'checksum'
+UNIT_CHECKSUM_TYPE_FIELD = 'checksumtype'
+
+# -- upload files -------------------------------------------------------------
+
+class UploadFile(object):
+    """
+    Open handle on the file backing an upload request. Segments are written
+    at their offset through a single file descriptor, so they may arrive in
+    any order, and the byte ranges written are recorded so the completeness
+    of the upload can be checked without reading the file.
+
+    The received ranges are kept as a sorted list of non-overlapping
+    [start, end) pairs. They are persisted next to the upload file every
+    RANGES_SAVE_INTERVAL writes and when the file is closed; ranges lost to a
+    crash in between only cause the upload to be reported as incomplete.
+
+    Instances are shared through the UploadFileCache, which tracks how many
+    requests are using each one and only closes it once none are.
+    """
+
+    def __init__(self, file_path, size=None, ranges=None):
+        """
+        @param file_path: full path to the upload file
+        @type  file_path: str
+
+        @param size: declared size of the uploaded file, if known
+        @type  size: int or None
+
+        @param ranges: byte ranges already received
+        @type  ranges: list
+        """
+        self.file_path = file_path
+        self.size = size
+        self.ranges = ranges or []
+        self.fd = os.open(file_path, os.O_WRONLY)
+        self.lock = threading.Lock()
+        # maintained by the UploadFileCache under its own lock
+        self.users = 0
+        self.discarded = False
+        self._unsaved_writes = 0
+
+    @classmethod
+    def create(cls, file_path, size=None):
+        """
+        Creates a new, empty upload file, preallocated to the declared size.
+
+        @return: open upload file
+        @rtype:  UploadFile
+        """
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0644)
+        try:
+            if size:
+                os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+        upload_file = cls(file_path, size)
+        upload_file.save_ranges()
+        return upload_file
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Opens an existing upload file, loading its received ranges if they
+        were recorded.
+
+        @return: open upload file
+        @rtype:  UploadFile
+        """
+        size = None
+        ranges = None
+        ranges_path = file_path + RANGES_FILE_SUFFIX
+        if os.path.exists(ranges_path):
+            f = open(ranges_path)
+            try:
+                record = json.load(f)
+            finally:
+                f.close()
+            size = record['size']
+            ranges = record['ranges']
+        return cls(file_path, size, ranges)
+
+    def write(self, offset, data):
+        """
+        Writes data into the file at the given offset and records the range.
+
+        @param offset: position in the file to write the data at
+        @type  offset: int
+
+        @param data: content to write
+        @type  data: str
+
+        @raise ValueError: if the file has been closed
+        """
+        self.lock.acquire()
+        try:
+            if self.fd is None:
+                raise ValueError('upload file [%s] is closed' % self.file_path)
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            written = 0
+            while written < len(data):
+                written += os.write(self.fd, data[written:])
+            self._add_range(offset, offset + len(data))
+            self._unsaved_writes += 1
+            if self._unsaved_writes >= RANGES_SAVE_INTERVAL:
+                self._save_ranges()
+        finally:
+            self.lock.release()
+
+    def is_complete(self):
+        """
+        Determines whether every byte of the upload has been received. If the
+        size was not declared, the upload is complete when the data received
+        is contiguous from the start of the file.
+
+        @rtype: bool
+        """
+        self.lock.acquire()
+        try:
+            if not self.ranges:
+                return not self.size
+            if len(self.ranges) > 1 or self.ranges[0][0] != 0:
+                return False
+            return self.size is None or self.ranges[0][1] == self.size
+        finally:
+            self.lock.release()
+
+    def save_ranges(self):
+        """
+        Persists the declared size and received ranges next to the upload file.
+        """
+        self.lock.acquire()
+        try:
+            self._save_ranges()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """
+        Persists the received ranges and closes the file. The ranges are not
+        saved if the upload file has already been deleted.
+        """
+        self.lock.acquire()
+        try:
+            if self.fd is None:
+                return
+            os.close(self.fd)
+            self.fd = None
+            if self._unsaved_writes and os.path.exists(self.file_path):
+                self._save_ranges()
+        finally:
+            self.lock.release()
+
+    def _save_ranges(self):
+        """
+        Writes the ranges file; the caller must hold the lock.
+        """
+        ranges_path = self.file_path + RANGES_FILE_SUFFIX
+        tmp_path = ranges_path + '.tmp'
+        f = open(tmp_path, 'w')
+        try:
+            json.dump({'size': self.size, 'ranges': self.ranges}, f)
+        finally:
+            f.close()
+        os.rename(tmp_path, ranges_path)
+        self._unsaved_writes = 0
+
+    def _add_range(self, start, end):
+        """
+        Merges the [start, end) range into the received ranges.
+        """
+        merged = []
+        for range_start, range_end in self.ranges:
+            if range_end < start or range_start > end:
+                merged.append([range_start, range_end])
+                continue
+            start = min(start, range_start)
+            end = max(end, range_end)
+        merged.append([start, end])
+        merged.sort()
+        self.ranges = merged
+
+
+class UploadFileCache(object):
+    """
+    Keeps the most recently used upload files open so that consecutive
+    segments of an upload are written without reopening the file.
+
+    There is at most one UploadFile per path. Callers acquire it before using
+    it and release it afterwards; a file is only closed, whether evicted or
+    discarded, once it has no users left, so a file handed out to one request
+    is never closed underneath it. Files are closed under the cache lock so
+    their ranges are saved before the path can be loaded again.
+    """
+
+    def __init__(self, max_open=MAX_OPEN_UPLOAD_FILES):
+        self.max_open = max_open
+        self._files = {}
+        self._order = []
+        self._lock = threading.Lock()
+
+    def acquire(self, file_path):
+        """
+        Returns the open upload file for the path, opening it if necessary.
+        The file must be handed back with release() once the caller is done
+        with it.
+
+        @rtype: UploadFile
+        """
+        self._lock.acquire()
+        try:
+            upload_file = self._files.get(file_path)
+            if upload_file is None:
+                upload_file = UploadFile.load(file_path)
+                self._files[file_path] = upload_file
+            else:
+                self._order.remove(file_path)
+            self._order.append(file_path)
+            upload_file.users += 1
+            self._evict()
+            return upload_file
+        finally:
+            self._lock.release()
+
+    def release(self, upload_file):
+        """
+        Hands back a file obtained from acquire(), closing it if it was
+        discarded or evicted while in use.
+        """
+        self._lock.acquire()
+        try:
+            upload_file.users -= 1
+            if upload_file.discarded and upload_file.users == 0:
+                upload_file.close()
+            self._evict()
+        finally:
+            self._lock.release()
+
+    def put(self, upload_file):
+        """
+        Adds a newly created upload file to the cache.
+        """
+        self.discard(upload_file.file_path)
+        self._lock.acquire()
+        try:
+            self._files[upload_file.file_path] = upload_file
+            self._order.append(upload_file.file_path)
+            self._evict()
+        finally:
+            self._lock.release()
+
+    def discard(self, file_path):
+        """
+        Removes the upload file for the path from the cache, closing it once
+        it is no longer in use.
+        """
+        self._lock.acquire()
+        try:
+            upload_file = self._files.pop(file_path, None)
+            if upload_file is None:
+                return
+            self._order.remove(file_path)
+            upload_file.discarded = True
+            if not upload_file.users:
+                upload_file.close()
+        finally:
+            self._lock.release()
+
+    def _evict(self):
+        """
+        Closes the least recently used idle files beyond the limit; the caller
+        must hold the lock. Files in use stay cached until released.
+        """
+        excess = len(self._order) - self.max_open
+        for file_path in list(self._order):
+            if excess <= 0:
+                break
+            upload_file = self._files[file_path]
+            if upload_file.users:
+                continue
+            self._order.remove(file_path)
+            del self._files[file_path]
+            upload_file.close()
+            excess -= 1
+
+
+_UPLOAD_FILES = UploadFileCache()
+
 # -- manager ------------------------------------------------------------------
 
 class ContentUploadManager(object):
 
     # -- uploading bits functionality -----------------------------------------
 
-    def initialize_upload(self):
+    def initialize_upload(self, size=None):
         """
         Informs the Pulp server that a new file is about to be uploaded, allowing
         it to do any preparation it needs to do to store or track the upload.
@@ -44,6 +346,13 @@ class ContentUploadManager(object):
         The ID returned from this call is used to track this specific uploaded
         file for the remainder of its life.
 
+        If the size of the file is provided, the upload file is preallocated
+        to that size and the upload is only considered complete once every
+        byte of it has been received.
+
+        @param size: size in bytes of the file to be uploaded, if known
+        @type  size: int or None
+
         @return: unique ID to refer to this upload request in the future
         @rtype:  str
         """
@@ -59,8 +368,7 @@ class ContentUploadManager(object):
         # write to the file path we will find out now and bomb on the initialize
         # before attempting to write bits.
         file_path = self._upload_file_path(upload_id)
-        f = open(file_path, 'w')
-        f.close()
+        _UPLOAD_FILES.put(UploadFile.create(file_path, size))
 
         return upload_id
 
@@ -71,6 +379,9 @@ class ContentUploadManager(object):
         to retrieve the upload_id value and perform any steps necessary before
         bits can be saved.
 
+        Segments may be saved in any order and concurrently; the upload file is
+        kept open between calls and the range written is recorded.
+
         @param upload_id: upload request ID
         @type  upload_id: str
 
@@ -79,18 +390,53 @@ class ContentUploadManager(object):
 
         @param data: content to write to the file
         @type  data: str
+
+        @raise InvalidValue: if the data extends beyond the declared size
         """
 
         file_path = self._upload_file_path(upload_id)
 
         # Make sure the upload was initialized first and hasn't been deleted
         if not os.path.exists(file_path):
+            _UPLOAD_FILES.discard(file_path)
             raise MissingResource(upload_request=upload_id)
 
-        f = open(file_path, 'r+')
-        f.seek(offset)
-        f.write(data)
-        f.close()
+        upload_file = _UPLOAD_FILES.acquire(file_path)
+        try:
+            if offset < 0 or (upload_file.size is not None and offset + len(data) > upload_file.size):
+                raise InvalidValue(['offset'])
+
+            upload_file.write(offset, data)
+        finally:
+            _UPLOAD_FILES.release(upload_file)
+
+    def is_upload_complete(self, upload_id):
+        """
+        Determines whether all of the bits for the given upload request have
+        been received, using the ranges recorded as segments were saved.
+        Uploads that predate the recording of ranges are assumed complete.
+
+        @param upload_id: upload request ID
+        @type  upload_id: str
+
+        @return: true if no part of the upload is missing
+        @rtype:  bool
+
+        @raise MissingResource: if the upload request does not exist
+        """
+
+        file_path = self._upload_file_path(upload_id)
+        if not os.path.exists(file_path):
+            raise MissingResource(upload_request=upload_id)
+
+        if not os.path.exists(file_path + RANGES_FILE_SUFFIX):
+            return True
+
+        upload_file = _UPLOAD_FILES.acquire(file_path)
+        try:
+            return upload_file.is_complete()
+        finally:
+            _UPLOAD_FILES.release(upload_file)
 
     def delete_upload(self, upload_id):
         """
@@ -103,8 +449,10 @@ class ContentUploadManager(object):
         """
 
         file_path = self._upload_file_path(upload_id)
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        _UPLOAD_FILES.discard(file_path)
+        for path in (file_path, file_path + RANGES_FILE_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
 
     def read_upload(self, upload_id):
         """
@@ -138,7 +486,7 @@ class ContentUploadManager(object):
         @rtype:  list
         """
         upload_dir = self._upload_storage_dir()
-        upload_ids = os.listdir(upload_dir)
+        upload_ids = [f for f in os.listdir(upload_dir) if RANGES_FILE_SUFFIX not in f]
         return upload_ids
 
     # -- import functionality -------------------------------------------------
@@ -181,7 +529,8 @@ class ContentUploadManager(object):
 
         This call will first call is_valid_upload to check the integrity of the
         destination repository. See that method's documentation for exception
-        possibilities.
+        possibilities. The upload itself must be complete; see
+        is_upload_complete.
 
         @param repo_id: identifies the repository into which the unit is uploaded
         @type  repo_id: str
@@ -197,11 +546,16 @@ class ContentUploadManager(object):
 
         @param upload_id: upload being imported
         @type  upload_id: str
+
+        @raise PulpDataException: if not all of the upload's bits were received
         """
 
         # If it doesn't raise an exception, it's good to go
         self.is_valid_upload(repo_id, unit_type_id)
 
+        if not self.is_upload_complete(upload_id):
+            raise PulpDataException('Upload [%s] has not been completely received' % upload_id)
+
         repo_query_manager = manager_factory.repo_query_manager()
         importer_manager = manager_factory.repo_importer_manager()
 
@@ -221,6 +575,7 @@ class ContentUploadManager(object):
         transfer_repo.working_dir = repo_common_utils.importer_working_dir(repo_importer['importer_type_id'], repo_id, mkdir=True)
 
         file_path = self._upload_file_path(upload_id)
+        _UPLOAD_FILES.discard(file_path)
 
         # Invoke the importer
         try:
@@ -234,8 +589,121 @@ class ContentUploadManager(object):
 
         # TODO: Add support for tracking the report as a history entry on the repo
 
+    def find_existing_unit(self, unit_type_id, unit_key, checksum_type, checksum):
+        """
+        Pre-flight for an upload: looks for a unit with the given unit key
+        whose file has the given checksum. If there is one, there is no need
+        to upload the file's bits; import_existing_unit associates the unit
+        with the repository instead. This is a read-only lookup.
+
+        The unit's checksum is taken from its checksum and checksumtype fields
+        when the unit has them and they are of the requested type; otherwise
+        the unit's stored file is checksummed on the server.
+
+        @param unit_type_id: type of unit being uploaded
+        @type  unit_type_id: str
+
+        @param unit_key: unique identifier for the unit (user-specified)
+        @type  unit_key: dict
+
+        @param checksum_type: hash algorithm used to calculate the checksum
+        @type  checksum_type: str
+
+        @param checksum: hex digest of the file that would be uploaded
+        @type  checksum: str
+
+        @return: the matching unit or None if the file must be uploaded
+        @rtype:  dict or None
+
+        @raise InvalidValue: if the checksum type is not supported
+        """
+        content_query_manager = manager_factory.content_query_manager()
+        try:
+            unit = content_query_manager.get_content_unit_by_keys_dict(unit_type_id, unit_key)
+        except (MissingResource, ValueError):
+            return None
+
+        if not self._unit_matches_checksum(unit, checksum_type, checksum):
+            return None
+
+        return unit
+
+    def import_existing_unit(self, repo_id, unit_type_id, unit_key, checksum_type, checksum):
+        """
+        Imports a unit found by find_existing_unit, in place of an upload of
+        its file, by associating the existing unit with the repository. The
+        unit is looked up again as it may have been removed since.
+
+        This call will first call is_valid_upload to check the integrity of the
+        destination repository. See that method's documentation for exception
+        possibilities.
+
+        @param repo_id: identifies the repository into which the unit is uploaded
+        @type  repo_id: str
+
+        @param unit_type_id: type of unit being uploaded
+        @type  unit_type_id: str
+
+        @param unit_key: unique identifier for the unit (user-specified)
+        @type  unit_key: dict
+
+        @param checksum_type: hash algorithm used to calculate the checksum
+        @type  checksum_type: str
+
+        @param checksum: hex digest of the file that would be uploaded
+        @type  checksum: str
+
+        @raise InvalidValue: if the checksum type is not supported
+        @raise MissingResource: if there is no such unit with a matching file
+        """
+
+        # If it doesn't raise an exception, it's good to go
+        self.is_valid_upload(repo_id, unit_type_id)
+
+        unit = self.find_existing_unit(unit_type_id, unit_key, checksum_type, checksum)
+        if unit is None:
+            raise MissingResource(unit_key=unit_key)
+
+        association_manager = manager_factory.repo_unit_association_manager()
+        association_manager.associate_unit_by_id(repo_id, unit_type_id, unit['_id'],
+            RepoContentUnit.OWNER_TYPE_USER, manager_factory.principal_manager().get_principal()['login'])
+
     # -- utilities ------------------------------------------------------------
 
+    def _unit_matches_checksum(self, unit, checksum_type, checksum):
+        """
+        Determines whether the file of an existing unit has the given checksum.
+
+        @param unit: content unit from the database
+        @type  unit: dict
+
+        @param checksum_type: hash algorithm used to calculate the checksum
+        @type  checksum_type: str
+
+        @param checksum: hex digest to compare against
+        @type  checksum: str
+
+        @rtype: bool
+
+        @raise InvalidValue: if the checksum type is not supported
+        """
+        checksum_type = checksum_type.lower()
+        checksum = checksum.lower()
+
+        unit_checksum = unit.get(UNIT_CHECKSUM_FIELD)
+        unit_checksum_type = unit.get(UNIT_CHECKSUM_TYPE_FIELD)
+        if unit_checksum and unit_checksum_type and unit_checksum_type.lower() == checksum_type:
+            return unit_checksum.lower() == checksum
+
+        storage_path = unit.get('_storage_path')
+        if not storage_path or not os.path.isfile(storage_path):
+            return False
+
+        try:
+            return calculate_checksum(storage_path, checksum_type) == checksum
+        except ValueError:
+            raise InvalidValue(['checksum_type']), None, sys.exc_info()[2]
+
     def _upload_file_path(self, upload_id):
         """
         Returns the full path to the file backing the given upload.
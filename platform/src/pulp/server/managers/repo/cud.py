@@ -336,7 +336,9 @@ class RepoManager(object):
     @staticmethod
     def update_unit_count(repo_id, delta):
         """
-        Updates the total count of units associated with the repo.
+        Updates the total count of units associated with the repo. As the
+        repo's content has changed, its content version is incremented and
+        the stored applicability of consumers bound to it is invalidated.
 
         @param repo_id: identifies the repo
         @type  repo_id: str
@@ -345,7 +347,7 @@ class RepoManager(object):
         @type  delta: int
         """
         spec = {'id' : repo_id}
-        operation = {'$inc' : {'content_unit_count': delta}}
+        operation = {'$inc' : {'content_unit_count': delta, 'content_version': 1}}
         repo_coll = Repo.get_collection()
 
         if delta:
@@ -354,6 +356,29 @@ class RepoManager(object):
             except pymongo.errors.OperationFailure:
                 message = 'There was a problem updating repository %s' % repo_id
                 raise PulpExecutionException(message), None, sys.exc_info()[2]
+            manager = manager_factory.consumer_applicability_manager()
+            manager.repo_content_changed(repo_id)
+
+    @staticmethod
+    def units_updated(repo_ids):
+        """
+        Notification that the metadata of units associated with the repos
+        has been updated in place. As the content of the repos has changed,
+        their content versions are incremented and the stored applicability
+        of consumers bound to them is invalidated.
+
+        @param repo_ids: identifies the repos
+        @type  repo_ids: list
+        """
+        if not repo_ids:
+            return
+        spec = {'id' : {'$in' : list(repo_ids)}}
+        operation = {'$inc' : {'content_version': 1}}
+        repo_coll = Repo.get_collection()
+        repo_coll.update(spec, operation, multi=True, safe=True)
+        manager = manager_factory.consumer_applicability_manager()
+        for repo_id in repo_ids:
+            manager.repo_content_changed(repo_id)
 
     def update_repo_and_plugins(self, repo_id, repo_delta, importer_config,
                                 distributor_configs):
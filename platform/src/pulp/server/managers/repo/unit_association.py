@@ -18,6 +18,7 @@ repositories and content units.
 
 import logging
 import pymongo
+from pymongo.errors import DuplicateKeyError
 import sys
 
 import pulp.plugins.conduits._common as conduit_common_utils
@@ -56,6 +57,10 @@ SORT_DESCENDING = pymongo.DESCENDING
 
 _VALID_DIRECTIONS = (SORT_ASCENDING, SORT_DESCENDING)
 
+# Maximum number of unit IDs sent to the database in a single $in query or
+# multi-document insert when associating units in bulk
+ASSOCIATION_BATCH_SIZE = 1000
+
 # -- manager ------------------------------------------------------------------
 
 class RepoUnitAssociationManager(object):
@@ -159,15 +164,43 @@ class RepoUnitAssociationManager(object):
         @raise InvalidType: if the given owner type is not of the valid enumeration
         """
 
-        # There may be a way to batch this in mongo which would be ideal for a
-        # bulk operation like this. But for deadline purposes, this call will
-        # simply loop and call the single method.
+        if owner_type not in _OWNER_TYPES:
+            raise exceptions.InvalidValue(['owner_type'])
 
-        unique_count = 0
+        # Remove duplicates while preserving the order the caller gave
+        unique_unit_ids = []
+        seen = set()
         for unit_id in unit_id_list:
-            if not self.association_exists(repo_id, unit_id, unit_type_id):
-                unique_count += 1
-            self.associate_unit_by_id(repo_id, unit_type_id, unit_id, owner_type, owner_id, False)
+            if unit_id not in seen:
+                seen.add(unit_id)
+                unique_unit_ids.append(unit_id)
+
+        collection = RepoContentUnit.get_collection()
+        unique_count = 0
+
+        for i in range(0, len(unique_unit_ids), ASSOCIATION_BATCH_SIZE):
+            batch_ids = unique_unit_ids[i:i + ASSOCIATION_BATCH_SIZE]
+
+            # A single query tells us both which units are already associated
+            # to the repo at all (for the unit count) and which already have
+            # an association with this owner (which need not be created)
+            spec = {'repo_id' : repo_id,
+                    'unit_type_id' : unit_type_id,
+                    'unit_id' : {'$in' : batch_ids},}
+            fields = ['unit_id', 'owner_type', 'owner_id']
+
+            associated_ids = set()
+            owned_ids = set()
+            for association in collection.find(spec, fields=fields):
+                associated_ids.add(association['unit_id'])
+                if association['owner_type'] == owner_type and association['owner_id'] == owner_id:
+                    owned_ids.add(association['unit_id'])
+
+            new_associations = [RepoContentUnit(repo_id, unit_id, unit_type_id, owner_type, owner_id)
+                                for unit_id in batch_ids if unit_id not in owned_ids]
+            _insert_associations(collection, new_associations)
+
+            unique_count += len([u for u in batch_ids if u not in associated_ids])
 
         # update the count of associated units on the repo object
         if unique_count:
@@ -451,6 +484,24 @@ def create_transfer_units(associate_units, associated_unit_type_ids):
 
     return transfer_units
 
+def _insert_associations(collection, associations):
+    """
+    Inserts the given associations in a single multi-document insert. If an
+    association was created concurrently, the insert is retried one document
+    at a time, skipping those that already exist.
+    """
+    if not associations:
+        return
+
+    try:
+        collection.insert(associations, safe=True)
+    except DuplicateKeyError:
+        for association in associations:
+            try:
+                collection.insert(association, safe=True)
+            except DuplicateKeyError:
+                pass
+
 def remove_from_importer(repo_id, removed_units):
 
     # Retrieve the repo from the database and convert to the transfer repo
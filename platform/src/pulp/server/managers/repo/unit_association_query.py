@@ -20,8 +20,10 @@ import logging
 import pymongo
 
 import pulp.plugins.types.database as types_db
+from pulp.server import config as pulp_config
 from pulp.server.db.model.criteria import UnitAssociationCriteria
 from pulp.server.db.model.repository import RepoContentUnit
+from pulp.server.exceptions import InvalidValue
 
 # -- constants ----------------------------------------------------------------
 
@@ -194,10 +196,7 @@ class RepoUnitAssociationQueryManager(object):
         # We simply need to look up the unit metadata itself and merge it into the
         # combined association and unit metadata dictionary.
 
-        for u in units:
-            type_collection = types_db.type_units_collection(u['unit_type_id'])
-            metadata = type_collection.find_one({'_id' : u['unit_id']})
-            u['metadata'] = metadata
+        self._merge_unit_metadata(units)
 
         return units
 
@@ -285,11 +284,8 @@ class RepoUnitAssociationQueryManager(object):
             # The units are already sorted, so we have to maintain the order in
             # the units list.
 
-            for u in unit_associations:
-                spec = copy.copy(unit_spec)
-                spec['_id'] = u['unit_id']
-                metadata = type_collection.find_one(spec, fields=criteria.unit_fields)
-                u['metadata'] = metadata
+            self._merge_unit_metadata(unit_associations, unit_spec=unit_spec,
+                                      unit_fields=criteria.unit_fields)
 
             return unit_associations
 
@@ -339,6 +335,197 @@ class RepoUnitAssociationQueryManager(object):
 
             return merged_units
 
+    def get_units_iter(self, repo_id, criteria=None, batch_size=None):
+        """
+        Generator variation of get_units. The associations are read through a
+        cursor and their unit metadata is merged in batches of batch_size, so
+        the number of units held in memory at any point is bounded by the
+        batch size rather than the size of the repository.
+
+        Units are yielded in association order. If an association sort is not
+        specified, units are sorted by unit_type_id and created, as in
+        get_units_across_types. Sorting on unit metadata is not supported.
+
+        As with get_units_by_type, unit filters and unit fields are only
+        applied when the criteria specifies a single type ID. Associations
+        whose unit does not match the unit filters are not yielded and do not
+        count against the criteria's limit and skip.
+
+        @param repo_id: identifies the repository
+        @type  repo_id: str
+
+        @param criteria: if specified will drive the query
+        @type  criteria: L{UnitAssociationCriteria}
+
+        @param batch_size: number of associations to merge unit metadata for
+                           at a time; defaults to the database query_batch_size
+                           server setting
+        @type  batch_size: int or None
+
+        @return: generator of association documents with their unit metadata
+                 stored under the "metadata" key
+        @rtype:  generator of dict
+
+        @raise InvalidValue: if the criteria contains a unit sort; as with any
+               generator, this is raised when iteration begins
+        """
+
+        # For simplicity, create a criteria if one is not provided and use its defaults
+        if criteria is None:
+            criteria = UnitAssociationCriteria()
+
+        if criteria.unit_sort is not None:
+            raise InvalidValue(['unit_sort'])
+
+        if batch_size is None:
+            batch_size = pulp_config.config.getint('database', 'query_batch_size')
+        batch_size = max(1, batch_size)
+
+        # -- association collection lookup ------------------------------------
+
+        spec = {'repo_id' : repo_id}
+
+        if criteria.type_ids is not None:
+            spec['unit_type_id'] = {'$in' : criteria.type_ids}
+
+        association_filters = criteria.association_filters
+        association_filters.pop('repo_id', None)
+        association_filters.pop('unit_type_id', None)
+        spec.update(association_filters)
+
+        # Unit level filtering only makes sense for a single type
+        unit_spec = None
+        unit_fields = None
+        if criteria.type_ids is not None and len(criteria.type_ids) == 1:
+            unit_spec = criteria.unit_filters or None
+            unit_fields = criteria.unit_fields
+
+        cursor = RepoContentUnit.get_collection().find(spec, fields=criteria.association_fields)
+        cursor.batch_size(batch_size)
+
+        # When removing duplicates without an explicit sort, sorting on the unit
+        # ID puts all associations for a unit next to each other (earliest
+        # first), so duplicates can be dropped without remembering every unit
+        # seen so far.
+        adjacent_duplicates = False
+        if criteria.association_sort is not None:
+            cursor.sort(criteria.association_sort)
+        elif criteria.remove_duplicates:
+            adjacent_duplicates = True
+            cursor.sort([('unit_type_id', SORT_ASCENDING), ('unit_id', SORT_ASCENDING), ('created', SORT_ASCENDING)])
+        else:
+            cursor.sort([('unit_type_id', SORT_ASCENDING), ('created', SORT_ASCENDING)])
+
+        # The limit and skip can only be left to the database if every
+        # association read from the cursor will be yielded
+        filter_in_memory = unit_spec is not None or criteria.remove_duplicates
+        if not filter_in_memory:
+            if criteria.limit is not None:
+                cursor.limit(criteria.limit)
+            if criteria.skip is not None:
+                cursor.skip(criteria.skip)
+
+        to_skip = 0
+        remaining = None
+        if filter_in_memory:
+            to_skip = criteria.skip or 0
+            remaining = criteria.limit
+
+        def _batches():
+            seen_units = set()
+            last_unit = None
+            batch = []
+
+            for association in cursor:
+                if criteria.remove_duplicates:
+                    unit = (association['unit_type_id'], association['unit_id'])
+                    if adjacent_duplicates:
+                        if unit == last_unit:
+                            continue
+                        last_unit = unit
+                    else:
+                        if unit in seen_units:
+                            continue
+                        seen_units.add(unit)
+
+                batch.append(association)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+
+            if batch:
+                yield batch
+
+        # -- unit lookups -----------------------------------------------------
+
+        for batch in _batches():
+            self._merge_unit_metadata(batch, unit_spec=unit_spec, unit_fields=unit_fields)
+
+            for u in batch:
+                # Units that don't match the unit filters come back without metadata
+                if unit_spec is not None and u['metadata'] is None:
+                    continue
+
+                if to_skip:
+                    to_skip -= 1
+                    continue
+
+                yield u
+
+                if remaining is not None:
+                    remaining -= 1
+                    if remaining <= 0:
+                        return
+
+    def _merge_unit_metadata(self, unit_associations, unit_spec=None,
+                             unit_fields=None, batch_size=None):
+        """
+        Looks up the unit metadata for each of the given associations and
+        stores it under the association's "metadata" key. The unit IDs are
+        grouped by type and retrieved with chunked $in queries, so the number
+        of database round trips depends on the number of chunks rather than
+        the number of units. The order of the associations is not affected.
+
+        If a unit cannot be found (or does not match the unit spec), its
+        metadata will be set to None.
+
+        @param unit_associations: association documents to populate
+        @type  unit_associations: list of dict
+
+        @param unit_spec: optional additional filters applied to the units
+        @type  unit_spec: dict or None
+
+        @param unit_fields: optional list of unit fields to retrieve
+        @type  unit_fields: list or None
+
+        @param batch_size: maximum number of unit IDs per query; defaults to
+                           the database query_batch_size server setting
+        @type  batch_size: int or None
+        """
+        if batch_size is None:
+            batch_size = pulp_config.config.getint('database', 'query_batch_size')
+        batch_size = max(1, batch_size)
+
+        unit_ids_by_type = {}
+        for u in unit_associations:
+            unit_ids = unit_ids_by_type.setdefault(u['unit_type_id'], [])
+            unit_ids.append(u['unit_id'])
+
+        metadata_by_type = {}
+        for type_id, unit_ids in unit_ids_by_type.items():
+            type_collection = types_db.type_units_collection(type_id)
+            unit_ids = list(set(unit_ids))
+            metadata_by_id = metadata_by_type.setdefault(type_id, {})
+
+            for i in range(0, len(unit_ids), batch_size):
+                spec = copy.copy(unit_spec or {})
+                spec['_id'] = {'$in' : unit_ids[i:i + batch_size]}
+                for metadata in type_collection.find(spec, fields=unit_fields):
+                    metadata_by_id[metadata['_id']] = metadata
+
+        for u in unit_associations:
+            u['metadata'] = metadata_by_type[u['unit_type_id']].get(u['unit_id'])
+
     def _remove_duplicate_associations(self, units):
         """
         For units that are associated with a repository more than once, this
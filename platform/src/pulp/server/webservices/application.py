@@ -47,6 +47,7 @@ from pulp.server.db import reaper
 from pulp.server.debugging import StacktraceDumper
 from pulp.server.dispatch import factory as dispatch_factory
 from pulp.server.managers import factory as manager_factory
+from pulp.server.managers.consumer import applicability
 from pulp.server.db.migrate import models as migration_models
 from pulp.server.webservices.controllers import (
     agent, consumer_groups, consumers, contents, dispatch, events, permissions,
@@ -138,6 +139,9 @@ def _initialize_pulp():
     # database document reaper
     reaper.initialize()
 
+    # stale content applicability refresher
+    applicability.initialize()
+
     # agent services
     AgentServices.start()
 
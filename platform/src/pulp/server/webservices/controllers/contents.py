@@ -20,7 +20,7 @@ from pulp.server.auth.authorization import CREATE, READ, UPDATE, DELETE, EXECUTE
 from pulp.server.db.model.criteria import Criteria
 from pulp.server.dispatch import constants as dispatch_constants
 from pulp.server.dispatch.call import CallRequest
-from pulp.server.exceptions import MissingResource, InvalidValue
+from pulp.server.exceptions import MissingResource, MissingValue, InvalidValue
 from pulp.server.managers import factory
 from pulp.server.webservices import execution, serialization
 from pulp.server.webservices.controllers.base import JSONController
@@ -222,8 +222,19 @@ class UploadsCollection(JSONController):
 
     @auth_required(CREATE)
     def POST(self):
+        # The size of the file is optional; when given the upload is
+        # preallocated and checked for completeness against it
+        size = self.params().get('size', None)
+        if size is not None:
+            try:
+                size = int(size)
+            except (TypeError, ValueError):
+                raise InvalidValue(['size'])
+            if size < 0:
+                raise InvalidValue(['size'])
+
         upload_manager = factory.content_upload_manager()
-        upload_id = upload_manager.initialize_upload()
+        upload_id = upload_manager.initialize_upload(size)
         location = serialization.link.child_link_obj(upload_id)
         return self.created(location['_href'], {'_href' : location['_href'], 'upload_id' : upload_id})
 
@@ -263,6 +274,30 @@ class UploadSegmentResource(JSONController):
 
         return self.ok(None)
 
+
+class FindExistingUnitAction(JSONController):
+
+    # Scope: Action
+    # POST:  Determine whether a file to upload is already on the server
+
+    @auth_required(READ)
+    def POST(self):
+        params = self.params()
+        unit_type_id = params.get('unit_type_id', None)
+        unit_key = params.get('unit_key', None)
+        checksum_type = params.get('checksum_type', None)
+        checksum = params.get('checksum', None)
+
+        missing = [name for name, value in (('unit_type_id', unit_type_id), ('unit_key', unit_key),
+                                            ('checksum_type', checksum_type), ('checksum', checksum))
+                   if value is None]
+        if missing:
+            raise MissingValue(missing)
+
+        upload_manager = factory.content_upload_manager()
+        unit = upload_manager.find_existing_unit(unit_type_id, unit_key, checksum_type, checksum)
+        return self.ok(unit is not None)
+
 # content orphans controller classes -------------------------------------------
 
 class OrphanCollection(JSONController):
@@ -343,6 +378,7 @@ _URLS = ('/types/$', ContentTypesCollection,
          '/orphans/$', OrphanCollection,
          '/orphans/([^/]+)/$', OrphanTypeSubCollection,
          '/orphans/([^/]+)/([^/]+)/$', OrphanResource,
-         '/actions/delete_orphans/$', DeleteOrphansAction,)
+         '/actions/delete_orphans/$', DeleteOrphansAction,
+         '/actions/find_existing_unit/$', FindExistingUnitAction,)
 
 application = web.application(_URLS, globals())
@@ -13,15 +13,17 @@
 
 import httplib
 import logging
+import threading
 from gettext import gettext as _
 
 import web
 
+from pulp.server import config as pulp_config
 from pulp.server.auth import authorization
 from pulp.server.db.model.dispatch import QueuedCall
 from pulp.server.dispatch import factory as dispatch_factory
 from pulp.server.dispatch import history as dispatch_history
-from pulp.server.exceptions import MissingResource, PulpExecutionException
+from pulp.server.exceptions import InvalidValue, MissingResource, PulpExecutionException
 from pulp.server.webservices import serialization
 from pulp.server.webservices.controllers.base import JSONController
 from pulp.server.webservices.controllers.decorators import auth_required
@@ -30,6 +32,10 @@ from pulp.server.webservices.controllers.decorators import auth_required
 
 _LOG = logging.getLogger(__name__)
 
+# bounds the number of requests waiting for tasks to change, see _wait_for_change
+_LONG_POLL_SEMAPHORE = None
+_LONG_POLL_LOCK = threading.Lock()
+
 # exceptions -------------------------------------------------------------------
 
 class TaskNotFound(MissingResource):
@@ -65,6 +71,64 @@ class TaskGroupCancelNotImplemented(PulpExecutionException):
     def __str__(self):
         return _('Cancel Not Implemented for TaskGroup: %(id)s') % {'id': self.args[0]}
 
+# long polling -----------------------------------------------------------------
+
+def _wait_for_change(controller, **criteria):
+    """
+    Honor the optional query parameters of a task status request that ask to
+    wait for the tasks to change before responding:
+     * wait: maximum number of seconds to wait, limited by the [tasks]
+       long_poll_timeout option
+     * state: state the client last saw the tasks in; the response is not
+       delayed if they are no longer in it
+    Each waiting request holds a web server thread, so no more than the [tasks]
+    long_poll_max_waiters option's requests wait at once; any others are
+    answered immediately, as if they had not asked to wait.
+    @param controller: controller handling the request
+    @type  controller: L{JSONController}
+    @param criteria: coordinator search criteria selecting the tasks
+    """
+    filters = controller.filters(['wait', 'state'])
+    if 'wait' not in filters:
+        return
+    try:
+        wait = float(filters['wait'][0])
+    except ValueError:
+        raise InvalidValue(['wait'])
+    if wait < 0:
+        raise InvalidValue(['wait'])
+    wait = min(wait, pulp_config.config.getfloat('tasks', 'long_poll_timeout'))
+    if wait <= 0:
+        return
+    known_state = filters.get('state', [None])[0]
+    semaphore = _long_poll_semaphore()
+    if semaphore is None or not semaphore.acquire(False):
+        return
+    try:
+        coordinator = dispatch_factory.coordinator()
+        coordinator.wait_for_call_reports(wait, known_state, **criteria)
+    finally:
+        semaphore.release()
+
+
+def _long_poll_semaphore():
+    """
+    Get the semaphore bounding the number of waiting requests.
+    @return: semaphore or None if no requests may wait
+    @rtype:  threading.BoundedSemaphore or None
+    """
+    global _LONG_POLL_SEMAPHORE
+    _LONG_POLL_LOCK.acquire()
+    try:
+        if _LONG_POLL_SEMAPHORE is None:
+            max_waiters = pulp_config.config.getint('tasks', 'long_poll_max_waiters')
+            if max_waiters <= 0:
+                return None
+            _LONG_POLL_SEMAPHORE = threading.BoundedSemaphore(max_waiters)
+        return _LONG_POLL_SEMAPHORE
+    finally:
+        _LONG_POLL_LOCK.release()
+
 # task controllers -------------------------------------------------------------
 
 class TaskCollection(JSONController):
@@ -89,6 +153,7 @@ class TaskResource(JSONController):
 
     @auth_required(authorization.READ)
     def GET(self, call_request_id):
+        _wait_for_change(self, call_request_id=call_request_id)
         link = serialization.link.link_obj('/pulp/api/v2/tasks/%s/' % call_request_id)
         coordinator = dispatch_factory.coordinator()
         call_reports = coordinator.find_call_reports(call_request_id=call_request_id)
@@ -181,6 +246,7 @@ class TaskGroupResource(JSONController):
 
     @auth_required(authorization.READ)
     def GET(self, call_request_group_id):
+        _wait_for_change(self, call_request_group_id=call_request_group_id)
         link = serialization.link.link_obj('/pulp/api/v2/task_groups/%s/' % call_request_group_id)
         coordinator = dispatch_factory.coordinator()
         call_reports = coordinator.find_call_reports(call_request_group_id=call_request_group_id)
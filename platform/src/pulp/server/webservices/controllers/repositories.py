@@ -958,6 +958,41 @@ class RepoImportUpload(JSONController):
         execution.execute(call_request)
         return self.ok(None)
 
+class RepoImportExistingUnit(JSONController):
+
+    # Scope: Actions
+    # POST:  Import an existing unit found by the upload pre-flight
+
+    @auth_required(UPDATE)
+    def POST(self, repo_id):
+
+        # Collect user input
+        params = self.params()
+        unit_type_id = params.get('unit_type_id', None)
+        unit_key = params.get('unit_key', None)
+        checksum_type = params.get('checksum_type', None)
+        checksum = params.get('checksum', None)
+
+        missing = [name for name, value in (('unit_type_id', unit_type_id), ('unit_key', unit_key),
+                                            ('checksum_type', checksum_type), ('checksum', checksum))
+                   if value is None]
+        if missing:
+            raise exceptions.MissingValue(missing)
+
+        # Coordinator configuration
+        resources = {dispatch_constants.RESOURCE_REPOSITORY_TYPE:
+                        {repo_id: dispatch_constants.RESOURCE_UPDATE_OPERATION}}
+        tags = [resource_tag(dispatch_constants.RESOURCE_REPOSITORY_TYPE, repo_id),
+                action_tag('import_existing_unit')]
+
+        upload_manager = manager_factory.content_upload_manager()
+        call_request = CallRequest(upload_manager.import_existing_unit,
+            [repo_id, unit_type_id, unit_key, checksum_type, checksum],
+            resources=resources, tags=tags, archive=True)
+
+        execution.execute(call_request)
+        return self.ok(None)
+
 class RepoResolveDependencies(JSONController):
 
     # Scope: Actions
@@ -1054,6 +1089,7 @@ urls = (
     '/([^/]+)/actions/associate/$', 'RepoAssociate', # resource action
     '/([^/]+)/actions/unassociate/$', 'RepoUnassociate', # resource action
     '/([^/]+)/actions/import_upload/$', 'RepoImportUpload', # resource action
+    '/([^/]+)/actions/import_existing_unit/$', 'RepoImportExistingUnit', # resource action
     '/([^/]+)/actions/resolve_dependencies/$', 'RepoResolveDependencies', # resource action
 
     '/([^/]+)/search/units/$', 'RepoUnitAdvancedSearch', # resource search
@@ -21,6 +21,7 @@ import web
 from pulp.common.tags import action_tag, resource_tag
 from pulp.server import config as pulp_config
 import pulp.server.managers.factory as managers
+from pulp.server.auth import authorization_index
 from pulp.server.auth.authorization import READ, CREATE, UPDATE, DELETE
 from pulp.server.webservices import execution
 from pulp.server.db.model.auth import Permission
@@ -147,6 +148,7 @@ class UserResource(JSONController):
         user_link = serialization.link.current_link_obj()['_href']
         if Permission.get_collection().find_one({'resource' : user_link}):
             Permission.get_collection().remove({'resource' : user_link}, safe=True)
+            authorization_index.permission_deleted(user_link)
 
         return self.ok(result)
 
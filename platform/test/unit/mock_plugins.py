@@ -223,6 +223,9 @@ def install():
             mock.Mock(side_effect=lambda i,u,o,c,x: sorted(u))
         profiler.unit_applicable = \
             mock.Mock(side_effect=lambda i,u,c,x: ApplicabilityReport(u, False, 'mocked'))
+        # Delegates to unit_applicable, as Profiler does, so tests can mock either
+        profiler.units_applicable = \
+            mock.Mock(side_effect=lambda i,u,c,x,p=profiler: [p.unit_applicable(i,v,c,x) for v in u])
 
 def reset():
     """
@@ -25,6 +25,7 @@ sys.path.insert(0, srcdir)
 
 from pulp.common.compat import json
 from pulp.server import config
+from pulp.server.auth import authorization_index, cache as auth_cache
 from pulp.server.db import connection
 from pulp.server.db.model.auth import User
 from pulp.server.dispatch import constants as dispatch_constants
@@ -78,6 +79,9 @@ class PulpServerTests(unittest.TestCase):
         self._mocks = {}
         self.config = PulpServerTests.CONFIG # shadow for simplicity
         self.clean()
+        # the in-memory auth state does not see collections cleaned directly
+        auth_cache.reset()
+        authorization_index.reset()
 
     def tearDown(self):
         super(PulpServerTests, self).tearDown()
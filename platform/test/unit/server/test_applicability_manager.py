@@ -11,16 +11,20 @@
 # have received a copy of GPLv2 along with this software; if not, see
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
+import time
+
 import base
 import mock_plugins
 
 from mock import Mock
 from pulp.plugins.loader import api as plugins
 from pulp.server.db.model.criteria import Criteria
-from pulp.server.db.model.consumer import Consumer, UnitProfile
+from pulp.server.db.model.consumer import Consumer, ConsumerApplicability, UnitProfile
 from pulp.plugins.conduits.profiler import ProfilerConduit
 from pulp.plugins.model import ApplicabilityReport
+from pulp.plugins.profiler import Profiler
 from pulp.server.managers import factory as factory
+from pulp.server.managers.consumer import applicability
 from pulp.server.exceptions import PulpExecutionException
 
 # -- test cases ---------------------------------------------------------------
@@ -37,6 +41,7 @@ class ApplicabilityManagerTests(base.PulpServerTests):
         base.PulpServerTests.setUp(self)
         Consumer.get_collection().remove()
         UnitProfile.get_collection().remove()
+        ConsumerApplicability.get_collection().remove()
         plugins._create_manager()
         mock_plugins.install()
         profiler = plugins.get_profiler_by_type('rpm')[0]
@@ -48,6 +53,7 @@ class ApplicabilityManagerTests(base.PulpServerTests):
         base.PulpServerTests.tearDown(self)
         Consumer.get_collection().remove()
         UnitProfile.get_collection().remove()
+        ConsumerApplicability.get_collection().remove()
         mock_plugins.reset()
 
     def populate(self):
@@ -129,3 +135,254 @@ class ApplicabilityManagerTests(base.PulpServerTests):
             manager.units_applicable,
             self.CRITERIA,
             units)
+
+    def test_report_order(self):
+        # Setup
+        self.populate()
+        # Test
+        units = [
+            {'type_id':'mock-type', 'unit_key':{'name':'abc'}},
+            {'type_id':'rpm', 'unit_key':{'name':'zsh'}},
+            {'type_id':'mock-type', 'unit_key':{'name':'def'}},
+            {'type_id':'rpm', 'unit_key':{'name':'ksh'}},
+        ]
+        manager = factory.consumer_applicability_manager()
+        applicability = manager.units_applicable(self.CRITERIA, units)
+        # Verify
+        for id in self.CONSUMER_IDS:
+            self.assertEquals([r.unit for r in applicability[id]], units)
+
+    def test_profiles_fetched_once(self):
+        # Setup
+        self.populate()
+        manager = factory.consumer_profile_manager()
+        self.mock(manager.__class__, 'get_profiles')
+        # Test
+        units = [
+            {'type_id':'rpm', 'unit_key':{'name':'zsh'}},
+            {'type_id':'rpm', 'unit_key':{'name':'ksh'}},
+        ]
+        manager = factory.consumer_applicability_manager()
+        applicability = manager.units_applicable(self.CRITERIA, units)
+        # Verify
+        self.assertEquals(len(applicability), 2)
+        self.assertEquals(factory.consumer_profile_manager().get_profiles.call_count, 0)
+        profiler, cfg = plugins.get_profiler_by_type('rpm')
+        for call in profiler.unit_applicable.call_args_list:
+            self.assertEquals(call[0][0].profiles, {'rpm':self.PROFILE})
+
+    def test_bulk_profiler(self):
+        # Setup
+        self.populate()
+        class BulkProfiler(Profiler):
+            def units_applicable(self, consumer, units, config, conduit):
+                return [ApplicabilityReport(u, True, 'bulk') for u in units]
+        profiler = BulkProfiler()
+        profiler.unit_applicable = Mock()
+        self.mock(plugins, 'get_profiler_by_type', Mock(return_value=(profiler, {})))
+        # Test
+        units = [
+            {'type_id':'rpm', 'unit_key':{'name':'zsh'}},
+            {'type_id':'rpm', 'unit_key':{'name':'ksh'}},
+        ]
+        manager = factory.consumer_applicability_manager()
+        applicability = manager.units_applicable(self.CRITERIA, units)
+        # Verify
+        for id in self.CONSUMER_IDS:
+            self.assertEquals([r.unit for r in applicability[id]], units)
+            self.assertEquals([r.summary for r in applicability[id]], ['bulk', 'bulk'])
+        self.assertEquals(profiler.unit_applicable.call_count, 0)
+        self.assertEquals(plugins.get_profiler_by_type.call_count, 1)
+
+    def test_concurrent_batches(self):
+        # Setup
+        self.mock(applicability, 'CONSUMER_BATCH_SIZE', 1)
+        self.populate()
+        # Test
+        units = [
+            {'type_id':'rpm', 'unit_key':{'name':'zsh'}},
+            {'type_id':'mock-type', 'unit_key':{'name':'abc'}},
+        ]
+        manager = factory.consumer_applicability_manager()
+        applicability = manager.units_applicable(self.CRITERIA, units)
+        # Verify
+        self.assertEquals(len(applicability), 2)
+        for id in self.CONSUMER_IDS:
+            self.assertEquals([r.unit for r in applicability[id]], units)
+            self.assertTrue(applicability[id][0].applicable)
+            self.assertFalse(applicability[id][1].applicable)
+
+    def test_concurrent_batches_exception(self):
+        # Setup
+        self.mock(applicability, 'CONSUMER_BATCH_SIZE', 1)
+        self.populate()
+        profiler, cfg = plugins.get_profiler_by_type('rpm')
+        profiler.unit_applicable = Mock(side_effect=KeyError)
+        # Test
+        units = [
+            {'type_id':'rpm', 'unit_key':{'name':'zsh'}},
+        ]
+        manager = factory.consumer_applicability_manager()
+        self.assertRaises(
+            PulpExecutionException,
+            manager.units_applicable,
+            self.CRITERIA,
+            units)
+
+    def test_stored(self):
+        # Setup
+        self.populate()
+        units = [
+            {'type_id':'rpm', 'unit_key':{'name':'zsh'}},
+            {'type_id':'mock-type', 'unit_key':{'name':'abc'}},
+        ]
+        manager = factory.consumer_applicability_manager()
+        manager.units_applicable(self.CRITERIA, units)
+        profiler, cfg = plugins.get_profiler_by_type('rpm')
+        self.assertEquals(profiler.unit_applicable.call_count, 2)
+        # Test
+        applicability = manager.units_applicable(self.CRITERIA, units)
+        # Verify
+        self.assertEquals(profiler.unit_applicable.call_count, 2)
+        collection = ConsumerApplicability.get_collection()
+        self.assertEquals(collection.find().count(), 4)
+        for id in self.CONSUMER_IDS:
+            reports = applicability[id]
+            self.assertEquals([r.unit for r in reports], units)
+            self.assertTrue(reports[0].applicable)
+            self.assertEquals(reports[0].summary, 'mysummary')
+            self.assertEquals(reports[0].details, 'mydetails')
+            self.assertFalse(reports[1].applicable)
+
+    def test_profile_changed(self):
+        # Setup
+        self.populate()
+        units = [
+            {'type_id':'rpm', 'unit_key':{'name':'zsh'}},
+        ]
+        manager = factory.consumer_applicability_manager()
+        manager.units_applicable(self.CRITERIA, units)
+        # Test
+        profile_manager = factory.consumer_profile_manager()
+        profile_manager.update(self.CONSUMER_IDS[0], 'rpm', [4,5,6])
+        manager.units_applicable(self.CRITERIA, units)
+        # Verify
+        profiler, cfg = plugins.get_profiler_by_type('rpm')
+        self.assertEquals(profiler.unit_applicable.call_count, 3)
+        args = profiler.unit_applicable.call_args[0]
+        self.assertEquals(args[0].id, self.CONSUMER_IDS[0])
+        self.assertEquals(args[0].profiles, {'rpm':[4,5,6]})
+
+    def test_profile_unchanged(self):
+        # Setup
+        self.populate()
+        units = [
+            {'type_id':'rpm', 'unit_key':{'name':'zsh'}},
+        ]
+        manager = factory.consumer_applicability_manager()
+        manager.units_applicable(self.CRITERIA, units)
+        # Test
+        profile_manager = factory.consumer_profile_manager()
+        profile_manager.update(self.CONSUMER_IDS[0], 'rpm', self.PROFILE)
+        manager.units_applicable(self.CRITERIA, units)
+        # Verify
+        profiler, cfg = plugins.get_profiler_by_type('rpm')
+        self.assertEquals(profiler.unit_applicable.call_count, 2)
+
+    def test_repo_content_changed(self):
+        # Setup
+        self.populate()
+        units = [
+            {'type_id':'rpm', 'unit_key':{'name':'zsh'}},
+        ]
+        manager = factory.consumer_applicability_manager()
+        manager.units_applicable(self.CRITERIA, units)
+        collection = ConsumerApplicability.get_collection()
+        collection.update(
+            {'consumer_id':self.CONSUMER_IDS[0]},
+            {'$set':{'repo_ids':['repo-1']}},
+            multi=True, safe=True)
+        # Test
+        manager.repo_content_changed('repo-1')
+        # Verify
+        stale = collection.find({'stale':True})
+        self.assertEquals([e['consumer_id'] for e in stale], self.CONSUMER_IDS[:1])
+        manager.units_applicable(self.CRITERIA, units)
+        profiler, cfg = plugins.get_profiler_by_type('rpm')
+        self.assertEquals(profiler.unit_applicable.call_count, 3)
+        self.assertEquals(collection.find({'stale':True}).count(), 0)
+
+    def test_refresh_stale(self):
+        # Setup
+        self.populate()
+        units = [
+            {'type_id':'rpm', 'unit_key':{'name':'zsh'}},
+            {'type_id':'rpm', 'unit_key':{'name':'ksh'}},
+        ]
+        manager = factory.consumer_applicability_manager()
+        manager.units_applicable(self.CRITERIA, units)
+        manager.bindings_changed(self.CONSUMER_IDS[0])
+        # Test
+        refreshed = manager.refresh_stale(10)
+        # Verify
+        self.assertEquals(refreshed, 2)
+        collection = ConsumerApplicability.get_collection()
+        self.assertEquals(collection.find({'stale':True}).count(), 0)
+        profiler, cfg = plugins.get_profiler_by_type('rpm')
+        self.assertEquals(profiler.unit_applicable.call_count, 6)
+        self.assertEquals(manager.refresh_stale(10), 0)
+
+    def test_refresh_stale_failed(self):
+        # Setup
+        self.populate()
+        units = [
+            {'type_id':'rpm', 'unit_key':{'name':'zsh'}},
+        ]
+        manager = factory.consumer_applicability_manager()
+        manager.units_applicable(self.CRITERIA, units)
+        manager.bindings_changed(self.CONSUMER_IDS[0])
+        profiler, cfg = plugins.get_profiler_by_type('rpm')
+        profiler.unit_applicable = Mock(side_effect=KeyError)
+        # Test
+        refreshed = manager.refresh_stale(10)
+        # Verify
+        self.assertEquals(refreshed, 1)
+        collection = ConsumerApplicability.get_collection()
+        entries = list(collection.find())
+        self.assertEquals([e['consumer_id'] for e in entries], self.CONSUMER_IDS[1:])
+
+    def test_consumer_deleted(self):
+        # Setup
+        self.populate()
+        units = [
+            {'type_id':'rpm', 'unit_key':{'name':'zsh'}},
+        ]
+        manager = factory.consumer_applicability_manager()
+        manager.units_applicable(self.CRITERIA, units)
+        # Test
+        manager.consumer_deleted(self.CONSUMER_IDS[0])
+        # Verify
+        collection = ConsumerApplicability.get_collection()
+        entries = list(collection.find())
+        self.assertEquals([e['consumer_id'] for e in entries], self.CONSUMER_IDS[1:])
+
+
+class ApplicabilityRefresherTests(base.PulpServerTests):
+
+    def test_refresh_until_done(self):
+        manager = Mock()
+        manager.refresh_stale = Mock(side_effect=[10, 10, 3])
+        self.mock(factory, 'consumer_applicability_manager', Mock(return_value=manager))
+        refresher = applicability.ApplicabilityRefresher(60, 10)
+        refresher._refresh_stale()
+        self.assertEquals(manager.refresh_stale.call_count, 3)
+
+    def test_start_stop(self):
+        manager = Mock()
+        manager.refresh_stale = Mock(return_value=0)
+        self.mock(factory, 'consumer_applicability_manager', Mock(return_value=manager))
+        refresher = applicability.ApplicabilityRefresher(0.01, 10)
+        refresher.start()
+        time.sleep(0.1)
+        refresher.stop()
+        self.assertTrue(manager.refresh_stale.call_count > 0)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import time
+import unittest
+
+import base
+import mock
+
+from pulp.server.auth import cache as auth_cache
+from pulp.server.auth.cache import AuthenticationCache, CONSUMER, USER
+from pulp.server.db.model.auth import Role, User
+from pulp.server.managers import factory as manager_factory
+
+# authentication cache tests ---------------------------------------------------
+
+class AuthenticationCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        super(AuthenticationCacheTests, self).setUp()
+        self.cache = AuthenticationCache(ttl=60, max_entries=3)
+
+    def test_fingerprint(self):
+        fingerprint = self.cache.fingerprint('password', 'user', 'secret')
+        self.assertEqual(fingerprint, self.cache.fingerprint('password', 'user', 'secret'))
+        self.assertNotEqual(fingerprint, self.cache.fingerprint('password', 'user', 'other'))
+        self.assertNotEqual(fingerprint, self.cache.fingerprint('password', 'users', 'ecret'))
+        self.assertTrue('secret' not in fingerprint)
+        # a different cache has a different secret
+        self.assertNotEqual(fingerprint, AuthenticationCache().fingerprint('password', 'user', 'secret'))
+
+    def test_get_put(self):
+        self.assertEqual(self.cache.get('fp', USER), None)
+        self.cache.put('fp', USER, 'user')
+        self.assertEqual(self.cache.get('fp', USER), 'user')
+        self.assertEqual(self.cache.get('fp', CONSUMER), None)
+
+    def test_expiration(self):
+        self.cache.ttl = 0.05
+        self.cache.put('fp', USER, 'user')
+        time.sleep(0.1)
+        self.assertEqual(self.cache.get('fp', USER), None)
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_eviction(self):
+        for i in range(4):
+            self.cache.put('fp-%d' % i, USER, 'user-%d' % i)
+        self.assertEqual(self.cache.get('fp-0', USER), None)
+        for i in range(1, 4):
+            self.assertEqual(self.cache.get('fp-%d' % i, USER), 'user-%d' % i)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_eviction_after_replace(self):
+        self.cache.put('fp-0', USER, 'user-0')
+        self.cache.put('fp-1', USER, 'user-1')
+        self.cache.put('fp-0', USER, 'user-0')
+        self.cache.put('fp-2', USER, 'user-2')
+        self.cache.put('fp-3', USER, 'user-3')
+        # fp-0 was re-added after fp-1, so fp-1 is the oldest
+        self.assertEqual(self.cache.get('fp-1', USER), None)
+        self.assertEqual(self.cache.get('fp-0', USER), 'user-0')
+
+    def test_invalidate(self):
+        self.cache.put('fp-0', USER, 'user')
+        self.cache.put('fp-1', USER, 'user')
+        self.cache.put('fp-2', CONSUMER, 'user')
+        self.cache.invalidate(USER, 'user')
+        self.assertEqual(self.cache.get('fp-0', USER), None)
+        self.assertEqual(self.cache.get('fp-1', USER), None)
+        self.assertEqual(self.cache.get('fp-2', CONSUMER), 'user')
+        self.assertEqual(self.cache.stats()['invalidations'], 2)
+
+    def test_disabled(self):
+        self.cache.ttl = 0
+        self.cache.put('fp', USER, 'user')
+        self.assertEqual(self.cache.get('fp', USER), None)
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_stats(self):
+        self.cache.put('fp', USER, 'user')
+        self.cache.get('fp', USER)
+        self.cache.get('fp', USER)
+        self.cache.get('fp', USER)
+        self.cache.get('other', USER)
+        stats = self.cache.stats()
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.75)
+
+    def test_stats_logged(self):
+        cache = AuthenticationCache(ttl=60, max_entries=3, stats_interval=0.05)
+        cache.put('fp', USER, 'user')
+        with mock.patch.object(auth_cache._LOG, 'info') as mock_info:
+            cache.get('fp', USER)
+            self.assertEqual(mock_info.call_count, 0)
+            time.sleep(0.1)
+            cache.get('fp', USER)
+            cache.get('fp', USER)
+            self.assertEqual(mock_info.call_count, 1)
+            self.assertTrue('2 hits' in mock_info.call_args[0][0])
+
+    def test_stats_logging_disabled(self):
+        cache = AuthenticationCache(ttl=60, max_entries=3, stats_interval=0)
+        with mock.patch.object(auth_cache._LOG, 'info') as mock_info:
+            cache.get('fp', USER)
+            cache.get('fp', USER)
+        self.assertEqual(mock_info.call_count, 0)
+
+# authentication manager tests -------------------------------------------------
+
+class AuthenticationManagerCacheTests(base.PulpServerTests):
+
+    def setUp(self):
+        super(AuthenticationManagerCacheTests, self).setUp()
+        auth_cache.reset()
+        self.authentication_manager = manager_factory.authentication_manager()
+        self.user_manager = manager_factory.user_manager()
+        self.role_manager = manager_factory.role_manager()
+        self.user_manager.create_user('cache-user', 'password-1')
+
+    def tearDown(self):
+        super(AuthenticationManagerCacheTests, self).tearDown()
+        auth_cache.reset()
+
+    def clean(self):
+        super(AuthenticationManagerCacheTests, self).clean()
+        User.get_collection().remove()
+        Role.get_collection().remove()
+
+    def _change_stored_password(self, password):
+        # bypasses the user manager, and so the cache invalidation
+        user = User.get_collection().find_one({'login': 'cache-user'})
+        user['password'] = manager_factory.password_manager().hash_password(password)
+        User.get_collection().save(user, safe=True)
+
+    def test_password_cached(self):
+        login = self.authentication_manager.check_username_password('cache-user', 'password-1')
+        self.assertEqual(login, 'cache-user')
+        self._change_stored_password('password-2')
+        # answered from the cache without checking the stored password
+        login = self.authentication_manager.check_username_password('cache-user', 'password-1')
+        self.assertEqual(login, 'cache-user')
+        stats = auth_cache.authentication_cache().stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_invalid_password_not_cached(self):
+        login = self.authentication_manager.check_username_password('cache-user', 'wrong')
+        self.assertEqual(login, None)
+        self.assertEqual(auth_cache.authentication_cache().stats()['entries'], 0)
+
+    def test_invalidated_on_password_change(self):
+        self.authentication_manager.check_username_password('cache-user', 'password-1')
+        self.user_manager.update_user('cache-user', {'password': 'password-2'})
+        login = self.authentication_manager.check_username_password('cache-user', 'password-1')
+        self.assertEqual(login, None)
+        login = self.authentication_manager.check_username_password('cache-user', 'password-2')
+        self.assertEqual(login, 'cache-user')
+
+    def test_invalidated_on_delete(self):
+        self.authentication_manager.check_username_password('cache-user', 'password-1')
+        self.user_manager.delete_user('cache-user')
+        login = self.authentication_manager.check_username_password('cache-user', 'password-1')
+        self.assertEqual(login, None)
+
+    def test_invalidated_on_role_change(self):
+        self.role_manager.create_role('cache-role')
+        self.authentication_manager.check_username_password('cache-user', 'password-1')
+        self._change_stored_password('password-2')
+        self.role_manager.add_user_to_role('cache-role', 'cache-user')
+        login = self.authentication_manager.check_username_password('cache-user', 'password-1')
+        self.assertEqual(login, None)
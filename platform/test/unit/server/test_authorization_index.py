@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import unittest
+
+import base
+
+from pulp.server.auth import authorization_index
+from pulp.server.auth.authorization import CREATE, READ, UPDATE
+from pulp.server.auth.authorization_index import AuthorizationIndex
+from pulp.server.db.model.auth import Permission, Role, User
+from pulp.server.exceptions import MissingResource
+from pulp.server.managers import factory as manager_factory
+
+# authorization index tests ----------------------------------------------------
+
+class AuthorizationIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        super(AuthorizationIndexTests, self).setUp()
+        self.index = AuthorizationIndex()
+
+    def test_exact_resource(self):
+        self.index.set_permission('/repositories/zoo/', {'user': [READ]})
+        self.assertTrue(self.index.is_authorized('/repositories/zoo/', 'user', READ))
+        self.assertFalse(self.index.is_authorized('/repositories/zoo/', 'user', UPDATE))
+        self.assertFalse(self.index.is_authorized('/repositories/zoo/', 'other', READ))
+
+    def test_ancestor_resource(self):
+        self.index.set_permission('/repositories/', {'user': [READ]})
+        self.assertTrue(self.index.is_authorized('/repositories/zoo/importers/', 'user', READ))
+        self.assertFalse(self.index.is_authorized('/consumers/', 'user', READ))
+
+    def test_root_resource(self):
+        self.index.set_permission('/', {'user': [CREATE]})
+        self.assertTrue(self.index.is_authorized('/repositories/zoo/', 'user', CREATE))
+        self.assertTrue(self.index.is_authorized('/', 'user', CREATE))
+
+    def test_unnormalized_resource_ignored(self):
+        # authorization checks only ever look up /a/b/ style resources
+        self.index.set_permission('/repositories/zoo', {'user': [READ]})
+        self.assertFalse(self.index.is_authorized('/repositories/zoo/', 'user', READ))
+
+    def test_set_permission_replaces(self):
+        self.index.set_permission('/repositories/', {'user': [READ, UPDATE]})
+        self.index.set_permission('/repositories/', {'user': [READ]})
+        self.assertTrue(self.index.is_authorized('/repositories/', 'user', READ))
+        self.assertFalse(self.index.is_authorized('/repositories/', 'user', UPDATE))
+
+    def test_remove_permission(self):
+        self.index.set_permission('/repositories/', {'user': [READ]})
+        self.index.set_permission('/repositories/zoo/', {'user': [UPDATE]})
+        self.index.remove_permission('/repositories/')
+        self.assertFalse(self.index.is_authorized('/repositories/zoo/', 'user', READ))
+        self.assertTrue(self.index.is_authorized('/repositories/zoo/', 'user', UPDATE))
+        self.index.remove_permission('/repositories/zoo/')
+        self.assertFalse(self.index.is_authorized('/repositories/zoo/', 'user', UPDATE))
+        # removing a resource that was never indexed is harmless
+        self.index.remove_permission('/consumers/')
+
+    def test_users(self):
+        self.index.set_user('admin', ['super-users'])
+        self.index.set_user('user', [])
+        self.assertTrue(self.index.is_superuser('admin'))
+        self.assertFalse(self.index.is_superuser('user'))
+        self.assertEqual(self.index.is_superuser('missing'), None)
+        self.index.remove_user('admin')
+        self.assertEqual(self.index.is_superuser('admin'), None)
+
+    def test_load(self):
+        self.index.set_permission('/consumers/', {'user': [READ]})
+        self.index.load([{'resource': '/repositories/', 'users': {'user': [READ]}}],
+                        [{'login': 'user', 'roles': []}])
+        self.assertTrue(self.index.is_authorized('/repositories/', 'user', READ))
+        self.assertFalse(self.index.is_authorized('/consumers/', 'user', READ))
+        self.assertFalse(self.index.is_superuser('user'))
+
+# user query manager tests -----------------------------------------------------
+
+class AuthorizationIndexManagerTests(base.PulpServerTests):
+
+    def setUp(self):
+        super(AuthorizationIndexManagerTests, self).setUp()
+        self.user_manager = manager_factory.user_manager()
+        self.user_query_manager = manager_factory.user_query_manager()
+        self.role_manager = manager_factory.role_manager()
+        self.permission_manager = manager_factory.permission_manager()
+        self.role_manager.ensure_super_user_role()
+        manager_factory.principal_manager().clear_principal()
+        self.user_manager.create_user('index-user', 'password')
+
+    def clean(self):
+        super(AuthorizationIndexManagerTests, self).clean()
+        Permission.get_collection().remove()
+        Role.get_collection().remove()
+        User.get_collection().remove()
+
+    def test_loaded_from_database(self):
+        self.permission_manager.grant('/repositories/', 'index-user', [READ])
+        authorization_index.reset()
+        self.assertTrue(self.user_query_manager.is_authorized('/repositories/zoo/', 'index-user', READ))
+
+    def test_grant_and_revoke(self):
+        self.assertFalse(self.user_query_manager.is_authorized('/repositories/', 'index-user', READ))
+        self.permission_manager.grant('/repositories/', 'index-user', [READ])
+        self.assertTrue(self.user_query_manager.is_authorized('/repositories/', 'index-user', READ))
+        self.permission_manager.revoke('/repositories/', 'index-user', [READ])
+        self.assertFalse(self.user_query_manager.is_authorized('/repositories/', 'index-user', READ))
+
+    def test_role_permissions(self):
+        self.role_manager.create_role('index-role')
+        self.role_manager.add_permissions_to_role('index-role', '/consumers/', [UPDATE])
+        # load the index before the user joins the role
+        self.assertFalse(self.user_query_manager.is_authorized('/consumers/', 'index-user', UPDATE))
+        self.role_manager.add_user_to_role('index-role', 'index-user')
+        self.assertTrue(self.user_query_manager.is_authorized('/consumers/', 'index-user', UPDATE))
+        self.role_manager.remove_user_from_role('index-role', 'index-user')
+        self.assertFalse(self.user_query_manager.is_authorized('/consumers/', 'index-user', UPDATE))
+
+    def test_super_user(self):
+        self.assertFalse(self.user_query_manager.is_superuser('index-user'))
+        self.role_manager.add_user_to_role(self.role_manager.super_user_role, 'index-user')
+        self.assertTrue(self.user_query_manager.is_superuser('index-user'))
+        self.assertTrue(self.user_query_manager.is_authorized('/anything/', 'index-user', UPDATE))
+
+    def test_deleted_user(self):
+        self.assertFalse(self.user_query_manager.is_superuser('index-user'))
+        self.user_manager.delete_user('index-user')
+        self.assertRaises(MissingResource, self.user_query_manager.is_superuser, 'index-user')
+
+    def test_disabled(self):
+        self.config.set('security', 'authorization_index_refresh', '0')
+        try:
+            self.assertFalse(self.user_query_manager.is_authorized('/repositories/', 'index-user', READ))
+            # changes made directly to the database are seen immediately
+            Permission.get_collection().save(Permission('/repositories/', {'index-user': [READ]}), safe=True)
+            self.assertTrue(self.user_query_manager.is_authorized('/repositories/', 'index-user', READ))
+        finally:
+            self.config.set('security', 'authorization_index_refresh', '300')
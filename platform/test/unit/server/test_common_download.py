@@ -11,6 +11,7 @@
 # You should have received a copy of GPLv2 along with this software; if not,
 # see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
 
+import hashlib
 import os
 import re
 import shutil
@@ -20,8 +21,15 @@ import unittest
 import mock
 import pycurl
 
+from pulp.common.download import cache as download_cache
 from pulp.common.download import factory as download_factory
 from pulp.common.download.backends import curl as curl_backend
+from pulp.common.download.backends.base import DownloadBackend
+from pulp.common.download.backends import hosts as download_hosts
+from pulp.common.download.backends import local as local_backend
+from pulp.common.download.backends import threaded as threaded_backend
+from pulp.common.download import report as download_report
+from pulp.common.download import verification
 from pulp.common.download.config import DownloaderConfig
 from pulp.common.download.request import DownloadRequest
 
@@ -35,6 +43,7 @@ class MockEventListener(mock.Mock):
         super(MockEventListener, self).__init__()
 
         self.batch_started = mock.Mock()
+        self.batch_progress = mock.Mock()
         self.batch_finished = mock.Mock()
 
         self.download_started = mock.Mock()
@@ -54,7 +63,10 @@ def mock_curl_multi_factory():
         mock_curl_multi._curls.append(curl)
 
     def _info_read():
-        return 0, [c for c in mock_curl_multi._curls if c._is_active], []
+        active_curls = [c for c in mock_curl_multi._curls if c._is_active]
+        ok_list = [c for c in active_curls if c._error is None]
+        err_list = [(c, c._error[0], c._error[1]) for c in active_curls if c._error is not None]
+        return 0, ok_list, err_list
 
     def _perform():
         for curl in mock_curl_multi._curls:
@@ -84,18 +96,38 @@ def mock_curl_factory():
     mock_curl = mock.Mock()
     mock_curl._is_active = False
     mock_curl._opts = {}
+    mock_curl._error = None
+    # for each successive perform, bytes to transfer before failing with a connection error
+    mock_curl._fail_after_list = []
 
     def _perform():
         # strip off the protocol scheme + hostname + port and use the remaining *relative* path
         input_file_path = re.sub(r'^[a-z]+://localhost:8088/', '', mock_curl._opts[pycurl.URL], 1)
         input_fp = open(input_file_path, 'rb')
 
-        output_fp = mock_curl._opts[pycurl.WRITEDATA]
+        write_callback = mock_curl._opts[pycurl.WRITEFUNCTION]
 
         progress_callback = mock_curl._opts[pycurl.PROGRESSFUNCTION]
         progress_callback(0, 0, 0, 0)
 
-        shutil.copyfileobj(input_fp, output_fp)
+        input_fp.seek(mock_curl._opts.get(pycurl.RESUME_FROM_LARGE, 0))
+        mock_curl._error = None
+        fail_after = None
+        if mock_curl._fail_after_list:
+            fail_after = mock_curl._fail_after_list.pop(0)
+        bytes_read = 0
+
+        while True:
+            data = input_fp.read(16384)
+            if not data:
+                break
+            if fail_after is not None and bytes_read + len(data) > fail_after:
+                write_callback(data[:fail_after - bytes_read])
+                mock_curl._error = (pycurl.E_RECV_ERROR, 'Connection reset by peer')
+                input_fp.close()
+                return
+            write_callback(data)
+            bytes_read += len(data)
 
         file_size = os.fstat(input_fp.fileno())[6]
         progress_callback(file_size, file_size, 0, 0)
@@ -144,6 +176,28 @@ class FactoryTests(unittest.TestCase):
         del downloader
         self.assertFalse(os.path.exists(ssl_working_dir))
 
+    def test_threaded_factory(self):
+        config = DownloaderConfig('http', backend='threaded')
+        downloader = download_factory.get_downloader(config)
+
+        self.assertTrue(isinstance(downloader, threaded_backend.HTTPThreadedDownloadBackend))
+
+    def test_threaded_https_factory(self):
+        config = DownloaderConfig('https', backend='threaded')
+        downloader = download_factory.get_downloader(config)
+
+        self.assertTrue(isinstance(downloader, threaded_backend.HTTPSThreadedDownloadBackend))
+
+    def test_file_factory(self):
+        config = DownloaderConfig('file')
+        downloader = download_factory.get_downloader(config)
+
+        self.assertTrue(isinstance(downloader, local_backend.FileDownloadBackend))
+
+    def test_unknown_backend(self):
+        config = DownloaderConfig('http', backend='carrier-pigeon')
+        self.assertRaises(download_factory.NoBackendForProtocol, download_factory.get_downloader, config)
+
 
 class DownloadTests(unittest.TestCase):
     data_dir = 'data/test_common_download/'
@@ -188,7 +242,7 @@ class MockCurlDownloadTests(DownloadTests):
 
         mock_curl = pycurl.Curl.mock_objs[-1] # curl objects are used from back of the list
 
-        self.assertEqual(mock_curl.setopt.call_count, 9) # also dangerous for the same reasons
+        self.assertEqual(mock_curl.setopt.call_count, 12) # also dangerous for the same reasons
         self.assertEqual(mock_curl.perform.call_count, 1)
 
     @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
@@ -254,7 +308,709 @@ class MockCurlDownloadTests(DownloadTests):
 
         mock_curl = pycurl.Curl.mock_objs[-1] # curl objects are used from the end
 
-        self.assertEqual(mock_curl.setopt.call_count, 11) # dangerous as this could easily change
+        self.assertEqual(mock_curl.setopt.call_count, 14) # dangerous as this could easily change
+
+
+class MockCurlVerificationTests(DownloadTests):
+    # test suite for the streaming checksum and size verification
+
+    def _checksum(self, file_name, checksum_type='sha256'):
+        hasher = hashlib.new(checksum_type)
+        fp = open(os.path.join(self.data_dir, file_name), 'rb')
+        try:
+            hasher.update(fp.read())
+        finally:
+            fp.close()
+        return hasher.hexdigest()
+
+    def _download_request(self, **kwargs):
+        file_name = self.file_list[0]
+        return DownloadRequest('http://localhost:8088/' + self.data_dir + file_name,
+                               os.path.join(self.storage_dir, file_name), **kwargs)
+
+    def _download(self, request):
+        config = DownloaderConfig('http')
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+        downloader.download([request])
+        return listener
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_verified(self):
+        checksum = self._checksum(self.file_list[0])
+        request = self._download_request(checksum_type='sha256', checksum_value=checksum,
+                                         size=self.file_sizes[0])
+        listener = self._download(request)
+
+        self.assertEqual(listener.download_succeeded.call_count, 1)
+        self.assertEqual(listener.download_failed.call_count, 0)
+
+        report = listener.download_succeeded.call_args[0][0]
+        self.assertEqual(report.state, download_report.DOWNLOAD_SUCCEEDED)
+        self.assertEqual(report.checksum_type, 'sha256')
+        self.assertEqual(report.checksum, checksum)
+        self.assertTrue(os.path.exists(request.file_path))
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_checksum_recorded_without_expected_value(self):
+        request = self._download_request(checksum_type='md5')
+        listener = self._download(request)
+
+        report = listener.download_succeeded.call_args[0][0]
+        self.assertEqual(report.checksum, self._checksum(self.file_list[0], 'md5'))
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_checksum_mismatch(self):
+        request = self._download_request(checksum_type='sha256', checksum_value='0' * 64)
+        listener = self._download(request)
+
+        self.assertEqual(listener.download_succeeded.call_count, 0)
+        self.assertEqual(listener.download_failed.call_count, 1)
+
+        report = listener.download_failed.call_args[0][0]
+        self.assertEqual(report.state, download_report.DOWNLOAD_FAILED)
+        self.assertEqual(report.error_report['expected_checksum'], '0' * 64)
+        self.assertEqual(report.error_report['actual_checksum'], self._checksum(self.file_list[0]))
+        self.assertFalse(os.path.exists(request.file_path))
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_size_mismatch(self):
+        request = self._download_request(size=self.file_sizes[0] + 1)
+        listener = self._download(request)
+
+        self.assertEqual(listener.download_failed.call_count, 1)
+
+        report = listener.download_failed.call_args[0][0]
+        self.assertEqual(report.error_report['expected_size'], self.file_sizes[0] + 1)
+        self.assertEqual(report.error_report['actual_size'], self.file_sizes[0])
+        self.assertFalse(os.path.exists(request.file_path))
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_unsupported_checksum_type(self):
+        request = self._download_request(checksum_type='not-a-checksum', checksum_value='abc')
+        listener = self._download(request)
+
+        self.assertEqual(listener.download_started.call_count, 1)
+        self.assertEqual(listener.download_failed.call_count, 1)
+        self.assertEqual(listener.batch_finished.call_count, 1)
+        self.assertFalse(os.path.exists(request.file_path))
+
+    def test_streaming_verifier(self):
+        request = DownloadRequest('http://localhost/file', '/tmp/file', checksum_type='SHA1',
+                                  checksum_value=hashlib.sha1('abcdef').hexdigest(), size=6)
+        report = download_report.DownloadReport.from_download_request(request)
+        verifier = verification.StreamingVerifier(request)
+        verifier.update('abc')
+        verifier.update('def')
+
+        self.assertEqual(verifier.verify(report), {})
+        self.assertEqual(report.checksum, hashlib.sha1('abcdef').hexdigest())
+
+
+class MockCurlRetryTests(DownloadTests):
+    # test suite for retrying and resuming failed downloads
+
+    def _download(self, fail_after_list, request=None, **config_kwargs):
+        config_kwargs.setdefault('retry_backoff', 0)
+        config = DownloaderConfig('http', max_concurrent=1, **config_kwargs)
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+
+        mock_curl = pycurl.Curl.mock_objs[-1]
+        mock_curl._fail_after_list = list(fail_after_list)
+
+        request = request or self._download_requests()[0]
+        downloader.download([request])
+        return request, listener, mock_curl
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_retry_resumes(self):
+        request, listener, mock_curl = self._download([40000, 30000], max_retries=2)
+
+        self.assertEqual(listener.download_started.call_count, 1)
+        self.assertEqual(listener.download_succeeded.call_count, 1)
+        self.assertEqual(listener.download_failed.call_count, 0)
+
+        report = listener.download_succeeded.call_args[0][0]
+        self.assertEqual(report.attempts, 3)
+        self.assertEqual(report.error_report, {})
+        self.assertEqual(os.stat(request.file_path)[6], self.file_sizes[0])
+
+        # the last attempt resumed after the bytes from the first two
+        self.assertEqual(mock_curl._opts[pycurl.RESUME_FROM_LARGE], 70000)
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_retry_resume_verified(self):
+        fp = open(os.path.join(self.data_dir, self.file_list[0]), 'rb')
+        checksum = hashlib.sha256(fp.read()).hexdigest()
+        fp.close()
+
+        request = self._download_requests()[0]
+        request.checksum_type = 'sha256'
+        request.checksum_value = checksum
+        request, listener, mock_curl = self._download([50000], request, max_retries=1)
+
+        # the bytes from the failed attempt are included in the checksum
+        report = listener.download_succeeded.call_args[0][0]
+        self.assertEqual(report.attempts, 2)
+        self.assertEqual(report.checksum, checksum)
+        self.assertEqual(mock_curl._opts[pycurl.RESUME_FROM_LARGE], 50000)
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_retries_exhausted(self):
+        request, listener, mock_curl = self._download([10, 10, 10], max_retries=1)
+
+        self.assertEqual(listener.download_succeeded.call_count, 0)
+        self.assertEqual(listener.download_failed.call_count, 1)
+
+        report = listener.download_failed.call_args[0][0]
+        self.assertEqual(report.attempts, 2)
+        self.assertEqual(report.error_report['error_code'], pycurl.E_RECV_ERROR)
+        self.assertEqual(mock_curl.perform.call_count, 2)
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_no_retries(self):
+        request, listener, mock_curl = self._download([10], max_retries=0)
+
+        self.assertEqual(listener.download_failed.call_count, 1)
+        self.assertEqual(listener.download_failed.call_args[0][0].attempts, 1)
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_verification_failure_restarts(self):
+        config = DownloaderConfig('http', max_concurrent=1, max_retries=1, retry_backoff=0)
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+        request = self._download_requests()[0]
+        request.size = 1
+        downloader.download([request])
+
+        report = listener.download_failed.call_args[0][0]
+        self.assertEqual(report.attempts, 2)
+        self.assertEqual(pycurl.Curl.mock_objs[-1]._opts[pycurl.RESUME_FROM_LARGE], 0)
+        self.assertFalse(os.path.exists(request.file_path))
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_resume_partial(self):
+        request = self._download_requests()[0]
+        input_fp = open(os.path.join(self.data_dir, self.file_list[0]), 'rb')
+        output_fp = open(request.file_path, 'wb')
+        output_fp.write(input_fp.read(1000))
+        output_fp.close()
+        input_fp.close()
+
+        config = DownloaderConfig('http', resume_partial=True)
+        downloader = download_factory.get_downloader(config)
+        downloader.download([request])
+
+        mock_curl = pycurl.Curl.mock_objs[-1]
+        self.assertEqual(mock_curl._opts[pycurl.RESUME_FROM_LARGE], 1000)
+        self.assertEqual(os.stat(request.file_path)[6], self.file_sizes[0])
+
+    def test_retry_delay(self):
+        config = DownloaderConfig('http', retry_backoff=2, max_retry_backoff=5)
+        downloader = download_factory.get_downloader(config)
+
+        self.assertEqual(downloader._retry_delay(1), 2)
+        self.assertEqual(downloader._retry_delay(2), 4)
+        self.assertEqual(downloader._retry_delay(3), 5)
+
+    def test_config_validation(self):
+        self.assertRaises(AttributeError, DownloaderConfig, 'http', max_retries=-1)
+        self.assertRaises(AttributeError, DownloaderConfig, 'http', retry_backoff=-1)
+
+
+class DownloadCacheTests(DownloadTests):
+
+    def setUp(self):
+        super(DownloadCacheTests, self).setUp()
+        self.cache_dir = tempfile.mkdtemp(prefix='test_common_download_cache-')
+        self.cache = download_cache.DownloadCache(self.cache_dir, max_size=self.file_sizes[0] * 2)
+
+    def tearDown(self):
+        super(DownloadCacheTests, self).tearDown()
+        shutil.rmtree(self.cache_dir)
+
+    def _store(self, file_name, url=None, headers=None):
+        file_path = os.path.join(self.data_dir, file_name)
+        fp = open(file_path, 'rb')
+        checksum = hashlib.sha256(fp.read()).hexdigest()
+        fp.close()
+        self.cache.store(url or 'http://localhost/' + file_name, file_path, 'sha256', checksum, headers)
+        return checksum
+
+    def test_store_and_fetch(self):
+        checksum = self._store(self.file_list[0])
+
+        content_key = self.cache.lookup_checksum('SHA256', checksum.upper())
+        self.assertEqual(content_key, 'sha256:' + checksum)
+
+        file_path = os.path.join(self.storage_dir, 'fetched')
+        self.assertTrue(self.cache.fetch(content_key, file_path))
+        self.assertEqual(os.stat(file_path)[6], self.file_sizes[0])
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['files'], 1)
+        self.assertEqual(stats['size'], self.file_sizes[0])
+
+    def test_lookup_missing(self):
+        self.assertEqual(self.cache.lookup_checksum('sha256', '0' * 64), None)
+        self.assertEqual(self.cache.lookup_url('http://localhost/nothing'), None)
+
+    def test_conditional_headers(self):
+        url = 'http://localhost/' + self.file_list[0]
+        self._store(self.file_list[0], url, {'etag': '"abc"', 'last-modified': 'Tue, 15 Jan 2013 00:00:00 GMT'})
+
+        headers = self.cache.conditional_headers(self.cache.lookup_url(url))
+        self.assertEqual(headers, {'If-None-Match': '"abc"',
+                                   'If-Modified-Since': 'Tue, 15 Jan 2013 00:00:00 GMT'})
+
+    def test_lru_eviction(self):
+        # room for the smallest and the largest files, but not all three
+        self.cache.max_size = self.file_sizes[0] + self.file_sizes[2]
+        first_checksum = self._store(self.file_list[0], 'http://localhost/first')
+        second_checksum = self._store(self.file_list[1], 'http://localhost/second')
+
+        # touch the first file so that the second is the least recently used
+        self.cache.fetch('sha256:' + first_checksum, os.path.join(self.storage_dir, 'first'))
+        third_checksum = self._store(self.file_list[2], 'http://localhost/third')
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['size'], self.cache.max_size)
+        self.assertNotEqual(self.cache.lookup_checksum('sha256', first_checksum), None)
+        self.assertEqual(self.cache.lookup_checksum('sha256', second_checksum), None)
+        self.assertEqual(self.cache.lookup_url('http://localhost/second'), None)
+        self.assertNotEqual(self.cache.lookup_checksum('sha256', third_checksum), None)
+
+    def test_too_large(self):
+        self.cache.max_size = 10
+        self._store(self.file_list[0])
+        self.assertEqual(self.cache.stats()['files'], 0)
+
+    def test_index_persistence(self):
+        url = 'http://localhost/' + self.file_list[0]
+        checksum = self._store(self.file_list[0], url, {'etag': '"abc"'})
+        self.cache.save()
+
+        cache = download_cache.DownloadCache(self.cache_dir)
+        self.assertEqual(cache.lookup_checksum('sha256', checksum), 'sha256:' + checksum)
+        self.assertEqual(cache.lookup_url(url)['etag'], '"abc"')
+        self.assertEqual(cache.stats()['size'], self.file_sizes[0])
+
+    def test_factory(self):
+        config = DownloaderConfig('http', cache_dir=self.cache_dir)
+        downloader = download_factory.get_downloader(config)
+
+        self.assertTrue(isinstance(downloader, download_cache.CachingDownloadBackend))
+        self.assertTrue(isinstance(downloader.backend, curl_backend.HTTPCurlDownloadBackend))
+        self.assertTrue(downloader.cache is download_cache.get_cache(self.cache_dir))
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_caching_backend(self):
+        config = DownloaderConfig('http', cache_dir=self.cache_dir)
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+
+        # first download populates the cache
+        request_list = self._download_requests()[:1]
+        downloader.download(request_list)
+
+        report = listener.download_succeeded.call_args[0][0]
+        self.assertEqual(report.cache_hit, False)
+        self.assertEqual(report.checksum_type, download_cache.DEFAULT_CHECKSUM_TYPE)
+
+        # second download, expecting the same checksum, is served from the cache
+        request = self._download_requests()[0]
+        request.file_path = os.path.join(self.storage_dir, 'second')
+        request.checksum_type = report.checksum_type
+        request.checksum_value = report.checksum
+        downloader.download([request])
+
+        self.assertEqual(sum(c.perform.call_count for c in pycurl.Curl.mock_objs), 1)
+        self.assertEqual(os.stat(request.file_path)[6], self.file_sizes[0])
+
+        report = listener.download_succeeded.call_args[0][0]
+        self.assertEqual(report.cache_hit, True)
+
+        batch_report = listener.batch_finished.call_args[0][0]
+        self.assertEqual(batch_report.cache_hits, 1)
+        self.assertEqual(batch_report.cache_misses, 0)
+        self.assertEqual(batch_report.cache_stats['hits'], 1)
+        self.assertEqual(batch_report.cache_stats['misses'], 1)
+
+    def test_caching_backend_no_checksum(self):
+        config = DownloaderConfig('http', cache_dir=self.cache_dir)
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+        url = 'http://localhost/' + self.file_list[0]
+        report = download_report.DownloadReport(url, os.path.join(self.data_dir, self.file_list[0]))
+
+        # the backend reported success without computing a checksum
+        downloader._download_succeeded(report)
+
+        self.assertEqual(listener.download_succeeded.call_count, 1)
+        self.assertEqual(report.cache_hit, False)
+        self.assertEqual(downloader.cache.lookup_url(url), None)
+
+    def test_caching_backend_store_error(self):
+        config = DownloaderConfig('http', cache_dir=self.cache_dir)
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+        report = download_report.DownloadReport('http://localhost/file', '/tmp/file')
+        report.checksum_type = 'sha256'
+        report.checksum = '0' * 64
+
+        with mock.patch.object(downloader.cache, 'store', side_effect=ValueError()):
+            downloader._download_succeeded(report)
+
+        self.assertEqual(listener.download_succeeded.call_count, 1)
+
+
+class ProgressEventTests(unittest.TestCase):
+
+    def setUp(self):
+        super(ProgressEventTests, self).setUp()
+        self.listener = MockEventListener()
+        self.backend = DownloadBackend(DownloaderConfig('http', progress_interval=60), self.listener)
+        self.report = download_report.DownloadReport('http://localhost/file', '/tmp/file')
+        self.report.total_bytes = 100
+        self.batch_report = download_report.DownloadBatchReport([self.report])
+        self.backend.fire_batch_started(self.batch_report)
+
+    def _progress(self, bytes_downloaded):
+        self.report.bytes_downloaded = bytes_downloaded
+        self.backend.fire_download_progress(self.report)
+
+    def test_throttled(self):
+        for bytes_downloaded in range(0, 100, 10):
+            self._progress(bytes_downloaded)
+
+        # only the first progress event makes it within the interval
+        self.assertEqual(self.listener.download_progress.call_count, 1)
+        # the batch's progress is first reported an interval after it started
+        self.assertEqual(self.listener.batch_progress.call_count, 0)
+
+    def test_batch_progress_interval(self):
+        self._progress(10)
+        self.backend._last_batch_progress -= 60
+        self._progress(20)
+        self._progress(30)
+
+        self.assertEqual(self.listener.batch_progress.call_count, 1)
+        self.assertEqual(self.listener.batch_progress.call_args[0][0], self.batch_report)
+
+    def test_listener_without_batch_progress(self):
+        class OldEventListener(object):
+            def __init__(self):
+                self.batch_started = mock.Mock()
+                self.download_progress = mock.Mock()
+
+        listener = OldEventListener()
+        backend = DownloadBackend(DownloaderConfig('http', progress_interval=0), listener)
+        backend.fire_batch_started(self.batch_report)
+        self.report.bytes_downloaded = 10
+        backend.fire_download_progress(self.report)
+
+        self.assertEqual(listener.download_progress.call_count, 1)
+
+    def test_final_progress(self):
+        self._progress(10)
+        self._progress(50)
+        self._progress(100)
+        self._progress(100)
+
+        self.assertEqual(self.listener.download_progress.call_count, 2)
+
+    def test_no_interval(self):
+        self.backend.config.progress_interval = 0
+        for bytes_downloaded in range(0, 100, 10):
+            self._progress(bytes_downloaded)
+
+        self.assertEqual(self.listener.download_progress.call_count, 10)
+        self.assertEqual(self.listener.batch_progress.call_count, 10)
+
+    def test_batch_aggregates(self):
+        other_report = download_report.DownloadReport('http://localhost/other', '/tmp/other')
+        self.batch_report.append(other_report)
+        self.report.bytes_downloaded = 50
+
+        # one file's size is not known yet
+        self.assertEqual(self.batch_report.total_bytes, None)
+        self.assertEqual(self.batch_report.eta, None)
+
+        other_report.total_bytes = 100
+        other_report.bytes_downloaded = 50
+        self.batch_report.start_time -= 10
+
+        self.assertEqual(self.batch_report.total_bytes, 200)
+        self.assertEqual(self.batch_report.bytes_downloaded, 100)
+        self.assertAlmostEqual(self.batch_report.bytes_per_second, 10, 0)
+        self.assertAlmostEqual(self.batch_report.eta, 10, 0)
+
+    def test_expected_size(self):
+        request = DownloadRequest('http://localhost/file', '/tmp/file', size=1024)
+        report = download_report.DownloadReport.from_download_request(request)
+        self.assertEqual(report.total_bytes, 1024)
+
+
+class HostSchedulerTests(unittest.TestCase):
+
+    def _put(self, scheduler, urls):
+        for url in urls:
+            scheduler.put(DownloadRequest(url, '/tmp/' + url.rsplit('/', 1)[-1]), None)
+
+    def test_host_for_url(self):
+        self.assertEqual(download_hosts.host_for_url('http://Mirror.Example.com:8080/a/b'),
+                         'mirror.example.com:8080')
+
+    def test_round_robin(self):
+        scheduler = download_hosts.HostScheduler()
+        self._put(scheduler, ['http://a/1', 'http://a/2', 'http://a/3', 'http://b/1', 'http://c/1'])
+
+        urls = []
+        while True:
+            next_request = scheduler.get()
+            if next_request is None:
+                break
+            urls.append(next_request[0].url)
+
+        self.assertEqual(urls, ['http://a/1', 'http://b/1', 'http://c/1', 'http://a/2', 'http://a/3'])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_per_host_cap(self):
+        scheduler = download_hosts.HostScheduler(max_per_host=1)
+        self._put(scheduler, ['http://a/1', 'http://a/2', 'http://b/1'])
+
+        first = scheduler.get()[0]
+        second = scheduler.get()[0]
+        self.assertEqual((first.url, second.url), ('http://a/1', 'http://b/1'))
+        self.assertEqual(scheduler.get(), None)
+        self.assertEqual(scheduler.active('a'), 1)
+
+        scheduler.release(first)
+        self.assertEqual(scheduler.get()[0].url, 'http://a/2')
+
+    def test_put_front(self):
+        scheduler = download_hosts.HostScheduler()
+        self._put(scheduler, ['http://a/1', 'http://a/2'])
+        retry = scheduler.get()[0]
+        scheduler.release(retry)
+        scheduler.put(retry, None, front=True)
+
+        self.assertEqual(scheduler.get()[0].url, 'http://a/1')
+
+    def test_host_statistics(self):
+        statistics = download_hosts.HostStatistics()
+        statistics.started('a')
+        statistics.started('a')
+        statistics.finished('a', 100, True)
+        statistics.finished('a', 50, False)
+
+        stats = statistics.report()['a']
+        self.assertEqual(stats['attempts'], 2)
+        self.assertEqual(stats['succeeded'], 1)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['bytes'], 150)
+        self.assertTrue(stats['busy_seconds'] >= 0)
+
+
+class MockCurlHostSchedulingTests(DownloadTests):
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_speed_limits(self):
+        config = DownloaderConfig('http', max_speed=3000, max_speed_per_host=1000)
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+        downloader.download(self._download_requests())
+
+        # all three downloads are from the same host, so the per-host limit applies
+        used_mock_curl_objs = pycurl.Curl.mock_objs[-len(self.file_list):]
+        for mock_curl in used_mock_curl_objs:
+            self.assertEqual(mock_curl._opts[pycurl.MAX_RECV_SPEED_LARGE], 333)
+
+    @mock.patch('pycurl.CurlMulti', MockObjFactory(mock_curl_multi_factory))
+    @mock.patch('pycurl.Curl', MockObjFactory(mock_curl_factory))
+    def test_host_stats(self):
+        config = DownloaderConfig('http', max_concurrent_per_host=1)
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+        downloader.download(self._download_requests())
+
+        mock_curl_multi = pycurl.CurlMulti.mock_objs[0]
+        self.assertEqual(mock_curl_multi.perform.call_count, len(self.file_list))
+
+        batch_report = listener.batch_finished.call_args[0][0]
+        stats = batch_report.host_stats['localhost:8088']
+        self.assertEqual(stats['succeeded'], len(self.file_list))
+        self.assertEqual(stats['bytes'], sum(self.file_sizes))
+
+    def test_config_validation(self):
+        self.assertRaises(AttributeError, DownloaderConfig, 'http', max_concurrent_per_host=0)
+        self.assertRaises(AttributeError, DownloaderConfig, 'http', max_speed=0)
+
+
+class FileDownloadTests(DownloadTests):
+
+    def _download_requests(self, protocol='file'):
+        data_dir = os.path.abspath(self.data_dir)
+        return [DownloadRequest('file://' + os.path.join(data_dir, f), os.path.join(self.storage_dir, f))
+                for f in self.file_list]
+
+    def _checksum(self, file_path):
+        fp = open(file_path, 'rb')
+        try:
+            return hashlib.sha256(fp.read()).hexdigest()
+        finally:
+            fp.close()
+
+    def test_file_path_from_url(self):
+        self.assertEqual(local_backend.file_path_from_url('file:///mnt/mirror/some%20file'),
+                         '/mnt/mirror/some file')
+
+    def test_download(self):
+        config = DownloaderConfig('file')
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+        downloader.download(self._download_requests())
+
+        self.assertEqual(listener.batch_started.call_count, 1)
+        self.assertEqual(listener.batch_finished.call_count, 1)
+        self.assertEqual(listener.download_succeeded.call_count, len(self.file_list))
+        self.assertEqual(listener.download_failed.call_count, 0)
+
+        for file_name, file_size in zip(self.file_list, self.file_sizes):
+            self.assertEqual(os.stat(os.path.join(self.storage_dir, file_name))[6], file_size)
+
+    def test_copy(self):
+        config = DownloaderConfig('file', link_files=False)
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+        request = self._download_requests()[0]
+        request.checksum_type = 'sha256'
+        request.checksum_value = self._checksum(file_path_from_request(request))
+        downloader.download([request])
+
+        self.assertEqual(listener.download_succeeded.call_count, 1)
+        self.assertEqual(os.stat(request.file_path).st_nlink, 1)
+
+        report = listener.download_succeeded.call_args[0][0]
+        self.assertEqual(report.checksum, request.checksum_value)
+        self.assertEqual(report.bytes_downloaded, self.file_sizes[0])
+
+    def test_copy_over_link(self):
+        # a file linked into place must not be written through by a later copy
+        request = self._download_requests()[0]
+        source_path = file_path_from_request(request)
+        checksum = self._checksum(source_path)
+
+        download_factory.get_downloader(DownloaderConfig('file')).download([request])
+        download_factory.get_downloader(DownloaderConfig('file', link_files=False)).download([request])
+
+        self.assertEqual(os.stat(source_path)[6], self.file_sizes[0])
+        self.assertEqual(self._checksum(source_path), checksum)
+
+    def test_checksum_mismatch(self):
+        config = DownloaderConfig('file', max_retries=0)
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+        request = self._download_requests()[0]
+        request.checksum_type = 'sha256'
+        request.checksum_value = '0' * 64
+        downloader.download([request])
+
+        self.assertEqual(listener.download_failed.call_count, 1)
+        self.assertFalse(os.path.exists(request.file_path))
+        self.assertTrue(os.path.exists(file_path_from_request(request)))
+
+    def test_missing_file(self):
+        config = DownloaderConfig('file', max_retries=1, retry_backoff=0)
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+        request = DownloadRequest('file:///does/not/exist', os.path.join(self.storage_dir, 'missing'))
+        downloader.download([request])
+
+        self.assertEqual(listener.download_failed.call_count, 1)
+        report = listener.download_failed.call_args[0][0]
+        self.assertEqual(report.attempts, 2)
+        self.assertTrue('error_message' in report.error_report)
+
+
+def file_path_from_request(request):
+    return local_backend.file_path_from_url(request.url)
+
+
+class ThreadedHTTPSVerificationTests(unittest.TestCase):
+    # the pure-python https backend verifies servers unless told not to
+
+    def _connect(self, peer_cert, validate=True, ca_bundle='/ca-bundle.crt'):
+        mock_ssl_sock = mock.Mock()
+        mock_ssl_sock.getpeercert.return_value = peer_cert
+        with mock.patch.object(threaded_backend.socket, 'create_connection'):
+            with mock.patch.object(threaded_backend.ssl, 'wrap_socket') as mock_wrap_socket:
+                with mock.patch.object(threaded_backend, '_system_ca_bundle') as mock_ca_bundle:
+                    mock_wrap_socket.return_value = mock_ssl_sock
+                    mock_ca_bundle.return_value = ca_bundle
+                    connection = threaded_backend._HTTPSConnection('pulp.example.com', validate=validate)
+                    connection.connect()
+                    return mock_wrap_socket
+
+    def test_verified_by_default(self):
+        mock_wrap_socket = self._connect({'subjectAltName': (('DNS', 'pulp.example.com'),)})
+
+        kwargs = mock_wrap_socket.call_args[1]
+        self.assertEqual(kwargs['cert_reqs'], threaded_backend.ssl.CERT_REQUIRED)
+        self.assertEqual(kwargs['ca_certs'], '/ca-bundle.crt')
+
+    def test_host_name_mismatch(self):
+        self.assertRaises(threaded_backend.ssl.SSLError, self._connect,
+                          {'subjectAltName': (('DNS', 'other.example.com'),)})
+
+    def test_no_ca_certificates(self):
+        self.assertRaises(threaded_backend.ssl.SSLError, self._connect,
+                          {'subjectAltName': (('DNS', 'pulp.example.com'),)}, ca_bundle=None)
+
+    def test_validation_disabled(self):
+        mock_wrap_socket = self._connect({}, validate=False, ca_bundle=None)
+
+        kwargs = mock_wrap_socket.call_args[1]
+        self.assertEqual(kwargs['cert_reqs'], threaded_backend.ssl.CERT_NONE)
+
+    def test_validation_config(self):
+        config = DownloaderConfig('https', backend='threaded', ssl_validation=False)
+        downloader = download_factory.get_downloader(config)
+        opener = downloader._build_opener()
+
+        # the backend's handler replaces urllib2's default https handler
+        handlers = opener.handle_open['https']
+        self.assertEqual(len(handlers), 1)
+        self.assertTrue(isinstance(handlers[0], threaded_backend._HTTPSHandler))
+        self.assertFalse(handlers[0].validate)
+
+    def test_match_hostname(self):
+        match = threaded_backend._match_hostname
+        self.assertTrue(match({'subjectAltName': (('DNS', '*.example.com'),)}, 'pulp.example.com'))
+        self.assertFalse(match({'subjectAltName': (('DNS', '*.example.com'),)}, 'a.pulp.example.com'))
+        self.assertFalse(match({'subjectAltName': (('DNS', '*.example.com'),)}, 'example.com'))
+        self.assertTrue(match({'subject': ((('commonName', 'Pulp.Example.com'),),)}, 'pulp.example.com'))
+        # the common name is ignored when there are alternative names
+        self.assertFalse(match({'subject': ((('commonName', 'pulp.example.com'),),),
+                                'subjectAltName': (('DNS', 'other.example.com'),)}, 'pulp.example.com'))
+
 
 class LiveCurlDownloadTests(DownloadTests):
     # test suite that tests that pycurl is being used (mostly) correctly
@@ -308,3 +1064,64 @@ class LiveCurlDownloadTests(DownloadTests):
         self.assertEqual(listener.download_succeeded.call_count, 1)
         self.assertEqual(listener.download_failed.call_count, 0)
 
+
+class LiveThreadedDownloadTests(DownloadTests):
+    # test suite for the pure-python http backend against a local http server
+
+    # the server is bound to its port on creation, so it's shared between suites
+    http_server = LiveCurlDownloadTests.http_server
+
+    @classmethod
+    def setUpClass(cls):
+        cls.http_server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.http_server.stop()
+
+    def test_download_multiple(self):
+        config = DownloaderConfig('http', backend='threaded')
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+        downloader.download(self._download_requests())
+
+        self.assertEqual(listener.batch_started.call_count, 1)
+        self.assertEqual(listener.batch_finished.call_count, 1)
+        self.assertEqual(listener.download_started.call_count, len(self.file_list))
+        self.assertNotEqual(listener.download_progress.call_count, 0)
+        self.assertEqual(listener.download_succeeded.call_count, len(self.file_list))
+
+        for file_name, file_size in zip(self.file_list, self.file_sizes):
+            self.assertEqual(os.stat(os.path.join(self.storage_dir, file_name))[6], file_size)
+
+        batch_report = listener.batch_finished.call_args[0][0]
+        self.assertEqual(batch_report.host_stats['localhost:8088']['bytes'], sum(self.file_sizes))
+
+    def test_checksum(self):
+        fp = open(os.path.join(self.data_dir, self.file_list[0]), 'rb')
+        checksum = hashlib.sha256(fp.read()).hexdigest()
+        fp.close()
+
+        config = DownloaderConfig('http', backend='threaded')
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+        request = self._download_requests()[0]
+        request.checksum_type = 'sha256'
+        request.checksum_value = checksum
+        downloader.download([request])
+
+        report = listener.download_succeeded.call_args[0][0]
+        self.assertEqual(report.checksum, checksum)
+        self.assertEqual(report.response_code, 200)
+
+    def test_not_found(self):
+        config = DownloaderConfig('http', backend='threaded', max_retries=0)
+        listener = MockEventListener()
+        downloader = download_factory.get_downloader(config, listener)
+        request = DownloadRequest('http://localhost:8088/' + self.data_dir + 'no_such_file',
+                                  os.path.join(self.storage_dir, 'no_such_file'))
+        downloader.download([request])
+
+        self.assertEqual(listener.download_failed.call_count, 1)
+        report = listener.download_failed.call_args[0][0]
+        self.assertEqual(report.error_report['response_code'], 404)
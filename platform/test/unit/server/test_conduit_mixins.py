@@ -140,6 +140,46 @@ class SingleRepoUnitsMixinTests(unittest.TestCase):
         # Test
         self.assertRaises(mixins.DistributorConduitException, self.mixin.get_units)
 
+    @mock.patch('pulp.plugins.types.database.type_definition')
+    @mock.patch('pulp.server.managers.repo.unit_association_query.RepoUnitAssociationQueryManager.get_units_iter')
+    def test_get_units_iter(self, mock_query_call, mock_type_def_call):
+        # Setup
+        mock_query_call.return_value = iter([
+            {'unit_type_id' : 'type-1', 'metadata' : {'m' : 'm1', 'k1' : 'v1'}},
+            {'unit_type_id' : 'type-1', 'metadata' : {'m' : 'm1', 'k1' : 'v2'}},
+            {'unit_type_id' : 'type-2', 'metadata' : {'m' : 'm1', 'k1' : 'v3'}},
+        ])
+
+        mock_type_def_call.return_value = {
+            'id' : 'mock-type-def',
+            'unit_key' : ['k1']
+        }
+
+        fake_criteria = 'fake-criteria'
+
+        # Test
+        units = self.mixin.get_units_iter(criteria=fake_criteria, batch_size=2)
+
+        # Verify
+        self.assertEqual(0, mock_query_call.call_count) # lazy until consumed
+        units = list(units)
+        self.assertEqual(3, len(units))
+        self.assertEqual(['v1', 'v2', 'v3'], [u.unit_key['k1'] for u in units])
+        self.assertEqual(1, mock_query_call.call_count)
+        self.assertEqual(mock_query_call.call_args[0][0], self.repo_id)
+        self.assertEqual(mock_query_call.call_args[1]['criteria'], fake_criteria)
+        self.assertEqual(mock_query_call.call_args[1]['batch_size'], 2)
+        self.assertEqual(2, mock_type_def_call.call_count) # once per type
+
+    @mock.patch('pulp.server.managers.repo.unit_association_query.RepoUnitAssociationQueryManager.get_units_iter')
+    def test_get_units_iter_server_error(self, mock_query_call):
+        # Setup
+        mock_query_call.side_effect = Exception()
+
+        # Test
+        units = self.mixin.get_units_iter()
+        self.assertRaises(mixins.DistributorConduitException, list, units)
+
 
 class MultipleRepoUnitsMixinTests(unittest.TestCase):
 
@@ -13,16 +13,23 @@
 
 import os
 import shutil
+import threading
+import time
 import traceback
 import unittest
 
+import mock_agent
+import mock_plugins
 from base import PulpAsyncServerTests
 
+from pulp.plugins.loader import api as plugin_api
 from pulp.server import exceptions as pulp_exceptions
 from pulp.server.db.model.criteria import Criteria
-from pulp.server.db.model.consumer import Consumer, ConsumerGroup
+from pulp.server.db.model.consumer import Bind, Consumer, ConsumerGroup
+from pulp.server.db.model.repository import Repo, RepoDistributor
 from pulp.server.managers import factory as managers_factory
 from pulp.server.managers.consumer.group import cud
+from pulp.server.managers.consumer.group.fanout import FanOut, GroupReport
 
 
 class ConsumerGroupManagerInstantiationTests(unittest.TestCase):
@@ -224,3 +231,127 @@ class ConsumerGroupMembershipTests(ConsumerGroupTests):
         self.assertTrue(consumer_2['id'] in group['consumer_ids'])
 
 
+class ConsumerGroupFanOutTests(unittest.TestCase):
+
+    def test_report(self):
+        report = GroupReport()
+        report.succeeded('consumer_1', 'details')
+        report.failed('consumer_2', pulp_exceptions.MissingResource(consumer='consumer_2'))
+        self.assertFalse(report['succeeded'])
+        self.assertEqual(report['summary'], {'total': 2, 'succeeded': 1, 'failed': 1})
+        self.assertEqual(report['consumers']['consumer_1']['details'], 'details')
+        exception = report['consumers']['consumer_2']['exception']
+        self.assertEqual(exception['type'], 'MissingResource')
+
+    def test_run(self):
+        def call(consumer_id):
+            if consumer_id == 'consumer_3':
+                raise ValueError(consumer_id)
+            return consumer_id.upper()
+        calls = [('consumer_%d' % i, call, ('consumer_%d' % i,)) for i in range(10)]
+        report = FanOut(4).run(GroupReport(), calls)
+        self.assertEqual(report['summary'], {'total': 10, 'succeeded': 9, 'failed': 1})
+        self.assertEqual(report['consumers']['consumer_0']['details'], 'CONSUMER_0')
+        self.assertEqual(report['consumers']['consumer_3']['exception']['type'], 'ValueError')
+
+    def test_concurrency_bounded(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+        def call():
+            lock.acquire()
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+            lock.release()
+            time.sleep(0.01)
+            lock.acquire()
+            state['running'] -= 1
+            lock.release()
+        calls = [('consumer_%d' % i, call, ()) for i in range(20)]
+        report = FanOut(3).run(GroupReport(), calls)
+        self.assertTrue(report['succeeded'])
+        self.assertTrue(1 < state['peak'] <= 3)
+
+
+class ConsumerGroupOperationTests(ConsumerGroupTests):
+
+    GROUP_ID = 'operation_group'
+    CONSUMER_IDS = ['consumer_1', 'consumer_2', 'consumer_3']
+    REPO_ID = 'test-repo'
+    DISTRIBUTOR_ID = 'mock-distributor'
+
+    def setUp(self):
+        super(ConsumerGroupOperationTests, self).setUp()
+        plugin_api._create_manager()
+        mock_plugins.install()
+        mock_agent.install()
+        manager = managers_factory.repo_manager()
+        manager.create_repo(self.REPO_ID)
+        manager = managers_factory.repo_distributor_manager()
+        manager.add_distributor(self.REPO_ID, 'mock-distributor', {}, True,
+                                distributor_id=self.DISTRIBUTOR_ID)
+        for consumer_id in self.CONSUMER_IDS:
+            self._create_consumer(consumer_id)
+        self.manager.create_consumer_group(self.GROUP_ID, consumer_ids=self.CONSUMER_IDS)
+
+    def tearDown(self):
+        super(ConsumerGroupOperationTests, self).tearDown()
+        Repo.get_collection().remove(safe=True)
+        RepoDistributor.get_collection().remove(safe=True)
+        Bind.get_collection().remove(safe=True)
+        mock_plugins.reset()
+
+    def test_install_content(self):
+        units = [{'type_id': 'mock-type', 'unit_key': {'name': 'zsh'}}]
+        options = {'importkeys': True}
+        report = self.manager.install_content(self.GROUP_ID, units, options)
+        self.assertTrue(report['succeeded'])
+        self.assertEqual(sorted(report['consumers'].keys()), self.CONSUMER_IDS)
+        self.assertEqual(mock_agent.Content.install.call_count, 3)
+        args = mock_agent.Content.install.call_args[0]
+        self.assertEqual(args[0], units)
+        self.assertEqual(args[1], options)
+        profiler = plugin_api.get_profiler_by_type('mock-type')[0]
+        consumer_ids = [c[0][0].id for c in profiler.install_units.call_args_list]
+        self.assertEqual(sorted(consumer_ids), self.CONSUMER_IDS)
+
+    def test_uninstall_content_missing_consumer(self):
+        Consumer.get_collection().remove({'id': 'consumer_2'}, safe=True)
+        units = [{'type_id': 'mock-type', 'unit_key': {'name': 'zsh'}}]
+        report = self.manager.uninstall_content(self.GROUP_ID, units, {})
+        self.assertFalse(report['succeeded'])
+        self.assertEqual(report['summary'], {'total': 3, 'succeeded': 2, 'failed': 1})
+        self.assertFalse(report['consumers']['consumer_2']['succeeded'])
+        self.assertEqual(mock_agent.Content.uninstall.call_count, 2)
+
+    def test_content_missing_group(self):
+        self.assertRaises(pulp_exceptions.MissingResource,
+                          self.manager.update_content, 'missing_group', [], {})
+
+    def test_bind(self):
+        bind_manager = managers_factory.consumer_bind_manager()
+        bind_manager.bind('consumer_1', self.REPO_ID, self.DISTRIBUTOR_ID)
+        report = self.manager.bind(self.GROUP_ID, self.REPO_ID, self.DISTRIBUTOR_ID)
+        self.assertTrue(report['succeeded'])
+        self.assertEqual(report['summary']['succeeded'], 3)
+        for consumer_id in self.CONSUMER_IDS:
+            bind = report['consumers'][consumer_id]['details']
+            self.assertEqual(bind['consumer_id'], consumer_id)
+        binds = bind_manager.find_by_distributor(self.REPO_ID, self.DISTRIBUTOR_ID)
+        self.assertEqual(sorted(b['consumer_id'] for b in binds), self.CONSUMER_IDS)
+
+    def test_bind_missing_distributor(self):
+        self.assertRaises(pulp_exceptions.MissingResource,
+                          self.manager.bind, self.GROUP_ID, self.REPO_ID, 'missing')
+        self.assertEqual(Bind.get_collection().find().count(), 0)
+
+    def test_unbind(self):
+        bind_manager = managers_factory.consumer_bind_manager()
+        bind_manager.bind('consumer_1', self.REPO_ID, self.DISTRIBUTOR_ID)
+        bind_manager.bind('consumer_2', self.REPO_ID, self.DISTRIBUTOR_ID)
+        report = self.manager.unbind(self.GROUP_ID, self.REPO_ID, self.DISTRIBUTOR_ID)
+        self.assertTrue(report['succeeded'])
+        self.assertEqual(report['consumers']['consumer_1']['details']['consumer_id'], 'consumer_1')
+        # not bound
+        self.assertEqual(report['consumers']['consumer_3']['details'], None)
+        binds = bind_manager.find_by_distributor(self.REPO_ID, self.DISTRIBUTOR_ID)
+        self.assertEqual(binds, [])
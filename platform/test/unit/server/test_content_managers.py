@@ -18,6 +18,7 @@ import base
 from pulp.plugins.types import database, model
 from pulp.server.db.connection import PulpCollection
 from pulp.server.db.model.criteria import Criteria
+from pulp.server.db.model.repository import RepoContentUnit
 from pulp.server.managers.content.cud import ContentManager
 from pulp.server.managers.content.query import ContentQueryManager
 
@@ -62,6 +63,7 @@ class PulpContentTests(base.PulpServerTests):
     def clean(self):
         super(PulpContentTests, self).clean()
         database.clean()
+        RepoContentUnit.get_collection().remove()
 
 # cud unit tests ---------------------------------------------------------------
 
@@ -73,6 +75,20 @@ class PulpContentCUDTests(PulpContentTests):
         units = self.query_manager.list_content_units(TYPE_1_DEF.id)
         self.assertEqual(len(units), 1)
 
+    def test_add_content_units(self):
+        unit_ids = self.cud_manager.add_content_units(TYPE_1_DEF.id, TYPE_1_UNITS)
+        self.assertEqual(len(unit_ids), len(TYPE_1_UNITS))
+        self.assertEqual(len(set(unit_ids)), len(TYPE_1_UNITS))
+        for unit_id, unit_model in zip(unit_ids, TYPE_1_UNITS):
+            unit = self.query_manager.get_content_unit_by_id(TYPE_1_DEF.id, unit_id)
+            self.assertEqual(unit['key-1'], unit_model['key-1'])
+
+    def test_add_content_units_empty(self):
+        unit_ids = self.cud_manager.add_content_units(TYPE_1_DEF.id, [])
+        self.assertEqual(unit_ids, [])
+        units = self.query_manager.list_content_units(TYPE_1_DEF.id)
+        self.assertEqual(len(units), 0)
+
     def test_update_content_unit(self):
         unit_id = self.cud_manager.add_content_unit(TYPE_1_DEF.id, None, TYPE_1_UNITS[0])
         unit = self.query_manager.get_content_unit_by_id(TYPE_1_DEF.id, unit_id)
@@ -81,6 +97,42 @@ class PulpContentCUDTests(PulpContentTests):
         unit = self.query_manager.get_content_unit_by_id(TYPE_1_DEF.id, unit_id)
         self.assertTrue(unit['search-1'] == 'two')
 
+    @mock.patch('pulp.server.managers.repo.cud.RepoManager.units_updated')
+    def test_update_content_unit_repos(self, mock_units_updated):
+        unit_id = self.cud_manager.add_content_unit(TYPE_1_DEF.id, None, TYPE_1_UNITS[0])
+        association = RepoContentUnit('repo-1', unit_id, TYPE_1_DEF.id, 'importer', 'test')
+        RepoContentUnit.get_collection().save(association, safe=True)
+        self.cud_manager.update_content_unit(TYPE_1_DEF.id, unit_id, {'search-1': 'two'})
+        mock_units_updated.assert_called_once_with(['repo-1'])
+
+    @mock.patch('pulp.server.managers.repo.cud.RepoManager.units_updated')
+    def test_update_content_unit_unchanged(self, mock_units_updated):
+        unit_id = self.cud_manager.add_content_unit(TYPE_1_DEF.id, None, TYPE_1_UNITS[0])
+        association = RepoContentUnit('repo-1', unit_id, TYPE_1_DEF.id, 'importer', 'test')
+        RepoContentUnit.get_collection().save(association, safe=True)
+        self.cud_manager.update_content_unit(TYPE_1_DEF.id, unit_id, {'search-1': 'one'})
+        self.assertEqual(mock_units_updated.call_count, 0)
+
+    @mock.patch('pulp.server.managers.repo.cud.RepoManager.units_updated')
+    def test_update_content_units(self, mock_units_updated):
+        unit_ids = self.cud_manager.add_content_units(TYPE_1_DEF.id, TYPE_1_UNITS)
+        for i, repo_id in enumerate(['repo-1', 'repo-1', 'repo-2']):
+            association = RepoContentUnit(repo_id, unit_ids[i], TYPE_1_DEF.id, 'importer', 'test')
+            RepoContentUnit.get_collection().save(association, safe=True)
+        deltas = {unit_ids[0]: {'search-1': 'two'},
+                  unit_ids[1]: {'search-1': 'three'},
+                  unit_ids[2]: {'search-1': 'two'}}
+        self.cud_manager.update_content_units(TYPE_1_DEF.id, deltas)
+        units = self.query_manager.get_multiple_units_by_ids(TYPE_1_DEF.id, unit_ids)
+        self.assertEqual(sorted(['two', 'three', 'two']), sorted([u['search-1'] for u in units]))
+        # the third unit is unchanged, so only repo-1 is updated, and only once
+        mock_units_updated.assert_called_once_with(['repo-1'])
+
+    @mock.patch('pulp.server.managers.repo.cud.RepoManager.units_updated')
+    def test_update_content_units_empty(self, mock_units_updated):
+        self.cud_manager.update_content_units(TYPE_1_DEF.id, {})
+        self.assertEqual(mock_units_updated.call_count, 0)
+
     def test_delete_content_unit(self):
         unit_id = self.cud_manager.add_content_unit(TYPE_1_DEF.id, None, TYPE_1_UNITS[0])
         units = self.query_manager.list_content_units(TYPE_1_DEF.id)
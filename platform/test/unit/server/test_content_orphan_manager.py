@@ -16,8 +16,10 @@ import shutil
 import string
 import tempfile
 import traceback
+import types
 
 import base
+import mock
 
 from pulp.server import exceptions as pulp_exceptions
 from pulp.plugins.types import database as content_type_db
@@ -171,6 +173,30 @@ class OrphanManagerTests(base.PulpServerTests):
         orphans = self.orphan_manager.list_all_orphans()
         self.assertTrue(len(orphans) == 1)
 
+    def test_generate_orphans_by_type_batches(self):
+        units = [gen_content_unit(PHONY_TYPE_1.id, self.content_root) for i in range(5)]
+        associate_content_unit_with_repo(units[1])
+        associate_content_unit_with_repo(units[3])
+        orphans = self.orphan_manager.generate_orphans_by_type(PHONY_TYPE_1.id, batch_size=2)
+        self.assertTrue(isinstance(orphans, types.GeneratorType))
+        orphan_ids = [o['_id'] for o in orphans]
+        expected_ids = sorted(u['_id'] for i, u in enumerate(units) if i not in (1, 3))
+        self.assertEqual(orphan_ids, expected_ids)
+
+    def test_generate_orphans_with_fields(self):
+        unit = gen_content_unit(PHONY_TYPE_1.id, self.content_root)
+        orphans = list(self.orphan_manager.generate_all_orphans(fields=['_id']))
+        self.assertEqual(len(orphans), 1)
+        self.assertEqual(orphans[0]['_id'], unit['_id'])
+        self.assertFalse('name' in orphans[0])
+
+    def test_get_associated_orphan(self):
+        unit = gen_content_unit(PHONY_TYPE_1.id, self.content_root)
+        associate_content_unit_with_repo(unit)
+        self.assertRaises(pulp_exceptions.MissingResource,
+                          self.orphan_manager.get_orphan,
+                          PHONY_TYPE_1.id, unit['_id'])
+
     # delete test methods ------------------------------------------------------
 
     def test_delete_one_orphan(self):
@@ -197,6 +223,71 @@ class OrphanManagerTests(base.PulpServerTests):
         self.assertFalse(os.path.exists(unit_1['_storage_path']))
         self.assertTrue(os.path.exists(unit_2['_storage_path']))
 
+    def test_delete_by_type_batches(self):
+        self.config.set('database', 'query_batch_size', '2')
+        try:
+            units = [gen_content_unit(PHONY_TYPE_1.id, self.content_root) for i in range(5)]
+            associate_content_unit_with_repo(units[2])
+            self.orphan_manager.delete_orphans_by_type(PHONY_TYPE_1.id)
+        finally:
+            self.config.set('database', 'query_batch_size', '1000')
+        orphans = self.orphan_manager.list_all_orphans()
+        self.assertEqual(len(orphans), 0)
+        self.assertEqual(self.number_of_files_in_content_root(), 1)
+        self.assertTrue(os.path.exists(units[2]['_storage_path']))
+
+    def test_delete_report(self):
+        unit_1 = gen_content_unit(PHONY_TYPE_1.id, self.content_root)
+        unit_2 = gen_content_unit(PHONY_TYPE_2.id, self.content_root)
+        f = open(unit_1['_storage_path'], 'w')
+        f.write('x' * 10)
+        f.close()
+        report = self.orphan_manager.delete_all_orphans()
+        self.assertFalse(report['dry_run'])
+        self.assertEqual(report['units_removed'], 2)
+        self.assertEqual(report['files_removed'], 2)
+        self.assertEqual(report['bytes_reclaimed'], 10)
+        self.assertEqual(report['errors'], [])
+        self.assertEqual(self.number_of_files_in_content_root(), 0)
+
+    def test_delete_dry_run(self):
+        unit = gen_content_unit(PHONY_TYPE_1.id, self.content_root)
+        f = open(unit['_storage_path'], 'w')
+        f.write('x' * 10)
+        f.close()
+        report = self.orphan_manager.delete_all_orphans(dry_run=True)
+        self.assertTrue(report['dry_run'])
+        self.assertEqual(report['units_removed'], 1)
+        self.assertEqual(report['files_removed'], 1)
+        self.assertEqual(report['bytes_reclaimed'], 10)
+        orphans = self.orphan_manager.list_all_orphans()
+        self.assertEqual(len(orphans), 1)
+        self.assertTrue(os.path.exists(unit['_storage_path']))
+
+    def test_delete_orphaned_files_prunes_parents(self):
+        paths = []
+        for sub_dir in ('a', 'b'):
+            dir_path = os.path.join(self.content_root, 'nested', sub_dir)
+            os.makedirs(dir_path)
+            for name in ('one', 'two'):
+                path = os.path.join(dir_path, name)
+                open(path, 'w').close()
+                paths.append(path)
+        report = self.orphan_manager.delete_orphaned_files(paths, threads=2)
+        self.assertEqual(report['files_removed'], 4)
+        self.assertEqual(report['errors'], [])
+        self.assertFalse(os.path.exists(os.path.join(self.content_root, 'nested')))
+
+    def test_delete_orphaned_files_errors(self):
+        path = os.path.join(self.content_root, 'file')
+        open(path, 'w').close()
+        with mock.patch('os.unlink') as mock_unlink:
+            mock_unlink.side_effect = OSError('boom')
+            report = self.orphan_manager.delete_orphaned_files([path])
+        self.assertEqual(report['files_removed'], 0)
+        self.assertEqual(len(report['errors']), 1)
+        self.assertEqual(report['errors'][0]['path'], path)
+
     def test_delete_by_id(self):
         unit = gen_content_unit(PHONY_TYPE_1.id, self.content_root)
         json_obj = {'content_type_id': unit['_content_type_id'],
@@ -12,6 +12,7 @@
 # have received a copy of GPLv2 along with this software; if not, see
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
+import hashlib
 import os
 import shutil
 
@@ -20,12 +21,17 @@ import mock_plugins
 
 from   pulp.plugins.conduits.upload import UploadConduit
 from   pulp.plugins.model import Repository
+from   pulp.plugins.types import database, model
 from   pulp.server.db.model.auth import User
-from   pulp.server.db.model.repository import Repo, RepoImporter
+from   pulp.server.db.model.repository import Repo, RepoContentUnit, RepoImporter
 from   pulp.server.exceptions import MissingResource, PulpDataException, PulpExecutionException, InvalidValue
 import pulp.server.managers.factory as manager_factory
+from   pulp.server.managers.content import upload
 from   pulp.server.managers.repo.unit_association import OWNER_TYPE_USER
 
+MOCK_TYPE_DEF = model.TypeDefinition('mock-type', 'Mock Type', 'Used by the mock importer',
+                                     ['key-1'], [], [])
+
 class ContentUploadManagerTests(base.PulpServerTests):
 
     def setUp(self):
@@ -50,6 +56,8 @@ class ContentUploadManagerTests(base.PulpServerTests):
         base.PulpServerTests.clean(self)
         Repo.get_collection().remove()
         RepoImporter.get_collection().remove()
+        RepoContentUnit.get_collection().remove()
+        database.clean()
 
     # -- uploading bits functionality -----------------------------------------
 
@@ -102,6 +110,123 @@ class ContentUploadManagerTests(base.PulpServerTests):
 
         self.assertEqual(expected_size, found_size)
 
+    def test_save_data_out_of_order(self):
+
+        # Test
+        upload_id = self.upload_manager.initialize_upload()
+
+        self.upload_manager.save_data(upload_id, 5, 'fghij')
+        self.assertFalse(self.upload_manager.is_upload_complete(upload_id))
+        self.upload_manager.save_data(upload_id, 0, 'abcde')
+
+        # Verify
+        written = self.upload_manager.read_upload(upload_id)
+        self.assertEqual(written, 'abcdefghij')
+        self.assertTrue(self.upload_manager.is_upload_complete(upload_id))
+
+    def test_save_data_preallocated(self):
+
+        # Test
+        upload_id = self.upload_manager.initialize_upload(10)
+
+        # Verify
+        uploaded_filename = self.upload_manager._upload_file_path(upload_id)
+        self.assertEqual(10, os.path.getsize(uploaded_filename))
+        self.assertFalse(self.upload_manager.is_upload_complete(upload_id))
+
+        self.upload_manager.save_data(upload_id, 0, 'abc')
+        self.upload_manager.save_data(upload_id, 6, 'ghij')
+        self.assertFalse(self.upload_manager.is_upload_complete(upload_id))
+
+        self.upload_manager.save_data(upload_id, 3, 'def')
+        self.assertTrue(self.upload_manager.is_upload_complete(upload_id))
+        self.assertEqual(10, os.path.getsize(uploaded_filename))
+        self.assertEqual('abcdefghij', self.upload_manager.read_upload(upload_id))
+
+    def test_save_data_beyond_size(self):
+
+        # Test
+        upload_id = self.upload_manager.initialize_upload(4)
+
+        # Verify
+        self.assertRaises(InvalidValue, self.upload_manager.save_data, upload_id, 2, 'abc')
+
+    def test_save_data_file_in_use_not_evicted(self):
+
+        # Setup
+        upload_id = self.upload_manager.initialize_upload()
+        file_path = self.upload_manager._upload_file_path(upload_id)
+        cache = upload.UploadFileCache(max_open=1)
+        upload_file = cache.acquire(file_path)
+
+        # Test
+        other_id = self.upload_manager.initialize_upload()
+        other_file = cache.acquire(self.upload_manager._upload_file_path(other_id))
+        cache.release(other_file)
+        upload_file.write(0, 'abc')
+
+        # Verify
+        self.assertTrue(cache.acquire(file_path) is upload_file)
+        cache.release(upload_file)
+        cache.release(upload_file)
+        self.assertTrue(other_file.fd is None)
+        self.assertTrue(upload_file.fd is not None)
+        self.assertEqual('abc', self.upload_manager.read_upload(upload_id))
+        cache.discard(file_path)
+
+    def test_discard_file_in_use(self):
+
+        # Setup
+        upload_id = self.upload_manager.initialize_upload()
+        file_path = self.upload_manager._upload_file_path(upload_id)
+        cache = upload.UploadFileCache()
+        upload_file = cache.acquire(file_path)
+
+        # Test
+        cache.discard(file_path)
+        upload_file.write(0, 'abc')
+        cache.release(upload_file)
+
+        # Verify
+        self.assertTrue(upload_file.fd is None)
+        self.assertRaises(ValueError, upload_file.write, 3, 'def')
+        self.assertEqual([[0, 3]], upload.UploadFile.load(file_path).ranges)
+
+    def test_ranges_saved_periodically(self):
+
+        # Setup
+        upload_id = self.upload_manager.initialize_upload()
+        file_path = self.upload_manager._upload_file_path(upload_id)
+
+        # Test
+        for i in range(upload.RANGES_SAVE_INTERVAL - 1):
+            self.upload_manager.save_data(upload_id, i, 'a')
+        saved_before = upload.UploadFile.load(file_path)
+        self.upload_manager.save_data(upload_id, upload.RANGES_SAVE_INTERVAL - 1, 'a')
+        saved_after = upload.UploadFile.load(file_path)
+
+        # Verify
+        saved_before.close()
+        saved_after.close()
+        self.assertEqual([], saved_before.ranges)
+        self.assertEqual([[0, upload.RANGES_SAVE_INTERVAL]], saved_after.ranges)
+
+    def test_received_ranges_reloaded(self):
+
+        # Setup
+        upload_id = self.upload_manager.initialize_upload(6)
+        self.upload_manager.save_data(upload_id, 0, 'abc')
+
+        # Test
+        uploaded_filename = self.upload_manager._upload_file_path(upload_id)
+        upload._UPLOAD_FILES.discard(uploaded_filename)
+        upload_file = upload.UploadFile.load(uploaded_filename)
+        upload_file.close()
+
+        # Verify
+        self.assertEqual(6, upload_file.size)
+        self.assertEqual([[0, 3]], upload_file.ranges)
+
     def test_save_no_init(self):
 
         # Test
@@ -125,6 +250,7 @@ class ContentUploadManagerTests(base.PulpServerTests):
 
         # Verify
         self.assertTrue(not os.path.exists(uploaded_filename))
+        self.assertTrue(not os.path.exists(uploaded_filename + upload.RANGES_FILE_SUFFIX))
 
     def test_list_upload_ids(self):
 
@@ -208,6 +334,20 @@ class ContentUploadManagerTests(base.PulpServerTests):
         mock_plugins.MOCK_IMPORTER.upload_unit.return_value = None
         manager_factory.principal_manager().set_principal(principal=None)
 
+    def test_import_uploaded_unit_incomplete(self):
+        # Setup
+        self.repo_manager.create_repo('repo-u')
+        self.importer_manager.set_importer('repo-u', 'mock-importer', {})
+
+        upload_id = self.upload_manager.initialize_upload(10)
+        self.upload_manager.save_data(upload_id, 0, 'abc')
+
+        # Test
+        self.assertRaises(PulpDataException, self.upload_manager.import_uploaded_unit, 'repo-u', 'mock-type', {}, {}, upload_id)
+
+        # Verify
+        self.assertEqual(0, mock_plugins.MOCK_IMPORTER.upload_unit.call_count)
+
     def test_import_uploaded_unit_missing_repo(self):
         # Test
         self.assertRaises(MissingResource, self.upload_manager.import_uploaded_unit, 'fake', 'mock-type', {}, {}, 'irrelevant')
@@ -235,3 +375,113 @@ class ContentUploadManagerTests(base.PulpServerTests):
 
         # Test
         self.assertRaises(InvalidValue, self.upload_manager.import_uploaded_unit, 'repo-u', 'mock-type', {}, {}, upload_id)
+
+    # -- upload pre-flight ----------------------------------------------------
+
+    def _setup_existing_unit(self, unit_metadata):
+        self.repo_manager.create_repo('repo-u')
+        self.importer_manager.set_importer('repo-u', 'mock-importer', {})
+
+        database.update_database([MOCK_TYPE_DEF])
+        unit = {'key-1' : 'unit-1'}
+        unit.update(unit_metadata)
+        manager_factory.content_manager().add_content_unit('mock-type', 'unit-1', unit)
+
+        manager_factory.principal_manager().set_principal(principal=User('import-user', ''))
+
+    def test_find_existing_unit_checksum_field(self):
+        # Setup
+        self._setup_existing_unit({'checksum' : 'ABC123', 'checksumtype' : 'sha256'})
+
+        # Test
+        unit = self.upload_manager.find_existing_unit('mock-type', {'key-1' : 'unit-1'}, 'sha256', 'abc123')
+
+        # Verify
+        self.assertEqual('unit-1', unit['_id'])
+        # the lookup does not associate the unit
+        self.assertEqual(0, RepoContentUnit.get_collection().find({'repo_id' : 'repo-u'}).count())
+
+        manager_factory.principal_manager().set_principal(principal=None)
+
+    def test_find_existing_unit_storage_path(self):
+        # Setup
+        test_rpm_filename = os.path.abspath(os.path.dirname(__file__)) + '/../data/pulp-test-package-0.3.1-1.fc11.x86_64.rpm'
+        self._setup_existing_unit({'_storage_path' : test_rpm_filename,
+                                   'checksum' : 'irrelevant', 'checksumtype' : 'md5'})
+
+        f = open(test_rpm_filename)
+        checksum = hashlib.sha1(f.read()).hexdigest()
+        f.close()
+
+        # Test
+        unit = self.upload_manager.find_existing_unit('mock-type', {'key-1' : 'unit-1'}, 'sha1', checksum)
+
+        # Verify
+        self.assertEqual('unit-1', unit['_id'])
+
+        manager_factory.principal_manager().set_principal(principal=None)
+
+    def test_find_existing_unit_checksum_mismatch(self):
+        # Setup
+        self._setup_existing_unit({'checksum' : 'abc123', 'checksumtype' : 'sha256'})
+
+        # Test
+        unit = self.upload_manager.find_existing_unit('mock-type', {'key-1' : 'unit-1'}, 'sha256', 'def456')
+
+        # Verify
+        self.assertTrue(unit is None)
+
+        manager_factory.principal_manager().set_principal(principal=None)
+
+    def test_find_existing_unit_missing_unit(self):
+        # Setup
+        self._setup_existing_unit({'checksum' : 'abc123', 'checksumtype' : 'sha256'})
+
+        # Test
+        unit = self.upload_manager.find_existing_unit('mock-type', {'key-1' : 'unit-2'}, 'sha256', 'abc123')
+
+        # Verify
+        self.assertTrue(unit is None)
+
+        manager_factory.principal_manager().set_principal(principal=None)
+
+    def test_find_existing_unit_unsupported_checksum_type(self):
+        # Setup
+        test_rpm_filename = os.path.abspath(os.path.dirname(__file__)) + '/../data/pulp-test-package-0.3.1-1.fc11.x86_64.rpm'
+        self._setup_existing_unit({'_storage_path' : test_rpm_filename})
+
+        # Test
+        self.assertRaises(InvalidValue, self.upload_manager.find_existing_unit, 'mock-type',
+                          {'key-1' : 'unit-1'}, 'fake-type', 'abc123')
+
+        manager_factory.principal_manager().set_principal(principal=None)
+
+    def test_import_existing_unit(self):
+        # Setup
+        self._setup_existing_unit({'checksum' : 'abc123', 'checksumtype' : 'sha256'})
+
+        # Test
+        self.upload_manager.import_existing_unit('repo-u', 'mock-type', {'key-1' : 'unit-1'},
+                                                 'sha256', 'abc123')
+
+        # Verify
+        associations = list(RepoContentUnit.get_collection().find({'repo_id' : 'repo-u'}))
+        self.assertEqual(1, len(associations))
+        self.assertEqual('unit-1', associations[0]['unit_id'])
+        self.assertEqual(OWNER_TYPE_USER, associations[0]['owner_type'])
+        self.assertEqual('import-user', associations[0]['owner_id'])
+
+        manager_factory.principal_manager().set_principal(principal=None)
+
+    def test_import_existing_unit_removed(self):
+        # Setup
+        self._setup_existing_unit({'checksum' : 'abc123', 'checksumtype' : 'sha256'})
+
+        # Test
+        self.assertRaises(MissingResource, self.upload_manager.import_existing_unit, 'repo-u', 'mock-type',
+                          {'key-1' : 'unit-2'}, 'sha256', 'abc123')
+
+        # Verify
+        self.assertEqual(0, RepoContentUnit.get_collection().find({'repo_id' : 'repo-u'}).count())
+
+        manager_factory.principal_manager().set_principal(principal=None)
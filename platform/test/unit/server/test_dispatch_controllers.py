@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import threading
+
+import mock
+
+import base
+
+from pulp.server.exceptions import InvalidValue
+from pulp.server.webservices.controllers import dispatch as dispatch_controllers
+
+# long polling tests -----------------------------------------------------------
+
+class WaitForChangeTests(base.PulpServerTests):
+
+    def setUp(self):
+        super(WaitForChangeTests, self).setUp()
+        self.coordinator = mock.Mock()
+        self.coordinator_patch = mock.patch('pulp.server.dispatch.factory.coordinator',
+                                            return_value=self.coordinator)
+        self.coordinator_patch.start()
+        dispatch_controllers._LONG_POLL_SEMAPHORE = threading.BoundedSemaphore(1)
+
+    def tearDown(self):
+        super(WaitForChangeTests, self).tearDown()
+        self.coordinator_patch.stop()
+        dispatch_controllers._LONG_POLL_SEMAPHORE = None
+
+    def controller(self, **filters):
+        controller = mock.Mock()
+        controller.filters.return_value = dict((k, [v]) for k, v in filters.items())
+        return controller
+
+    def test_no_wait(self):
+        dispatch_controllers._wait_for_change(self.controller(), call_request_id='call')
+        self.assertEqual(self.coordinator.wait_for_call_reports.call_count, 0)
+
+    def test_wait(self):
+        controller = self.controller(wait='5', state='running')
+        dispatch_controllers._wait_for_change(controller, call_request_id='call')
+        self.coordinator.wait_for_call_reports.assert_called_once_with(5.0, 'running', call_request_id='call')
+
+    def test_wait_limited(self):
+        long_poll_timeout = self.config.getfloat('tasks', 'long_poll_timeout')
+        controller = self.controller(wait=str(long_poll_timeout + 100))
+        dispatch_controllers._wait_for_change(controller, call_request_group_id='group')
+        self.coordinator.wait_for_call_reports.assert_called_once_with(long_poll_timeout, None,
+                                                                       call_request_group_id='group')
+
+    def test_invalid_wait(self):
+        for wait in ('soon', '-1'):
+            self.assertRaises(InvalidValue, dispatch_controllers._wait_for_change,
+                              self.controller(wait=wait), call_request_id='call')
+
+    def test_max_waiters(self):
+        semaphore = dispatch_controllers._LONG_POLL_SEMAPHORE
+        semaphore.acquire()
+        try:
+            dispatch_controllers._wait_for_change(self.controller(wait='5'), call_request_id='call')
+        finally:
+            semaphore.release()
+        self.assertEqual(self.coordinator.wait_for_call_reports.call_count, 0)
+        # the waiter's slot is released once it is done
+        dispatch_controllers._wait_for_change(self.controller(wait='5'), call_request_id='call')
+        dispatch_controllers._wait_for_change(self.controller(wait='5'), call_request_id='call')
+        self.assertEqual(self.coordinator.wait_for_call_reports.call_count, 2)
@@ -12,6 +12,8 @@
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
 import datetime
+import threading
+import time
 import traceback
 import unittest
 
@@ -25,6 +27,7 @@ from pulp.server.dispatch import constants as dispatch_constants
 from pulp.server.dispatch import call
 from pulp.server.dispatch import coordinator
 from pulp.server.dispatch import factory as dispatch_factory
+from pulp.server.dispatch import task as dispatch_task
 from pulp.server.dispatch.task import Task
 from pulp.server.exceptions import OperationTimedOut
 from pulp.server.util import CycleExists, topological_sort
@@ -206,7 +209,7 @@ class CoordinatorCollisionDetectionTests(CoordinatorTests):
 
         call_resources = coordinator.resource_dict_to_call_resources(resources)
         coordinator.set_call_request_id_on_call_resources(task_id, call_resources)
-        self.collection.insert(call_resources, safe=True)
+        self.coordinator._lock_resources(call_resources)
 
         response, blockers, reasons, call_resources = self.coordinator._find_conflicts(resources)
 
@@ -229,7 +232,7 @@ class CoordinatorCollisionDetectionTests(CoordinatorTests):
         }
         existing_task_resources = coordinator.resource_dict_to_call_resources(existing_resources)
         coordinator.set_call_request_id_on_call_resources(task_id, existing_task_resources)
-        self.collection.insert(existing_task_resources, safe=True)
+        self.coordinator._lock_resources(existing_task_resources)
 
         # delete on content unit is postponed by read
 
@@ -276,8 +279,8 @@ class CoordinatorCollisionDetectionTests(CoordinatorTests):
         task_2_resources = coordinator.resource_dict_to_call_resources(bind_2_resources)
         coordinator.set_call_request_id_on_call_resources(call_2_id, task_2_resources)
 
-        self.collection.insert(task_1_resources, safe=True)
-        self.collection.insert(task_2_resources, safe=True)
+        self.coordinator._lock_resources(task_1_resources)
+        self.coordinator._lock_resources(task_2_resources)
 
         # deleting the repository should be postponed by both binds
 
@@ -305,7 +308,7 @@ class CoordinatorCollisionDetectionTests(CoordinatorTests):
         }
         deletion_task_resources = coordinator.resource_dict_to_call_resources(deletion_resources)
         coordinator.set_call_request_id_on_call_resources(task_id, deletion_task_resources)
-        self.collection.insert(deletion_task_resources, safe=True)
+        self.coordinator._lock_resources(deletion_task_resources)
 
         # a cds sync should be rejected by the deletion
 
@@ -324,6 +327,77 @@ class CoordinatorCollisionDetectionTests(CoordinatorTests):
         self.assertTrue(task_id in blockers)
         self.assertTrue(reasons)
 
+    def test_unlocked_resources(self):
+        task_id = 'cds_deletion'
+        cds_id = 'less_than_awesome_cds'
+        deletion_resources = {
+            dispatch_constants.RESOURCE_CDS_TYPE: {
+                cds_id: dispatch_constants.RESOURCE_DELETE_OPERATION
+            }
+        }
+        deletion_task_resources = coordinator.resource_dict_to_call_resources(deletion_resources)
+        coordinator.set_call_request_id_on_call_resources(task_id, deletion_task_resources)
+        self.coordinator._lock_resources(deletion_task_resources)
+        self.coordinator._unlock_resources(task_id)
+
+        # the deletion no longer rejects a cds sync once it has been dequeued
+
+        resources = {
+            dispatch_constants.RESOURCE_CDS_TYPE: {
+                cds_id: dispatch_constants.RESOURCE_UPDATE_OPERATION
+            }
+        }
+
+        response, blockers, reasons, call_resources = self.coordinator._find_conflicts(resources)
+
+        self.assertTrue(response is dispatch_constants.CALL_ACCEPTED_RESPONSE)
+        self.assertFalse(blockers)
+        self.assertFalse(reasons)
+
+# resource index tests ---------------------------------------------------------
+
+class CoordinatorResourceIndexTests(CoordinatorTests):
+
+    def setUp(self):
+        super(CoordinatorResourceIndexTests, self).setUp()
+        self.resources = {
+            dispatch_constants.RESOURCE_REPOSITORY_TYPE: {
+                'my_repo': dispatch_constants.RESOURCE_UPDATE_OPERATION
+            },
+            dispatch_constants.RESOURCE_CONTENT_UNIT_TYPE: {
+                'my_content_unit': dispatch_constants.RESOURCE_READ_OPERATION
+            }
+        }
+
+    def lock_resources(self, call_request_id):
+        call_resources = coordinator.resource_dict_to_call_resources(self.resources)
+        coordinator.set_call_request_id_on_call_resources(call_request_id, call_resources)
+        self.coordinator._lock_resources(call_resources)
+
+    def test_start_restores_index(self):
+        # the index is not persisted; queuing interrupted calls again rebuilds it
+        call_request = call.CallRequest(dummy_call, resources=self.resources)
+        QueuedCall.get_collection().insert({'serialized_call_request': 'call_request',
+                                            'timestamp': datetime.datetime.now()}, safe=True)
+        with mock.patch.object(coordinator.CallRequest, 'deserialize', return_value=call_request):
+            self.coordinator.start()
+        response, blockers, reasons, call_resources = self.coordinator._find_conflicts(self.resources)
+        self.assertTrue(response is dispatch_constants.CALL_POSTPONED_RESPONSE)
+        self.assertEqual(blockers, set([call_request.id]))
+
+    def test_dequeue_callback(self):
+        self.lock_resources('task_1')
+        call_request = call.CallRequest(dummy_call)
+        call_request.id = 'task_1'
+        self._coordinator = dispatch_factory._COORDINATOR
+        dispatch_factory._COORDINATOR = self.coordinator
+        try:
+            coordinator.coordinator_dequeue_callback(call_request, None)
+        finally:
+            dispatch_factory._COORDINATOR = self._coordinator
+        response, blockers, reasons, call_resources = self.coordinator._find_conflicts(self.resources)
+        self.assertTrue(response is dispatch_constants.CALL_ACCEPTED_RESPONSE)
+
 # call execution tests ---------------------------------------------------------
 
 def dummy_call(progress, success, failure):
@@ -544,3 +618,90 @@ class CoordinatorFindCallReportsTests(CoordinatorTests):
         self.assertEqual(len(call_report_list), 1)
         self.assertEqual(call_report_list[0].schedule_id, schedule_id)
 
+
+# coordinator wait tests -------------------------------------------------------
+
+class CoordinatorWaitForCallReportsTests(CoordinatorFindCallReportsTests):
+
+    def setUp(self):
+        super(CoordinatorWaitForCallReportsTests, self).setUp()
+        self.task = Task(call.CallRequest(find_dummy_call))
+        self.set_task_queue([self.task])
+
+    def change_later(self, change, delay=0.1):
+        thread = threading.Timer(delay, change)
+        thread.start()
+        return thread
+
+    def test_timeout(self):
+        start = time.time()
+        call_reports = self.coordinator.wait_for_call_reports(0.2, call_request_id=self.task.call_request.id)
+        self.assertTrue(time.time() - start >= 0.2)
+        self.assertEqual(len(call_reports), 1)
+        self.assertEqual(call_reports[0].state, dispatch_constants.CALL_WAITING_STATE)
+
+    def test_no_tasks(self):
+        start = time.time()
+        call_reports = self.coordinator.wait_for_call_reports(10, call_request_id=str(ObjectId()))
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(call_reports, [])
+
+    def test_complete(self):
+        self.task._set_state(dispatch_constants.CALL_FINISHED_STATE)
+        start = time.time()
+        call_reports = self.coordinator.wait_for_call_reports(10, call_request_id=self.task.call_request.id)
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(call_reports[0].state, dispatch_constants.CALL_FINISHED_STATE)
+
+    def test_known_state_changed(self):
+        start = time.time()
+        call_reports = self.coordinator.wait_for_call_reports(
+            10, dispatch_constants.CALL_RUNNING_STATE, call_request_id=self.task.call_request.id)
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(call_reports[0].state, dispatch_constants.CALL_WAITING_STATE)
+
+    def test_state_change(self):
+        thread = self.change_later(lambda: self.task._set_state(dispatch_constants.CALL_RUNNING_STATE))
+        start = time.time()
+        call_reports = self.coordinator.wait_for_call_reports(
+            10, dispatch_constants.CALL_WAITING_STATE, call_request_id=self.task.call_request.id)
+        thread.join()
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(call_reports[0].state, dispatch_constants.CALL_RUNNING_STATE)
+
+    def test_progress(self):
+        thread = self.change_later(lambda: self.task._report_progress({'step': 1}))
+        start = time.time()
+        call_reports = self.coordinator.wait_for_call_reports(10, call_request_id=self.task.call_request.id)
+        thread.join()
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(call_reports[0].progress, {'step': 1})
+
+    def test_other_task_changed(self):
+        other = Task(call.CallRequest(find_dummy_call))
+        thread = self.change_later(lambda: other._report_progress({'step': 1}))
+        start = time.time()
+        self.coordinator.wait_for_call_reports(0.5, call_request_id=self.task.call_request.id)
+        thread.join()
+        self.assertTrue(time.time() - start >= 0.5)
+
+
+class WaitForTaskChangeTests(unittest.TestCase):
+
+    def test_timeout(self):
+        count = dispatch_task.change_count()
+        self.assertFalse(dispatch_task.wait_for_change(count, 0.1))
+
+    def test_changed(self):
+        count = dispatch_task.change_count()
+        Task(call.CallRequest(find_dummy_call))._report_progress({})
+        self.assertTrue(dispatch_task.wait_for_change(count, 0))
+
+    def test_wait_for_task_woken(self):
+        task = Task(call.CallRequest(find_dummy_call))
+        thread = threading.Timer(0.1, task._set_state, [dispatch_constants.CALL_FINISHED_STATE])
+        thread.start()
+        start = time.time()
+        coordinator.wait_for_task(task, [dispatch_constants.CALL_FINISHED_STATE], poll_interval=10)
+        thread.join()
+        self.assertTrue(time.time() - start < 5)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import threading
+import time
+import unittest
+
+import mock
+
+from pulp.server.dispatch.pool import WorkerPool
+
+# worker pool tests ------------------------------------------------------------
+
+class WorkerPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        super(WorkerPoolTests, self).setUp()
+        self.pool = WorkerPool(2)
+        self.events = []
+
+    def tearDown(self):
+        super(WorkerPoolTests, self).tearDown()
+        for event in self.events:
+            event.set()
+        self.pool.stop()
+        self.pool = None
+
+    def gen_blocking_call(self):
+        started = threading.Event()
+        release = threading.Event()
+        self.events.append(release)
+
+        def _call():
+            started.set()
+            release.wait(5.0)
+
+        return _call, started, release
+
+    def wait_for_completed(self, count, interval=0.05, timeout=1.0):
+        elapsed = 0.0
+        while self.pool.stats()['completed'] < count:
+            time.sleep(interval)
+            elapsed += interval
+            if elapsed < timeout:
+                continue
+            self.fail('Worker pool failed to complete %d calls after %.2f seconds' % (count, timeout))
+
+    def test_submit(self):
+        call = mock.Mock()
+        self.pool.submit(call, 'arg', kwarg='kwarg')
+        self.wait_for_completed(1)
+        call.assert_called_once_with('arg', kwarg='kwarg')
+
+    def test_thread_reuse(self):
+        threads = set()
+
+        def _call():
+            threads.add(threading.currentThread())
+
+        for i in range(20):
+            self.pool.submit(_call)
+        self.wait_for_completed(20)
+        self.assertTrue(len(threads) <= 2)
+        self.assertTrue(self.pool.stats()['workers'] <= 2)
+
+    def test_queued_when_busy(self):
+        call_1, started_1, release_1 = self.gen_blocking_call()
+        call_2, started_2, release_2 = self.gen_blocking_call()
+        call_3 = mock.Mock()
+        self.pool.submit(call_1)
+        self.pool.submit(call_2)
+        started_1.wait(1.0)
+        started_2.wait(1.0)
+        self.pool.submit(call_3)
+        self.assertEqual(self.pool.available(), 0)
+        stats = self.pool.stats()
+        self.assertEqual(stats['busy_workers'], 2)
+        self.assertEqual(stats['queued'], 1)
+        self.assertEqual(stats['peak_busy_workers'], 2)
+        release_1.set()
+        self.wait_for_completed(2)
+        self.assertEqual(call_3.call_count, 1)
+
+    def test_exception(self):
+        call = mock.Mock(side_effect=Exception())
+        self.pool.submit(call)
+        self.pool.submit(call)
+        self.wait_for_completed(2)
+        self.assertEqual(self.pool.stats()['busy_workers'], 0)
+
+    def test_idle_callback(self):
+        self.pool.idle_callback = mock.Mock()
+        self.pool.submit(mock.Mock())
+        self.wait_for_completed(1)
+        time.sleep(0.1)
+        self.assertEqual(self.pool.idle_callback.call_count, 1)
+
+    def test_stats(self):
+        self.pool.submit(mock.Mock())
+        self.wait_for_completed(1)
+        stats = self.pool.stats()
+        self.assertEqual(stats['max_workers'], 2)
+        self.assertEqual(stats['submitted'], 1)
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['queued'], 0)
+        self.assertTrue(0.0 <= stats['utilization'] <= 1.0)
+
+    def test_stop(self):
+        self.pool.submit(mock.Mock())
+        self.pool.stop()
+        self.assertRaises(AssertionError, self.pool.submit, mock.Mock())
+
+    def test_run_all(self):
+        threads = set()
+        results = []
+        lock = threading.Lock()
+
+        def _call(item):
+            lock.acquire()
+            try:
+                threads.add(threading.currentThread())
+                results.append(item)
+            finally:
+                lock.release()
+
+        WorkerPool.run_all(2, _call, range(10))
+        self.assertEqual(range(10), sorted(results))
+        self.assertFalse(threading.currentThread() in threads)
+
+    def test_run_all_inline(self):
+        threads = []
+        WorkerPool.run_all(2, lambda i: threads.append(threading.currentThread()), [1])
+        WorkerPool.run_all(1, lambda i: threads.append(threading.currentThread()), [2, 3])
+        self.assertEqual([threading.currentThread()] * 3, threads)
+
+    def test_run_all_exception(self):
+        results = []
+
+        def _call(item):
+            if item == 0:
+                raise ValueError(item)
+            results.append(item)
+
+        self.assertRaises(ValueError, WorkerPool.run_all, 2, _call, range(4))
+        self.assertTrue(len(results) <= 3)
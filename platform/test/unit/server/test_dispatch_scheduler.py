@@ -261,6 +261,107 @@ class SchedulerSchedulingTests(SchedulerTests):
         # generator
         self.assertRaises(StopIteration, next, call_group_generator)
 
+# next run heap tests ----------------------------------------------------------
+
+class SchedulerNextRunHeapTests(SchedulerTests):
+
+    def setUp(self):
+        super(SchedulerNextRunHeapTests, self).setUp()
+        self.mocked_coordinator = mock.Mock()
+        self.mocked_coordinator.find_call_reports = mock.Mock(return_value=[])
+        itinerary_call_report = CallReport()
+        itinerary_call_report.result = [CallRequest(dummy_call)]
+        self.mocked_coordinator.execute_call_synchronously = mock.Mock(return_value=itinerary_call_report)
+        dispatch_factory.coordinator = mock.Mock(return_value=self.mocked_coordinator)
+
+    def test_empty(self):
+        self.assertTrue(self.scheduler._dispatch_timeout() is None)
+        self.assertEqual(list(self.scheduler._get_scheduled_call_groups()), [])
+
+    def test_add_remove(self):
+        call_request = CallRequest(itinerary_call)
+        schedule_id = self.scheduler.add(call_request, DISPATCH_FUTURE_SCHEDULE)
+        timeout = self.scheduler._dispatch_timeout()
+        self.assertFalse(timeout is None)
+        self.assertTrue(timeout > 0)
+        self.scheduler.remove(schedule_id)
+        self.assertTrue(self.scheduler._dispatch_timeout() is None)
+
+    def test_due(self):
+        call_request = CallRequest(itinerary_call)
+        schedule_id = self.scheduler.add(call_request, DISPATCH_SCHEDULE)
+        self.scheduler.add(CallRequest(itinerary_call), DISPATCH_FUTURE_SCHEDULE)
+        self.assertEqual(self.scheduler._dispatch_timeout(), 0.0)
+        call_groups = list(self.scheduler._get_scheduled_call_groups())
+        self.assertEqual(len(call_groups), 1)
+        self.assertEqual(call_groups[0][0].schedule_id, schedule_id)
+        self.assertEqual(self.mocked_coordinator.find_call_reports.call_count, 1)
+
+    def test_not_due(self):
+        self.scheduler.add(CallRequest(itinerary_call), DISPATCH_FUTURE_SCHEDULE)
+        call_groups = list(self.scheduler._get_scheduled_call_groups())
+        self.assertEqual(call_groups, [])
+        self.assertEqual(self.mocked_coordinator.execute_call_synchronously.call_count, 0)
+
+    def test_update_next_runs(self):
+        schedule_id_1 = self.scheduler.add(CallRequest(itinerary_call), DISPATCH_SCHEDULE)
+        schedule_id_2 = self.scheduler.add(CallRequest(itinerary_call), DISPATCH_SCHEDULE)
+        self.scheduled_call_collection.update({'_id': ObjectId(schedule_id_2)},
+                                              {'$set': {'remaining_runs': 0}}, safe=True)
+        scheduled_calls = list(self.scheduled_call_collection.find())
+        self.scheduler.update_next_runs(scheduled_calls)
+        self.assertFalse(self.scheduled_call_collection.find_one({'_id': ObjectId(schedule_id_1)}) is None)
+        self.assertTrue(self.scheduled_call_collection.find_one({'_id': ObjectId(schedule_id_2)}) is None)
+
+    def test_disabled_past_due_deferred(self):
+        self.scheduler.add(CallRequest(itinerary_call), DISPATCH_SCHEDULE, enabled=False)
+        self.assertEqual(self.scheduler._dispatch_timeout(), 0.0)
+        self.assertEqual(list(self.scheduler._get_scheduled_call_groups()), [])
+        timeout = self.scheduler._dispatch_timeout()
+        self.assertTrue(timeout > self.scheduler.dispatch_interval - 5, timeout)
+        self.assertEqual(self.mocked_coordinator.find_call_reports.call_count, 1)
+
+    def test_running_past_due_deferred(self):
+        schedule_id = self.scheduler.add(CallRequest(itinerary_call), DISPATCH_SCHEDULE)
+        call_report = CallReport.from_call_request(CallRequest(dummy_call))
+        call_report.schedule_id = schedule_id
+        self.mocked_coordinator.find_call_reports.return_value = [call_report]
+        for i in range(3):
+            self.assertEqual(list(self.scheduler._get_scheduled_call_groups()), [])
+            self.assertTrue(self.scheduler._dispatch_timeout() > 0)
+        # only the first pass found the scheduled call due
+        self.assertEqual(self.mocked_coordinator.find_call_reports.call_count, 1)
+        self.assertFalse(schedule_id in self.scheduler.lateness_stats())
+        self.assertEqual(len(self.scheduler._Scheduler__next_run_heap), 1)
+
+    def test_heap_entries_not_duplicated(self):
+        schedule_id = ObjectId()
+        next_run = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        for i in range(10):
+            self.scheduler._set_next_run(schedule_id, next_run)
+        self.assertEqual(len(self.scheduler._Scheduler__next_run_heap), 1)
+        for i in range(10):
+            self.scheduler._set_next_run(schedule_id, next_run + datetime.timedelta(minutes=i))
+        self.assertTrue(len(self.scheduler._Scheduler__next_run_heap) <= 2)
+
+    def test_load_next_runs(self):
+        self.scheduler.add(CallRequest(itinerary_call), DISPATCH_FUTURE_SCHEDULE)
+        scheduler = Scheduler()
+        self.assertTrue(scheduler._dispatch_timeout() is None)
+        scheduler._load_next_runs()
+        self.assertFalse(scheduler._dispatch_timeout() is None)
+
+    def test_lateness_stats(self):
+        schedule_id = self.scheduler.add(CallRequest(itinerary_call), DISPATCH_SCHEDULE)
+        list(self.scheduler._get_scheduled_call_groups())
+        stats = self.scheduler.lateness_stats()
+        self.assertTrue(schedule_id in stats)
+        self.assertEqual(stats[schedule_id]['runs'], 1)
+        self.assertTrue(stats[schedule_id]['last'] >= 0)
+        self.assertTrue(stats[schedule_id]['max'] >= stats[schedule_id]['last'])
+        self.scheduler.remove(schedule_id)
+        self.assertFalse(schedule_id in self.scheduler.lateness_stats())
+
 # query tests ------------------------------------------------------------------
 
 class SchedulerQueryTests(SchedulerTests):
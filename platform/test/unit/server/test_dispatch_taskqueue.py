@@ -24,6 +24,7 @@ from pulp.server.db.model.dispatch import QueuedCall
 from pulp.server.dispatch import constants as dispatch_constants
 from pulp.server.dispatch import pickling
 from pulp.server.dispatch.call import CallRequest, OBFUSCATED_VALUE
+from pulp.server.dispatch.pool import WorkerPool
 from pulp.server.dispatch.task import AsyncTask, Task
 from pulp.server.dispatch.taskqueue import TaskQueue
 
@@ -43,6 +44,11 @@ def call_with_result(*args, **kwargs):
 def error(*args, **kwargs):
     raise Exception()
 
+RELEASE = threading.Event()
+
+def blocking_call(*args, **kwargs):
+    RELEASE.wait(5.0)
+
 # instantiation testing --------------------------------------------------------
 
 class TaskQueueInstantiationTests(base.PulpServerTests):
@@ -212,6 +218,18 @@ class TaskQueueControlFlowTests(TaskQueueTests):
         self.assertTrue(task_2 in task_list)
         self.assertFalse(task_3 in task_list)
 
+    def test_get_ready_tasks_weighted(self):
+        task_1 = self.gen_task()
+        task_2 = self.gen_task()
+        task_3 = self.gen_task()
+        task_4 = self.gen_task()
+        task_1.call_request.weight = 3 # exceeds the concurrency threshold
+        task_3.call_request.weight = 0
+        for t in (task_1, task_2, task_3, task_4):
+            self.queue.enqueue(t)
+        task_list = self.queue._get_ready_tasks()
+        self.assertEqual(task_list, [task_2, task_3, task_4])
+
     def test_get_ready_tasks_blocking(self):
         task_1 = self.gen_task()
         task_2 = self.gen_task()
@@ -284,6 +302,37 @@ class TaskQueueControlFlowTests(TaskQueueTests):
         self.wait_for_task_to_complete(task_2)
         self.assertEqual(task_2.call_request_exit_state, dispatch_constants.CALL_SKIPPED_STATE)
 
+    def test_run_ready_task_unblocks_dependents(self):
+        task_1 = self.gen_async_task()
+        task_2 = self.gen_task()
+        task_3 = self.gen_task()
+        task_2.call_request.dependencies[task_1.call_request.id] = dispatch_constants.CALL_COMPLETE_STATES
+        task_3.call_request.dependencies[task_1.call_request.id] = dispatch_constants.CALL_COMPLETE_STATES
+        task_3.call_request.dependencies[task_2.call_request.id] = dispatch_constants.CALL_COMPLETE_STATES
+        for t in (task_1, task_2, task_3):
+            self.queue.enqueue(t)
+        self.queue._run_ready_task(task_1)
+        self.wait_for_task_to_start(task_1)
+        task_1._succeeded()
+        self.wait_for_task_to_complete(task_1)
+        task_list = self.queue._get_ready_tasks()
+        self.assertEqual(task_list, [task_2])
+        self.assertEqual(task_3.call_request.dependencies.keys(), [task_2.call_request.id])
+
+    def test_skipped_task_weight(self):
+        task_1 = self.gen_async_task()
+        task_2 = self.gen_task()
+        task_2.call_request.dependencies[task_1.call_request.id] = [dispatch_constants.CALL_FINISHED_STATE]
+        self.queue.enqueue(task_1)
+        self.queue.enqueue(task_2)
+        self.queue._run_ready_task(task_1)
+        self.wait_for_task_to_start(task_1)
+        task_1._failed()
+        self.wait_for_task_to_complete(task_2)
+        self.assertEqual(task_2.call_request_exit_state, dispatch_constants.CALL_SKIPPED_STATE)
+        # the skipped task never ran, so it must not free any weight
+        self.assertEqual(self.queue._TaskQueue__running_weight, 0)
+
     def test_task_dequeue(self):
         task = self.gen_task()
         self.queue.enqueue(task)
@@ -311,6 +360,107 @@ class TaskQueueControlFlowTests(TaskQueueTests):
         self.queue.dequeue(task_1)
         self.assertFalse(task_1.call_request.id in task_2.call_request.dependencies)
 
+# task queue dispatcher tests --------------------------------------------------
+
+class TaskQueueDispatcherTests(TaskQueueTests):
+
+    def setUp(self):
+        super(TaskQueueDispatcherTests, self).setUp()
+        # a long interval ensures that dispatching is driven by queue events
+        self.queue = TaskQueue(2, dispatch_interval=60.0)
+        self.queue.start()
+
+    def tearDown(self):
+        self.queue.stop()
+        super(TaskQueueDispatcherTests, self).tearDown()
+
+    def test_enqueue_wakes_dispatcher(self):
+        task = self.gen_task(call_with_result)
+        self.queue.enqueue(task)
+        self.wait_for_task_to_complete(task)
+        self.assertEqual(CALL_RESULT, task.call_report.result)
+
+    def test_complete_wakes_dispatcher(self):
+        task_1 = self.gen_async_task()
+        task_2 = self.gen_async_task()
+        task_3 = self.gen_task()
+        for t in (task_1, task_2, task_3):
+            self.queue.enqueue(t)
+        self.wait_for_task_to_start(task_1)
+        self.wait_for_task_to_start(task_2)
+        self.assertTrue(task_3 in self.queue.waiting_tasks())
+        task_1._succeeded()
+        self.wait_for_task_to_complete(task_3)
+
+    def test_enqueue_before_dispatcher_waits(self):
+        queue = TaskQueue(2, dispatch_interval=60.0)
+        task = self.gen_task(call_with_result)
+        # hold the lock so the dispatcher thread cannot reach its first wait
+        # before the task is enqueued, e.g. when restarting queued calls
+        queue.lock()
+        try:
+            queue.start()
+            queue.enqueue(task)
+        finally:
+            queue.unlock()
+        try:
+            self.wait_for_task_to_complete(task)
+        finally:
+            queue.stop()
+
+    def test_dependency_chain(self):
+        tasks = [self.gen_task() for i in range(20)]
+        for previous, task in zip(tasks[:-1], tasks[1:]):
+            task.call_request.dependencies[previous.call_request.id] = dispatch_constants.CALL_COMPLETE_STATES
+        self.queue.batch_enqueue(tasks)
+        self.wait_for_task_to_complete(tasks[-1], timeout=5.0)
+        self.assertEqual(self.queue.waiting_tasks(), [])
+        self.assertEqual(self.queue.running_tasks(), [])
+
+# task queue worker pool tests -------------------------------------------------
+
+class TaskQueueWorkerPoolTests(TaskQueueTests):
+
+    def setUp(self):
+        super(TaskQueueWorkerPoolTests, self).setUp()
+        self.worker_pool = WorkerPool(2)
+        self.queue = TaskQueue(2, worker_pool=self.worker_pool)
+
+    def tearDown(self):
+        RELEASE.set()
+        self.worker_pool.stop()
+        super(TaskQueueWorkerPoolTests, self).tearDown()
+
+    def test_enqueue_sets_worker_pool(self):
+        task = self.gen_task()
+        self.queue.enqueue(task)
+        self.assertTrue(task.worker_pool is self.worker_pool)
+        self.assertEqual(self.worker_pool.idle_callback, self.queue._worker_available)
+
+    def test_run_ready_task(self):
+        task = self.gen_task(call_with_result)
+        self.queue.enqueue(task)
+        self.queue._run_ready_task(task)
+        self.wait_for_task_to_complete(task)
+        self.assertEqual(CALL_RESULT, task.call_report.result)
+        self.assertEqual(self.worker_pool.stats()['submitted'], 1)
+
+    def test_get_ready_tasks_available_workers(self):
+        RELEASE.clear()
+        tasks = [self.gen_task(blocking_call) for i in range(3)]
+        for t in tasks:
+            t.call_request.weight = 0
+            self.queue.enqueue(t)
+        task_list = self.queue._get_ready_tasks()
+        self.assertEqual(task_list, tasks[:2])
+        self.queue._run_ready_task(tasks[0])
+        self.wait_for_task_to_start(tasks[0])
+        # the running task occupies one of the two worker threads
+        task_list = self.queue._get_ready_tasks()
+        self.assertEqual(task_list, [tasks[1]])
+        RELEASE.set()
+        self.wait_for_task_to_complete(tasks[0])
+
 # task queue query tests -------------------------------------------------------
 
 class TaskQueueQueryTests(TaskQueueTests):
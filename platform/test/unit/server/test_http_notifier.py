@@ -105,11 +105,25 @@ class TestHTTPNotifierTests(base.PulpAsyncServerTests):
         # Verify
         self.assertEqual(0, mock_create.call_count)
 
+    @mock.patch('pulp.server.event.http._send_post')
+    def test_handle_event_post_pool(self, mock_send):
+        # Test
+        http.handle_event({'url' : 'https://localhost/api/'}, Event('type-1', {}))
+        time.sleep(.5)
+
+        # Verify
+        self.assertEqual(1, mock_send.call_count)
+        stats = http._post_pool().stats()
+        self.assertEqual(http.MAX_CONCURRENT_POSTS, stats['max_workers'])
+        self.assertTrue(stats['completed'] >= 1)
+
     def test_create_configuration(self):
         # Test HTTPS
         conn = http._create_connection('https', 'foo')
         self.assertTrue(isinstance(conn, httplib.HTTPSConnection))
+        self.assertEqual(http.POST_TIMEOUT, conn.timeout)
 
         # Test HTTP
         conn = http._create_connection('http', 'foo')
         self.assertTrue(isinstance(conn, httplib.HTTPConnection))
+        self.assertEqual(http.POST_TIMEOUT, conn.timeout)
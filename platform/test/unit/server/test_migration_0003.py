@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import base
+from pulp.server.db.migrate.models import MigrationModule
+from pulp.server.db.model.consumer import UnitProfile
+
+
+class TestMigration0003(base.PulpServerTests):
+
+    def tearDown(self):
+        super(TestMigration0003, self).tearDown()
+        UnitProfile.get_collection().remove()
+
+    def test_database_integration(self):
+        # make sure the migration works on a live document in mongo
+        profile = {'name':'zsh', 'version':'1.0'}
+        collection = UnitProfile.get_collection()
+        collection.insert({
+            'consumer_id' : 'consumer-1',
+            'content_type' : 'rpm',
+            'profile' : profile,
+        }, safe=True)
+
+        module = MigrationModule('pulp.server.db.migrations.0003_unit_profile_hash')._module
+        module.migrate()
+
+        unit_profile = collection.find_one({'consumer_id':'consumer-1'})
+        self.assertEqual(unit_profile['profile_hash'], UnitProfile.calculate_hash(profile))
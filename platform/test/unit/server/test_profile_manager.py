@@ -85,6 +85,46 @@ class ProfileManagerTests(base.PulpAsyncServerTests):
         profiles = manager.get_profiles(self.CONSUMER_ID)
         self.assertEquals(len(profiles), 0)
 
+    def test_find_profiles(self):
+        # Setup
+        self.populate()
+        # Test
+        manager = factory.consumer_profile_manager()
+        manager.create(self.CONSUMER_ID, self.TYPE_1, self.PROFILE_1)
+        manager.create(self.CONSUMER_ID, self.TYPE_2, self.PROFILE_2)
+        profiles = manager.find_profiles([self.CONSUMER_ID, 'unprofiled'])
+        # Verify
+        self.assertEquals(len(profiles), 2)
+        self.assertEquals(profiles[self.CONSUMER_ID],
+            {self.TYPE_1:self.PROFILE_1, self.TYPE_2:self.PROFILE_2})
+        self.assertEquals(profiles['unprofiled'], {})
+
+    def test_find_profile_hashes(self):
+        # Setup
+        self.populate()
+        # Test
+        manager = factory.consumer_profile_manager()
+        manager.create(self.CONSUMER_ID, self.TYPE_1, self.PROFILE_1)
+        manager.create(self.CONSUMER_ID, self.TYPE_2, self.PROFILE_2)
+        hashes = manager.find_profile_hashes([self.CONSUMER_ID, 'unprofiled'], [self.TYPE_1])
+        # Verify
+        self.assertEquals(len(hashes), 2)
+        self.assertEquals(hashes[self.CONSUMER_ID],
+            {self.TYPE_1:UnitProfile.calculate_hash(self.PROFILE_1)})
+        self.assertEquals(hashes['unprofiled'], {})
+
+    def test_update_hash(self):
+        # Setup
+        self.populate()
+        # Test
+        manager = factory.consumer_profile_manager()
+        manager.create(self.CONSUMER_ID, self.TYPE_1, self.PROFILE_1)
+        manager.update(self.CONSUMER_ID, self.TYPE_1, self.PROFILE_2)
+        # Verify
+        profile = manager.get_profile(self.CONSUMER_ID, self.TYPE_1)
+        self.assertEquals(profile['profile_hash'], UnitProfile.calculate_hash(self.PROFILE_2))
+        self.assertNotEquals(profile['profile_hash'], UnitProfile.calculate_hash(self.PROFILE_1))
+
     def test_get_profile(self):
         # Setup
         self.populate()
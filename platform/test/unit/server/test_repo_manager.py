@@ -510,12 +510,12 @@ class RepoManagerTests(base.PulpAsyncServerTests):
         mock_get_collection.return_value.update = mock_update
 
         ARGS = ('repo-123', 7)
-        EXPECT = ({'id': 'repo-123'}, {'$inc': {'content_unit_count': 7}})
+        EXPECT = ({'id': 'repo-123'}, {'$inc': {'content_unit_count': 7, 'content_version': 1}})
 
         self.manager.update_unit_count(*ARGS)
         #mock_update.assert_called_once_with(*EXPECT, safe=True)
         # if the data passed to mock is a var in this case the test fails.. weird..
-        mock_update.assert_called_once_with({'id': 'repo-123'}, {'$inc': {'content_unit_count': 7}}, safe=True)
+        mock_update.assert_called_once_with({'id': 'repo-123'}, {'$inc': {'content_unit_count': 7, 'content_version': 1}}, safe=True)
 
     def test_update_unit_count_with_db(self):
         """
@@ -528,11 +528,29 @@ class RepoManagerTests(base.PulpAsyncServerTests):
         self.manager.create_repo(REPO_ID)
         repo = Repo.get_collection().find_one({'id' : REPO_ID})
         self.assertEqual(repo['content_unit_count'], 0)
+        self.assertEqual(repo['content_version'], 0)
 
         # increase unit count, verify result
         self.manager.update_unit_count(REPO_ID, 3)
         repo = Repo.get_collection().find_one({'id' : REPO_ID})
         self.assertEqual(repo['content_unit_count'], 3)
+        self.assertEqual(repo['content_version'], 1)
+
+    def test_units_updated(self):
+        self.manager.create_repo('repo-1')
+        self.manager.create_repo('repo-2')
+        self.manager.units_updated(['repo-1'])
+        repo = Repo.get_collection().find_one({'id' : 'repo-1'})
+        self.assertEqual(repo['content_version'], 1)
+        repo = Repo.get_collection().find_one({'id' : 'repo-2'})
+        self.assertEqual(repo['content_version'], 0)
+
+    @mock.patch.object(manager_factory, 'consumer_applicability_manager')
+    def test_units_updated_applicability(self, mock_manager):
+        self.manager.units_updated(['repo-1', 'repo-2'])
+        calls = mock_manager.return_value.repo_content_changed.call_args_list
+        self.assertEqual([c[0][0] for c in calls], ['repo-1', 'repo-2'])
+
 
 
 class UtilityMethodsTests(unittest.TestCase):
@@ -150,3 +150,189 @@ class RepoSyncConduitTests(base.PulpServerTests):
 
         # Test
         self.assertRaises(ImporterConduitException, self.conduit.remove_unit, None)
+
+    def test_save_units(self):
+        """
+        Tests saving multiple units, some new and some existing, in batches.
+        """
+
+        # Setup
+        existing = self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'unit_0'}, {'meta_1' : 'a'}, '/foo/bar')
+        self.conduit.save_unit(existing)
+
+        units = []
+        for i in range(0, 5):
+            unit_key = {'key-1' : 'unit_%d' % i}
+            units.append(self.conduit.init_unit(TYPE_1_DEF.id, unit_key, {'meta_1' : 'b'}, '/foo/bar'))
+        units.append(self.conduit.init_unit(TYPE_2_DEF.id, {'key-2a' : 'a', 'key-2b' : 'b'}, {}, None))
+
+        self.conduit.save_batch_size = 2
+
+        # Test
+        saved = self.conduit.save_units(units)
+
+        # Verify
+        self.assertEqual(6, len(saved))
+        for u in saved:
+            self.assertTrue(u.id is not None)
+        self.assertEqual(existing.id, saved[0].id)
+
+        db_unit = self.query_manager.get_content_unit_by_id(TYPE_1_DEF.id, existing.id)
+        self.assertEqual('b', db_unit['meta_1'])
+
+        associated_units = list(RepoContentUnit.get_collection().find({'repo_id' : 'repo-1'}))
+        self.assertEqual(6, len(associated_units))
+
+        repo = Repo.get_collection().find_one({'id' : 'repo-1'})
+        self.assertEqual(6, repo['content_unit_count'])
+
+        self.assertEqual(6, self.conduit._added_count)
+        self.assertEqual(1, self.conduit._updated_count)
+
+    @mock.patch('pulp.server.managers.repo.cud.RepoManager.units_updated')
+    def test_save_units_updates_in_bulk(self, mock_units_updated):
+        """
+        Tests the content version of the repo is incremented once for all of
+        the updated units in a batch.
+        """
+
+        # Setup
+        existing = []
+        for i in range(0, 3):
+            unit = self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'unit_%d' % i}, {'meta_1' : 'a'}, '/foo/bar')
+            existing.append(self.conduit.save_unit(unit))
+
+        units = []
+        for i in range(0, 3):
+            units.append(self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'unit_%d' % i}, {'meta_1' : 'b'}, '/foo/bar'))
+
+        # Test
+        self.conduit.save_units(units)
+
+        # Verify
+        mock_units_updated.assert_called_once_with(['repo-1'])
+        for unit in existing:
+            db_unit = self.query_manager.get_content_unit_by_id(TYPE_1_DEF.id, unit.id)
+            self.assertEqual('b', db_unit['meta_1'])
+
+    @mock.patch('pulp.server.managers.content.cud.ContentManager.update_content_units')
+    def test_save_units_unchanged(self, mock_update):
+        """
+        Tests existing units whose metadata is unchanged are not written.
+        """
+
+        # Setup
+        existing = self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'unit_0'}, {'meta_1' : 'a'}, '/foo/bar')
+        self.conduit.save_unit(existing)
+        changed = self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'unit_1'}, {'meta_1' : 'a'}, '/foo/bar')
+        self.conduit.save_unit(changed)
+
+        units = [self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'unit_0'}, {'meta_1' : 'a'}, '/foo/bar'),
+                 self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'unit_1'}, {'meta_1' : 'b'}, '/foo/bar')]
+
+        # Test
+        self.conduit.save_units(units)
+
+        # Verify
+        self.assertEqual(1, mock_update.call_count)
+        self.assertEqual([changed.id], mock_update.call_args[0][1].keys())
+        self.assertEqual(existing.id, units[0].id)
+
+    def test_save_units_duplicate_keys(self):
+        """
+        Tests that a unit key appearing twice in one batch results in a single unit.
+        """
+
+        # Setup
+        unit_1 = self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'dupe'}, {'meta_1' : 'a'}, '/foo/bar')
+        unit_2 = self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'dupe'}, {'meta_1' : 'b'}, '/foo/bar')
+
+        # Test
+        self.conduit.save_units([unit_1, unit_2])
+
+        # Verify
+        self.assertEqual(unit_1.id, unit_2.id)
+        units = self.query_manager.list_content_units(TYPE_1_DEF.id)
+        self.assertEqual(1, len(units))
+        self.assertEqual('b', units[0]['meta_1'])
+        self.assertEqual(1, self.conduit._added_count)
+        self.assertEqual(1, self.conduit._updated_count)
+
+    def test_queue_flush_units(self):
+        """
+        Tests queued units are saved when the batch size is reached and when
+        the report is built.
+        """
+
+        # Setup
+        self.conduit.save_batch_size = 3
+
+        # Test
+        for i in range(0, 4):
+            unit = self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'unit_%d' % i}, {}, '/foo/bar')
+            self.conduit.queue_unit(unit)
+
+        # Verify
+        associated_units = list(RepoContentUnit.get_collection().find({'repo_id' : 'repo-1'}))
+        self.assertEqual(3, len(associated_units))
+
+        report = self.conduit.build_success_report('summary', 'details')
+        self.assertEqual(4, report.added_count)
+        associated_units = list(RepoContentUnit.get_collection().find({'repo_id' : 'repo-1'}))
+        self.assertEqual(4, len(associated_units))
+
+    def test_flush_units_with_error(self):
+        """
+        Tests queued units are kept when saving them fails.
+        """
+
+        # Setup
+        unit = self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'unit_1'}, {}, '/foo/bar')
+        self.conduit.queue_unit(unit)
+
+        # Test
+        with mock.patch('pulp.server.managers.factory.repo_unit_association_manager') as mock_factory:
+            mock_factory.return_value.associate_all_by_ids.side_effect = Exception()
+            self.assertRaises(ImporterConduitException, self.conduit.flush_units)
+
+        # Verify
+        flushed = self.conduit.flush_units()
+        self.assertEqual([unit], flushed)
+        associated_units = list(RepoContentUnit.get_collection().find({'repo_id' : 'repo-1'}))
+        self.assertEqual(1, len(associated_units))
+
+    def test_failure_report_flushes_units(self):
+        # Setup
+        unit = self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'unit_1'}, {}, '/foo/bar')
+        self.conduit.queue_unit(unit)
+
+        # Test
+        report = self.conduit.build_failure_report('summary', 'details')
+
+        # Verify
+        self.assertEqual(1, report.added_count)
+        associated_units = list(RepoContentUnit.get_collection().find({'repo_id' : 'repo-1'}))
+        self.assertEqual(1, len(associated_units))
+
+    def test_failure_report_flush_error(self):
+        # Setup
+        unit = self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'unit_1'}, {}, '/foo/bar')
+        self.conduit.queue_unit(unit)
+
+        # Test
+        with mock.patch('pulp.server.managers.factory.repo_unit_association_manager') as mock_factory:
+            mock_factory.return_value.associate_all_by_ids.side_effect = Exception()
+            report = self.conduit.build_failure_report('summary', 'details')
+
+        # Verify
+        self.assertEqual(False, report.success_flag)
+        self.assertEqual([], self.conduit.discard_units())
+
+    def test_save_units_with_error(self):
+        # Setup
+        unit = self.conduit.init_unit(TYPE_1_DEF.id, {'key-1' : 'unit_1'}, {}, '/foo/bar')
+
+        # Test
+        with mock.patch('pulp.server.managers.factory.repo_unit_association_manager') as mock_factory:
+            mock_factory.return_value.associate_all_by_ids.side_effect = Exception()
+            self.assertRaises(ImporterConduitException, self.conduit.save_units, [unit])
@@ -429,6 +429,34 @@ class RepoUnitAssociationManagerTests(base.PulpServerTests):
 
         mock_call.assert_called_once_with(self.repo_id, 2)
 
+    @mock.patch('pulp.server.managers.repo.cud.RepoManager.update_unit_count')
+    def test_associate_all_existing_associations(self, mock_call):
+        """
+        Makes sure units already associated by another owner are associated
+        but not counted and units already associated by the same owner are
+        left alone, across multiple batches.
+        """
+        self.manager.associate_unit_by_id(
+            self.repo_id, 'type-1', 'foo', OWNER_TYPE_USER, 'admin', False)
+        self.manager.associate_unit_by_id(
+            self.repo_id, 'type-1', 'bar', OWNER_TYPE_USER, 'admin2', False)
+
+        IDS = ('foo', 'bar', 'baz', 'qux', 'quux')
+
+        with mock.patch.object(association_manager, 'ASSOCIATION_BATCH_SIZE', 2):
+            self.manager.associate_all_by_ids(
+                self.repo_id, 'type-1', IDS, OWNER_TYPE_USER, 'admin')
+
+        mock_call.assert_called_once_with(self.repo_id, 3)
+
+        repo_units = list(RepoContentUnit.get_collection().find({'repo_id' : self.repo_id, 'owner_id' : 'admin'}))
+        self.assertEqual(len(IDS), len(repo_units))
+        self.assertEqual(set(IDS), set(u['unit_id'] for u in repo_units))
+
+    def test_associate_all_invalid_owner_type(self):
+        # Test
+        self.assertRaises(exceptions.InvalidValue, self.manager.associate_all_by_ids, self.repo_id, 'type-1', ['unit-1'], 'bad-owner', 'irrelevant')
+
     def test_unassociate_all(self):
         """
         Tests unassociating multiple units in a single call.
@@ -13,6 +13,7 @@
 
 import datetime
 import math
+import types
 
 import base
 import mock
@@ -21,6 +22,7 @@ from pulp.common import dateutils
 from pulp.plugins.types import database, model
 from pulp.server.db.model.criteria import Criteria, UnitAssociationCriteria
 from pulp.server.db.model.repository import RepoContentUnit
+import pulp.server.exceptions as exceptions
 import pulp.server.managers.repo.unit_association as association_manager
 from pulp.server.managers.repo.unit_association import OWNER_TYPE_USER, OWNER_TYPE_IMPORTER
 import pulp.server.managers.repo.unit_association_query as association_query_manager
@@ -399,6 +401,111 @@ class UnitAssociationQueryTests(base.PulpServerTests):
             self.assertFalse('created' in u)
             self.assertFalse('updated' in u)
 
+    def test_get_units_metadata_batched(self):
+        # Setup
+        self.config.set('database', 'query_batch_size', '2')
+
+        # Test
+        try:
+            units = self.manager.get_units_across_types('repo-1')
+        finally:
+            self.config.set('database', 'query_batch_size', '1000')
+
+        # Verify
+        self.assertEqual(self.repo_1_count, len(units))
+        for u in units:
+            self._assert_unit_integrity(u)
+        self._assert_default_sort(units)
+
+    def test_merge_unit_metadata_preserves_order(self):
+        # Setup
+        associations = [{'unit_type_id' : 'beta', 'unit_id' : 'bat'},
+                        {'unit_type_id' : 'alpha', 'unit_id' : 'apple'},
+                        {'unit_type_id' : 'beta', 'unit_id' : 'ball'},
+                        {'unit_type_id' : 'alpha', 'unit_id' : 'missing'},
+                        {'unit_type_id' : 'alpha', 'unit_id' : 'aardvark'}]
+
+        # Test
+        self.manager._merge_unit_metadata(associations, batch_size=1)
+
+        # Verify
+        self.assertEqual(['bat', 'apple', 'ball', None, 'aardvark'],
+                         [a['metadata'] and a['metadata']['key_1'] for a in associations])
+
+    def test_merge_unit_metadata_unit_spec(self):
+        # Setup
+        associations = [{'unit_type_id' : 'alpha', 'unit_id' : u} for u in self.units['alpha']]
+
+        # Test
+        self.manager._merge_unit_metadata(associations, unit_spec={'md_2' : 1}, unit_fields=['md_2'])
+
+        # Verify
+        for a in associations:
+            if a['metadata'] is None:
+                continue
+            self.assertEqual(1, a['metadata']['md_2'])
+            self.assertFalse('md_1' in a['metadata'])
+        self.assertEqual(1, len([a for a in associations if a['metadata'] is not None]))
+
+    # -- get_units_iter tests -------------------------------------------------
+
+    def test_get_units_iter_no_criteria(self):
+        # Test
+        units = self.manager.get_units_iter('repo-1', batch_size=2)
+
+        # Verify
+        self.assertTrue(isinstance(units, types.GeneratorType))
+        units = list(units)
+        self.assertEqual(self.repo_1_count, len(units))
+        for u in units:
+            self._assert_unit_integrity(u)
+        self._assert_default_sort(units)
+
+    def test_get_units_iter_matches_get_units(self):
+        # Test
+        sort = [('owner_id', association_manager.SORT_DESCENDING), ('unit_id', association_manager.SORT_ASCENDING)]
+        criteria = UnitAssociationCriteria(association_sort=sort)
+        expected = self.manager.get_units_across_types('repo-1', criteria)
+        criteria = UnitAssociationCriteria(association_sort=sort)
+        units = list(self.manager.get_units_iter('repo-1', criteria, batch_size=3))
+
+        # Verify
+        self.assertEqual([(u['unit_type_id'], u['unit_id']) for u in expected],
+                         [(u['unit_type_id'], u['unit_id']) for u in units])
+
+    def test_get_units_iter_remove_duplicates(self):
+        # Test
+        criteria = UnitAssociationCriteria(remove_duplicates=True)
+        units = list(self.manager.get_units_iter('repo-1', criteria, batch_size=2))
+
+        # Verify
+        self.assertEqual(self.repo_1_count_no_dupes, len(units))
+        non_user_gamma_units = [u for u in units if u['unit_type_id'] == 'gamma' and u['owner_type'] != OWNER_TYPE_USER]
+        self.assertEqual(0, len(non_user_gamma_units))
+
+    def test_get_units_iter_unit_filter_limit_skip(self):
+        # Test
+        criteria = UnitAssociationCriteria(type_ids=['beta'], unit_filters={'md_2' : 0}, skip=1, limit=1)
+        units = list(self.manager.get_units_iter('repo-1', criteria, batch_size=1))
+
+        # Verify
+        self.assertEqual(1, len(units))
+        self.assertEqual(0, units[0]['metadata']['md_2'])
+
+    def test_get_units_iter_limit(self):
+        # Test
+        criteria = UnitAssociationCriteria(limit=2)
+        units = list(self.manager.get_units_iter('repo-1', criteria))
+
+        # Verify
+        self.assertEqual(2, len(units))
+
+    def test_get_units_iter_unit_sort(self):
+        # Test
+        criteria = UnitAssociationCriteria(type_ids=['alpha'], unit_sort=[('md_1', association_manager.SORT_ASCENDING)])
+        units = self.manager.get_units_iter('repo-1', criteria)
+        self.assertRaises(exceptions.InvalidValue, list, units)
+
     # -- get_units_by_type tests ----------------------------------------------
 
     def test_get_units_by_type_no_criteria(self):
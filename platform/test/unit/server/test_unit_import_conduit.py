@@ -10,9 +10,12 @@
 # have received a copy of GPLv2 along with this software; if not, see
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
+import mock
+
 import base
 
 from pulp.plugins.conduits import mixins, unit_import
+from pulp.plugins.model import Unit
 
 
 class ImportUnitConduitTests(base.PulpServerTests):
@@ -40,3 +43,33 @@ class ImportUnitConduitTests(base.PulpServerTests):
         self.assertTrue(mixins.RepoScratchPadMixin in base_classes)
         self.assertTrue(mixins.SearchUnitsMixin in base_classes)
         self.assertTrue(mixins.SingleRepoUnitsMixin in base_classes)
+
+    def test_associate_units(self):
+        # Setup
+        mock_manager = mock.Mock()
+        self.conduit._ImportUnitConduit__association_manager = mock_manager
+        units = [Unit('type-1', {'k' : 'a'}, {}, None),
+                 Unit('type-1', {'k' : 'b'}, {}, None),
+                 Unit('type-2', {'k' : 'c'}, {}, None)]
+        for i, u in enumerate(units):
+            u.id = 'unit-%d' % i
+
+        # Test
+        result = self.conduit.associate_units(units)
+
+        # Verify
+        self.assertEqual(units, result)
+        self.assertEqual(2, mock_manager.associate_all_by_ids.call_count)
+        calls = dict((c[0][1], c[0][2]) for c in mock_manager.associate_all_by_ids.call_args_list)
+        self.assertEqual(['unit-0', 'unit-1'], calls['type-1'])
+        self.assertEqual(['unit-2'], calls['type-2'])
+
+    def test_associate_units_with_error(self):
+        # Setup
+        mock_manager = mock.Mock()
+        mock_manager.associate_all_by_ids.side_effect = Exception()
+        self.conduit._ImportUnitConduit__association_manager = mock_manager
+        unit = Unit('type-1', {'k' : 'a'}, {}, None)
+
+        # Test
+        self.assertRaises(unit_import.UnitImportConduitException, self.conduit.associate_units, [unit])
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import copy
+
+import mock
+
+import base
+
+from pulp.bindings.responses import Task, Response, STATE_RUNNING, STATE_WAITING
+from pulp.client.commands import polling
+
+# -- constants ----------------------------------------------------------------
+
+TASK_TEMPLATE = {
+    "exception": None,
+    "call_request_group_id": 'default-group',
+    "call_request_id": 'default-id',
+    "call_request_tags": [],
+    "reasons": [],
+    "start_time": None,
+    "traceback": None,
+    "state": STATE_WAITING,
+    "finish_time": None,
+    "schedule_id": None,
+    "result": None,
+    "progress": {},
+    "response": None,
+}
+
+# -- test cases ---------------------------------------------------------------
+
+class PollTaskTests(base.PulpClientTests):
+
+    def setUp(self):
+        super(PollTaskTests, self).setUp()
+        self.config['output']['poll_frequency_in_seconds'] = '2'
+        self.config['output']['poll_wait_in_seconds'] = '5'
+        self.task = Task(copy.deepcopy(TASK_TEMPLATE))
+
+    @mock.patch('time.sleep')
+    @mock.patch('pulp.bindings.tasks.TasksAPI.get_task')
+    def test_changed(self, mock_get, mock_sleep):
+        next_task = Task(copy.deepcopy(TASK_TEMPLATE))
+        next_task.state = STATE_RUNNING
+        mock_get.return_value = Response(200, next_task)
+
+        result = polling.poll_task(self.context, self.task)
+
+        self.assertTrue(result is next_task)
+        mock_get.assert_called_once_with('default-id', wait=5.0, state=STATE_WAITING)
+        self.assertEqual(mock_sleep.call_count, 0)
+
+    @mock.patch('time.sleep')
+    @mock.patch('pulp.bindings.tasks.TasksAPI.get_task')
+    def test_unchanged(self, mock_get, mock_sleep):
+        # a server that does not support waiting responds immediately
+        mock_get.return_value = Response(200, Task(copy.deepcopy(TASK_TEMPLATE)))
+
+        polling.poll_task(self.context, self.task)
+
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertTrue(0 < mock_sleep.call_args[0][0] <= 2)
+
+    @mock.patch('time.sleep')
+    @mock.patch('pulp.bindings.tasks.TasksAPI.get_task')
+    def test_default_wait(self, mock_get, mock_sleep):
+        del self.config['output']['poll_wait_in_seconds']
+        mock_get.return_value = Response(200, Task(copy.deepcopy(TASK_TEMPLATE)))
+
+        polling.poll_task(self.context, self.task)
+
+        mock_get.assert_called_once_with('default-id', wait=float(polling.DEFAULT_POLL_WAIT_IN_SECONDS),
+                                         state=STATE_WAITING)
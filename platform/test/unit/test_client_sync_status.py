@@ -133,7 +133,7 @@ class StatusTests(base.PulpClientTests):
         mock_create.return_value = mock_spinner
 
         # Side effect call to simulate polling a number of times before it completes
-        def poll(task_id):
+        def poll(task_id, wait=None, state=None):
             task = Task(TASK_TEMPLATE)
 
             # Wait for the first 2 polls
@@ -11,13 +11,14 @@
 # have received a copy of GPLv2 along with this software; if not, see
 # http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
 
+import hashlib
 import math
 import mock
 import os
 import shutil
 import unittest
 
-from   pulp.bindings.exceptions import NotFoundException
+from   pulp.bindings.exceptions import NotFoundException, PulpServerException
 from   pulp.bindings.responses import Response
 import pulp.client.upload.manager as upload_util
 
@@ -50,6 +51,7 @@ class UploadManagerTests(unittest.TestCase):
         self._mock_upload_segment()
         self._mock_delete_upload()
         self._mock_import_upload()
+        self._mock_find_existing_unit()
 
         # Create the manager to test
         self.upload_manager = upload_util.UploadManager(self.upload_working_dir, self.mock_bindings)
@@ -140,6 +142,100 @@ class UploadManagerTests(unittest.TestCase):
         self.assertEqual(tracker.unit_key, {'k1' : 'v1'})
         self.assertEqual(tracker.unit_metadata, {})
 
+    def test_initialize_upload_existing_unit(self):
+        # Setup
+        self.upload_manager.initialize()
+        self.mock_upload_bindings.find_existing_unit.return_value = Response(200, True)
+        existing_response = Response(202, {})
+        self.mock_upload_bindings.import_existing_unit.return_value = existing_response
+
+        mock_callback = mock.Mock()
+
+        # Test
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1', {'k' : 'v'}, 'm-1')
+        self.upload_manager.upload(upload_id, mock_callback.update_status)
+        response = self.upload_manager.import_upload(upload_id)
+
+        # Verify
+
+        # Pre-flight sent the file's checksum
+        f = open(TEST_RPM_FILENAME, 'r')
+        checksum = hashlib.sha256(f.read()).hexdigest()
+        f.close()
+
+        self.assertEqual(1, self.mock_upload_bindings.find_existing_unit.call_count)
+        args = self.mock_upload_bindings.find_existing_unit.call_args[0]
+        self.assertEqual(('type-1', {'k' : 'v'}, 'sha256', checksum), args)
+
+        # No bits sent and the existing unit imported instead of the upload
+        rpm_size = os.path.getsize(TEST_RPM_FILENAME)
+        self.assertEqual(0, self.mock_upload_bindings.upload_segment.call_count)
+        self.assertEqual(0, self.mock_upload_bindings.import_upload.call_count)
+        self.assertEqual((rpm_size, rpm_size), mock_callback.update_status.call_args[0])
+        self.assertEqual(1, self.mock_upload_bindings.import_existing_unit.call_count)
+        args = self.mock_upload_bindings.import_existing_unit.call_args[0]
+        self.assertEqual(('repo-1', 'type-1', {'k' : 'v'}, 'sha256', checksum), args)
+        self.assertTrue(response is existing_response)
+
+        tracker = upload_util.UploadTracker.load(self.upload_manager._tracker_filename(upload_id))
+        self.assertTrue(tracker.is_duplicate)
+        self.assertTrue(tracker.is_finished_uploading)
+
+    def test_initialize_upload_new_unit(self):
+        # Setup
+        self.upload_manager.initialize()
+
+        # Test
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1', {'k' : 'v'}, 'm-1')
+        self.upload_manager.upload(upload_id)
+
+        # Verify
+        rpm_size = os.path.getsize(TEST_RPM_FILENAME)
+        self.assertEqual(1, self.mock_upload_bindings.find_existing_unit.call_count)
+        self.assertEqual((rpm_size,), self.mock_upload_bindings.initialize_upload.call_args[0])
+        self.assertEqual(1, self.mock_upload_bindings.upload_segment.call_count)
+
+        tracker = self.upload_manager._get_tracker_file_by_id(upload_id)
+        self.assertFalse(tracker.is_duplicate)
+
+    def test_initialize_upload_preflight_unsupported(self):
+        # Setup
+        self.upload_manager.initialize()
+        self.mock_upload_bindings.find_existing_unit.side_effect = NotFoundException({})
+
+        # Test
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1', {'k' : 'v'}, 'm-1')
+        self.upload_manager.upload(upload_id)
+
+        # Verify
+        self.assertEqual(1, self.mock_upload_bindings.upload_segment.call_count)
+
+    def test_initialize_upload_preflight_failed(self):
+        # Setup
+        self.upload_manager.initialize()
+        self.mock_upload_bindings.find_existing_unit.side_effect = PulpServerException({})
+
+        # Test
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1', {'k' : 'v'}, 'm-1')
+        self.upload_manager.upload(upload_id)
+        self.upload_manager.import_upload(upload_id)
+
+        # Verify
+        self.assertEqual(1, self.mock_upload_bindings.upload_segment.call_count)
+        self.assertEqual(1, self.mock_upload_bindings.import_upload.call_count)
+        self.assertEqual(0, self.mock_upload_bindings.import_existing_unit.call_count)
+
+    def test_initialize_upload_no_deduplicate(self):
+        # Setup
+        self.upload_manager.deduplicate = False
+        self.upload_manager.initialize()
+
+        # Test
+        self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1', {'k' : 'v'}, 'm-1')
+
+        # Verify
+        self.assertEqual(0, self.mock_upload_bindings.find_existing_unit.call_count)
+
     def test_upload_single_pass(self):
         # Setup
         self.upload_manager.chunk_size = upload_util.DEFAULT_CHUNKSIZE * 10 # way higher than needed
@@ -180,6 +276,7 @@ class UploadManagerTests(unittest.TestCase):
     def test_upload_multiple_passes(self):
         # Setup
         self.upload_manager.chunk_size = 100
+        self.upload_manager.concurrency = 1 # segments are sent in order
         self.upload_manager.initialize()
         upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1', {'k' : 'v'}, 'm-1')
 
@@ -232,6 +329,109 @@ class UploadManagerTests(unittest.TestCase):
         tracker = self.upload_manager._get_tracker_file_by_id(upload_id)
         self.assertEqual(rpm_size, tracker.offset)
 
+    def test_upload_concurrent_segments(self):
+        # Setup
+        self.upload_manager.chunk_size = 100
+        self.upload_manager.concurrency = 4
+        self.upload_manager.initialize()
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1', {'k' : 'v'}, 'm-1')
+
+        mock_callback = mock.Mock()
+
+        # Test
+        self.upload_manager.upload(upload_id, mock_callback.update_status)
+
+        # Verify
+        rpm_size = os.path.getsize(TEST_RPM_FILENAME)
+        num_upload_calls = int(math.ceil(float(rpm_size) / float(self.upload_manager.chunk_size)))
+
+        # Every segment was sent exactly once with the right contents
+        f = open(TEST_RPM_FILENAME, 'r')
+        contents = f.read()
+        f.close()
+
+        self.assertEqual(num_upload_calls, self.mock_upload_bindings.upload_segment.call_count)
+        offsets = []
+        for single_call_args in self.mock_upload_bindings.upload_segment.call_args_list:
+            offset = single_call_args[0][1]
+            body = single_call_args[0][2]
+            self.assertEqual(contents[offset:offset + self.upload_manager.chunk_size], body)
+            offsets.append(offset)
+        self.assertEqual(range(0, rpm_size, self.upload_manager.chunk_size), sorted(offsets))
+
+        # Progress is reported as the total uploaded
+        self.assertEqual(num_upload_calls, mock_callback.update_status.call_count)
+        self.assertEqual((rpm_size, rpm_size), mock_callback.update_status.call_args[0])
+
+        tracker = upload_util.UploadTracker.load(self.upload_manager._tracker_filename(upload_id))
+        self.assertEqual([[0, rpm_size]], tracker.completed_ranges)
+        self.assertEqual(rpm_size, tracker.offset)
+        self.assertTrue(tracker.is_finished_uploading)
+
+    def test_upload_resume_missing_ranges(self):
+        # Setup
+        self.upload_manager.chunk_size = 100
+        self.upload_manager.initialize()
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1', {'k' : 'v'}, 'm-1')
+
+        rpm_size = os.path.getsize(TEST_RPM_FILENAME)
+        tracker = self.upload_manager._get_tracker_file_by_id(upload_id)
+        tracker.add_completed_range(0, 300)
+        tracker.add_completed_range(500, rpm_size)
+
+        # Test
+        self.upload_manager.upload(upload_id)
+
+        # Verify
+        offsets = sorted(c[0][1] for c in self.mock_upload_bindings.upload_segment.call_args_list)
+        self.assertEqual([300, 400], offsets)
+        self.assertEqual([[0, rpm_size]], tracker.completed_ranges)
+
+    def test_upload_segment_failure(self):
+        # Setup
+        self.upload_manager.chunk_size = 100
+        self.upload_manager.concurrency = 1
+        self.upload_manager.initialize()
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1', {'k' : 'v'}, 'm-1')
+
+        responses = [Response(200, {}), Response(200, {}), NotFoundException({})]
+
+        def upload_segment(*args):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        self.mock_upload_bindings.upload_segment.side_effect = upload_segment
+
+        # Test
+        self.assertRaises(NotFoundException, self.upload_manager.upload, upload_id)
+
+        # Verify
+        self.assertEqual(3, self.mock_upload_bindings.upload_segment.call_count)
+
+        tracker = upload_util.UploadTracker.load(self.upload_manager._tracker_filename(upload_id))
+        self.assertEqual([[0, 200]], tracker.completed_ranges)
+        self.assertEqual(200, tracker.offset)
+        self.assertFalse(tracker.is_finished_uploading)
+        self.assertFalse(tracker.is_running)
+
+    def test_tracker_missing_segments(self):
+        # Setup
+        tracker = upload_util.UploadTracker('irrelevant')
+        tracker.add_completed_range(200, 250)
+        tracker.add_completed_range(0, 100)
+        tracker.add_completed_range(250, 300)
+
+        # Test
+        segments = tracker.missing_segments(520, 100)
+
+        # Verify
+        self.assertEqual([[0, 100], [200, 300]], tracker.completed_ranges)
+        self.assertEqual(100, tracker.offset)
+        self.assertEqual(200, tracker.completed_bytes())
+        self.assertEqual([(100, 100), (300, 100), (400, 100), (500, 20)], segments)
+
     def test_upload_concurrent_upload(self):
         # Setup
         self.upload_manager.initialize()
@@ -389,4 +589,11 @@ class UploadManagerTests(unittest.TestCase):
         """
         Configures the mock bindings to return a valid response on importing an upload.
         """
-        self.mock_upload_bindings.import_upload.return_value = Response(200, {})
\ No newline at end of file
+        self.mock_upload_bindings.import_upload.return_value = Response(200, {})
+
+    def _mock_find_existing_unit(self):
+        """
+        Configures the mock bindings to report the unit is not on the server in
+        the upload pre-flight.
+        """
+        self.mock_upload_bindings.find_existing_unit.return_value = Response(200, False)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+import httplib
+import threading
+import unittest
+
+import mock
+from M2Crypto import SSL
+
+from pulp.bindings import exceptions
+from pulp.bindings.server import PulpConnection
+
+
+class FakeResponse(object):
+
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+    def read(self):
+        return self.body
+
+
+class FakeConnection(object):
+    """
+    Stands in for M2Crypto's HTTPSConnection; errors queued in the class'
+    errors list are raised by the next requests and those queued in its
+    response_errors list while reading the next responses.
+    """
+
+    instances = []
+    errors = []
+    response_errors = []
+
+    def __init__(self, host, port, ssl_context=None):
+        self.ssl_context = ssl_context
+        self.sock = None
+        self.session = None
+        self.closed = False
+        self.requests = 0
+        FakeConnection.instances.append(self)
+
+    def set_session(self, session):
+        self.session = session
+
+    def get_session(self):
+        return 'session-%d' % FakeConnection.instances.index(self)
+
+    def request(self, method, url, body=None, headers=None):
+        if FakeConnection.errors:
+            raise FakeConnection.errors.pop(0)
+        self.sock = object()
+        self.requests += 1
+
+    def getresponse(self):
+        if FakeConnection.response_errors:
+            raise FakeConnection.response_errors.pop(0)
+        return FakeResponse(200, '{"ok": true}')
+
+    def close(self):
+        self.sock = None
+        self.closed = True
+
+
+class ConnectionPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        super(ConnectionPoolTests, self).setUp()
+        FakeConnection.instances = []
+        FakeConnection.errors = []
+        FakeConnection.response_errors = []
+        self.patches = [mock.patch('pulp.bindings.server.httpslib.HTTPSConnection', FakeConnection),
+                        mock.patch('pulp.bindings.server.SSL.Context')]
+        for p in self.patches:
+            p.start()
+        self.connection = PulpConnection('localhost', username='admin', password='admin')
+
+    def tearDown(self):
+        super(ConnectionPoolTests, self).tearDown()
+        for p in self.patches:
+            p.stop()
+
+    def test_reuse(self):
+        for i in range(3):
+            response = self.connection.GET('/v2/repositories/')
+            self.assertEqual(response.response_body, {'ok': True})
+        self.assertEqual(len(FakeConnection.instances), 1)
+        self.assertEqual(FakeConnection.instances[0].requests, 3)
+        stats = self.connection.connection_stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['reused'], 2)
+        self.assertEqual(stats['idle'], 1)
+
+    def test_session_resumed(self):
+        pool = self.connection.connection_pool
+        first, reused = pool.acquire()
+        second, reused = pool.acquire()
+        self.assertFalse(reused)
+        self.connection.server_wrapper._send(first, 'GET', '/', None, {})
+        third = pool.connect()
+        # only the first connection negotiates a session
+        self.assertEqual(second.session, None)
+        self.assertEqual(third.session, 'session-0')
+        self.assertTrue(first.ssl_context is third.ssl_context)
+
+    def test_stale_connection(self):
+        self.connection.GET('/v2/repositories/')
+        FakeConnection.errors.append(httplib.BadStatusLine(''))
+        response = self.connection.GET('/v2/repositories/')
+        self.assertEqual(response.response_code, 200)
+        self.assertEqual(len(FakeConnection.instances), 2)
+        self.assertTrue(FakeConnection.instances[0].closed)
+        self.assertEqual(self.connection.connection_stats()['reconnected'], 1)
+
+    def test_closed_without_response(self):
+        self.connection.GET('/v2/repositories/')
+        FakeConnection.response_errors.append(httplib.BadStatusLine(''))
+        response = self.connection.GET('/v2/repositories/')
+        self.assertEqual(response.response_code, 200)
+        self.assertEqual(len(FakeConnection.instances), 2)
+        self.assertEqual(self.connection.connection_stats()['reconnected'], 1)
+
+    def test_unsafe_method_not_resent(self):
+        self.connection.GET('/v2/repositories/')
+        FakeConnection.response_errors.append(httplib.BadStatusLine(''))
+        self.assertRaises(httplib.BadStatusLine, self.connection.POST, '/v2/repositories/', {})
+        self.assertEqual(len(FakeConnection.instances), 1)
+        self.assertEqual(FakeConnection.instances[0].requests, 2)
+
+    def test_partial_response_not_resent(self):
+        self.connection.GET('/v2/repositories/')
+        FakeConnection.response_errors.append(httplib.BadStatusLine('HTTP/1.1 2'))
+        self.assertRaises(httplib.BadStatusLine, self.connection.GET, '/v2/repositories/')
+        self.assertEqual(len(FakeConnection.instances), 1)
+
+    def test_expired_connection_not_reused(self):
+        self.connection.connection_pool.max_idle_seconds = -1
+        self.connection.GET('/v2/repositories/')
+        self.connection.GET('/v2/repositories/')
+        self.assertEqual(len(FakeConnection.instances), 2)
+        self.assertTrue(FakeConnection.instances[0].closed)
+        self.assertEqual(self.connection.connection_stats()['reused'], 0)
+
+    def test_new_connection_not_retried(self):
+        FakeConnection.errors.append(SSL.SSLError('connection refused'))
+        self.assertRaises(exceptions.ConnectionException, self.connection.GET, '/v2/repositories/')
+        self.assertEqual(len(FakeConnection.instances), 1)
+        self.assertEqual(self.connection.connection_stats()['idle'], 0)
+
+    def test_certificate_changed(self):
+        self.connection.GET('/v2/repositories/')
+        self.connection.username = self.connection.password = None
+        self.connection.cert_filename = '/tmp/user-cert.pem'
+        self.connection.GET('/v2/repositories/')
+        self.assertEqual(len(FakeConnection.instances), 2)
+        self.assertTrue(FakeConnection.instances[0].closed)
+        self.assertEqual(FakeConnection.instances[1].session, None)
+
+    def test_certificate_not_used_with_password(self):
+        self.connection.cert_filename = '/tmp/user-cert.pem'
+        self.connection.GET('/v2/repositories/')
+        # a plain context, as the certificate may have expired
+        SSL.Context.assert_called_once_with()
+        self.assertEqual(SSL.Context.return_value.load_cert.call_count, 0)
+
+    def test_max_connections(self):
+        pool = self.connection.connection_pool
+        connections = [pool.acquire()[0] for i in range(6)]
+        for c in connections:
+            pool.release(c)
+        self.assertEqual(pool.stats()['idle'], pool.max_connections)
+        self.assertEqual(len([c for c in connections if c.closed]), 6 - pool.max_connections)
+        self.connection.close()
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    def test_threads(self):
+        errors = []
+        def call():
+            try:
+                for i in range(10):
+                    self.connection.GET('/v2/repositories/')
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=call) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sum(c.requests for c in FakeConnection.instances), 40)
+        stats = self.connection.connection_stats()
+        self.assertEqual(stats['created'] + stats['reused'], 40)
+        self.assertTrue(stats['created'] <= 4)
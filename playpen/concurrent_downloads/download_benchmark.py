@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the License
+# (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied, including the
+# implied warranties of MERCHANTABILITY, NON-INFRINGEMENT, or FITNESS FOR A
+# PARTICULAR PURPOSE.
+# You should have received a copy of GPLv2 along with this software; if not,
+# see http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt
+
+"""
+Compare the throughput and cpu usage of the pulp.common.download backends.
+
+A scratch directory of synthetic files is served by a threaded, local http
+server standing in for a remote feed; each backend downloads every file and
+the wall clock time, throughput and cpu time (user + system) of the run are
+reported. The file backend reads the scratch directory directly.
+
+Example:
+    python download_benchmark.py --files 200 --size 262144 --concurrent 5 curl threaded file
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from BaseHTTPServer import HTTPServer
+from SimpleHTTPServer import SimpleHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../platform/src'))
+
+from pulp.common.download import factory as download_factory
+from pulp.common.download.config import DownloaderConfig
+from pulp.common.download.listener import DownloadEventListener
+from pulp.common.download.request import DownloadRequest
+
+
+# backend name -> (protocol, backend hint)
+BACKENDS = {
+    'curl': ('http', 'curl'),
+    'threaded': ('http', 'threaded'),
+    'file': ('file', None),
+}
+
+
+class QuietRequestHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class CountingEventListener(DownloadEventListener):
+
+    def __init__(self):
+        self.succeeded = 0
+        self.failed = 0
+
+    def download_succeeded(self, report):
+        self.succeeded += 1
+
+    def download_failed(self, report):
+        self.failed += 1
+
+
+def parse_args():
+    parser = OptionParser(usage='%prog [options] [backend ...]')
+    parser.add_option('--files', type='int', default=200,
+                      help='number of files to download [200]')
+    parser.add_option('--size', type='int', default=262144,
+                      help='size of each file in bytes [262144]')
+    parser.add_option('--concurrent', type='int', default=5,
+                      help='maximum concurrent downloads [5]')
+    parser.add_option('--port', type='int', default=8089,
+                      help='port of the local http server [8089]')
+    return parser.parse_args()
+
+
+def generate_files(source_dir, options):
+    for i in range(options.files):
+        fp = open(os.path.join(source_dir, 'file-%05d' % i), 'wb')
+        fp.write(os.urandom(options.size))
+        fp.close()
+
+
+def start_server(source_dir, port):
+    os.chdir(source_dir)
+    server = ThreadedHTTPServer(('localhost', port), QuietRequestHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    return server
+
+
+def run_backend(name, source_dir, options):
+    protocol, backend = BACKENDS[name]
+    config = DownloaderConfig(protocol, backend=backend, max_concurrent=options.concurrent,
+                              max_retries=0)
+    listener = CountingEventListener()
+
+    try:
+        downloader = download_factory.get_downloader(config, listener)
+    except download_factory.NoBackendForProtocol:
+        print '%-10s not available' % name
+        return
+
+    storage_dir = tempfile.mkdtemp(prefix='download_benchmark-%s-' % name)
+    if protocol == 'file':
+        base_url = 'file://' + source_dir + '/'
+    else:
+        base_url = 'http://localhost:%d/' % options.port
+    file_names = sorted(os.listdir(source_dir))
+    request_list = [DownloadRequest(base_url + f, os.path.join(storage_dir, f)) for f in file_names]
+
+    try:
+        cpu_start = os.times()
+        start = time.time()
+        downloader.download(request_list)
+        elapsed = time.time() - start
+        cpu_end = os.times()
+    finally:
+        shutil.rmtree(storage_dir)
+
+    cpu = (cpu_end[0] - cpu_start[0]) + (cpu_end[1] - cpu_start[1])
+    total_bytes = listener.succeeded * options.size
+
+    print '%-10s %6d ok %4d failed %8.3fs %10.1f MB/s %8.3fs cpu (%3.0f%%)' % \
+          (name, listener.succeeded, listener.failed, elapsed,
+           total_bytes / elapsed / 1048576, cpu, 100 * cpu / elapsed)
+
+
+def main():
+    options, backend_names = parse_args()
+    backend_names = backend_names or sorted(BACKENDS)
+
+    for name in backend_names:
+        if name not in BACKENDS:
+            print 'Unknown backend: %s' % name
+            return 1
+
+    source_dir = tempfile.mkdtemp(prefix='download_benchmark-source-')
+    try:
+        generate_files(source_dir, options)
+        server = start_server(source_dir, options.port)
+
+        print '%d files of %d bytes, %d concurrent downloads' % (options.files, options.size, options.concurrent)
+        for name in backend_names:
+            run_backend(name, source_dir, options)
+
+        server.shutdown()
+    finally:
+        shutil.rmtree(source_dir)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
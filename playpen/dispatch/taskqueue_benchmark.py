@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2013 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public
+# License as published by the Free Software Foundation; either version
+# 2 of the License (GPLv2) or (at your option) any later version.
+# There is NO WARRANTY for this software, express or implied,
+# including the implied warranties of MERCHANTABILITY,
+# NON-INFRINGEMENT, or FITNESS FOR A PARTICULAR PURPOSE. You should
+# have received a copy of GPLv2 along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+
+"""
+Drive a large number of synthetic tasks through the dispatch task queue and
+report the enqueue and dispatch throughput along with the start latency of the
+tasks (time from enqueue to run).
+
+Requires a running mongo instance; queued calls are written to a scratch
+database that is dropped when the benchmark finishes.
+
+Example:
+    python taskqueue_benchmark.py --tasks 10000 --threshold 9 --chain 10
+"""
+
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../platform/src'))
+
+from pulp.server.db import connection
+from pulp.server.dispatch import constants as dispatch_constants
+from pulp.server.dispatch import pickling
+from pulp.server.dispatch.call import CallRequest
+from pulp.server.dispatch.task import Task
+from pulp.server.dispatch.taskqueue import TaskQueue
+from pulp.server.managers import factory as managers_factory
+
+
+DATABASE_NAME = 'pulp_taskqueue_benchmark'
+
+# call request id -> time the task was run
+START_TIMES = {}
+
+
+def noop():
+    pass
+
+
+def record_start(call_request, call_report):
+    # module-level so that it can be pickled along with the call request
+    START_TIMES[call_request.id] = time.time()
+
+
+def parse_args():
+    parser = OptionParser()
+    parser.add_option('--tasks', type='int', default=10000,
+                      help='number of synthetic tasks to queue [10000]')
+    parser.add_option('--threshold', type='int', default=9,
+                      help='task queue concurrency threshold [9]')
+    parser.add_option('--weight', type='int', default=1,
+                      help='weight of each task [1]')
+    parser.add_option('--chain', type='int', default=0,
+                      help='make each task depend on the previous one in runs of this length; 0 disables [0]')
+    parser.add_option('--timeout', type='float', default=600.0,
+                      help='seconds to wait for all of the tasks to complete [600]')
+    return parser.parse_args()[0]
+
+
+def generate_tasks(options):
+    tasks = []
+    previous = None
+    for i in range(options.tasks):
+        call_request = CallRequest(noop, weight=options.weight)
+        call_request.add_life_cycle_callback(dispatch_constants.CALL_RUN_LIFE_CYCLE_CALLBACK, record_start)
+        if previous is not None and options.chain and i % options.chain:
+            call_request.dependencies[previous.call_request.id] = dispatch_constants.CALL_COMPLETE_STATES
+        task = Task(call_request)
+        tasks.append(task)
+        previous = task
+    return tasks
+
+
+def main():
+    options = parse_args()
+
+    connection.initialize(name=DATABASE_NAME)
+    managers_factory.initialize()
+    pickling.initialize()
+
+    tasks = generate_tasks(options)
+    queue = TaskQueue(options.threshold)
+    queue.start()
+
+    try:
+        enqueue_start = time.time()
+        queue.batch_enqueue(tasks)
+        enqueue_end = time.time()
+
+        while len(START_TIMES) < len(tasks) or queue.running_tasks():
+            if time.time() - enqueue_start > options.timeout:
+                print 'Timed out with %d of %d tasks started' % (len(START_TIMES), len(tasks))
+                return 1
+            time.sleep(0.05)
+        finish = time.time()
+
+    finally:
+        queue.stop(clear_queued_calls=True)
+        connection._connection.drop_database(DATABASE_NAME)
+
+    latencies = sorted(START_TIMES[t.call_request.id] - enqueue_start for t in tasks)
+    enqueue_time = enqueue_end - enqueue_start
+    total_time = finish - enqueue_start
+
+    print 'tasks:              %d (threshold %d, weight %d, chain %d)' % \
+          (len(tasks), options.threshold, options.weight, options.chain)
+    print 'enqueue:            %.3fs (%.0f tasks/s)' % (enqueue_time, len(tasks) / enqueue_time)
+    print 'enqueue to drained: %.3fs (%.0f tasks/s)' % (total_time, len(tasks) / total_time)
+    print 'start latency:      median %.3fs, 99th %.3fs, max %.3fs' % \
+          (latencies[len(latencies) / 2], latencies[int(len(latencies) * 0.99)], latencies[-1])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())